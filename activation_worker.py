@@ -44,9 +44,37 @@ if ACTIVATION_INTERVAL_SECONDS < 60:  # Минимум 1 минута
 if ACTIVATION_INTERVAL_SECONDS > 1800:  # Максимум 30 минут
     ACTIVATION_INTERVAL_SECONDS = 1800
 
+# LISTEN/NOTIFY (migration 085): пока канал activation_pending жив и
+# pending-строк нет совсем, интервал выше — лишь страховка на пропущенный
+# NOTIFY. Исчерпавшие попытки pending-строки держат обычный интервал:
+# по ним notify_admin_pending_activations.
+ACTIVATION_SAFETY_INTERVAL_SECONDS = max(
+    ACTIVATION_INTERVAL_SECONDS, int(os.getenv("ACTIVATION_SAFETY_INTERVAL_SECONDS", "1800"))
+)
+# Пауза после NOTIFY: склеиваем пачку платежей в одну итерацию.
+ACTIVATION_NOTIFY_DELAY_SECONDS = float(os.getenv("ACTIVATION_NOTIFY_DELAY_SECONDS", "2"))
+
 # Максимальное количество попыток активации (используется для логирования)
 MAX_ACTIVATION_ATTEMPTS = activation_service.get_max_activation_attempts()
 
+async def _has_pending_activations() -> bool:
+    """Есть ли activation_status='pending' (включая исчерпавшие попытки).
+
+    Ошибка БД → True: лучше обычный интервал, чем проспать 30 минут.
+    """
+    try:
+        pool = await database.get_pool()
+        if pool is None:
+            return True
+        async with acquire_connection(pool, "activation_has_pending") as conn:
+            return bool(await conn.fetchval(
+                "SELECT EXISTS (SELECT 1 FROM subscriptions WHERE activation_status = 'pending')"
+            ))
+    except Exception as e:
+        logger.debug(f"activation_worker: pending check failed: {type(e).__name__}: {str(e)[:100]}")
+        return True
+
+
 async def process_pending_activations(bot: Bot) -> tuple[int, str]:
     """
     Обработать подписки с отложенной активацией (activation_status='pending')
@@ -354,7 +382,8 @@ async def process_pending_activations(bot: Bot) -> tuple[int, str]:
                         )
 
             # Connection released before sleep — no conn held during asyncio.sleep
-            await asyncio.sleep(0.5)
+            if i < len(pending_subscriptions) - 1:
+                await asyncio.sleep(0.5)
 
         return (items_processed, outcome)
     except (asyncpg.PostgresError, asyncio.TimeoutError) as e:
@@ -496,5 +525,23 @@ async def activation_worker_task(bot: Bot):
         if should_exit_loop:
             break
         
-        # Sleep after iteration completes (outside try/finally)
-        await asyncio.sleep(ACTIVATION_INTERVAL_SECONDS)
+        # Sleep after iteration completes (outside try/finally).
+        # Остались pending (ретраи или исчерпавшие попытки — по ним нужен
+        # алерт админу) или LISTEN не поднят — обычный интервал; иначе ждём
+        # NOTIFY activation_pending, poll — редкая страховка.
+        if (
+            items_processed
+            or outcome != "success"
+            or not database.listener_connected()
+            or await _has_pending_activations()
+        ):
+            interval = ACTIVATION_INTERVAL_SECONDS
+        else:
+            interval = ACTIVATION_SAFETY_INTERVAL_SECONDS
+        try:
+            if await database.wait_for_notify(database.CHANNEL_ACTIVATION, interval):
+                logger.debug("activation_worker: woken by NOTIFY")
+                await asyncio.sleep(ACTIVATION_NOTIFY_DELAY_SECONDS)
+        except asyncio.CancelledError:
+            logger.info("Activation worker task cancelled")
+            break
@@ -83,6 +83,15 @@ try:
 except Exception:
     logger.exception("sub_aggregator_route mount failed")
 
+# Prometheus scrape endpoint — GET /metrics (см. app/api/metrics_route.py).
+try:
+    import config as _cfg
+    if getattr(_cfg, "METRICS_ENABLED", False):
+        from app.api import metrics_route
+        app.include_router(metrics_route.router)
+except Exception:
+    logger.exception("metrics_route mount failed")
+
 # Admin web dashboard — mounted only when JWT_SECRET + DASHBOARD_BASE_URL are
 # set (config.DASHBOARD_ENABLED). When disabled, the bot runs identically to
 # the pre-dashboard build. When enabled:
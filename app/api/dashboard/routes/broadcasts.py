@@ -253,8 +253,7 @@ async def segments_list():
     out = []
     for key, label, description, group in segments:
         try:
-            ids = await database.get_users_by_segment(key)
-            count = len(ids)
+            count = await database.count_users_by_segment(key)
         except Exception as e:
             logger.warning("SEGMENT_COUNT_FAIL key=%s err=%s", key, e)
             count = -1
@@ -1,10 +1,18 @@
-"""CSV export endpoints — streamed line-by-line."""
+"""CSV export endpoints — streamed from a server-side cursor.
+
+Rows come from database.iter_*_for_export (asyncpg cursor, bounded
+prefetch) and are encoded to CSV as they arrive, so memory stays flat
+regardless of table size. The first chunk is pulled before the response
+starts: a failing query still surfaces as HTTP 500 instead of a
+truncated download.
+"""
 import csv
 import io
 import logging
-from datetime import datetime, timezone
+from datetime import datetime, timedelta, timezone
+from typing import AsyncIterator, Optional
 
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query
 from fastapi.responses import StreamingResponse
 
 import database
@@ -13,6 +21,10 @@ from app.api.dashboard.deps import require_admin
 logger = logging.getLogger(__name__)
 router = APIRouter(dependencies=[Depends(require_admin)])
 
+# Flush in 500-row chunks to keep the per-write cost small without
+# spamming the network with one frame per row.
+FLUSH_EVERY_ROWS = 500
+
 
 def _stringify(value):
     if value is None:
@@ -24,67 +36,86 @@ def _stringify(value):
     return str(value)
 
 
-def _csv_stream(rows: list, columns: list[str] | None = None):
-    """Generator that yields CSV chunks as bytes. Header first, then rows."""
-    if not rows:
-        # Empty result: emit just a sentinel empty CSV with no header so the
-        # caller's download still completes.
-        yield b""
-        return
-
-    if columns is None:
-        columns = list(rows[0].keys())
-
+async def _csv_stream(rows: AsyncIterator, columns: list[str] | None = None):
+    """Async generator that yields CSV chunks as bytes. Header first, then rows."""
     buf = io.StringIO()
     writer = csv.writer(buf, quoting=csv.QUOTE_MINIMAL, lineterminator="\n")
-
-    writer.writerow(columns)
-    yield buf.getvalue().encode("utf-8")
-    buf.seek(0)
-    buf.truncate()
-
-    # Flush in 500-row chunks to keep the per-write cost small without
-    # spamming the network with one frame per row.
-    flush_every = 500
     written = 0
-    for row in rows:
+    async for row in rows:
+        if written == 0:
+            if columns is None:
+                columns = list(row.keys())
+            writer.writerow(columns)
         writer.writerow([_stringify(row.get(c)) for c in columns])
         written += 1
-        if written % flush_every == 0:
+        if written % FLUSH_EVERY_ROWS == 0:
             yield buf.getvalue().encode("utf-8")
             buf.seek(0)
             buf.truncate()
+    if written == 0:
+        # Empty result: emit just a sentinel empty CSV with no header so the
+        # caller's download still completes.
+        yield b""
+        return
     # Final tail
     tail = buf.getvalue()
     if tail:
         yield tail.encode("utf-8")
 
 
-@router.get("/users.csv")
-async def export_users():
-    """All users — id, telegram_id, username, language, balance, created_at, etc."""
+async def _prepend(first: bytes, rest):
+    yield first
+    async for chunk in rest:
+        yield chunk
+
+
+async def _csv_response(rows: AsyncIterator, prefix: str, error_code: str) -> StreamingResponse:
+    stream = _csv_stream(rows)
     try:
-        rows = await database.get_all_users_for_export()
+        first = await stream.__anext__()
+    except StopAsyncIteration:
+        first = b""
     except Exception as e:
-        raise HTTPException(500, f"export_users_failed: {e}")
-    name = f"users_{datetime.now(timezone.utc).strftime('%Y%m%d_%H%M%S')}.csv"
+        await stream.aclose()
+        raise HTTPException(500, f"{error_code}: {e}")
+    name = f"{prefix}_{datetime.now(timezone.utc).strftime('%Y%m%d_%H%M%S')}.csv"
     return StreamingResponse(
-        _csv_stream(rows),
+        _prepend(first, stream),
         media_type="text/csv; charset=utf-8",
         headers={"Content-Disposition": f'attachment; filename="{name}"'},
     )
 
 
+@router.get("/users.csv")
+async def export_users():
+    """All users — id, telegram_id, username, language, balance, created_at, etc."""
+    return await _csv_response(database.iter_users_for_export(), "users", "export_users_failed")
+
+
 @router.get("/subscriptions.csv")
 async def export_subscriptions():
     """All currently active subscriptions."""
-    try:
-        rows = await database.get_active_subscriptions_for_export()
-    except Exception as e:
-        raise HTTPException(500, f"export_subscriptions_failed: {e}")
-    name = f"subscriptions_{datetime.now(timezone.utc).strftime('%Y%m%d_%H%M%S')}.csv"
-    return StreamingResponse(
-        _csv_stream(rows),
-        media_type="text/csv; charset=utf-8",
-        headers={"Content-Disposition": f'attachment; filename="{name}"'},
+    return await _csv_response(
+        database.iter_active_subscriptions_for_export(), "subscriptions", "export_subscriptions_failed",
+    )
+
+
+@router.get("/payments.csv")
+async def export_payments(
+    days: Optional[int] = Query(None, gt=0, le=3650),
+    status: Optional[str] = Query(None, max_length=32),
+):
+    """Payments, newest first. `days` limits to the last N days, `status` filters exactly."""
+    since = datetime.now(timezone.utc) - timedelta(days=days) if days else None
+    return await _csv_response(
+        database.iter_payments_for_export(since=since, status=status), "payments", "export_payments_failed",
+    )
+
+
+@router.get("/broadcast_log.csv")
+async def export_broadcast_log(broadcast_id: Optional[int] = Query(None, gt=0)):
+    """Per-recipient broadcast results — all broadcasts or one `broadcast_id`."""
+    prefix = f"broadcast_log_{broadcast_id}" if broadcast_id else "broadcast_log"
+    return await _csv_response(
+        database.iter_broadcast_log_for_export(broadcast_id), prefix, "export_broadcast_log_failed",
     )
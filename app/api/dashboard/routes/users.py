@@ -10,6 +10,9 @@ matter whether the action comes from a Telegram chat or the web UI.
 Bot-only writes (approve_payment_atomic, grant_access, finalize_purchase,
 mark_trial_used) are intentionally NOT exposed here.
 """
+import asyncio
+import time
+from collections import OrderedDict
 from datetime import datetime, timedelta, timezone
 from typing import Any, Optional
 
@@ -34,23 +37,77 @@ def _serialize_match(row: dict) -> dict:
     return out
 
 
+# Search-as-you-type: короткий кэш результатов + склейка одинаковых
+# запросов в полёте. Повторный набор / backspace / несколько вкладок
+# не бьют БД; 5с устаревания для списка поиска не страшно.
+SEARCH_CACHE_TTL_SEC = 5.0
+SEARCH_CACHE_MAX_ENTRIES = 256
+_search_cache: "OrderedDict[tuple, tuple[float, list]]" = OrderedDict()
+_search_inflight: dict = {}
+
+
+def _search_key(q: str, limit: int) -> tuple:
+    return (q.strip().lstrip("@").lower(), limit)
+
+
+async def _cached_search(q: str, limit: int) -> list:
+    key = _search_key(q, limit)
+    entry = _search_cache.get(key)
+    now = time.monotonic()
+    if entry is not None and entry[0] > now:
+        _search_cache.move_to_end(key)
+        return entry[1]
+    fut = _search_inflight.get(key)
+    if fut is not None:
+        try:
+            return await asyncio.shield(fut)
+        except asyncio.CancelledError:
+            if not fut.cancelled():
+                raise  # отменили нас самих
+            # Запрос-владелец отменён (клиент ушёл) — ищем сами.
+    fut = asyncio.get_running_loop().create_future()
+    _search_inflight[key] = fut
+    try:
+        rows = await database.search_users_dashboard(q, limit=limit)
+    except Exception as e:
+        fut.set_exception(e)
+        fut.exception()  # помечаем как прочитанное, если ждущих нет
+        raise
+    else:
+        fut.set_result(rows)
+        _search_cache[key] = (time.monotonic() + SEARCH_CACHE_TTL_SEC, rows)
+        _search_cache.move_to_end(key)
+        while len(_search_cache) > SEARCH_CACHE_MAX_ENTRIES:
+            _search_cache.popitem(last=False)
+        return rows
+    finally:
+        # CancelledError минует и set_exception, и set_result — без этого
+        # ждущие в shield(fut) висели бы вечно.
+        if not fut.done():
+            fut.cancel()
+        if _search_inflight.get(key) is fut:
+            _search_inflight.pop(key, None)
+
+
 @router.get("/search")
 async def users_search(
     q: str = Query(..., min_length=1),
     limit: int = Query(25, gt=0, le=100),
 ):
-    """Substring search across the whole users table.
+    """Indexed search across the whole users table.
 
-    Matches telegram_id (digits typed anywhere — as text, so prefixes
-    like "123" find tg:1234567890) and username (case-insensitive
-    substring, leading @ stripped). Returns up to `limit` ranked
-    matches as `{matches: [...], total: N}`.
+    Digits match telegram_id by prefix ("123" finds tg:1234567890);
+    text matches username (leading @ stripped) — prefix for 1-2
+    characters, case-insensitive substring from 3. Returns up to
+    `limit` ranked matches as `{matches: [...], total: N}`. Results
+    are cached for SEARCH_CACHE_TTL_SEC and identical in-flight
+    queries share one DB call.
 
     Empty result returns 200 with `matches: []` rather than 404 so the
     UI can render "ничего не нашлось" without an exception path.
     """
     try:
-        rows = await database.search_users_dashboard(q, limit=limit)
+        rows = await _cached_search(q, limit)
     except Exception as e:
         raise HTTPException(500, f"search_failed: {e}")
     return {
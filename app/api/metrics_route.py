@@ -0,0 +1,41 @@
+"""
+GET /metrics — Prometheus scrape endpoint (app/core/metrics).
+
+Access: with config.METRICS_TOKEN set, `Authorization: Bearer <token>` is
+required. Without it only direct loopback requests are served — anything
+that came through a reverse proxy (X-Forwarded-For / X-Real-IP present)
+gets 404, so the endpoint never leaks through nginx by accident.
+"""
+import hmac
+import logging
+
+from fastapi import APIRouter, Request, Response
+from fastapi.responses import PlainTextResponse
+
+import config
+from app.core import metrics
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+_LOOPBACK = ("127.0.0.1", "::1", "localhost")
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _authorized(request: Request) -> bool:
+    token = config.METRICS_TOKEN
+    if token:
+        auth = request.headers.get("authorization", "")
+        scheme, _, value = auth.partition(" ")
+        return scheme.lower() == "bearer" and hmac.compare_digest(value.strip(), token)
+    if request.headers.get("x-forwarded-for") or request.headers.get("x-real-ip"):
+        return False
+    return bool(request.client) and request.client.host in _LOOPBACK
+
+
+@router.get("/metrics")
+async def prometheus_metrics(request: Request) -> Response:
+    if not _authorized(request):
+        return PlainTextResponse("Not found", status_code=404)
+    return Response(content=metrics.render(), media_type=CONTENT_TYPE)
@@ -5,6 +5,14 @@ Webhook endpoints for payment providers:
 - POST /webhooks/platega — Platega (SBP) payment notifications
 - POST /webhooks/cryptobot — CryptoBot (Crypto Pay) payment notifications
 - POST /webhooks/lava — Lava (Card) payment notifications
+- POST /webhooks/wata — Wata (Card/SBP) payment notifications
+
+Processing (PAYMENT_INBOX_ENABLED, default on):
+- Endpoint verifies auth, stores the event in payment_webhook_inbox
+  (migration 084) and answers 200 {"status": "accepted"} at once.
+- app/workers/payment_inbox.py confirms / provisions / notifies later,
+  with retries. With the flag off, or for an event without an invoice
+  id, everything runs inline as before.
 
 Security:
 - Signature/auth verification required per provider.
@@ -18,6 +26,7 @@ import logging
 from fastapi import APIRouter, Request
 from fastapi.responses import JSONResponse
 
+import config
 from app.services.payments.confirmation import TransientPaymentError
 
 # Outer timeout for entire webhook processing — must complete before
@@ -53,6 +62,22 @@ async def _log_pe(
         logger.warning("payment_errors log skipped (%s): %s", stage, e)
 
 
+async def _accept(provider: str, request: Request, headers: dict, body) -> JSONResponse | None:
+    """Durable path: verify + persist into the payment inbox, reply now.
+
+    None → process inline (inbox disabled or event without invoice id).
+    """
+    if not config.PAYMENT_INBOX_ENABLED:
+        return None
+    from app.services.payments import inbox
+    raw_body = await request.body()
+    reply = await asyncio.wait_for(
+        inbox.accept(provider, headers, raw_body, body),
+        timeout=_WEBHOOK_TIMEOUT,
+    )
+    return None if reply is None else JSONResponse(reply)
+
+
 def setup(bot):
     """Store bot instance for webhook handlers."""
     global _bot
@@ -79,6 +104,10 @@ async def _handle_platega_webhook(request: Request):
             await _log_pe("webhook_invalid_json", "platega", error_message=str(e)[:300])
             return JSONResponse({"status": "invalid"}, status_code=400)
 
+        accepted = await _accept("platega", request, headers, body)
+        if accepted is not None:
+            return accepted
+
         result = await asyncio.wait_for(
             platega_service.process_webhook_data(headers, body, _bot),
             timeout=_WEBHOOK_TIMEOUT,
@@ -154,6 +183,10 @@ async def _handle_platega_subscription_webhook(request: Request):
             )
             return JSONResponse({"status": "invalid"}, status_code=400)
 
+        accepted = await _accept("platega_subscription", request, headers, body)
+        if accepted is not None:
+            return accepted
+
         result = await asyncio.wait_for(
             platega_service.process_subscription_webhook_data(headers, body, _bot),
             timeout=_WEBHOOK_TIMEOUT,
@@ -223,6 +256,10 @@ async def _handle_cryptobot_webhook(request: Request):
             await _log_pe("webhook_invalid_json", "cryptobot", error_message=str(e)[:300])
             return JSONResponse({"status": "invalid"}, status_code=400)
 
+        accepted = await _accept("cryptobot", request, headers, body)
+        if accepted is not None:
+            return accepted
+
         result = await asyncio.wait_for(
             cryptobot_service.process_webhook_data(headers, raw_body, body, _bot),
             timeout=_WEBHOOK_TIMEOUT,
@@ -277,6 +314,10 @@ async def _handle_lava_webhook(request: Request):
             await _log_pe("webhook_invalid_json", "lava", error_message=str(e)[:300])
             return JSONResponse({"status": "invalid"}, status_code=400)
 
+        accepted = await _accept("lava", request, headers, body)
+        if accepted is not None:
+            return accepted
+
         result = await asyncio.wait_for(
             lava_service.process_webhook_data(headers, body, _bot),
             timeout=_WEBHOOK_TIMEOUT,
@@ -343,6 +384,10 @@ async def _handle_wata_webhook(request: Request):
             await _log_pe("webhook_invalid_json", "wata", error_message=str(e)[:300])
             return JSONResponse({"status": "invalid"}, status_code=400)
 
+        accepted = await _accept("wata", request, headers, body)
+        if accepted is not None:
+            return accepted
+
         result = await asyncio.wait_for(
             wata_service.process_webhook_data(headers, raw, body, _bot),
             timeout=_WEBHOOK_TIMEOUT,
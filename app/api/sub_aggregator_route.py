@@ -18,8 +18,14 @@ Embedded sub-aggregator — GET /a/{token}.
     панели. LRU-границей MAX_CACHE_ENTRIES ограничена память.
   • pair-кеш: token→URLs, 1 час, чтобы не бить БД на каждый запрос.
   • singleflight: параллельные запросы одного token = 1 upstream fetch.
-Обновление подписки: бот после mutation зовёт clear_cache(token) —
+  • stale-while-revalidate: fresh истёк → stale-копия сразу + фоновый
+    refresh; горячие token'ы обновляются заранее (run_refresh_ahead).
+  • L2 (опционально, SUB_AGGREGATOR_REDIS_L2 + REDIS_URL): тот же body/pair
+    кеш в Redis (gzip), общий для воркеров/реплик и переживает рестарт.
+Обновление подписки: бот после mutation зовёт await clear_cache(token) —
 in-process, 0ms → следующий запрос клиента = свежие данные из панели.
+С L2 clear_cache ещё и публикует token в Redis pub/sub → остальные
+процессы чистят свой L1 (run_invalidation_listener).
 
 Нагрузка (см. tests/services/test_sub_aggregator_load.py): при hit-ratio
 >90% держит тысячи rps; узкое место — не агрегатор, а панель Remnawave.
@@ -28,6 +34,7 @@ from __future__ import annotations
 
 import asyncio
 import base64
+import gzip
 import json
 import logging
 import re
@@ -41,6 +48,7 @@ from fastapi.responses import PlainTextResponse
 
 import config
 import database
+from app.core import metrics
 
 logger = logging.getLogger(__name__)
 
@@ -75,9 +83,14 @@ def _upstream_ua() -> str:
 #                    status). DB SELECT только раз/час на token, не на
 #                    каждый request. При invalidate() чистим и его.
 #
-# LRU cap = 20 000 записей — при 20k активных подписок каждая ~30 KB body =
-# ~600 MB. Bound через OrderedDict.move_to_end + popitem(last=False) на
-# переполнении.
+# Body хранится gzip-сжатым (см. _compress): base64-список vless из
+# десятков почти одинаковых строк жмётся в 10–15 раз (~30 KB → ~2 KB).
+# Клиенту с Accept-Encoding: gzip отдаём сохранённые байты как есть,
+# остальным — распаковываем на лету.
+#
+# LRU cap = 100 000 записей — весь user base при ~2 KB сжатого body ≈
+# 200 MB. Bound через OrderedDict.move_to_end + popitem(last=False) на
+# переполнении. Фактический объём — cache_bytes в get_metrics_snapshot().
 #
 # Singleflight (in-flight dict) — параллельные запросы одного token
 # ждут одного и того же upstream fetch. Защищает панель от стадных
@@ -85,12 +98,13 @@ def _upstream_ua() -> str:
 FRESH_TTL = 15
 STALE_TTL = 24 * 3600
 PAIR_TTL = 3600
-MAX_CACHE_ENTRIES = 20_000
-MAX_PAIR_ENTRIES = 40_000
+MAX_CACHE_ENTRIES = 100_000
+MAX_PAIR_ENTRIES = 200_000
 
-# fresh_until, stale_until, body, headers — фрешность отделена от stale-версии.
-# После fresh_until истечения — запись всё ещё в кеше как «stale-copy».
-_cache: "OrderedDict[str, tuple[float, float, bytes, dict[str, str]]]" = OrderedDict()
+# fresh_until, stale_until, gzip(body), headers, raw_len — фрешность отделена
+# от stale-версии. После fresh_until истечения — запись всё ещё в кеше как
+# «stale-copy». raw_len — для учёта памяти (cache_raw_bytes).
+_cache: "OrderedDict[str, tuple[float, float, bytes, dict[str, str], int]]" = OrderedDict()
 
 # pair-mapping cache: token → (expires_ts, pair-dict|None). None = negative cache
 # (token не найден в БД) — избавляет от повторных DB-запросов при spamm'е случайных токенов.
@@ -101,6 +115,46 @@ NEG_PAIR_TTL = 60  # negative кеш (not-found) короче — вдруг т
 # Второй запрос на тот же token во время активного fetch — ждёт первого.
 _inflight: Dict[str, "asyncio.Future"] = {}
 
+# ── Stale-while-revalidate + refresh-ahead ─────────────────────────
+# SWR: fresh истёк, но копии < SWR_WINDOW после fresh_until → отдаём её
+# сразу (x-cache=stale) и обновляем в фоне. Панельная latency уходит с
+# пути клиента: почти все клиенты дёргают /a/ по таймеру (раз в час),
+# т.е. приходят уже после FRESH_TTL. Цена — body/userinfo может отставать
+# на один интервал опроса; mutation'ы бота всё равно идут через
+# clear_cache → следующий запрос синхронный. Старше окна (долго не
+# заходил) — синхронный fetch, как раньше. SWR_WINDOW = 0 → выключено.
+SWR_WINDOW = 2 * 3600
+
+# Refresh-ahead: счётчик обращений на token живёт рядом с LRU (чистится
+# вместе с записью). run_refresh_ahead() раз в REFRESH_AHEAD_INTERVAL
+# перекачивает самые горячие token'ы (≥ MIN_HITS за окно затухания) за
+# REFRESH_AHEAD_LEAD сек до истечения fresh — они вообще не видят stale.
+# Счётчики делятся пополам каждые REFRESH_AHEAD_DECAY сек, чтобы
+# «остывшие» token'ы выпадали и панель не качалась впустую.
+REFRESH_AHEAD_INTERVAL = 5
+REFRESH_AHEAD_LEAD = 5
+REFRESH_AHEAD_MIN_HITS = 4
+REFRESH_AHEAD_DECAY = 60
+REFRESH_AHEAD_BATCH = 50
+REFRESH_AHEAD_CONCURRENCY = 8
+_access_counts: Dict[str, int] = {}
+
+# Ссылки на fire-and-forget задачи (фоновые refresh, L2-инвалидация),
+# иначе GC может собрать незавершённую задачу.
+_bg_tasks: "set[asyncio.Task]" = set()
+
+
+def _spawn(coro) -> Optional["asyncio.Task"]:
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        coro.close()
+        return None
+    task = loop.create_task(coro)
+    _bg_tasks.add(task)
+    task.add_done_callback(_bg_tasks.discard)
+    return task
+
 # Метрики — периодически логируем + видно через /a/_metrics
 _metrics: Dict[str, int] = {
     "hits": 0, "misses": 0, "stale": 0,
@@ -111,9 +165,39 @@ _metrics: Dict[str, int] = {
     # p95/p99 в проде считаются через x-cache=miss логи (в них timestamp).
     "upstream_ms_sum": 0, "upstream_count": 0,
     "attack_alerts_sent": 0,
+    # L2 (Redis) — см. блок «L2: общий Redis-tier» ниже.
+    "l2_hits": 0, "l2_errors": 0,
+    # SWR-выдачи и фоновые обновления (по запросу / refresh-ahead).
+    "swr": 0, "bg_refresh_ok": 0, "bg_refresh_fail": 0, "refresh_ahead": 0,
 }
 
 
+def _prometheus_families():
+    """Те же счётчики для /metrics — читаются в момент scrape, не дублируются."""
+    m = _metrics
+    return [
+        ("sub_aggregator_requests", "counter", "Sub-aggregator requests by cache result.", [
+            ({"result": "hit"}, m.get("hits", 0) - m.get("l2_hits", 0)),
+            ({"result": "l2_hit"}, m.get("l2_hits", 0)),
+            ({"result": "swr"}, m.get("swr", 0)),
+            ({"result": "stale"}, m.get("stale", 0)),
+            ({"result": "miss"}, m.get("misses", 0)),
+            ({"result": "not_found"}, m.get("not_found", 0)),
+            ({"result": "revoked"}, m.get("revoked", 0)),
+        ]),
+        ("sub_aggregator_upstream", "counter", "Sub-aggregator upstream fetches by outcome.", [
+            ({"outcome": "ok"}, m.get("upstream_ok", 0)),
+            ({"outcome": "fail"}, m.get("upstream_fail", 0)),
+        ]),
+        ("sub_aggregator_cache_entries", "gauge", "Sub-aggregator L1 body cache entries.", [
+            ({}, len(_cache)),
+        ]),
+    ]
+
+
+metrics.register_collector(_prometheus_families)
+
+
 # ── Attack detector ─────────────────────────────────────────────────
 # Скользящее 60-сек окно считает «плохие» события: not_found (флуд
 # случайных tokens) и upstream_fail (панель гасят / упала). При пробитии
@@ -155,13 +239,19 @@ def _fire_attack_alert(*, kind: str, count: int) -> None:
         if bot is None:
             return
         _metrics["attack_alerts_sent"] += 1
+        cache_bytes, _ = _cache_memory()
+        mem_line = (
+            f"Кеш: {len(_cache)} body / {cache_bytes / 1_048_576:.1f} MB "
+            f"(cap {MAX_CACHE_ENTRIES}).\n"
+        )
         if kind == "not_found":
             msg = (
                 f"🚨 <b>Sub-aggregator: подозрительный флуд</b>\n\n"
                 f"За последнюю минуту: <b>{count}+</b> запросов с несуществующим token.\n"
                 f"Возможно — random-token DoS.\n\n"
                 f"Проверить: <code>curl https://api.atlassecure.ru/a/_metrics</code>\n"
-                f"Порог: {ATTACK_NOT_FOUND_THRESHOLD}/мин.\n\n"
+                f"Порог: {ATTACK_NOT_FOUND_THRESHOLD}/мин.\n"
+                f"{mem_line}\n"
                 f"Действие: включить Cloudflare proxied:true, если продолжится."
             )
         else:
@@ -169,7 +259,8 @@ def _fire_attack_alert(*, kind: str, count: int) -> None:
                 f"🚨 <b>Sub-aggregator: массовые upstream fails</b>\n\n"
                 f"За последнюю минуту: <b>{count}+</b> фейлов запроса к панели.\n"
                 f"Возможно — панель Remnawave тупит / упала / сеть.\n\n"
-                f"Порог: {ATTACK_UPSTREAM_FAIL_THRESHOLD}/мин.\n\n"
+                f"Порог: {ATTACK_UPSTREAM_FAIL_THRESHOLD}/мин.\n"
+                f"{mem_line}\n"
                 f"Юзеры получают stale-cache — 503 не видят первые 24 часа."
             )
         from app.services.admin_alerts import send_alert
@@ -178,42 +269,80 @@ def _fire_attack_alert(*, kind: str, count: int) -> None:
         logger.warning("SUB_AGG_ATTACK_ALERT_FAIL: %s", e)
 
 
-def _cache_get(token: str) -> tuple[Optional[bytes], Optional[dict], str]:
-    """Fetch cached entry.
-    Returns (body, headers, state):
-      state = 'fresh'   → отдать мгновенно
-      state = 'stale'   → отдать если апстрим упал, иначе refresh
-      state = 'miss'    → в кеше нет вообще
-    """
+def _compress(body: bytes) -> bytes:
+    # mtime=0 → детерминированный gzip (одинаковое тело = одинаковые байты).
+    # Именно gzip-фрейм (а не голый zlib) — чтобы отдавать как
+    # Content-Encoding: gzip без перепаковки.
+    return gzip.compress(body, compresslevel=6, mtime=0)
+
+
+def _decompress(blob: bytes) -> bytes:
+    return gzip.decompress(blob)
+
+
+def _cache_lookup(token: str) -> tuple[Optional[bytes], Optional[dict], str]:
+    """Как _cache_get, но отдаёт сохранённый gzip-блоб без распаковки."""
     entry = _cache.get(token)
     if entry is None:
         return None, None, "miss"
-    fresh_until, stale_until, body, headers = entry
+    fresh_until, stale_until, gz, headers, _raw_len = entry
     now = time.monotonic()
     if now < fresh_until:
         _cache.move_to_end(token)  # LRU touch
-        return body, headers, "fresh"
+        return gz, headers, "fresh"
     if now < stale_until:
-        return body, headers, "stale"
+        return gz, headers, "stale"
     # Полностью expired — удаляем.
     _cache.pop(token, None)
+    _access_counts.pop(token, None)
     return None, None, "miss"
 
 
-def _cache_put(token: str, body: bytes, headers: dict, fresh_ttl: float, stale_ttl: float) -> None:
-    """Единая запись в кеш с LRU-границей. Используется и для обычных
-    ответов (_cache_set), и для revoked-заглушки — чтобы rev-записи тоже
-    считались в MAX_CACHE_ENTRIES и не текла память."""
+def _cache_get(token: str) -> tuple[Optional[bytes], Optional[dict], str]:
+    """Fetch cached entry.
+    Returns (body, headers, state):
+      state = 'fresh'   → отдать мгновенно
+      state = 'stale'   → отдать если апстрим упал, иначе refresh
+      state = 'miss'    → в кеше нет вообще
+    """
+    gz, headers, state = _cache_lookup(token)
+    if gz is None:
+        return None, None, state
+    return _decompress(gz), headers, state
+
+
+def _cache_put_gz(
+    token: str, gz: bytes, raw_len: int, headers: dict, fresh_ttl: float, stale_ttl: float,
+) -> None:
     now = time.monotonic()
-    _cache[token] = (now + fresh_ttl, now + stale_ttl, body, dict(headers))
+    _cache[token] = (now + fresh_ttl, now + stale_ttl, gz, dict(headers), raw_len)
     _cache.move_to_end(token)
     while len(_cache) > MAX_CACHE_ENTRIES:
-        _cache.popitem(last=False)
+        evicted, _ = _cache.popitem(last=False)
+        _access_counts.pop(evicted, None)
 
 
-def _cache_set(token: str, body: bytes, headers: dict) -> None:
+def _cache_put(token: str, body: bytes, headers: dict, fresh_ttl: float, stale_ttl: float) -> bytes:
+    """Единая запись в кеш с LRU-границей. Используется и для обычных
+    ответов (_cache_set), и для revoked-заглушки — чтобы rev-записи тоже
+    считались в MAX_CACHE_ENTRIES и не текла память. Возвращает gzip-блоб."""
+    gz = _compress(body)
+    _cache_put_gz(token, gz, len(body), headers, fresh_ttl, stale_ttl)
+    return gz
+
+
+def _cache_set(token: str, body: bytes, headers: dict) -> bytes:
     """Обычный ответ: fresh 15s + stale 24h."""
-    _cache_put(token, body, headers, FRESH_TTL, STALE_TTL)
+    return _cache_put(token, body, headers, FRESH_TTL, STALE_TTL)
+
+
+def _cache_memory() -> tuple[int, int]:
+    """(сжатые байты body, исходные байты body) по всему L1 — O(n), только для метрик."""
+    stored = raw = 0
+    for entry in _cache.values():
+        stored += len(entry[2])
+        raw += entry[4]
+    return stored, raw
 
 
 def _pair_get(token: str) -> tuple[Optional[dict], bool]:
@@ -240,15 +369,197 @@ def _pair_set(token: str, pair: Optional[dict]) -> None:
         _pair_cache.popitem(last=False)
 
 
-def clear_cache(token: Optional[str] = None) -> None:
-    """Прямой in-process сброс кеша (fresh+stale+pair) по token.
-    None → полный wipe (админский рычаг). Экспортится для sub_aggregator.py:invalidate."""
+def _clear_local(token: Optional[str]) -> None:
     if token is None:
         _cache.clear()
         _pair_cache.clear()
+        _access_counts.clear()
         return
     _cache.pop(token, None)
     _pair_cache.pop(token, None)
+    _access_counts.pop(token, None)
+
+
+async def clear_cache(token: Optional[str] = None) -> None:
+    """Прямой in-process сброс кеша (fresh+stale+pair) по token.
+    None → полный wipe (админский рычаг). Экспортится для sub_aggregator.py:invalidate.
+
+    С включённым L2 дополнительно удаляет Redis-ключи и публикует token в
+    SUB_AGG_INVALIDATE_CHANNEL — остальные воркеры/реплики чистят свой L1
+    в run_invalidation_listener(). DEL ждём до возврата: иначе запрос,
+    пришедший сразу после mutation, поднял бы старую L2-запись в L1."""
+    _clear_local(token)
+    if not _l2_enabled():
+        return
+    await _l2_invalidate(token)
+    # Запрос, успевший прочитать L2 до DEL, мог вернуть старое тело в L1.
+    _clear_local(token)
+
+
+# ── L2: общий Redis-tier ────────────────────────────────────────────
+# L1 (_cache/_pair_cache выше) — per-process. Каждый uvicorn-воркер /
+# реплика грела свою копию, а рестарт выбрасывал 24h stale-страховку →
+# после деплоя при упавшей панели юзеры ловили 503, а при живой — все
+# токены разом шли в панель (thundering herd).
+#
+# L2 в Redis (config.SUB_AGGREGATOR_REDIS_L2 + REDIS_URL):
+#   subagg:body:{token} → JSON {b: base64(gzip(body)), n: len(body), h: headers,
+#                               fu: fresh_until, su: stale_until} (wall-clock),
+#                         Redis TTL = STALE_TTL
+#   subagg:pair:{token} → JSON pair-dict, TTL = PAIR_TTL (negative — только L1)
+# Порядок чтения: L1 → L2 → БД/панель. Ошибки Redis = L2 miss, никогда не 5xx.
+# Инвалидация: DEL ключей + PUBLISH token ("*" = полный wipe).
+_L2_BODY_PREFIX = "subagg:body:"
+_L2_PAIR_PREFIX = "subagg:pair:"
+SUB_AGG_INVALIDATE_CHANNEL = "subagg:invalidate"
+_L2_WIPE_ALL = "*"
+
+
+def _l2_enabled() -> bool:
+    if not getattr(config, "SUB_AGGREGATOR_REDIS_L2", False):
+        return False
+    return bool(getattr(config, "REDIS_URL", ""))
+
+
+async def _l2_redis():
+    if not _l2_enabled():
+        return None
+    try:
+        from app.utils.redis_client import get_redis
+        return await get_redis()
+    except Exception:
+        return None
+
+
+async def _l2_get(token: str) -> tuple[Optional[bytes], Optional[dict], str]:
+    """Как _cache_lookup (gzip-блоб), но из Redis. Хит прогревает L1 с
+    оставшимися TTL."""
+    r = await _l2_redis()
+    if r is None:
+        return None, None, "miss"
+    try:
+        raw = await r.get(_L2_BODY_PREFIX + token)
+        if not raw:
+            return None, None, "miss"
+        entry = json.loads(raw)
+        gz = base64.b64decode(entry["b"])
+        raw_len = int(entry.get("n", 0))
+        headers = dict(entry["h"])
+        fresh_left = float(entry["fu"]) - time.time()
+        stale_left = float(entry["su"]) - time.time()
+    except Exception as e:
+        _metrics["l2_errors"] += 1
+        logger.debug("SUB_AGG_L2_GET_FAIL token=%s... err=%s", token[:6], e)
+        return None, None, "miss"
+    if stale_left <= 0:
+        return None, None, "miss"
+    if fresh_left > 0 or token not in _cache:
+        # Stale из L2 не затирает свою (возможно более новую) stale-копию L1.
+        _cache_put_gz(token, gz, raw_len, headers, max(fresh_left, 0.0), stale_left)
+    return gz, headers, ("fresh" if fresh_left > 0 else "stale")
+
+
+async def _l2_put(token: str, gz: bytes, raw_len: int, headers: dict) -> None:
+    """Кладёт уже сжатый L1-блоб — без повторного gzip."""
+    r = await _l2_redis()
+    if r is None:
+        return
+    now = time.time()
+    entry = {
+        "b": base64.b64encode(gz).decode("ascii"),
+        "n": raw_len,
+        "h": headers,
+        "fu": now + FRESH_TTL,
+        "su": now + STALE_TTL,
+    }
+    try:
+        await r.set(_L2_BODY_PREFIX + token, json.dumps(entry), ex=STALE_TTL)
+    except Exception as e:
+        _metrics["l2_errors"] += 1
+        logger.debug("SUB_AGG_L2_PUT_FAIL token=%s... err=%s", token[:6], e)
+
+
+async def _l2_pair_get(token: str) -> Optional[dict]:
+    r = await _l2_redis()
+    if r is None:
+        return None
+    try:
+        raw = await r.get(_L2_PAIR_PREFIX + token)
+        return json.loads(raw) if raw else None
+    except Exception as e:
+        _metrics["l2_errors"] += 1
+        logger.debug("SUB_AGG_L2_PAIR_GET_FAIL token=%s... err=%s", token[:6], e)
+        return None
+
+
+async def _l2_pair_put(token: str, pair: dict) -> None:
+    r = await _l2_redis()
+    if r is None:
+        return
+    try:
+        await r.set(_L2_PAIR_PREFIX + token, json.dumps(pair, default=str), ex=PAIR_TTL)
+    except Exception as e:
+        _metrics["l2_errors"] += 1
+        logger.debug("SUB_AGG_L2_PAIR_PUT_FAIL token=%s... err=%s", token[:6], e)
+
+
+async def _l2_invalidate(token: Optional[str]) -> None:
+    """DEL L2-ключей + PUBLISH, чтобы остальные процессы сбросили свой L1."""
+    r = await _l2_redis()
+    if r is None:
+        return
+    try:
+        if token is None:
+            keys = [k async for k in r.scan_iter(match="subagg:*:*", count=1000)]
+            for i in range(0, len(keys), 500):
+                await r.delete(*keys[i:i + 500])
+            await r.publish(SUB_AGG_INVALIDATE_CHANNEL, _L2_WIPE_ALL)
+        else:
+            await r.delete(_L2_BODY_PREFIX + token, _L2_PAIR_PREFIX + token)
+            await r.publish(SUB_AGG_INVALIDATE_CHANNEL, token)
+    except Exception as e:
+        _metrics["l2_errors"] += 1
+        logger.warning("SUB_AGG_L2_INVALIDATE_FAIL token=%s err=%s", (token or "*")[:6], e)
+
+
+def _handle_invalidation_message(data: Any) -> None:
+    if not isinstance(data, str) or not data:
+        return
+    if data == _L2_WIPE_ALL:
+        _clear_local(None)
+    elif _TOKEN_RE.match(data):
+        _clear_local(data)
+
+
+async def run_invalidation_listener() -> None:
+    """Long-lived: слушает SUB_AGG_INVALIDATE_CHANNEL и чистит L1 этого процесса.
+    Отдельное pub/sub-соединение без socket_timeout — тишина в канале не
+    ошибка. Redis-обрыв → переподключение через 5 сек (L1 TTL 15s страхует окно)."""
+    if not _l2_enabled():
+        return
+    from app.utils.redis_client import get_pubsub_redis, iter_pubsub_messages
+    while True:
+        pubsub = None
+        try:
+            r = await get_pubsub_redis()
+            if r is None:
+                raise RuntimeError("redis pub/sub client unavailable")
+            pubsub = r.pubsub()
+            await pubsub.subscribe(SUB_AGG_INVALIDATE_CHANNEL)
+            logger.info("SUB_AGG_L2_LISTENER subscribed channel=%s", SUB_AGG_INVALIDATE_CHANNEL)
+            async for data in iter_pubsub_messages(pubsub):
+                _handle_invalidation_message(data)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning("SUB_AGG_L2_LISTENER_ERROR err=%s — reconnect in 5s", e)
+        finally:
+            if pubsub is not None:
+                try:
+                    await pubsub.aclose()
+                except Exception:
+                    pass
+        await asyncio.sleep(5)
 
 # Клиенты подписываются с интервалом. profile-update-interval — часы;
 # Happ/v2rayTun/Streisand дёргают апстрим раз в N часов. 1 час = свежие
@@ -380,6 +691,10 @@ async def _load_pair(token: str) -> Optional[dict]:
     cached, is_cached = _pair_get(token)
     if is_cached:
         return cached  # dict | None
+    shared = await _l2_pair_get(token)
+    if shared is not None:
+        _pair_set(token, shared)
+        return shared
     pool = await database.get_pool()
     if pool is None:
         return None
@@ -390,6 +705,8 @@ async def _load_pair(token: str) -> Optional[dict]:
         )
     pair = dict(row) if row else None
     _pair_set(token, pair)
+    if pair:
+        await _l2_pair_put(token, pair)
     return pair
 
 
@@ -535,6 +852,92 @@ async def _fetch_singleflight(token: str, pair: dict, ua: str) -> tuple[Optional
         _inflight.pop(token, None)
 
 
+async def _refresh_token(token: str, pair: Optional[dict] = None, ua: str = "refresh-ahead") -> bool:
+    """Фоновое обновление body одного token (SWR / refresh-ahead).
+    Ошибки не пробрасывает: stale-копия остаётся как была."""
+    try:
+        if pair is None:
+            pair = await _load_pair(token)
+        if not pair or pair.get("status") == "revoked":
+            return False
+        body_bytes, headers = await _fetch_singleflight(token, pair, ua)
+    except Exception as e:
+        _metrics["bg_refresh_fail"] += 1
+        logger.warning("SUB_AGG_BG_REFRESH_FAIL token=%s... err=%s", token[:6], e)
+        return False
+    if body_bytes is None or headers is None:
+        _metrics["bg_refresh_fail"] += 1
+        return False
+    gz = _cache_set(token, body_bytes, headers)
+    await _l2_put(token, gz, len(body_bytes), headers)
+    _metrics["bg_refresh_ok"] += 1
+    return True
+
+
+def _swr_eligible(token: str) -> bool:
+    """stale-копия моложе SWR_WINDOW (считая от истечения fresh)."""
+    entry = _cache.get(token)
+    if entry is None or SWR_WINDOW <= 0:
+        return False
+    return time.monotonic() - entry[0] < SWR_WINDOW
+
+
+def _refresh_ahead_candidates(now: float) -> list[str]:
+    """Горячие token'ы, у которых fresh истекает в ближайшие REFRESH_AHEAD_LEAD сек."""
+    hot = []
+    for token, count in _access_counts.items():
+        if count < REFRESH_AHEAD_MIN_HITS or token in _inflight:
+            continue
+        entry = _cache.get(token)
+        if entry is None or entry[0] - now > REFRESH_AHEAD_LEAD:
+            continue
+        hot.append((count, token))
+    hot.sort(reverse=True)
+    return [token for _, token in hot[:REFRESH_AHEAD_BATCH]]
+
+
+def _decay_access_counts() -> None:
+    for token in list(_access_counts):
+        halved = _access_counts[token] // 2
+        if halved:
+            _access_counts[token] = halved
+        else:
+            del _access_counts[token]
+
+
+async def refresh_ahead_tick(now: Optional[float] = None) -> int:
+    """Один проход refresh-ahead. Возвращает число обновлённых token'ов."""
+    tokens = _refresh_ahead_candidates(time.monotonic() if now is None else now)
+    if not tokens:
+        return 0
+    sem = asyncio.Semaphore(REFRESH_AHEAD_CONCURRENCY)
+
+    async def _one(token: str) -> bool:
+        async with sem:
+            return await _refresh_token(token)
+
+    results = await asyncio.gather(*(_one(t) for t in tokens))
+    done = sum(1 for ok in results if ok)
+    _metrics["refresh_ahead"] += done
+    return done
+
+
+async def run_refresh_ahead() -> None:
+    """Long-lived: refresh-ahead горячих token'ов + затухание счётчиков."""
+    if not getattr(config, "SUB_AGGREGATOR_REFRESH_AHEAD", True):
+        return
+    last_decay = time.monotonic()
+    while True:
+        await asyncio.sleep(REFRESH_AHEAD_INTERVAL)
+        try:
+            await refresh_ahead_tick()
+        except Exception as e:
+            logger.warning("SUB_AGG_REFRESH_AHEAD_ERROR err=%s", e)
+        if time.monotonic() - last_decay >= REFRESH_AHEAD_DECAY:
+            _decay_access_counts()
+            last_decay = time.monotonic()
+
+
 @router.get("/a/{token}")
 async def aggregate(
     request: Request,
@@ -543,6 +946,8 @@ async def aggregate(
     """GET /a/{token} — production merge premium+bypass subscriptions.
 
     Fast path (95% в проде): fresh cache hit → <5ms, ноль работы.
+    SWR path: fresh истёк, копия моложе SWR_WINDOW → отдаём её сразу,
+    обновляем в фоне (_refresh_token).
     Cold path: singleflight → 1 пара upstream GET на все параллельные запросы.
     Failure path: если апстрим упал — stale-copy (до 24 часов) → юзер не
     получит 503 при недолгом падении панели.
@@ -551,7 +956,7 @@ async def aggregate(
       1. FRESH_TTL=15s  → hit → мгновенно
       2. STALE_TTL=24h  → упал апстрим → отдаём последнее известное
       3. PAIR_TTL=1h    → DB SELECT только раз/час на token
-      4. LRU cap=20k    → bounded memory
+      4. LRU cap=100k   → bounded memory (gzip body)
     """
     if not _TOKEN_RE.match(token):
         _metrics["not_found"] += 1
@@ -561,10 +966,18 @@ async def aggregate(
     ua_early = request.headers.get("user-agent", "")
 
     # ── 1. Fresh cache hit ─────────────────────────────────────────
-    body_bytes, headers, state = _cache_get(token)
+    gz, headers, state = _cache_lookup(token)
     if state == "fresh":
         _metrics["hits"] += 1
-        return _make_response(request, ua_early, token, body_bytes, headers, "hit")
+        return _make_response(request, ua_early, token, None, headers, "hit", gz=gz)
+
+    # ── 1b. Shared L2 (Redis) — соседний воркер / до рестарта ──────
+    if _l2_enabled():
+        l2_gz, l2_headers, l2_state = await _l2_get(token)
+        if l2_state == "fresh":
+            _metrics["hits"] += 1
+            _metrics["l2_hits"] += 1
+            return _make_response(request, ua_early, token, None, l2_headers, "hit", gz=l2_gz)
 
     # ── 2. Load pair (with pair-cache — DB touch раз/час на token) ─
     pair = await _load_pair(token)
@@ -589,11 +1002,20 @@ async def aggregate(
         }
         # Короткий TTL — юзер может тут же активировать доступ. Через _cache_put
         # → тоже под LRU-границей.
-        _cache_put(token, body_bytes, headers, 10, 60)
-        return _make_response(request, ua_early, token, body_bytes, headers, "miss")
+        gz = _cache_put(token, body_bytes, headers, 10, 60)
+        return _make_response(request, ua_early, token, body_bytes, headers, "miss", gz=gz)
 
-    # ── 4. Fetch (singleflight) ────────────────────────────────────
     ua = ua_early or "Aggregator/1.0"
+
+    # ── 3b. Stale-while-revalidate ─────────────────────────────────
+    swr_gz, swr_headers, swr_state = _cache_lookup(token)
+    if swr_state == "stale" and swr_gz is not None and _swr_eligible(token):
+        _metrics["swr"] += 1
+        if token not in _inflight:
+            _spawn(_refresh_token(token, pair, ua))
+        return _make_response(request, ua_early, token, None, swr_headers, "stale", gz=swr_gz)
+
+    # ── 4. Fetch (singleflight) ────────────────────────────────────
     try:
         body_bytes, headers = await _fetch_singleflight(token, pair, ua)
     except Exception as e:
@@ -602,20 +1024,21 @@ async def aggregate(
 
     # ── 5. Success → cache and respond ─────────────────────────────
     if body_bytes is not None and headers is not None:
-        _cache_set(token, body_bytes, headers)
+        gz = _cache_set(token, body_bytes, headers)
+        await _l2_put(token, gz, len(body_bytes), headers)
         _metrics["misses"] += 1
-        return _make_response(request, ua_early, token, body_bytes, headers, "miss")
+        return _make_response(request, ua_early, token, body_bytes, headers, "miss", gz=gz)
 
     # ── 6. Upstream failure → stale fallback ───────────────────────
-    stale_body, stale_headers, stale_state = _cache_get(token)
-    if stale_body is not None and stale_headers is not None and stale_state == "stale":
+    stale_gz, stale_headers, stale_state = _cache_lookup(token)
+    if stale_gz is not None and stale_headers is not None and stale_state == "stale":
         _metrics["stale"] += 1
         logger.warning(
             "SUB_AGG_STALE_SERVED token=%s... — оба апстрима упали, "
             "отдаём последнюю копию из stale-tier",
             token[:6],
         )
-        return _make_response(request, ua_early, token, stale_body, stale_headers, "stale")
+        return _make_response(request, ua_early, token, None, stale_headers, "stale", gz=stale_gz)
 
     # ── 7. No stale → 503 с retry-after (панель полностью down + мы cold) ──
     logger.error("SUB_AGG_BOTH_UPSTREAMS_FAIL_NO_STALE token=%s...", token[:6])
@@ -626,22 +1049,44 @@ async def aggregate(
     )
 
 
+def _accepts_gzip(request: Request) -> bool:
+    """Accept-Encoding содержит gzip (и не с q=0)."""
+    for part in (request.headers.get("accept-encoding", "") or "").lower().split(","):
+        coding, _, params = part.strip().partition(";")
+        if coding.strip() in ("gzip", "*"):
+            q = params.strip()
+            return not (q.startswith("q=") and q[2:].strip() in ("0", "0.0", "0.00", "0.000"))
+    return False
+
+
 def _make_response(
     request: Request,
     ua: str,
     token: str,
-    body_bytes: bytes,
+    body_bytes: Optional[bytes],
     headers: dict,
     cache_state: str,
+    gz: Optional[bytes] = None,
 ) -> Response:
     """Любой запрос (браузер или VPN-клиент) получает сырую base64-подписку.
     ВСЕГДА text/plain: мы качаем панель фикс-UA → всегда base64, а base64
     как text/plain едят все клиенты. Панельный application/json (Happ-UA)
-    сюда не долетает — не пробрасываем."""
+    сюда не долетает — не пробрасываем.
+
+    gz — сохранённый в кеше gzip-блоб: клиенту с Accept-Encoding: gzip
+    уходит как есть (Content-Encoding: gzip), остальным — распакованный."""
+    if token in _cache:
+        _access_counts[token] = _access_counts.get(token, 0) + 1  # refresh-ahead
+    out_headers = {**headers, "x-cache": cache_state, "vary": "Accept-Encoding"}
+    if gz is not None and _accepts_gzip(request):
+        out_headers["content-encoding"] = "gzip"
+        content = gz
+    else:
+        content = body_bytes if body_bytes is not None else _decompress(gz or b"")
     return Response(
-        content=body_bytes,
+        content=content,
         media_type="text/plain; charset=utf-8",
-        headers={**headers, "x-cache": cache_state},
+        headers=out_headers,
     )
 
 
@@ -662,7 +1107,7 @@ async def invalidate_cache(
     if not _TOKEN_RE.match(token):
         return PlainTextResponse("Bad token", status_code=400)
     # Чистим и body-кеш, И pair-кеш (иначе старые sub-URL живут до PAIR_TTL).
-    clear_cache(token)
+    await clear_cache(token)
     return Response(content=b'{"ok":true}', media_type="application/json")
 
 
@@ -675,11 +1120,16 @@ def get_metrics_snapshot() -> dict:
         round(_metrics["upstream_ms_sum"] / _metrics["upstream_count"], 1)
         if _metrics["upstream_count"] > 0 else 0
     )
+    cache_bytes, cache_raw_bytes = _cache_memory()
     return {
         **_metrics,
         "cache_size": len(_cache),
+        "cache_bytes": cache_bytes,
+        "cache_raw_bytes": cache_raw_bytes,
+        "compression_ratio": round(cache_raw_bytes / cache_bytes, 1) if cache_bytes else 0,
         "pair_cache_size": len(_pair_cache),
         "inflight_size": len(_inflight),
+        "hot_tokens": sum(1 for c in _access_counts.values() if c >= REFRESH_AHEAD_MIN_HITS),
         "hit_ratio": hit_ratio,
         "avg_upstream_ms": avg_upstream_ms,
     }
@@ -705,4 +1155,11 @@ async def close() -> None:
             _client = None
 
 
-__all__ = ["router", "close", "clear_cache", "get_metrics_snapshot"]
+__all__ = [
+    "router",
+    "close",
+    "clear_cache",
+    "get_metrics_snapshot",
+    "run_invalidation_listener",
+    "run_refresh_ahead",
+]
@@ -1,6 +1,13 @@
 """
 Telegram webhook endpoint.
 Receives updates from Telegram and feeds them to aiogram Dispatcher.
+
+By default (config.TELEGRAM_UPDATE_QUEUE = "off") handlers run inline
+within the request (25s cap), so an update lost to a crash is redelivered
+by Telegram. Opt-in "redis" | "memory": the update is only validated here
+and queued (app/core/update_queue); the request returns 200 right away
+and handlers run on the per-user ordered worker pool. Only "redis" keeps
+acked updates across a crash or redeploy.
 """
 import asyncio
 import hmac
@@ -17,6 +24,7 @@ router = APIRouter()
 # Bot and Dispatcher are set from main.py at startup
 _bot = None
 _dp = None
+_ingestor = None
 
 # Liveness heartbeat — updated on every authenticated Telegram update.
 # Imported by main.py watchdog to track "last sign of life from Telegram".
@@ -29,6 +37,48 @@ def setup(bot, dp):
     _dp = dp
 
 
+async def _process_update(update: Update) -> None:
+    await _dp.feed_webhook_update(_bot, update)
+
+
+async def start_ingestion() -> None:
+    """Start the update queue workers (main.py, before uvicorn)."""
+    global _ingestor
+    backend = config.TELEGRAM_UPDATE_QUEUE
+    if backend in ("", "off", "inline"):
+        logger.info("UPDATE_QUEUE=off — handlers run inside the webhook request")
+        return
+    if backend == "redis" and not config.REDIS_URL:
+        logger.warning("TELEGRAM_UPDATE_QUEUE=redis but REDIS_URL is empty — handling inline")
+        return
+    if backend not in ("memory", "redis"):
+        logger.warning("TELEGRAM_UPDATE_QUEUE=%r unknown — handling inline", backend)
+        return
+    if backend == "memory":
+        logger.warning(
+            "UPDATE_QUEUE=memory — updates are acked before handling and are lost on crash/redeploy"
+        )
+    from app.core.update_queue import UpdateIngestor
+    _ingestor = UpdateIngestor(
+        _process_update,
+        Update.model_validate,
+        backend=backend,
+        workers=config.TELEGRAM_UPDATE_WORKERS,
+        max_pending=config.TELEGRAM_UPDATE_QUEUE_MAX,
+        timeout=config.TELEGRAM_UPDATE_TIMEOUT,
+    )
+    await _ingestor.start()
+
+
+async def stop_ingestion(drain_timeout: float = 10.0) -> None:
+    """Let queued updates finish (shutdown: after the HTTP server stopped,
+    before background tasks such as the last_seen flush are cancelled)."""
+    global _ingestor
+    ingestor, _ingestor = _ingestor, None
+    if ingestor is not None:
+        await ingestor.stop(drain_timeout)
+
+
 @router.post("/telegram/webhook")
 async def telegram_webhook(
     request: Request,
@@ -73,6 +123,17 @@ async def telegram_webhook(
         )
         return Response(status_code=400)
 
+    if _ingestor is not None:
+        try:
+            body = await request.json()
+            if not await _ingestor.ingest(body):
+                # Очередь полна — 503, Telegram доставит апдейт повторно.
+                return Response(status_code=503)
+        except Exception as e:
+            logger.error("WEBHOOK_PROCESSING_ERROR error=%s", e)
+            # Return 200 anyway — prevents Telegram from retrying a bad update
+        return Response(status_code=200)
+
     # Parse and feed update to aiogram with timeout
     try:
         body = await request.json()
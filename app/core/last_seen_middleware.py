@@ -5,18 +5,89 @@ Used by the Farm storm mechanic: at storm execution we need to know
 whether the user actually saw the 24h warning, and "saw it" boils down
 to "had any activity in the bot after announced_at".
 
-Fire-and-forget — must never block or fail the surrounding handler.
+Writes are coalesced: the middleware only records the latest timestamp
+per user in LastSeenBuffer, and the buffer flushes everything with one
+`UPDATE ... FROM unnest()` every LAST_SEEN_FLUSH_INTERVAL seconds (or
+earlier once LAST_SEEN_FLUSH_MAX_PENDING users are pending). Storm
+semantics need only second-level accuracy, so a few seconds of delay
+is fine and saves one UPDATE per message on the hot users table.
+
+Never blocks or fails the surrounding handler.
 """
 import asyncio
 import logging
-from typing import Any, Awaitable, Callable, Dict
+from datetime import datetime, timezone
+from typing import Any, Awaitable, Callable, Dict, Optional
 
 from aiogram import BaseMiddleware
 from aiogram.types import CallbackQuery, Message
 
+import config
+
 logger = logging.getLogger(__name__)
 
 
+class LastSeenBuffer:
+    """In-memory telegram_id → latest touch, flushed in bulk."""
+
+    def __init__(self, flush_interval: float, max_pending: int) -> None:
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self._pending: Dict[int, datetime] = {}
+        self._flush_lock: Optional[asyncio.Lock] = None
+        self._early_flush: Optional[asyncio.Task] = None
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def touch(self, telegram_id: int, at: Optional[datetime] = None) -> None:
+        self._pending[telegram_id] = at or datetime.now(timezone.utc)
+        if len(self._pending) >= self.max_pending and (
+            self._early_flush is None or self._early_flush.done()
+        ):
+            try:
+                self._early_flush = asyncio.get_running_loop().create_task(self.flush())
+            except RuntimeError:
+                pass  # no loop (sync context) — periodic flush picks it up
+
+    async def flush(self) -> int:
+        """Write all pending touches with one UPDATE. Returns users written."""
+        if self._flush_lock is None:
+            self._flush_lock = asyncio.Lock()
+        async with self._flush_lock:
+            if not self._pending:
+                return 0
+            batch, self._pending = self._pending, {}
+            try:
+                import database
+                return await database.touch_last_seen_bulk(batch)
+            except Exception as e:
+                # Вернуть в буфер, не затирая более свежие touch'и.
+                for tid, ts in batch.items():
+                    if tid not in self._pending:
+                        self._pending[tid] = ts
+                logger.warning(
+                    "last_seen flush failed users=%s err=%s", len(batch), type(e).__name__,
+                )
+                return 0
+
+    async def run(self) -> None:
+        """Periodic flusher; final flush on cancellation (shutdown)."""
+        try:
+            while True:
+                await asyncio.sleep(self.flush_interval)
+                await self.flush()
+        except asyncio.CancelledError:
+            await asyncio.shield(self.flush())
+            raise
+
+
+last_seen_buffer = LastSeenBuffer(
+    flush_interval=config.LAST_SEEN_FLUSH_INTERVAL,
+    max_pending=config.LAST_SEEN_FLUSH_MAX_PENDING,
+)
+
+
 class LastSeenMiddleware(BaseMiddleware):
     async def __call__(
         self,
@@ -29,11 +100,9 @@ class LastSeenMiddleware(BaseMiddleware):
             telegram_id = event.from_user.id
 
         if telegram_id is not None:
-            # Fire-and-forget — never await, never block the handler.
             try:
-                import database
-                asyncio.create_task(database.touch_last_seen(telegram_id))
+                last_seen_buffer.touch(telegram_id)
             except Exception as e:
-                logger.warning("last_seen scheduling failed: %s", type(e).__name__)
+                logger.warning("last_seen buffering failed: %s", type(e).__name__)
 
         return await handler(event, data)
@@ -0,0 +1,304 @@
+"""
+In-process Prometheus metrics (text exposition format 0.0.4).
+
+No prometheus_client dependency: counters and histograms are plain dicts
+keyed by label tuple, updated inline from hot paths (a dict lookup, a
+bisect and a few float adds per observation — no locks, single event
+loop). Values that already live elsewhere (DB/Redis pool sizes,
+sub-aggregator cache counters) are read at scrape time through
+register_collector() instead of being mirrored on every call.
+
+Exposed via GET /metrics (app/api/metrics_route.py) when
+config.METRICS_ENABLED. Label values must stay low-cardinality: router
+module names, Telegram method names, normalized Remnawave endpoints,
+worker names — never telegram_id or tokens.
+
+Usage:
+    from app.core import metrics
+    metrics.TELEGRAM_API_SECONDS.observe(elapsed, method="SendMessage")
+    async with metrics.worker_iteration("remnawave_outbox") as it:
+        it.items = await dispatch_once()
+"""
+import asyncio
+import bisect
+import contextlib
+import logging
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+import config
+
+logger = logging.getLogger(__name__)
+
+PREFIX = "atlas_"
+
+# Секунды. Покрывают и acquire пула (ms), и медленную панель (десятки сек).
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+WORKER_BUCKETS = (0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0)
+
+# (name, type, help, [(labels dict, value)])
+Family = Tuple[str, str, str, List[Tuple[Dict[str, str], float]]]
+
+_metrics: List["_Metric"] = []
+_collectors: List[Callable[[], Iterable[Family]]] = []
+
+
+def enabled() -> bool:
+    return bool(getattr(config, "METRICS_ENABLED", False))
+
+
+class _Metric:
+    type_name = ""
+
+    def __init__(self, name: str, help_text: str, labelnames: Tuple[str, ...] = ()) -> None:
+        self.name = PREFIX + name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], Any] = {}
+        _metrics.append(self)
+
+    def _key(self, labels: Dict[str, Any]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(n, "")) for n in self.labelnames)
+
+    def _labels(self, key: Tuple[str, ...]) -> Dict[str, str]:
+        return dict(zip(self.labelnames, key))
+
+    def reset(self) -> None:
+        self._values.clear()
+
+
+class Counter(_Metric):
+    type_name = "counter"
+
+    def inc(self, amount: float = 1.0, **labels: Any) -> None:
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels: Any) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def samples(self) -> Iterable[Tuple[str, Dict[str, str], float]]:
+        for key, value in self._values.items():
+            yield self.name + "_total", self._labels(key), value
+
+
+class Histogram(_Metric):
+    type_name = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help_text: str,
+        labelnames: Tuple[str, ...] = (),
+        buckets: Tuple[float, ...] = DEFAULT_BUCKETS,
+    ) -> None:
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # _values: key → [per-bucket counts (+Inf last), sum, count]
+
+    def observe(self, value: float, **labels: Any) -> None:
+        key = self._key(labels)
+        state = self._values.get(key)
+        if state is None:
+            state = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            self._values[key] = state
+        state[0][bisect.bisect_left(self.buckets, value)] += 1
+        state[1] += value
+        state[2] += 1
+
+    @contextlib.contextmanager
+    def time(self, **labels: Any):
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.observe(time.monotonic() - started, **labels)
+
+    def count(self, **labels: Any) -> int:
+        state = self._values.get(self._key(labels))
+        return state[2] if state else 0
+
+    def samples(self) -> Iterable[Tuple[str, Dict[str, str], float]]:
+        for key, (counts, total, count) in self._values.items():
+            labels = self._labels(key)
+            cumulative = 0
+            for bound, c in zip(self.buckets, counts):
+                cumulative += c
+                yield self.name + "_bucket", {**labels, "le": _fmt(bound)}, cumulative
+            yield self.name + "_bucket", {**labels, "le": "+Inf"}, count
+            yield self.name + "_sum", labels, total
+            yield self.name + "_count", labels, count
+
+
+def register_collector(fn: Callable[[], Iterable[Family]]) -> None:
+    """Scrape-time callback returning metric families (gauges/counters kept elsewhere)."""
+    if fn not in _collectors:
+        _collectors.append(fn)
+
+
+def reset() -> None:
+    """Zero every inline metric (tests)."""
+    for m in _metrics:
+        m.reset()
+
+
+# ── Exposition ──────────────────────────────────────────────────────
+
+def _fmt(value: float) -> str:
+    if float(value).is_integer() and abs(value) < 1e15:
+        return str(int(value))
+    return repr(float(value))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _line(name: str, labels: Dict[str, str], value: float) -> str:
+    if labels:
+        inner = ",".join(f'{k}="{_escape(str(v))}"' for k, v in labels.items())
+        return f"{name}{{{inner}}} {_fmt(value)}"
+    return f"{name} {_fmt(value)}"
+
+
+def render() -> str:
+    out: List[str] = []
+    for m in _metrics:
+        out.append(f"# HELP {m.name} {m.help}")
+        out.append(f"# TYPE {m.name} {m.type_name}")
+        out.extend(_line(n, labels, v) for n, labels, v in m.samples())
+    for fn in _collectors:
+        try:
+            families = list(fn())
+        except Exception as e:
+            logger.warning("METRICS_COLLECTOR_FAIL %s: %s", getattr(fn, "__name__", fn), e)
+            continue
+        for name, type_name, help_text, samples in families:
+            full = PREFIX + name
+            out.append(f"# HELP {full} {help_text}")
+            out.append(f"# TYPE {full} {type_name}")
+            suffix = "_total" if type_name == "counter" else ""
+            out.extend(_line(full + suffix, labels, v) for labels, v in samples)
+    return "\n".join(out) + "\n"
+
+
+# ── Hot-path metrics ────────────────────────────────────────────────
+
+DB_POOL_ACQUIRE_SECONDS = Histogram(
+    "db_pool_acquire_seconds", "Wait for a DB pool connection, by call-site label.", ("label",),
+)
+UPDATE_SECONDS = Histogram(
+    "update_handling_seconds", "Telegram update handler latency, by router module.", ("router", "event"),
+)
+UPDATE_ERRORS = Counter(
+    "update_handling_errors", "Telegram update handlers that raised, by router module.", ("router", "event"),
+)
+TELEGRAM_API_SECONDS = Histogram(
+    "telegram_api_seconds", "Bot API call latency, by method.", ("method",),
+)
+TELEGRAM_RETRY_AFTER = Counter(
+    "telegram_retry_after", "TelegramRetryAfter responses, by method.", ("method",),
+)
+REMNAWAVE_SECONDS = Histogram(
+    "remnawave_request_seconds", "Remnawave panel call latency, by normalized endpoint.", ("endpoint",),
+)
+REMNAWAVE_ERRORS = Counter(
+    "remnawave_request_errors", "Remnawave calls that failed (transport or HTTP >= 400).", ("endpoint",),
+)
+WORKER_ITERATION_SECONDS = Histogram(
+    "worker_iteration_seconds", "Background worker iteration duration.", ("worker",), WORKER_BUCKETS,
+)
+WORKER_ITEMS = Counter(
+    "worker_items_processed", "Items processed by background worker iterations.", ("worker",),
+)
+WORKER_ERRORS = Counter(
+    "worker_iteration_errors", "Background worker iterations that raised.", ("worker",),
+)
+WORKER_CRASH = Counter(
+    "worker_crash", "Background tasks that exited with an exception.", ("task",),
+)
+
+
+def record_worker_iteration(worker: str, seconds: float, items: int = 0, failed: bool = False) -> None:
+    WORKER_ITERATION_SECONDS.observe(seconds, worker=worker)
+    if items:
+        WORKER_ITEMS.inc(items, worker=worker)
+    if failed:
+        WORKER_ERRORS.inc(worker=worker)
+
+
+class _Iteration:
+    __slots__ = ("items",)
+
+    def __init__(self) -> None:
+        self.items = 0
+
+
+@contextlib.asynccontextmanager
+async def worker_iteration(worker: str):
+    """Time one worker loop iteration; set `.items` on the yielded object.
+
+    Workers that already call logging_helpers.log_worker_iteration_end are
+    recorded there and don't need this.
+    """
+    it = _Iteration()
+    started = time.monotonic()
+    failed = False
+    try:
+        yield it
+    except asyncio.CancelledError:
+        raise
+    except Exception:
+        failed = True
+        raise
+    finally:
+        record_worker_iteration(worker, time.monotonic() - started, it.items, failed)
+
+
+def _on_task_done(task: "asyncio.Task") -> None:
+    if task.cancelled():
+        return
+    exc = task.exception()
+    if exc is not None:
+        WORKER_CRASH.inc(task=task.get_name())
+        logger.error("WORKER_CRASH task=%s err=%s: %s", task.get_name(), type(exc).__name__, exc)
+
+
+def watch_task(task: Optional["asyncio.Task"]) -> None:
+    """Count the task in worker_crash_total if it dies with an exception."""
+    if task is not None:
+        task.add_done_callback(_on_task_done)
+
+
+# ── Scrape-time collectors ──────────────────────────────────────────
+
+def _pool_collector() -> Iterable[Family]:
+    import database.core as _core
+    pool = getattr(_core, "_pool", None)
+    if pool is None:
+        return []
+    size = pool.get_size()
+    idle = pool.get_idle_size()
+    return [
+        ("db_pool_size", "gauge", "Open DB pool connections.", [({}, size)]),
+        ("db_pool_in_use", "gauge", "DB pool connections checked out.", [({}, size - idle)]),
+        ("db_pool_max", "gauge", "DB pool max size.", [({}, pool.get_max_size())]),
+    ]
+
+
+def _redis_collector() -> Iterable[Family]:
+    from app.utils import redis_client
+    client = redis_client._redis_client
+    if client is None:
+        return []
+    cp = client.connection_pool
+    in_use = len(getattr(cp, "_in_use_connections", ()) or ())
+    available = len(getattr(cp, "_available_connections", ()) or ())
+    return [
+        ("redis_pool_in_use", "gauge", "Redis connections checked out.", [({}, in_use)]),
+        ("redis_pool_idle", "gauge", "Idle Redis connections.", [({}, available)]),
+    ]
+
+
+register_collector(_pool_collector)
+register_collector(_redis_collector)
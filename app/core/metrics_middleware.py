@@ -0,0 +1,66 @@
+"""
+Metrics middlewares (see app/core/metrics).
+
+UpdateMetricsMiddleware — inner middleware on the dispatcher observers:
+runs around the matched handler only, so `data["handler"]` is known and
+the latency is labelled by the handler's module (app.handlers.admin.stats →
+admin.stats). Inner middlewares of the root router apply to every
+sub-router, one registration per event type is enough.
+
+TelegramApiMetricsMiddleware — aiogram session middleware: Bot API call
+latency per method and TelegramRetryAfter count. Installed after the
+outbound scheduler so the scheduler's token wait is not counted.
+"""
+import time
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware, Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.exceptions import TelegramRetryAfter
+
+from app.core import metrics
+
+_HANDLERS_PREFIX = "app.handlers."
+
+
+def _router_label(data: Dict[str, Any]) -> str:
+    handler = data.get("handler")
+    module = getattr(getattr(handler, "callback", None), "__module__", None) or "unknown"
+    if module.startswith(_HANDLERS_PREFIX):
+        module = module[len(_HANDLERS_PREFIX):]
+    return module
+
+
+class UpdateMetricsMiddleware(BaseMiddleware):
+    def __init__(self, event: str) -> None:
+        super().__init__()
+        self._event = event
+
+    async def __call__(
+        self,
+        handler: Callable[[Any, Dict[str, Any]], Awaitable[Any]],
+        event: Any,
+        data: Dict[str, Any],
+    ) -> Any:
+        started = time.monotonic()
+        router = _router_label(data)
+        try:
+            return await handler(event, data)
+        except Exception:
+            metrics.UPDATE_ERRORS.inc(router=router, event=self._event)
+            raise
+        finally:
+            metrics.UPDATE_SECONDS.observe(time.monotonic() - started, router=router, event=self._event)
+
+
+class TelegramApiMetricsMiddleware(BaseRequestMiddleware):
+    async def __call__(self, make_request, bot: Bot, method):
+        name = type(method).__name__
+        started = time.monotonic()
+        try:
+            return await make_request(bot, method)
+        except TelegramRetryAfter:
+            metrics.TELEGRAM_RETRY_AFTER.inc(method=name)
+            raise
+        finally:
+            metrics.TELEGRAM_API_SECONDS.observe(time.monotonic() - started, method=name)
@@ -2,13 +2,18 @@
 Production-safe pool instrumentation: measure acquire wait time and log if high.
 
 Toggle via env: POOL_MONITOR_ENABLED=true (default: disabled).
-When disabled, acquire_connection(pool, label) behaves exactly like pool.acquire().
+With config.METRICS_ENABLED the wait also goes to the
+atlas_db_pool_acquire_seconds{label} histogram (app/core/metrics).
+When both are off, acquire_connection(pool, label) behaves exactly like pool.acquire().
+role="read" routes to database.get_read_pool() (replica when fresh, else primary).
 """
 import logging
 import os
 import time
 from typing import Any
 
+from app.core import metrics
+
 logger = logging.getLogger(__name__)
 
 _POOL_MONITOR_ENABLED = os.getenv("POOL_MONITOR_ENABLED", "").strip().lower() in ("true", "1", "yes")
@@ -39,6 +44,9 @@ class _MonitoredAcquireContextManager:
         start = time.monotonic()
         self._conn = await self.pool.acquire()
         wait_s = time.monotonic() - start
+        metrics.DB_POOL_ACQUIRE_SECONDS.observe(wait_s, label=self.label)
+        if not _is_enabled():
+            return self._conn
         global _last_pool_wait_spike_monotonic
         if wait_s > 5.0:
             _last_pool_wait_spike_monotonic = time.monotonic()
@@ -67,7 +75,18 @@ class _MonitoredAcquireContextManager:
             self._conn = None
 
 
-def acquire_connection(pool: Any, label: str = "") -> Any:
+class _ReadAcquireContextManager(_MonitoredAcquireContextManager):
+    """Same, but the pool is resolved on enter via database.get_read_pool()."""
+
+    __slots__ = ()
+
+    async def __aenter__(self) -> Any:
+        from database.core import get_read_pool
+        self.pool = await get_read_pool()
+        return await super().__aenter__()
+
+
+def acquire_connection(pool: Any, label: str = "", role: str = "write") -> Any:
     """
     Return an async context manager for acquiring a connection from the pool.
 
@@ -75,12 +94,20 @@ def acquire_connection(pool: Any, label: str = "") -> Any:
     - WARNING if wait > 1.0s
     - CRITICAL if wait > 5.0s
 
-    When POOL_MONITOR_ENABLED is false, behaves exactly like pool.acquire().
+    With METRICS_ENABLED the wait is recorded per label either way.
+    When both are off, behaves exactly like pool.acquire().
+
+    role="read": heavy read-only work — the connection comes from
+    database.get_read_pool() and `pool` is ignored (may be None).
 
     Usage:
         async with acquire_connection(pool, "fast_expiry") as conn:
             ...
+        async with acquire_connection(None, "traffic_audit", role="read") as conn:
+            ...
     """
-    if not _is_enabled():
+    if role == "read":
+        return _ReadAcquireContextManager(None, label or "unknown")
+    if not _is_enabled() and not metrics.enabled():
         return pool.acquire()
     return _MonitoredAcquireContextManager(pool, label or "unknown")
@@ -0,0 +1,233 @@
+"""
+Process-wide outbound Telegram scheduler.
+
+Every bot.send_* / copy / forward / delete_message goes through one
+global token bucket (installed as an aiogram session middleware in
+main.py), so broadcasts, reminders, payment confirmations and handler
+replies share the ~30 msg/s bot limit instead of each pacing itself
+with ad-hoc sleeps.
+
+Priority classes (lower value wins the next token):
+  INTERACTIVE  — replies inside update handlers (default)
+  PAYMENT      — payment confirmations from webhooks
+  REMINDER     — reminders / trial notifications / auto-renewal
+  BROADCAST    — admin broadcasts and broadcast deletion
+
+Callers mark their class with @with_send_priority(...) or the
+send_priority(...) context manager; the value lives in a ContextVar, so
+tasks spawned inside (asyncio.gather of per-user sends) inherit it.
+
+TelegramRetryAfter pauses the bucket for everyone for retry_after
+seconds; the exception is still re-raised so existing per-caller retry
+loops keep working — their retry simply waits behind the pause.
+
+Toggle via config.TELEGRAM_SCHEDULER_ENABLED. When disabled the
+middleware is not installed and pace() keeps the legacy sleeps.
+"""
+import asyncio
+import contextlib
+import functools
+import heapq
+import itertools
+import logging
+import time
+from contextvars import ContextVar
+from enum import IntEnum
+from typing import Any, Optional
+
+from aiogram import Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.exceptions import TelegramRetryAfter
+
+import config
+
+logger = logging.getLogger(__name__)
+
+
+class Priority(IntEnum):
+    INTERACTIVE = 0
+    PAYMENT = 1
+    REMINDER = 2
+    BROADCAST = 3
+
+
+_current_priority: ContextVar[Priority] = ContextVar("telegram_send_priority", default=Priority.INTERACTIVE)
+
+# Methods that count against the bot-wide message limit. Edits,
+# callback answers and getters are not paced.
+_SCHEDULED_METHODS = frozenset({
+    "CopyMessage",
+    "CopyMessages",
+    "DeleteMessage",
+    "DeleteMessages",
+    "ForwardMessage",
+    "ForwardMessages",
+})
+
+
+def _is_scheduled(method: Any) -> bool:
+    name = type(method).__name__
+    if name == "SendChatAction":
+        return False
+    return name.startswith("Send") or name in _SCHEDULED_METHODS
+
+
+@contextlib.contextmanager
+def send_priority(priority: Priority):
+    """Scope outbound sends in this context (and tasks spawned from it) to `priority`."""
+    token = _current_priority.set(priority)
+    try:
+        yield
+    finally:
+        _current_priority.reset(token)
+
+
+def with_send_priority(priority: Priority):
+    """Decorator form of send_priority for async functions."""
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            with send_priority(priority):
+                return await func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def current_priority() -> Priority:
+    return _current_priority.get()
+
+
+class OutboundScheduler:
+    """Global token bucket with strict priority ordering of waiters."""
+
+    def __init__(self, rate: float, burst: int) -> None:
+        self.rate = float(rate)
+        self.burst = max(1, int(burst))
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._heap: list = []
+        self._seq = itertools.count()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._pump_task: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self.stats = {
+            "granted": {p.name: 0 for p in Priority},
+            "retry_after": 0,
+            "paused_seconds": 0.0,
+        }
+
+    def _ensure_pump(self) -> None:
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # Новый event loop (тесты / рестарт) — loop-bound примитивы заново.
+            self._loop = loop
+            self._wakeup = asyncio.Event()
+            self._pump_task = None
+            self._heap.clear()
+        if self._pump_task is None or self._pump_task.done():
+            self._pump_task = loop.create_task(self._pump(), name="telegram_send_scheduler")
+
+    def _refill(self, now: float) -> None:
+        elapsed = now - self._updated
+        if elapsed > 0:
+            self._tokens = min(float(self.burst), self._tokens + elapsed * self.rate)
+            self._updated = now
+
+    async def acquire(self, priority: Priority = Priority.INTERACTIVE) -> None:
+        """Wait for a send slot. Higher priority waiters are served first."""
+        self._ensure_pump()
+        fut = self._loop.create_future()
+        heapq.heappush(self._heap, (int(priority), next(self._seq), fut))
+        self._wakeup.set()
+        await fut
+        self.stats["granted"][Priority(priority).name] += 1
+
+    def pause(self, seconds: float) -> None:
+        """Stop granting tokens to everyone for `seconds` (RetryAfter backpressure)."""
+        until = time.monotonic() + max(0.0, float(seconds))
+        if until > self._paused_until:
+            self.stats["paused_seconds"] += until - max(self._paused_until, time.monotonic())
+            self._paused_until = until
+        self.stats["retry_after"] += 1
+        # Токены, накопленные до паузы, не должны выстрелить пачкой после неё.
+        self._tokens = 0.0
+        self._updated = until
+
+    def queue_depth(self) -> dict:
+        depth = {p.name: 0 for p in Priority}
+        for prio, _, fut in self._heap:
+            if not fut.done():
+                depth[Priority(prio).name] += 1
+        return depth
+
+    async def _pump(self) -> None:
+        while True:
+            while self._heap and self._heap[0][2].done():
+                heapq.heappop(self._heap)  # отменённые ожидающие
+            if not self._heap:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            now = time.monotonic()
+            if now < self._paused_until:
+                await asyncio.sleep(self._paused_until - now)
+                continue
+            self._refill(now)
+            if self._tokens >= 1.0:
+                self._tokens -= 1.0
+                _, _, fut = heapq.heappop(self._heap)
+                fut.set_result(None)
+                continue
+            await asyncio.sleep((1.0 - self._tokens) / self.rate)
+
+
+_scheduler: Optional[OutboundScheduler] = None
+
+
+def get_scheduler() -> OutboundScheduler:
+    global _scheduler
+    if _scheduler is None:
+        _scheduler = OutboundScheduler(
+            rate=config.TELEGRAM_GLOBAL_RATE,
+            burst=config.TELEGRAM_GLOBAL_BURST,
+        )
+    return _scheduler
+
+
+def is_enabled() -> bool:
+    return bool(config.TELEGRAM_SCHEDULER_ENABLED)
+
+
+async def pace(seconds: float) -> None:
+    """Legacy per-sender pacing sleep. No-op while the global scheduler is
+    on — the token bucket already paces every send."""
+    if is_enabled():
+        await asyncio.sleep(0)
+        return
+    await asyncio.sleep(seconds)
+
+
+class TelegramSendSchedulerMiddleware(BaseRequestMiddleware):
+    """aiogram session middleware: routes outbound sends through the scheduler."""
+
+    def __init__(self, scheduler: Optional[OutboundScheduler] = None) -> None:
+        self._scheduler = scheduler
+
+    @property
+    def scheduler(self) -> OutboundScheduler:
+        return self._scheduler or get_scheduler()
+
+    async def __call__(self, make_request, bot: Bot, method):
+        if not _is_scheduled(method):
+            return await make_request(bot, method)
+        await self.scheduler.acquire(current_priority())
+        try:
+            return await make_request(bot, method)
+        except TelegramRetryAfter as e:
+            logger.warning(
+                "TELEGRAM_RETRY_AFTER: pausing all sends for %ss (method=%s priority=%s)",
+                e.retry_after, type(method).__name__, current_priority().name,
+            )
+            self.scheduler.pause(e.retry_after)
+            raise
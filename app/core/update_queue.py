@@ -0,0 +1,379 @@
+"""
+Ack-fast Telegram update ingestion (config.TELEGRAM_UPDATE_QUEUE, opt-in;
+the default "off" handles updates inline in the webhook request).
+
+The webhook endpoint validates the update, hands it to this module and
+answers 200 immediately; handlers run later on a worker pool:
+
+  • strict per-user order — updates with the same key (from_user /
+    chat id) never run concurrently and run in arrival order;
+  • parallel across users — up to `workers` keys in flight at once
+    (default MAX_CONCURRENT_UPDATES, so the ConcurrencyLimiterMiddleware
+    semaphore never queues behind us);
+  • bounded — at most `max_pending` updates buffered; beyond that the
+    webhook answers 503 and Telegram redelivers later (counted as
+    dropped{reason="queue_full"}).
+
+Backends:
+  "memory" — in-process buffer. An acked update that hasn't run yet is
+             lost if the process dies (shutdown drains it).
+  "redis"  — XADD to a Redis stream first, a single reader feeds the
+             same dispatcher and XACKs after the handler finished.
+             Unacked entries are re-read on restart (consumer group
+             pending list), so a crash doesn't lose acked updates.
+             Single reader per process + the instance advisory lock in
+             main.py keep per-user order. Redis errors on ingest fall
+             back to the in-memory path. The stream is never trimmed by
+             MAXLEN (that would delete unacked updates): entries are
+             XDEL'd after XACK, and once the stream holds 2×max_pending
+             entries ingest answers 503 (dropped{reason="stream_full"}).
+
+Queue depth, per-key lag and drop counters go to /metrics
+(atlas_update_queue_*).
+"""
+from __future__ import annotations
+
+import asyncio
+import collections
+import json
+import logging
+import time
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional, Tuple
+
+from app.core import metrics
+
+logger = logging.getLogger(__name__)
+
+STREAM_KEY = "tg:updates"
+STREAM_GROUP = "bot"
+STREAM_CONSUMER = "main"
+STREAM_READ_COUNT = 100
+STREAM_BLOCK_MS = 1000
+_RECONNECT_DELAY = 5.0
+
+# (item, enqueued_at monotonic, ack callback)
+_Entry = Tuple[Any, float, Optional[Callable[[], Awaitable[None]]]]
+
+ENQUEUED = metrics.Counter("update_queue_enqueued", "Updates accepted into the ingestion queue.", ("backend",))
+PROCESSED = metrics.Counter("update_queue_processed", "Updates processed by the ingestion workers.", ("outcome",))
+DROPPED = metrics.Counter("update_queue_dropped", "Updates not queued/processed, by reason.", ("reason",))
+LAG_SECONDS = metrics.Histogram(
+    "update_queue_lag_seconds", "Time an update waited in the queue before its handler started.",
+)
+
+
+def update_key(update: Any) -> str:
+    """Ordering key: the user (or chat) the update belongs to."""
+    try:
+        event = update.event
+    except Exception:
+        event = None
+    user = getattr(event, "from_user", None)
+    if user is not None:
+        return f"u{user.id}"
+    chat = getattr(event, "chat", None)
+    if chat is not None:
+        return f"c{chat.id}"
+    # Без пользователя порядок не важен — отдельный ключ на апдейт.
+    return f"x{getattr(update, 'update_id', id(update))}"
+
+
+class KeyedDispatcher:
+    """Worker pool with strict FIFO per key and parallelism across keys.
+
+    A key is in `_ready` at most once and a worker takes it exclusively,
+    runs one item, then puts the key back at the tail if more are queued —
+    so a chatty user can't starve the others.
+    """
+
+    def __init__(
+        self,
+        handler: Callable[[Any], Awaitable[None]],
+        workers: int,
+        max_pending: int,
+        timeout: float,
+    ) -> None:
+        self._handler = handler
+        self._workers_n = max(1, workers)
+        self._max_pending = max(1, max_pending)
+        self._timeout = timeout
+        self._queues: Dict[str, Deque[_Entry]] = {}
+        self._ready: asyncio.Queue[str] = asyncio.Queue()
+        self._pending = 0
+        self._space = asyncio.Event()
+        self._space.set()
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._workers: list[asyncio.Task] = []
+
+    @property
+    def pending(self) -> int:
+        return self._pending
+
+    @property
+    def keys(self) -> int:
+        return len(self._queues)
+
+    def oldest_lag(self) -> float:
+        now = time.monotonic()
+        heads = [q[0][1] for q in self._queues.values() if q]
+        return now - min(heads) if heads else 0.0
+
+    def start(self) -> None:
+        if self._workers:
+            return
+        self._workers = [
+            asyncio.create_task(self._worker(i), name=f"update_worker_{i}")
+            for i in range(self._workers_n)
+        ]
+
+    def submit(self, key: str, item: Any, ack: Optional[Callable[[], Awaitable[None]]] = None) -> bool:
+        """Queue `item` behind everything else with the same key. False when full."""
+        if self._pending >= self._max_pending:
+            return False
+        self._pending += 1
+        self._idle.clear()
+        if self._pending >= self._max_pending:
+            self._space.clear()
+        q = self._queues.get(key)
+        if q is None:
+            self._queues[key] = collections.deque([(item, time.monotonic(), ack)])
+            self._ready.put_nowait(key)
+        else:
+            q.append((item, time.monotonic(), ack))
+        return True
+
+    async def wait_for_space(self) -> None:
+        await self._space.wait()
+
+    async def _run_one(self, key: str) -> None:
+        q = self._queues[key]
+        item, enqueued_at, ack = q.popleft()
+        LAG_SECONDS.observe(time.monotonic() - enqueued_at)
+        finished = False
+        try:
+            try:
+                await asyncio.wait_for(self._handler(item), timeout=self._timeout)
+                PROCESSED.inc(outcome="ok")
+            except asyncio.TimeoutError:
+                PROCESSED.inc(outcome="timeout")
+                logger.error("UPDATE_QUEUE_HANDLER_TIMEOUT key=%s timeout=%ss", key, self._timeout)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                PROCESSED.inc(outcome="error")
+                logger.error("UPDATE_QUEUE_HANDLER_ERROR key=%s error=%s", key, e, exc_info=True)
+            finished = True
+            # Ошибка хендлера тоже ack: повтор того же апдейта упадёт так же.
+            if ack is not None:
+                try:
+                    await ack()
+                except Exception as e:
+                    logger.warning("UPDATE_QUEUE_ACK_FAIL key=%s error=%s", key, e)
+        finally:
+            self._pending -= 1
+            if self._pending < self._max_pending:
+                self._space.set()
+            if q and finished:
+                self._ready.put_nowait(key)
+            else:
+                # cancel посреди ключа (shutdown): хвост не трогаем — в redis
+                # он останется неподтверждённым и перечитается после рестарта.
+                if q:
+                    self._pending -= len(q)
+                del self._queues[key]
+                if not self._queues:
+                    self._idle.set()
+
+    async def _worker(self, index: int) -> None:
+        while True:
+            key = await self._ready.get()
+            await self._run_one(key)
+
+    async def drain(self, timeout: float) -> bool:
+        """Wait until everything queued has run (shutdown). True if drained."""
+        try:
+            await asyncio.wait_for(self._idle.wait(), timeout=timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    async def stop(self) -> None:
+        for task in self._workers:
+            task.cancel()
+        for task in self._workers:
+            try:
+                await task
+            except (asyncio.CancelledError, Exception):
+                pass
+        self._workers = []
+
+
+class UpdateIngestor:
+    """Front door used by the webhook endpoint (see module docstring)."""
+
+    def __init__(
+        self,
+        process: Callable[[Any], Awaitable[None]],
+        parse: Callable[[Dict[str, Any]], Any],
+        backend: str = "memory",
+        workers: int = 20,
+        max_pending: int = 10_000,
+        timeout: float = 60.0,
+    ) -> None:
+        self._parse = parse
+        self.backend = backend
+        self.dispatcher = KeyedDispatcher(process, workers, max_pending, timeout)
+        self._max_pending = max_pending
+        self._reader: Optional[asyncio.Task] = None
+        self._inflight_ids: set[str] = set()
+
+    def _families(self):
+        d = self.dispatcher
+        return [
+            ("update_queue_depth", "gauge", "Updates waiting or running in the ingestion queue.", [({}, d.pending)]),
+            ("update_queue_keys", "gauge", "Users with queued updates.", [({}, d.keys)]),
+            ("update_queue_oldest_lag_seconds", "gauge", "Age of the oldest queued update.", [({}, round(d.oldest_lag(), 3))]),
+        ]
+
+    async def start(self) -> None:
+        global _active
+        _active = self
+        self.dispatcher.start()
+        if self.backend == "redis":
+            self._reader = asyncio.create_task(self._stream_reader(), name="update_stream_reader")
+        logger.info(
+            "UPDATE_QUEUE started backend=%s workers=%d max_pending=%d",
+            self.backend, self.dispatcher._workers_n, self._max_pending,
+        )
+
+    async def ingest(self, body: Dict[str, Any]) -> bool:
+        """Accept a validated webhook body. False → caller answers 503."""
+        update = self._parse(body)
+        if self.backend == "redis":
+            try:
+                if await self._xadd(body, update):
+                    ENQUEUED.inc(backend="redis")
+                    return True
+                DROPPED.inc(reason="stream_full")
+                logger.warning("UPDATE_QUEUE_STREAM_FULL update_id=%s cap=%d", update.update_id, self._stream_cap)
+                return False
+            except Exception as e:
+                logger.warning("UPDATE_QUEUE_XADD_FAIL update_id=%s error=%s — in-memory", update.update_id, e)
+        if not self.dispatcher.submit(update_key(update), update):
+            DROPPED.inc(reason="queue_full")
+            logger.warning("UPDATE_QUEUE_FULL update_id=%s pending=%d", update.update_id, self.dispatcher.pending)
+            return False
+        ENQUEUED.inc(backend="memory")
+        return True
+
+    # ── Redis stream ────────────────────────────────────────────────
+
+    @property
+    def _stream_cap(self) -> int:
+        return self._max_pending * 2
+
+    async def _xadd(self, body: Dict[str, Any], update: Any) -> bool:
+        """XADD unless the stream is at its cap (False → 503, Telegram retries).
+
+        Без MAXLEN: обрезка удаляет и неподтверждённые записи, т.е. уже
+        отвеченные 200 апдейты. Обработанные удаляет ack (XDEL).
+        """
+        from app.utils.redis_client import get_redis
+        r = await get_redis()
+        if r is None:
+            raise RuntimeError("REDIS_URL not configured")
+        if await r.xlen(STREAM_KEY) >= self._stream_cap:
+            return False
+        await r.xadd(
+            STREAM_KEY,
+            {"u": json.dumps(body, separators=(",", ":")), "id": str(update.update_id)},
+        )
+        return True
+
+    async def _ack(self, r, entry_id: str) -> None:
+        await r.xack(STREAM_KEY, STREAM_GROUP, entry_id)
+        await r.xdel(STREAM_KEY, entry_id)
+
+    async def _ensure_group(self, r) -> None:
+        try:
+            await r.xgroup_create(STREAM_KEY, STREAM_GROUP, id="0", mkstream=True)
+        except Exception as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+
+    async def _submit_entry(self, r, entry_id: str, fields: Optional[Dict[str, str]]) -> None:
+        if entry_id in self._inflight_ids:
+            return  # уже в диспетчере (повторное чтение pending после reconnect)
+
+        async def ack() -> None:
+            self._inflight_ids.discard(entry_id)
+            await self._ack(r, entry_id)
+
+        try:
+            update = self._parse(json.loads((fields or {})["u"]))
+        except Exception as e:
+            DROPPED.inc(reason="bad_entry")
+            logger.error("UPDATE_QUEUE_BAD_ENTRY id=%s error=%s", entry_id, e)
+            await self._ack(r, entry_id)
+            return
+        self._inflight_ids.add(entry_id)
+        while not self.dispatcher.submit(update_key(update), update, ack):
+            await self.dispatcher.wait_for_space()
+
+    async def _stream_reader(self) -> None:
+        """Stream → dispatcher. Сначала свои неподтверждённые (после
+        рестарта), потом новые. Полный буфер — ждём, а не теряем."""
+        from app.utils.redis_client import get_redis
+        while True:
+            try:
+                r = await get_redis()
+                if r is None:
+                    logger.error("UPDATE_QUEUE backend=redis but REDIS_URL is empty — reader stopped")
+                    return
+                await self._ensure_group(r)
+                cursor = "0"
+                while True:
+                    await self.dispatcher.wait_for_space()
+                    resp = await r.xreadgroup(
+                        STREAM_GROUP, STREAM_CONSUMER, {STREAM_KEY: cursor},
+                        count=STREAM_READ_COUNT, block=STREAM_BLOCK_MS,
+                    )
+                    entries = resp[0][1] if resp else []
+                    if cursor != ">":
+                        if not entries:
+                            cursor = ">"
+                            continue
+                        cursor = entries[-1][0]
+                    for entry_id, fields in entries:
+                        await self._submit_entry(r, entry_id, fields)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning("UPDATE_QUEUE_STREAM_ERROR error=%s — retry in %ss", e, _RECONNECT_DELAY)
+                await asyncio.sleep(_RECONNECT_DELAY)
+
+    async def stop(self, drain_timeout: float = 10.0) -> None:
+        if self._reader is not None:
+            self._reader.cancel()
+            try:
+                await self._reader
+            except (asyncio.CancelledError, Exception):
+                pass
+        drained = await self.dispatcher.drain(drain_timeout)
+        if not drained:
+            logger.warning(
+                "UPDATE_QUEUE_DRAIN_TIMEOUT pending=%d backend=%s",
+                self.dispatcher.pending, self.backend,
+            )
+        await self.dispatcher.stop()
+
+
+_active: Optional[UpdateIngestor] = None
+
+
+def _families():
+    return _active._families() if _active is not None else []
+
+
+metrics.register_collector(_families)
@@ -1,5 +1,5 @@
 """
-In-process async event bus.
+Async event bus.
 
 Used by the admin web dashboard to receive live updates without
 polling the database. The bot publishes events from existing
@@ -7,29 +7,57 @@ handlers/services (`bus.publish({...})`) and WebSocket clients
 subscribe via `bus.subscribe()` to receive an `asyncio.Queue` that
 will be filled with every subsequent event.
 
-Single process only — if/when we split bot and dashboard into two
-Railway services, swap the implementation for Redis pub/sub with the
-same `publish` / `subscribe` signatures. Callers don't change.
+Two implementations with the same `publish` / `subscribe` signatures,
+picked by config.EVENT_BUS_BACKEND:
+
+- `Bus` ("memory", default) — single process fan-out.
+- `RedisBus` ("redis") — same local fan-out plus Redis pub/sub, so a
+  dashboard process sees events from every webhook worker. Events
+  leave the process in one batched PUBLISH per tick
+  (_FLUSH_INTERVAL); within a tick `broadcast:progress` /
+  `broadcast:delete_progress` keep only the latest event per
+  broadcast. Same-process subscribers get events directly, and a
+  process skips its own messages coming back from Redis.
+
+`subscribe(local_only=True)` receives only events published in this
+process — for consumers that run once per process (admin_notifier)
+and would otherwise act N times on every event.
 
 Overflow policy: per-subscriber queue is bounded (200). A slow
 WebSocket client that doesn't drain its queue gets new events
 dropped (logged as warning) instead of blocking the publisher.
-The bot must never stall because a browser tab froze.
+The bot must never stall because a browser tab froze. Redis being
+down only loses cross-process delivery — local fan-out keeps working.
 """
 import asyncio
+import json
 import logging
-from typing import Any
+import uuid
+from typing import Any, Optional
+
+import config
 
 logger = logging.getLogger(__name__)
 
 _MAX_QUEUE_SIZE = 200
 
+_CHANNEL = "events:bus"
+_FLUSH_INTERVAL = 0.25          # seconds between batched PUBLISHes
+_MAX_PENDING = 5000             # outbound buffer cap while Redis is slow/down
+_RECONNECT_DELAY = 5.0
+
+# type → key field: within one tick only the latest event per key is sent.
+_COALESCE_KEYS = {
+    "broadcast:progress": "broadcast_id",
+    "broadcast:delete_progress": "broadcast_id",
+}
+
 
 class Bus:
     def __init__(self) -> None:
         self._queues: list[asyncio.Queue] = []
 
-    def subscribe(self) -> asyncio.Queue:
+    def subscribe(self, local_only: bool = False) -> asyncio.Queue:
         q: asyncio.Queue = asyncio.Queue(maxsize=_MAX_QUEUE_SIZE)
         self._queues.append(q)
         return q
@@ -42,7 +70,11 @@ class Bus:
 
     def publish(self, event: dict[str, Any]) -> None:
         """Non-blocking fan-out. Safe to call from any sync or async context."""
-        for q in list(self._queues):
+        self._fan_out(event, self._queues)
+
+    @staticmethod
+    def _fan_out(event: dict[str, Any], queues) -> None:
+        for q in list(queues):
             try:
                 q.put_nowait(event)
             except asyncio.QueueFull:
@@ -55,5 +87,166 @@ class Bus:
     def subscriber_count(self) -> int:
         return len(self._queues)
 
+    async def close(self) -> None:
+        return None
+
+
+def _coalesce_key(event: dict[str, Any]) -> Optional[tuple]:
+    field = _COALESCE_KEYS.get(event.get("type"))
+    if field is None:
+        return None
+    return (event.get("type"), event.get(field))
+
+
+class RedisBus(Bus):
+    """Bus with cross-process delivery over Redis pub/sub (see module docstring)."""
+
+    def __init__(self, channel: str = _CHANNEL, flush_interval: float = _FLUSH_INTERVAL) -> None:
+        super().__init__()
+        self._channel = channel
+        self._flush_interval = flush_interval
+        self._origin = uuid.uuid4().hex
+        self._remote_queues: list[asyncio.Queue] = []
+        self._pending: list[dict[str, Any]] = []
+        self._pending_index: dict[tuple, int] = {}
+        self._flusher: Optional[asyncio.Task] = None
+        self._listener: Optional[asyncio.Task] = None
+        self._closed = False
+
+    def subscribe(self, local_only: bool = False) -> asyncio.Queue:
+        q = super().subscribe(local_only)
+        if not local_only:
+            self._remote_queues.append(q)
+            self._ensure_listener()
+        return q
+
+    def unsubscribe(self, q: asyncio.Queue) -> None:
+        super().unsubscribe(q)
+        try:
+            self._remote_queues.remove(q)
+        except ValueError:
+            pass
+
+    def publish(self, event: dict[str, Any]) -> None:
+        """Local fan-out now, Redis on the next tick. Never blocks."""
+        self._fan_out(event, self._queues)
+        if self._closed:
+            return
+        key = _coalesce_key(event)
+        if key is not None and key in self._pending_index:
+            self._pending[self._pending_index[key]] = event
+        elif len(self._pending) >= _MAX_PENDING:
+            logger.warning("BUS_REDIS_BUFFER_FULL type=%s — dropping remote delivery", event.get("type"))
+            return
+        else:
+            if key is not None:
+                self._pending_index[key] = len(self._pending)
+            self._pending.append(event)
+        self._ensure_flusher()
+
+    # ── background tasks ────────────────────────────────────────────
+
+    @staticmethod
+    def _running_loop() -> Optional[asyncio.AbstractEventLoop]:
+        try:
+            return asyncio.get_running_loop()
+        except RuntimeError:
+            return None
+
+    def _ensure_flusher(self) -> None:
+        if self._flusher is None or self._flusher.done():
+            if self._running_loop() is not None:
+                self._flusher = asyncio.create_task(self._flush_loop(), name="event_bus_flush")
+
+    def _ensure_listener(self) -> None:
+        if self._closed:
+            return
+        if self._listener is None or self._listener.done():
+            if self._running_loop() is not None:
+                self._listener = asyncio.create_task(self._listen_loop(), name="event_bus_listen")
+
+    def _take_batch(self) -> list[dict[str, Any]]:
+        batch, self._pending, self._pending_index = self._pending, [], {}
+        return batch
+
+    async def _flush(self) -> None:
+        batch = self._take_batch()
+        if not batch:
+            return
+        try:
+            from app.utils.redis_client import get_redis
+            r = await get_redis()
+            if r is None:
+                return
+            payload = json.dumps({"o": self._origin, "e": batch}, default=str)
+            await r.publish(self._channel, payload)
+        except Exception as e:
+            logger.warning("BUS_REDIS_PUBLISH_FAIL events=%d err=%s", len(batch), e)
+
+    async def _flush_loop(self) -> None:
+        # Выходим, когда буфер пуст: следующий publish перезапустит.
+        while self._pending:
+            await asyncio.sleep(self._flush_interval)
+            await self._flush()
+
+    def _handle_message(self, data: Any) -> None:
+        try:
+            message = json.loads(data)
+        except (TypeError, ValueError):
+            return
+        if not isinstance(message, dict) or message.get("o") == self._origin:
+            return
+        for event in message.get("e") or []:
+            if isinstance(event, dict):
+                self._fan_out(event, self._remote_queues)
+
+    async def _listen_loop(self) -> None:
+        """Long-lived: Redis → local non-local_only subscribers.
+        Отдельное pub/sub-соединение без socket_timeout — тишина в канале
+        не ошибка. Обрыв Redis или нет клиента → переподключение через
+        _RECONNECT_DELAY (выход оставил бы текущих подписчиков без
+        событий других процессов до следующего subscribe())."""
+        from app.utils.redis_client import get_pubsub_redis, iter_pubsub_messages
+        while not self._closed:
+            pubsub = None
+            try:
+                r = await get_pubsub_redis()
+                if r is None:
+                    raise RuntimeError("redis pub/sub client unavailable")
+                pubsub = r.pubsub()
+                await pubsub.subscribe(self._channel)
+                logger.info("BUS_REDIS_LISTENER subscribed channel=%s", self._channel)
+                async for data in iter_pubsub_messages(pubsub):
+                    self._handle_message(data)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning("BUS_REDIS_LISTENER_ERROR err=%s — reconnect in %ss", e, _RECONNECT_DELAY)
+            finally:
+                if pubsub is not None:
+                    try:
+                        await pubsub.aclose()
+                    except Exception:
+                        pass
+            await asyncio.sleep(_RECONNECT_DELAY)
+
+    async def close(self) -> None:
+        """Flush what's buffered and stop background tasks (shutdown)."""
+        self._closed = True
+        for task in (self._flusher, self._listener):
+            if task is not None and not task.done():
+                task.cancel()
+        await self._flush()
+
+
+def _make_bus() -> Bus:
+    backend = (config.EVENT_BUS_BACKEND or "memory").strip().lower()
+    if backend == "redis":
+        if config.REDIS_URL:
+            logger.info("EVENT_BUS=redis channel=%s", _CHANNEL)
+            return RedisBus()
+        logger.warning("EVENT_BUS_BACKEND=redis but REDIS_URL is empty — using in-process bus")
+    return Bus()
+
 
-bus = Bus()
+bus = _make_bus()
@@ -734,6 +734,7 @@ async def callback_admin_grant_flex_notify(callback: CallbackQuery, state: FSMCo
                 days=days_int,
                 admin_telegram_id=callback.from_user.id,
                 tariff=tariff,
+                remnawave_renew=tariff in ("basic", "plus"),
             )
         expires_date = expires_at.strftime("%d.%m.%Y")
         tariff_label = "Basic" if tariff == "basic" else "Plus"
@@ -741,7 +742,8 @@ async def callback_admin_grant_flex_notify(callback: CallbackQuery, state: FSMCo
         # Fire-and-forget: create/renew Remnawave bypass
         try:
             from app.services.remnawave_service import renew_remnawave_user_bg
-            if tariff in ("basic", "plus"):
+            # С outbox renew уже поставлен в транзакции admin_grant_access_atomic
+            if tariff in ("basic", "plus") and not database.outbox_enabled():
                 renew_remnawave_user_bg(user_id, tariff, expires_at, period_days=days_int)
         except Exception as rmn_err:
             logger.warning("REMNAWAVE_ADMIN_GRANT_FAIL: tg=%s %s", user_id, rmn_err)
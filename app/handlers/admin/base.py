@@ -1243,3 +1243,30 @@ async def process_admin_chat_message(message: Message, state: FSMContext, bot: B
     except Exception as e:
         logger.warning("ADMIN_CHAT_SEND_ERROR: target=%s error=%s", target_id, e)
         await message.answer(f"❌ Не удалось отправить: {e}", parse_mode="HTML")
+
+
+@admin_base_router.message(Command("rw_latency"))
+@admin_only
+async def cmd_rw_latency(message: Message):
+    """Латентность Remnawave API по endpoint (счётчики общего keep-alive
+    клиента app/services/remnawave_api). `/rw_latency reset` — обнулить."""
+    from app.services import remnawave_api
+
+    args = (message.text or "").split()[1:]
+    if args and args[0] == "reset":
+        remnawave_api.reset_latency_stats()
+        await message.answer("🔄 Счётчики Remnawave обнулены")
+        return
+
+    stats = remnawave_api.get_latency_stats()
+    if not stats:
+        await message.answer("📡 Remnawave: вызовов пока не было")
+        return
+
+    lines = ["📡 <b>Remnawave API — латентность</b>", ""]
+    for key, s in sorted(stats.items(), key=lambda kv: -kv[1]["count"])[:25]:
+        lines.append(
+            f"• <code>{key}</code>: n={s['count']} err={s['errors']} "
+            f"avg={s['avg_ms']}мс max={s['max_ms']}мс"
+        )
+    await message.answer("\n".join(lines), parse_mode="HTML")
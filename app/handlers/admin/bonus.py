@@ -266,12 +266,11 @@ async def callback_admin_bonus_seg(callback: CallbackQuery):
     except ValueError:
         return
     try:
-        user_ids = await database.get_users_by_segment(_seg_to_full(s))
+        total = await database.count_users_by_segment(_seg_to_full(s))
     except Exception as e:
         logger.exception(f"BONUS_SEG_FETCH_FAIL: {e}")
         await callback.message.answer("Не удалось получить список пользователей.")
         return
-    total = len(user_ids)
     text = (
         "🎁 <b>Подтверждение</b>\n\n"
         f"Бонус: <b>+{amount} {_type_label(t)}</b>\n"
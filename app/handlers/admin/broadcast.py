@@ -15,6 +15,7 @@ from aiogram.fsm.context import FSMContext
 import config
 import database
 from app.i18n import get_text as i18n_get_text
+from app.core.telegram_scheduler import Priority, pace, with_send_priority
 from app.services.language_service import resolve_user_language
 from app.handlers.common.states import BroadcastCreate, AdminBroadcastNoSubscription
 from app.handlers.admin.keyboards import (
@@ -2200,7 +2201,10 @@ async def callback_broadcast_confirm_send(callback: CallbackQuery, state: FSMCon
         admin_id = callback.from_user.id
         chat_id = callback.message.chat.id
 
+        @with_send_priority(Priority.BROADCAST)
         async def _run_broadcast_send():
+            from app.services.broadcast_log_buffer import BroadcastLogBuffer
+            log_buffer = BroadcastLogBuffer(broadcast_id)
             try:
                 semaphore = asyncio.Semaphore(BROADCAST_CONCURRENCY)
                 sent_count = 0
@@ -2267,15 +2271,16 @@ async def callback_broadcast_confirm_send(callback: CallbackQuery, state: FSMCon
                             continue
                         uid, v, msg_id = r
                         if msg_id:
-                            await database.log_broadcast_send(broadcast_id, uid, "sent", v, message_id=msg_id)
+                            await log_buffer.add(uid, "sent", v, message_id=msg_id)
                             sent_count += 1
                         else:
                             failed_list.append({"telegram_id": uid, "error": "Send failed"})
-                            await database.log_broadcast_send(broadcast_id, uid, "failed", v)
+                            await log_buffer.add(uid, "failed", v)
+                    await log_buffer.flush()
 
                     processed += len(batch)
                     logger.info(f"BROADCAST_PROGRESS processed={processed}/{total}")
-                    await asyncio.sleep(BROADCAST_BATCH_PAUSE)
+                    await pace(BROADCAST_BATCH_PAUSE)
 
                 failed_count = len(failed_list)
                 total_users = total
@@ -2307,8 +2312,12 @@ async def callback_broadcast_confirm_send(callback: CallbackQuery, state: FSMCon
 
             except asyncio.CancelledError:
                 logger.info(f"BROADCAST_CANCELLED broadcast_id={broadcast_id}")
+                # Дописать результаты недоотправленного batch — иначе stats
+                # и удаление по message_id недосчитаются.
+                await asyncio.shield(log_buffer.flush())
                 raise
             except Exception as e:
+                await log_buffer.flush()
                 logger.exception(f"Error in broadcast send: {e}")
                 try:
                     await bot.send_message(chat_id, f"Ошибка при отправке уведомления: {e}", parse_mode="HTML")
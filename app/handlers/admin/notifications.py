@@ -20,6 +20,7 @@ from app.services.language_service import resolve_user_language
 from app.handlers.common.utils import safe_edit_text
 from app.handlers.admin.keyboards import get_admin_back_keyboard
 from app.utils.referral_link import build_referral_link
+from app.core.telegram_scheduler import Priority, pace, with_send_priority
 
 admin_notifications_router = Router()
 logger = logging.getLogger(__name__)
@@ -27,6 +28,12 @@ logger = logging.getLogger(__name__)
 BROADCAST_CONCURRENCY = 15
 
 
+@with_send_priority(Priority.BROADCAST)
+async def _send_notification(bot: Bot, user_id: int, text: str, reply_markup=None):
+    """Отправка рассылочного сообщения с приоритетом BROADCAST в планировщике."""
+    return await bot.send_message(user_id, text, reply_markup=reply_markup, parse_mode="HTML")
+
+
 # === FSM States ===
 
 class AdminPromoNotif(StatesGroup):
@@ -322,15 +329,15 @@ async def callback_promo_send(callback: CallbackQuery, state: FSMContext, bot: B
 
                 async with semaphore:
                     try:
-                        await bot.send_message(user_id, text, reply_markup=keyboard, parse_mode="HTML")
+                        await _send_notification(bot, user_id, text, keyboard)
                         sent_count += 1
                     except TelegramRetryAfter as e:
                         await asyncio.sleep(e.retry_after + 1)
-                        await bot.send_message(user_id, text, reply_markup=keyboard, parse_mode="HTML")
+                        await _send_notification(bot, user_id, text, keyboard)
                         sent_count += 1
                     except Exception:
                         failed_count += 1
-                await asyncio.sleep(0.05)
+                await pace(0.05)
             except Exception:
                 failed_count += 1
 
@@ -496,15 +503,15 @@ async def callback_retention_send(callback: CallbackQuery, state: FSMContext, bo
 
                 async with semaphore:
                     try:
-                        await bot.send_message(user_id, text, reply_markup=reply_markup, parse_mode="HTML")
+                        await _send_notification(bot, user_id, text, reply_markup)
                         sent_count += 1
                     except TelegramRetryAfter as e:
                         await asyncio.sleep(e.retry_after + 1)
-                        await bot.send_message(user_id, text, reply_markup=reply_markup, parse_mode="HTML")
+                        await _send_notification(bot, user_id, text, reply_markup)
                         sent_count += 1
                     except Exception:
                         failed_count += 1
-                await asyncio.sleep(0.05)
+                await pace(0.05)
             except Exception:
                 failed_count += 1
 
@@ -757,13 +764,13 @@ async def _send_x2_cashback_notifications(
 
                 async with semaphore:
                     try:
-                        await bot.send_message(user_id, text, reply_markup=keyboard, parse_mode="HTML")
+                        await _send_notification(bot, user_id, text, keyboard)
                         sent_count += 1
                     except TelegramRetryAfter as e:
                         logger.warning("RATE_LIMITED retry_after=%s during x2 cashback notifications", e.retry_after)
                         await asyncio.sleep(e.retry_after)
                         try:
-                            await bot.send_message(user_id, text, reply_markup=keyboard, parse_mode="HTML")
+                            await _send_notification(bot, user_id, text, keyboard)
                             sent_count += 1
                         except Exception:
                             pass
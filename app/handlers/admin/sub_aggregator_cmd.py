@@ -201,7 +201,9 @@ async def cmd_aggstats(message: Message) -> None:
         f"• Singleflight-схлопов: <b>{s['singleflight_wait']}</b>\n\n"
         f"<b>Кеши</b>:\n"
         f"• Body: <b>{s['cache_size']}</b> · Pair: <b>{s['pair_cache_size']}</b> "
-        f"· In-flight: <b>{s['inflight_size']}</b>\n\n"
+        f"· In-flight: <b>{s['inflight_size']}</b>\n"
+        f"• Память body: <b>{s['cache_bytes'] / 1_048_576:.1f} MB</b> "
+        f"(сжатие ×{s['compression_ratio']})\n\n"
         f"<b>Безопасность</b>:\n"
         f"• Алертов об атаках: <b>{s['attack_alerts_sent']}</b>\n\n"
         f"<i>Норма: hit >90%, задержка &lt;400мс, upstream_fail не растёт.</i>"
@@ -308,7 +310,7 @@ async def cmd_aggcheck(message: Message) -> None:
         async with httpx.AsyncClient(timeout=6.0, follow_redirects=True) as c:
             for label, uas in _UAS.items():
                 # сброс кеша для чистого замера каждого UA
-                agg.clear_cache(pair["token"])
+                await agg.clear_cache(pair["token"])
                 r = await c.get(public_url, headers={"User-Agent": uas})
                 ct = (r.headers.get("content-type") or "?")[:28]
                 srv = len(agg._decode_body(type("R", (), {"text": r.text})())) if r.status_code == 200 else 0
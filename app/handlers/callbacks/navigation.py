@@ -424,12 +424,8 @@ async def callback_connect_instruction(callback: CallbackQuery):
         from app.services import remnawave_service
         rmn_uuid = await database.get_remnawave_uuid(telegram_id)
         if rmn_uuid:
-            remnawave_service._fire_and_forget(
-                remnawave_service.extend_remnawave_for_bypass(telegram_id)
-            )
-            remnawave_service._fire_and_forget(
-                remnawave_service.ensure_squad(telegram_id)
-            )
+            remnawave_service.extend_remnawave_for_bypass_bg(telegram_id)
+            remnawave_service.ensure_squad_bg(telegram_id)
 
     text = i18n_get_text(language, "setup.select_device")
 
@@ -572,7 +572,8 @@ async def callback_pay_balance(callback: CallbackQuery, state: FSMContext):
             amount_rubles=final_price_rubles,
             description=transaction_description,
             promo_code=promo_code_from_session,  # CRITICAL: Промокод потребляется внутри транзакции
-            country=country
+            country=country,
+            remnawave_renew=True,
         )
         
         if not result or not result.get("success"):
@@ -861,7 +862,11 @@ async def callback_pay_balance(callback: CallbackQuery, state: FSMContext):
         # Fire-and-forget: create or renew Remnawave bypass user
         try:
             from app.services.remnawave_service import renew_remnawave_user_bg
-            if expires_at and subscription_type not in ("trial",) + config.BIZ_TARIFFS:
+            # С outbox renew уже поставлен в транзакции finalize_balance_purchase
+            if (
+                expires_at and subscription_type not in ("trial",) + config.BIZ_TARIFFS
+                and not database.outbox_enabled()
+            ):
                 renew_remnawave_user_bg(telegram_id, subscription_type, expires_at, period_days=period_days)
         except Exception as rmn_err:
             logger.warning("REMNAWAVE_HOOK_FAIL: balance tg=%s %s", telegram_id, rmn_err)
@@ -572,7 +572,7 @@ async def show_profile(message_or_query, language: str):
             if rmn_uuid_prov:
                 show_traffic = True
                 from app.services import remnawave_service as _rmn_svc
-                _rmn_svc._fire_and_forget(_rmn_svc.ensure_squad(telegram_id))
+                _rmn_svc.ensure_squad_bg(telegram_id)
             elif has_active_subscription and expires_at and sub_type in ("basic", "plus", "trial"):
                 from app.services import remnawave_service as _rmn_svc
                 # Trial → TRIAL_BYPASS_MB (default 500 MB, per ТЗ),
@@ -584,11 +584,9 @@ async def show_profile(message_or_query, language: str):
                     override = trial_mb * (1024 ** 2)
                 else:
                     override = 10 * 1024**3
-                _rmn_svc._fire_and_forget(
-                    _rmn_svc.create_remnawave_user(
-                        telegram_id, sub_type, expires_at,
-                        traffic_limit_override=override,
-                    )
+                _rmn_svc.create_remnawave_user_bg(
+                    telegram_id, sub_type, expires_at,
+                    traffic_limit_override=override,
                 )
 
         keyboard = get_profile_keyboard(
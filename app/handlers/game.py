@@ -1194,20 +1194,7 @@ async def callback_farm_buy_plot(callback: CallbackQuery, state: FSMContext):
         return
     
     # Add new empty plot
-    new_plot = {
-        "plot_id": plot_count,
-        "status": "empty",
-        "plant_type": None,
-        "planted_at": None,
-        "ready_at": None,
-        "dead_at": None,
-        "notified_ready": False,
-        "notified_12h": False,
-        "notified_dead": False,
-        "water_used_at": None,
-        "fertilizer_used_at": None
-    }
-    farm_plots.append(new_plot)
+    farm_plots.append(database.empty_farm_plot(plot_count))
     plot_count += 1
     
     await database.save_farm_plots(telegram_id, farm_plots)
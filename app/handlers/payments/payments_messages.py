@@ -806,7 +806,8 @@ async def process_successful_payment(message: Message, state: FSMContext):
             purchase_id=purchase_id,
             telegram_id=telegram_id,
             payment_provider=payment_provider_name,
-            amount_rubles=payment_amount_rubles
+            amount_rubles=payment_amount_rubles,
+            remnawave_renew=True,
         )
         
         payment_id = result.payment_id
@@ -1245,7 +1246,11 @@ async def process_successful_payment(message: Message, state: FSMContext):
     try:
         from app.services.remnawave_service import renew_remnawave_user_bg
         _sub_type = (tariff_type or "basic").strip().lower()
-        if expires_at and _sub_type not in ("trial",) + config.BIZ_TARIFFS and combo_bypass_gb <= 0:
+        # С outbox renew уже поставлен в транзакции finalize_purchase
+        if (
+            expires_at and _sub_type not in ("trial",) + config.BIZ_TARIFFS and combo_bypass_gb <= 0
+            and not database.outbox_enabled()
+        ):
             renew_remnawave_user_bg(telegram_id, _sub_type, expires_at, period_days=period_days)
     except Exception as rmn_err:
         logger.warning("REMNAWAVE_HOOK_FAIL: stars tg=%s %s", telegram_id, rmn_err)
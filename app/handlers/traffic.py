@@ -323,11 +323,9 @@ async def callback_traffic_info(callback: CallbackQuery):
                 override = trial_mb * (1024 ** 2)
             else:
                 override = 10 * 1024**3
-            remnawave_service._fire_and_forget(
-                remnawave_service.create_remnawave_user(
-                    telegram_id, sub_type, expires_at,
-                    traffic_limit_override=override,
-                )
+            remnawave_service.create_remnawave_user_bg(
+                telegram_id, sub_type, expires_at,
+                traffic_limit_override=override,
             )
             text = i18n_get_text(language, "traffic.bypass_provisioning")
             kb = InlineKeyboardMarkup(inline_keyboard=[
@@ -343,9 +341,7 @@ async def callback_traffic_info(callback: CallbackQuery):
             return
     else:
         # Ensure squad is assigned for existing users (fire-and-forget)
-        remnawave_service._fire_and_forget(
-            remnawave_service.ensure_squad(telegram_id)
-        )
+        remnawave_service.ensure_squad_bg(telegram_id)
     if not rmn_uuid:
         text = i18n_get_text(language, "traffic.not_provisioned")
         kb = InlineKeyboardMarkup(inline_keyboard=[
@@ -508,11 +504,9 @@ async def show_traffic_info_message(message):
         expires_at = subscription.get("expires_at")
         if expires_at and config.REMNAWAVE_ENABLED:
             override = 5 * 1024**3 if is_trial else 10 * 1024**3
-            remnawave_service._fire_and_forget(
-                remnawave_service.create_remnawave_user(
-                    telegram_id, sub_type, expires_at,
-                    traffic_limit_override=override,
-                )
+            remnawave_service.create_remnawave_user_bg(
+                telegram_id, sub_type, expires_at,
+                traffic_limit_override=override,
             )
             text = i18n_get_text(language, "traffic.bypass_provisioning")
             kb = InlineKeyboardMarkup(inline_keyboard=[
@@ -538,9 +532,7 @@ async def show_traffic_info_message(message):
         await message.answer(text, reply_markup=kb, parse_mode="HTML")
         return
     else:
-        remnawave_service._fire_and_forget(
-            remnawave_service.ensure_squad(telegram_id)
-        )
+        remnawave_service.ensure_squad_bg(telegram_id)
 
     traffic = await remnawave_api.get_user_traffic(rmn_uuid)
     if not traffic:
@@ -289,6 +289,7 @@ async def cmd_start(message: Message, state: FSMContext):
                     activation_result = await database.activate_gift_subscription(
                         gift_code=gift_code,
                         activated_by=telegram_id,
+                        remnawave_renew=True,
                     )
                     language = await resolve_user_language(telegram_id)
 
@@ -331,7 +332,8 @@ async def cmd_start(message: Message, state: FSMContext):
                         # Fire-and-forget: create Remnawave bypass for gift recipient
                         try:
                             from app.services.remnawave_service import renew_remnawave_user_bg
-                            if tariff in ("basic", "plus"):
+                            # С outbox renew уже поставлен в транзакции активации подарка
+                            if tariff in ("basic", "plus") and not database.outbox_enabled():
                                 sub = await database.get_subscription(telegram_id)
                                 if sub and sub.get("expires_at"):
                                     renew_remnawave_user_bg(telegram_id, tariff, sub["expires_at"])
@@ -260,7 +260,9 @@ async def _on_payment_approved(bot: Bot, _e: dict[str, Any]) -> None:
 
 async def run_admin_notifier(bot: Bot) -> None:
     """Long-lived task: subscribe to bus, fan-out to handlers."""
-    q = bus.subscribe()
+    # local_only: при EVENT_BUS_BACKEND=redis каждый воркер шлёт DM только
+    # о своих событиях, иначе админ получил бы N копий.
+    q = bus.subscribe(local_only=True)
     logger.info("ADMIN_NOTIFIER started")
     try:
         while True:
@@ -8,6 +8,8 @@ Runtime helper для автоуведомлений.
 - log_notification_send(key, telegram_id, status=...) — метрика.
 - get_trigger_config(key) — dict для reminder-логики (allows
   админу подвинуть окно отправки без редиплоя).
+- is_user_in_segment(telegram_id, segment) — segment_filter из
+  trigger_config (EXISTS на юзера / мемо горячих сегментов).
 
 Кэш: помним состояние в памяти на 30с, чтобы не бить БД на каждом
 чеке в reminder-loop. Cache invalidation через touch_cache() —
@@ -214,15 +216,40 @@ async def get_trigger_config(key: str) -> Dict[str, Any]:
     return dict(spec.default_trigger) if spec else {}
 
 
+# Membership-мемо сегментов: {segment: (expires_at, frozenset(ids))}.
+# Сегмент материализуется целиком, когда за окно _SEGMENT_MEMO_TTL_SEC
+# по нему пришло _SEGMENT_HOT_PROBES точечных проверок (reminder-loop с
+# segment_filter на каждом получателе) — дальше проверки O(1) без БД.
+# Короткий TTL: состояние юзеров (подписка, триал) меняется, а сегмент
+# в пределах одной итерации воркера достаточно свежий.
+_SEGMENT_MEMO: Dict[str, tuple] = {}
+_SEGMENT_PROBES: Dict[str, tuple] = {}   # {segment: (window_start, probes)}
+_SEGMENT_MEMO_TTL_SEC = 60.0
+_SEGMENT_HOT_PROBES = 20
+
+
+def clear_segment_memo() -> None:
+    _SEGMENT_MEMO.clear()
+    _SEGMENT_PROBES.clear()
+
+
+def _segment_is_hot(segment_key: str, now: float) -> bool:
+    window_start, probes = _SEGMENT_PROBES.get(segment_key, (now, 0))
+    if now - window_start > _SEGMENT_MEMO_TTL_SEC:
+        window_start, probes = now, 0
+    probes += 1
+    _SEGMENT_PROBES[segment_key] = (window_start, probes)
+    return probes >= _SEGMENT_HOT_PROBES
+
+
 async def is_user_in_segment(telegram_id: int, segment_key: str) -> bool:
     """Проверить, входит ли юзер в admin-сегмент (из broadcasts.segments_list).
 
     Используется в reminder-логике для опционального segment_filter
     (например «шлём только тем, у кого нет активной подписки»).
-    Реализация: делегируем к database.get_users_by_segment — тот
-    возвращает список ID; ищем в нём. Для реально больших сегментов
-    (100k+) стоит переделать на dedicated SQL-check, но пока
-    достаточно.
+    Холодный сегмент — один EXISTS по предикату сегмента для этого
+    юзера (database.user_in_segment). Горячий (много проверок подряд) —
+    мемо-множество id на _SEGMENT_MEMO_TTL_SEC, см. выше.
 
     Fail-open: если сегмент неизвестен или произошла ошибка чтения,
     возвращаем True (не блокируем отправку из-за проблем валидации).
@@ -231,8 +258,18 @@ async def is_user_in_segment(telegram_id: int, segment_key: str) -> bool:
         return True
     try:
         import database
-        ids = await database.get_users_by_segment(segment_key)
-        return int(telegram_id) in {int(x) for x in ids}
+        now = time.monotonic()
+        memo = _SEGMENT_MEMO.get(segment_key)
+        if memo is not None and memo[0] > now:
+            return int(telegram_id) in memo[1]
+        if _segment_is_hot(segment_key, now):
+            if database.segment_sql(segment_key) is None:
+                return True
+            ids = frozenset([int(x) async for x in database.iter_users_by_segment(segment_key)])
+            _SEGMENT_MEMO[segment_key] = (time.monotonic() + _SEGMENT_MEMO_TTL_SEC, ids)
+            return int(telegram_id) in ids
+        member = await database.user_in_segment(int(telegram_id), segment_key)
+        return True if member is None else member
     except Exception as e:
         logger.warning(
             "is_user_in_segment failed segment=%s user=%s: %s",
@@ -60,6 +60,7 @@ def cancel_running(broadcast_id: int) -> bool:
 
 import database
 from app.events import bus
+from app.core.telegram_scheduler import Priority, pace, with_send_priority
 
 logger = logging.getLogger(__name__)
 
@@ -71,6 +72,7 @@ _DELETE_BATCH = 30
 _DELETE_PAUSE = 1.0
 
 
+@with_send_priority(Priority.BROADCAST)
 async def delete_broadcast_from_users(
     *,
     bot: Bot,
@@ -128,7 +130,7 @@ async def delete_broadcast_from_users(
                     "deleted": deleted,
                     "failed": failed,
                 })
-                await asyncio.sleep(_DELETE_PAUSE)
+                await pace(_DELETE_PAUSE)
 
         # Final flush
         bus.publish({
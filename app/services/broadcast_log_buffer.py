@@ -0,0 +1,84 @@
+"""
+Buffered writer for broadcast_log.
+
+Broadcast senders used to call database.log_broadcast_send once per
+recipient — one pool checkout + one single-row INSERT each. On a 100k
+broadcast that is 100k round-trips competing with handlers for the pool.
+
+BroadcastLogBuffer collects per-recipient results in memory and writes
+them with one COPY (database.log_broadcast_sends_bulk) per flush.
+Senders call flush() after every BROADCAST_BATCH_SIZE batch; use the
+buffer as an async context manager so whatever is still pending is
+written on exit — including task cancellation — and broadcast stats
+stay exact.
+
+Write failures are logged and dropped, same as the old per-row
+`try: log_broadcast_send ... except: pass` — the broadcast itself must
+not die because the log table is unhappy.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+from typing import Optional
+
+import database
+
+logger = logging.getLogger(__name__)
+
+
+class BroadcastLogBuffer:
+    """Accumulates broadcast_log rows for one broadcast and flushes in bulk."""
+
+    def __init__(self, broadcast_id: int, max_pending: int = 1000) -> None:
+        self.broadcast_id = broadcast_id
+        # Safety valve: если caller забыл flush между batch'ами, не копим
+        # бесконечно — пишем сами при достижении порога.
+        self.max_pending = max_pending
+        self._pending: list[tuple] = []
+        self._lock = asyncio.Lock()
+        self.written = 0
+        self.dropped = 0
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    async def add(
+        self,
+        telegram_id: int,
+        status: str,
+        variant: Optional[str] = None,
+        message_id: Optional[int] = None,
+    ) -> None:
+        self._pending.append((self.broadcast_id, telegram_id, status, variant, message_id))
+        if len(self._pending) >= self.max_pending:
+            await self.flush()
+
+    async def flush(self) -> int:
+        """Write everything pending with one COPY. Returns rows written."""
+        async with self._lock:
+            if not self._pending:
+                return 0
+            records, self._pending = self._pending, []
+            try:
+                n = await database.log_broadcast_sends_bulk(records)
+            except Exception as e:
+                self.dropped += len(records)
+                logger.warning(
+                    "BROADCAST_LOG_FLUSH_FAILED broadcast_id=%s rows=%s err=%s: %s",
+                    self.broadcast_id, len(records), type(e).__name__, e,
+                )
+                return 0
+            self.written += n
+            return n
+
+    async def __aenter__(self) -> "BroadcastLogBuffer":
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb) -> None:
+        # shield: при отмене задачи рассылки финальный COPY должен дойти,
+        # иначе broadcast_log (и delete-by-message_id) недосчитается.
+        try:
+            await asyncio.shield(self.flush())
+        except asyncio.CancelledError:
+            pass
@@ -10,6 +10,9 @@ inline closure (untouched) — we leave it alone to avoid risk;
 the dashboard path uses this function exclusively. Long-term they
 should converge.
 
+Delivery results go to broadcast_log through BroadcastLogBuffer — one
+COPY per BROADCAST_BATCH_SIZE batch instead of an INSERT per recipient.
+
 Publishes bus events so dashboard subscribers see live progress:
   - broadcast:progress {broadcast_id, processed, total, sent, failed}
   - broadcast:done     {broadcast_id, sent, failed, total}
@@ -27,7 +30,9 @@ from aiogram import Bot
 from aiogram.types import InlineKeyboardMarkup
 
 import database
+from app.core.telegram_scheduler import Priority, pace, with_send_priority
 from app.events import bus
+from app.services.broadcast_log_buffer import BroadcastLogBuffer
 from app.handlers.admin.broadcast import (
     BROADCAST_CONCURRENCY,
     BROADCAST_BATCH_SIZE,
@@ -38,6 +43,7 @@ from app.handlers.admin.broadcast import (
 logger = logging.getLogger(__name__)
 
 
+@with_send_priority(Priority.BROADCAST)
 async def send_broadcast(
     *,
     bot: Bot,
@@ -99,67 +105,60 @@ async def send_broadcast(
         )
         return (uid, variant, msg_id)
 
+    log_buffer = BroadcastLogBuffer(broadcast_id)
     try:
-        for i in range(0, total, BROADCAST_BATCH_SIZE):
-            batch = user_ids[i:i + BROADCAST_BATCH_SIZE]
-            items = []
-            for uid in batch:
-                if is_ab_test and message_a and message_b:
-                    variant = "A" if random.random() < 0.5 else "B"
-                    msg_for_user = message_a if variant == "A" else message_b
-                    items.append((uid, msg_for_user, variant, None, None, None))
-                else:
-                    if has_animation:
-                        items.append((uid, message, None, None, animation_file_id, message))
-                    elif has_photo:
-                        items.append((uid, message, None, photo_file_id, None, message))
+        async with log_buffer:
+            for i in range(0, total, BROADCAST_BATCH_SIZE):
+                batch = user_ids[i:i + BROADCAST_BATCH_SIZE]
+                items = []
+                for uid in batch:
+                    if is_ab_test and message_a and message_b:
+                        variant = "A" if random.random() < 0.5 else "B"
+                        msg_for_user = message_a if variant == "A" else message_b
+                        items.append((uid, msg_for_user, variant, None, None, None))
                     else:
-                        items.append((uid, message, None, None, None, None))
-
-            tasks = [_send_one(uid, m, v, p, a, c) for uid, m, v, p, a, c in items]
-            results = await asyncio.gather(*tasks, return_exceptions=True)
-
-            for r in results:
-                if isinstance(r, Exception):
-                    failed_count += 1
-                    logger.warning(
-                        "BROADCAST_TASK_ERROR broadcast_id=%s err=%s",
-                        broadcast_id, r,
-                    )
-                    continue
-                uid, v, msg_id = r
-                if msg_id:
-                    sent_count += 1
-                    try:
-                        await database.log_broadcast_send(
-                            broadcast_id, uid, "sent", v, message_id=msg_id,
-                        )
-                    except Exception:
-                        pass
-                else:
-                    failed_count += 1
-                    try:
-                        await database.log_broadcast_send(
-                            broadcast_id, uid, "failed", v,
+                        if has_animation:
+                            items.append((uid, message, None, None, animation_file_id, message))
+                        elif has_photo:
+                            items.append((uid, message, None, photo_file_id, None, message))
+                        else:
+                            items.append((uid, message, None, None, None, None))
+
+                tasks = [_send_one(uid, m, v, p, a, c) for uid, m, v, p, a, c in items]
+                results = await asyncio.gather(*tasks, return_exceptions=True)
+
+                for r in results:
+                    if isinstance(r, Exception):
+                        failed_count += 1
+                        logger.warning(
+                            "BROADCAST_TASK_ERROR broadcast_id=%s err=%s",
+                            broadcast_id, r,
                         )
-                    except Exception:
-                        pass
-
-            processed += len(batch)
-            bus.publish({
-                "type": "broadcast:progress",
-                "broadcast_id": broadcast_id,
-                "processed": processed,
-                "total": total,
-                "sent": sent_count,
-                "failed": failed_count,
-            })
-            logger.info(
-                "BROADCAST_PROGRESS broadcast_id=%s processed=%s/%s sent=%s failed=%s",
-                broadcast_id, processed, total, sent_count, failed_count,
-            )
-            if i + BROADCAST_BATCH_SIZE < total:
-                await asyncio.sleep(BROADCAST_BATCH_PAUSE)
+                        continue
+                    uid, v, msg_id = r
+                    if msg_id:
+                        sent_count += 1
+                        await log_buffer.add(uid, "sent", v, message_id=msg_id)
+                    else:
+                        failed_count += 1
+                        await log_buffer.add(uid, "failed", v)
+                await log_buffer.flush()
+
+                processed += len(batch)
+                bus.publish({
+                    "type": "broadcast:progress",
+                    "broadcast_id": broadcast_id,
+                    "processed": processed,
+                    "total": total,
+                    "sent": sent_count,
+                    "failed": failed_count,
+                })
+                logger.info(
+                    "BROADCAST_PROGRESS broadcast_id=%s processed=%s/%s sent=%s failed=%s",
+                    broadcast_id, processed, total, sent_count, failed_count,
+                )
+                if i + BROADCAST_BATCH_SIZE < total:
+                    await pace(BROADCAST_BATCH_PAUSE)
 
         bus.publish({
             "type": "broadcast:done",
@@ -13,19 +13,36 @@ call sets a module-level flag and returns None. The bot caller then
 just doesn't show the Incy button — Happ keeps working, no exceptions
 escape.
 
-Async
------
-We use `asyncio.create_subprocess_exec` so each encode (~50–150 ms,
-mostly Node start-up) doesn't block the FastAPI event loop the way
-`subprocess.run` would.
+Sidecar pool
+------------
+By default (config.INCY_SIDECAR_POOL_SIZE > 0) the script runs in
+`--serve` mode: a few long-lived Node processes speaking newline-
+delimited JSON over stdin/stdout. Requests are pipelined (many in
+flight per process, matched by id), so an encode costs the AES-GCM
+call plus a pipe round-trip instead of ~150 ms of Node start-up.
+A process that dies or stops answering pings is restarted with
+backoff; a missing node/package still flips `_disabled` like before.
+INCY_SIDECAR_POOL_SIZE=0 falls back to one `node` spawn per encode
+(`_spawn`), via `asyncio.create_subprocess_exec` so it doesn't block
+the event loop.
+
+prewarm_active_users() pushes the aggregator links of recently active
+users through the pool into `_link_cache` in one batch (startup), so the
+profile screen doesn't pay the first encode after a deploy.
 """
 from __future__ import annotations
 
 import asyncio
+import itertools
+import json
 import logging
 import os
+import time
+from collections import deque
 from pathlib import Path
-from typing import Optional
+from typing import Iterable, Optional
+
+import config
 
 logger = logging.getLogger(__name__)
 
@@ -86,19 +103,19 @@ async def selftest() -> bool:
     user taps a broken button.
 
     Returns True on success, False on any failure (and flips _disabled
-    via the underlying _spawn machinery). Doesn't raise."""
+    via the underlying _spawn / pool machinery). Doesn't raise."""
     if _disabled:
         return False
     if not _SCRIPT_PATH.is_file():
         _mark_disabled(f"sidecar not found at {_SCRIPT_PATH}")
         return False
     try:
-        sample = await _spawn("https://selftest.atlassecure.ru/sub/00000000")
+        sample = await _encode("https://selftest.atlassecure.ru/sub/00000000")
     except Exception:
         logger.exception("INCY_SELFTEST_CRASH")
         return False
     if not sample:
-        # _spawn already set _disabled if the cause was permanent;
+        # _spawn / the pool already set _disabled if the cause was permanent;
         # transient timeouts/etc fall through here without disabling,
         # so the next real call gets another chance.
         logger.warning("INCY_SELFTEST_FAIL: no output (see WARNING above)")
@@ -110,6 +127,14 @@ async def selftest() -> bool:
     return True
 
 
+def _missing_package(err_text: str) -> bool:
+    return (
+        "ERR_MODULE_NOT_FOUND" in err_text
+        or "Cannot find package" in err_text
+        or "Cannot find module" in err_text
+    )
+
+
 async def _spawn(url: str) -> Optional[str]:
     """Run the Node sidecar once and return stdout, or None on any
     expected-by-the-TZ failure mode. Unexpected failures still return
@@ -152,11 +177,7 @@ async def _spawn(url: str) -> Optional[str]:
         err_text = (stderr or b"").decode("utf-8", "replace").strip()
         # The two stderr signatures that mean «package isn't installed»
         # — flip the kill-switch so we don't try again every request.
-        if (
-            "ERR_MODULE_NOT_FOUND" in err_text
-            or "Cannot find package" in err_text
-            or "Cannot find module" in err_text
-        ):
+        if _missing_package(err_text):
             _mark_disabled(f"@incy/link-encoder not installed: {err_text[:120]}")
             return None
         logger.warning("INCY_NODE_RC=%s stderr=%s", proc.returncode, err_text[:200])
@@ -169,6 +190,288 @@ async def _spawn(url: str) -> Optional[str]:
     return out
 
 
+# ── Persistent sidecar pool (`incy_encode.mjs --serve`) ─────────────
+
+REQUEST_TIMEOUT = 1.0          # AES-GCM < 1 ms; запас на GC/нагрузку Node
+STARTUP_TIMEOUT = 5.0          # node start + import пакета
+HEALTH_INTERVAL = 30.0         # ping каждого процесса
+RESTART_BACKOFF_MAX = 30.0
+PREWARM_BATCH = 128            # в полёте за раз — не упираться в REQUEST_TIMEOUT
+_STREAM_LIMIT = 1 << 20        # одна строка ответа; ссылки ~1–2 KB
+
+
+class _SidecarError(Exception):
+    pass
+
+
+class _Sidecar:
+    """One `node incy_encode.mjs --serve` process with pipelined requests."""
+
+    def __init__(self, index: int) -> None:
+        self.index = index
+        self.proc: Optional[asyncio.subprocess.Process] = None
+        self._reader: Optional[asyncio.Task] = None
+        self._stderr_task: Optional[asyncio.Task] = None
+        self._stderr_tail: deque = deque(maxlen=20)
+        self._pending: dict[int, asyncio.Future] = {}
+        self._ids = itertools.count(1)
+        self._write_lock = asyncio.Lock()
+        self._start_lock = asyncio.Lock()
+        self._failures = 0
+        self._next_start_at = 0.0
+
+    @property
+    def alive(self) -> bool:
+        return (
+            self.proc is not None
+            and self.proc.returncode is None
+            and self._reader is not None
+            and not self._reader.done()
+        )
+
+    @property
+    def in_flight(self) -> int:
+        return len(self._pending)
+
+    def can_start(self) -> bool:
+        return time.monotonic() >= self._next_start_at
+
+    async def ensure_started(self) -> bool:
+        if self.alive:
+            return True
+        async with self._start_lock:
+            if self.alive:
+                return True
+            if not self.can_start():
+                return False
+            await self.stop()
+            try:
+                await self._start()
+            except Exception as e:
+                if self._stderr_task is not None:
+                    try:
+                        await asyncio.wait_for(asyncio.shield(self._stderr_task), timeout=0.5)
+                    except Exception:
+                        pass
+                self._failures += 1
+                self._next_start_at = time.monotonic() + min(2.0 ** self._failures, RESTART_BACKOFF_MAX)
+                stderr = " | ".join(self._stderr_tail)
+                if _missing_package(stderr):
+                    _mark_disabled(f"@incy/link-encoder not installed: {stderr[:120]}")
+                else:
+                    logger.warning("INCY_SIDECAR_START_FAIL #%d: %s stderr=%s", self.index, e, stderr[:200])
+                await self.stop()
+                return False
+            self._failures = 0
+            return True
+
+    async def _start(self) -> None:
+        cwd = str(_SCRIPT_PATH.parent.parent)
+        self._stderr_tail.clear()
+        try:
+            self.proc = await asyncio.create_subprocess_exec(
+                "node", str(_SCRIPT_PATH), "--serve",
+                stdin=asyncio.subprocess.PIPE,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE,
+                cwd=cwd,
+                limit=_STREAM_LIMIT,
+            )
+        except FileNotFoundError:
+            _mark_disabled(
+                "node binary not on PATH — apt-get install nodejs needed "
+                f"(cwd={cwd}, script={_SCRIPT_PATH})"
+            )
+            raise
+        self._reader = asyncio.create_task(self._read_loop(self.proc))
+        self._stderr_task = asyncio.create_task(self._drain_stderr(self.proc))
+        # Первый ping = готовность: пакет импортирован, процесс отвечает.
+        await self.request({"ping": True}, STARTUP_TIMEOUT)
+        logger.info("INCY_SIDECAR_STARTED #%d pid=%s", self.index, self.proc.pid)
+
+    async def _read_loop(self, proc: asyncio.subprocess.Process) -> None:
+        try:
+            while True:
+                line = await proc.stdout.readline()
+                if not line:
+                    break
+                try:
+                    msg = json.loads(line)
+                except ValueError:
+                    logger.warning("INCY_SIDECAR_BAD_LINE #%d: %r", self.index, line[:120])
+                    continue
+                fut = self._pending.pop(msg.get("id"), None)
+                if fut is not None and not fut.done():
+                    fut.set_result(msg)
+        except Exception as e:
+            logger.warning("INCY_SIDECAR_READ_FAIL #%d: %s", self.index, e)
+        finally:
+            # EOF — процесс умер: будим всех ожидающих, запрос уйдёт в fallback.
+            try:
+                await asyncio.wait_for(proc.wait(), timeout=1.0)
+            except (asyncio.TimeoutError, Exception):
+                pass
+            pending, self._pending = self._pending, {}
+            for fut in pending.values():
+                if not fut.done():
+                    fut.set_exception(_SidecarError(f"sidecar exited rc={proc.returncode}"))
+
+    async def _drain_stderr(self, proc: asyncio.subprocess.Process) -> None:
+        try:
+            while True:
+                line = await proc.stderr.readline()
+                if not line:
+                    return
+                self._stderr_tail.append(line.decode("utf-8", "replace").strip())
+        except Exception:
+            return
+
+    async def request(self, payload: dict, timeout: float) -> dict:
+        if self.proc is None or self.proc.returncode is not None:
+            raise _SidecarError("sidecar not running")
+        req_id = next(self._ids)
+        fut = asyncio.get_running_loop().create_future()
+        self._pending[req_id] = fut
+        data = (json.dumps({"id": req_id, **payload}) + "\n").encode()
+        try:
+            async with self._write_lock:
+                self.proc.stdin.write(data)
+                await self.proc.stdin.drain()
+            return await asyncio.wait_for(fut, timeout=timeout)
+        except (BrokenPipeError, ConnectionResetError) as e:
+            raise _SidecarError(f"sidecar pipe closed: {e}") from e
+        finally:
+            self._pending.pop(req_id, None)
+
+    async def ping(self) -> bool:
+        try:
+            msg = await self.request({"ping": True}, REQUEST_TIMEOUT)
+        except Exception:
+            return False
+        return bool(msg.get("pong"))
+
+    async def stop(self) -> None:
+        proc, self.proc = self.proc, None
+        if proc is not None and proc.returncode is None:
+            try:
+                proc.stdin.close()
+            except Exception:
+                pass
+            try:
+                await asyncio.wait_for(proc.wait(), timeout=1.0)
+            except (asyncio.TimeoutError, Exception):
+                try:
+                    proc.kill()
+                except ProcessLookupError:
+                    pass
+        for task in (self._reader, self._stderr_task):
+            if task is not None and not task.done():
+                task.cancel()
+        self._reader = self._stderr_task = None
+
+
+class _SidecarPool:
+    def __init__(self, size: int) -> None:
+        self._workers = [_Sidecar(i) for i in range(max(1, size))]
+        self._health_task: Optional[asyncio.Task] = None
+
+    def _ensure_health_loop(self) -> None:
+        if self._health_task is None or self._health_task.done():
+            self._health_task = asyncio.create_task(self._health_loop(), name="incy_sidecar_health")
+
+    async def _pick(self) -> Optional[_Sidecar]:
+        self._ensure_health_loop()
+        alive = [w for w in self._workers if w.alive]
+        if alive:
+            return min(alive, key=lambda w: w.in_flight)
+        for w in self._workers:
+            if _disabled:
+                return None
+            if w.can_start() and await w.ensure_started():
+                return w
+        return None
+
+    async def encode(self, url: str) -> Optional[str]:
+        worker = await self._pick()
+        if worker is None:
+            return None
+        try:
+            msg = await worker.request({"url": url}, REQUEST_TIMEOUT)
+        except asyncio.TimeoutError:
+            logger.warning("INCY_SIDECAR_TIMEOUT #%d — restarting", worker.index)
+            await worker.stop()
+            return None
+        except _SidecarError as e:
+            logger.warning("INCY_SIDECAR_FAIL #%d: %s", worker.index, e)
+            return None
+        link = msg.get("link") or ""
+        if not link.startswith(DEEP_LINK_PREFIX):
+            logger.warning("INCY_BAD_OUTPUT: %r", (msg.get("error") or link)[:120])
+            return None
+        return link
+
+    async def health_check(self) -> int:
+        """Ping every process, restart the dead/stuck ones. Returns alive count."""
+        healthy = 0
+        for w in self._workers:
+            if _disabled:
+                break
+            if w.alive and await w.ping():
+                healthy += 1
+                continue
+            if w.alive:
+                logger.warning("INCY_SIDECAR_UNHEALTHY #%d — restarting", w.index)
+                await w.stop()
+            if await w.ensure_started():
+                healthy += 1
+        return healthy
+
+    async def _health_loop(self) -> None:
+        while not _disabled:
+            await asyncio.sleep(HEALTH_INTERVAL)
+            try:
+                await self.health_check()
+            except Exception as e:
+                logger.warning("INCY_SIDECAR_HEALTH_ERROR: %s", e)
+
+    async def close(self) -> None:
+        if self._health_task is not None and not self._health_task.done():
+            self._health_task.cancel()
+        for w in self._workers:
+            await w.stop()
+
+
+_pool: Optional[_SidecarPool] = None
+
+
+def _pool_size() -> int:
+    return max(0, int(getattr(config, "INCY_SIDECAR_POOL_SIZE", 0) or 0))
+
+
+def _get_pool() -> Optional[_SidecarPool]:
+    global _pool
+    if _pool_size() <= 0:
+        return None
+    if _pool is None:
+        _pool = _SidecarPool(_pool_size())
+    return _pool
+
+
+async def _encode(url: str) -> Optional[str]:
+    pool = _get_pool()
+    if pool is None:
+        return await _spawn(url)
+    return await pool.encode(url)
+
+
+async def close() -> None:
+    """Stop the sidecar processes (shutdown)."""
+    global _pool
+    pool, _pool = _pool, None
+    if pool is not None:
+        await pool.close()
+
+
 async def to_incy_link(url: Optional[str]) -> Optional[str]:
     """Wrap a plain subscription URL into an Incy-importable deep link.
 
@@ -216,7 +519,11 @@ async def to_incy_link(url: Optional[str]) -> Optional[str]:
     from urllib.parse import quote
     safe = quote(url, safe="/:?&=@%+")
     fallback = f"incy://add/{safe}"
-    _store_in_cache(url, fallback)
+    # С пулом сбой обычно временный (рестарт процесса) — fallback не
+    # кэшируем, следующий рендер получит crypt1. Навсегда — только
+    # когда sidecar выключен или работаем по-старому, spawn на вызов.
+    if _disabled or _get_pool() is None:
+        _store_in_cache(url, fallback)
     return fallback
 
 
@@ -244,12 +551,50 @@ async def to_incy_link_crypt1(url: Optional[str]) -> Optional[str]:
     if not _SCRIPT_PATH.is_file():
         _mark_disabled(f"sidecar not found at {_SCRIPT_PATH}")
         return None
-    return await _spawn(url)
+    return await _encode(url)
+
+
+async def prewarm(urls: Iterable[str]) -> int:
+    """Encode `urls` into `_link_cache` ahead of time. Requests are
+    pipelined through the pool; returns how many links were added.
+    No-op without the pool (spawn-per-call would only burn CPU)."""
+    if _disabled or _get_pool() is None or not _SCRIPT_PATH.is_file():
+        return 0
+    todo = [u for u in dict.fromkeys(urls) if u and u not in _link_cache]
+    todo = todo[:_LINK_CACHE_LIMIT]
+    if not todo:
+        return 0
+    added = 0
+    for i in range(0, len(todo), PREWARM_BATCH):
+        chunk = todo[i:i + PREWARM_BATCH]
+        links = await asyncio.gather(*(_encode(u) for u in chunk), return_exceptions=True)
+        for url, link in zip(chunk, links):
+            if isinstance(link, str):
+                _store_in_cache(url, link)
+                added += 1
+    return added
+
+
+async def prewarm_active_users(since_hours: int = 24) -> int:
+    """Startup pre-warm: aggregator links of users seen in the last
+    `since_hours` (see sub_aggregator.active_public_urls)."""
+    from app.services import sub_aggregator
+    urls = await sub_aggregator.active_public_urls(since_hours, _LINK_CACHE_LIMIT // 2)
+    started = time.monotonic()
+    added = await prewarm(urls)
+    logger.info(
+        "INCY_PREWARM: users=%d cached=%d in %.2fs",
+        len(urls), added, time.monotonic() - started,
+    )
+    return added
 
 
 __all__ = [
     "DEEP_LINK_PREFIX",
+    "close",
     "is_available",
+    "prewarm",
+    "prewarm_active_users",
     "to_incy_link",
     "to_incy_link_crypt1",
 ]
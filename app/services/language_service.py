@@ -2,36 +2,177 @@
 """
 Central language resolution for Atlas Secure.
 ALL user language must be obtained via resolve_user_language.
+
+resolve_user_language is called from hundreds of places, often several
+times per update and once per recipient in workers. A bounded LRU+TTL
+cache (telegram_id → language) sits in front of the DB; with Redis
+configured and LANGUAGE_CACHE_REDIS on, entries are also shared across
+processes under `lang:{telegram_id}`.
+
+database.update_user_language invalidates the entry. Workers can warm
+the cache for a whole batch with resolve_languages(ids) — one
+`ANY($1)` query for all misses.
 """
 import logging
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, Optional
 
+import config
 import database
 
 DEFAULT_LANGUAGE = "ru"  # Canonical fallback when DB unavailable or user missing
 logger = logging.getLogger(__name__)
 
+_REDIS_PREFIX = "lang:"
+
+# telegram_id → (language, expires_at monotonic)
+_cache: "OrderedDict[int, tuple[str, float]]" = OrderedDict()
+
+
+def _cache_get(telegram_id: int) -> Optional[str]:
+    entry = _cache.get(telegram_id)
+    if entry is None:
+        return None
+    lang, expires_at = entry
+    if expires_at < time.monotonic():
+        _cache.pop(telegram_id, None)
+        return None
+    _cache.move_to_end(telegram_id)
+    return lang
+
+
+def _cache_put(telegram_id: int, language: str) -> None:
+    _cache[telegram_id] = (language, time.monotonic() + config.LANGUAGE_CACHE_TTL_SECONDS)
+    _cache.move_to_end(telegram_id)
+    while len(_cache) > config.LANGUAGE_CACHE_MAX_ENTRIES:
+        _cache.popitem(last=False)
+
+
+async def _redis():
+    if not config.LANGUAGE_CACHE_REDIS:
+        return None
+    try:
+        from app.utils.redis_client import get_redis, is_configured
+        if not is_configured():
+            return None
+        return await get_redis()
+    except Exception:
+        return None
+
+
+async def _redis_get(telegram_id: int) -> Optional[str]:
+    r = await _redis()
+    if r is None:
+        return None
+    try:
+        return await r.get(f"{_REDIS_PREFIX}{telegram_id}")
+    except Exception as e:
+        logger.debug("language cache redis get failed: %s", e)
+        return None
+
+
+async def _redis_put_many(mapping: Dict[int, str]) -> None:
+    if not mapping:
+        return
+    r = await _redis()
+    if r is None:
+        return
+    try:
+        pipe = r.pipeline(transaction=False)
+        for telegram_id, lang in mapping.items():
+            pipe.set(f"{_REDIS_PREFIX}{telegram_id}", lang, ex=int(config.LANGUAGE_CACHE_TTL_SECONDS))
+        await pipe.execute()
+    except Exception as e:
+        logger.debug("language cache redis set failed: %s", e)
+
+
+async def invalidate_user_language(telegram_id: int) -> None:
+    """Drop cached language for a user (local + Redis)."""
+    _cache.pop(telegram_id, None)
+    r = await _redis()
+    if r is None:
+        return
+    try:
+        await r.delete(f"{_REDIS_PREFIX}{telegram_id}")
+    except Exception as e:
+        logger.debug("language cache redis delete failed: %s", e)
+
+
+def clear_language_cache() -> None:
+    _cache.clear()
+
 
 async def resolve_user_language(telegram_id: int) -> str:
     """
     Get user language from DB. If missing, set to DEFAULT_LANGUAGE and persist.
 
     This is the ONLY valid way to obtain user language in handlers.
+    Served from the in-process cache (then Redis) when possible.
     """
+    lang = _cache_get(telegram_id)
+    if lang is not None:
+        return lang
+
+    lang = await _redis_get(telegram_id)
+    if lang:
+        _cache_put(telegram_id, lang)
+        return lang
+
     try:
-        user = await database.get_user(telegram_id)
+        langs = await database.get_user_languages([telegram_id])
     except Exception as e:
         logger.warning(f"Failed to get user for language resolution (user={telegram_id}): {e}")
         return DEFAULT_LANGUAGE
 
-    if not user:
+    if telegram_id not in langs:
         logger.debug(f"[I18N] language resolved: {DEFAULT_LANGUAGE} for user {telegram_id} (no user)")
         return DEFAULT_LANGUAGE
 
-    lang = user.get("language")
+    lang = langs[telegram_id]
     if not lang:
         await database.update_user_language(telegram_id, DEFAULT_LANGUAGE)
         logger.debug(f"[I18N] language resolved: {DEFAULT_LANGUAGE} for user {telegram_id} (set default)")
         return DEFAULT_LANGUAGE
 
+    _cache_put(telegram_id, lang)
+    await _redis_put_many({telegram_id: lang})
     logger.debug(f"[I18N] language resolved: {lang} for user {telegram_id}")
     return lang
+
+
+async def resolve_languages(telegram_ids: Iterable[int]) -> Dict[int, str]:
+    """Bulk resolve for workers: cache hits + one `ANY($1)` query for misses.
+
+    Warms the cache, so subsequent resolve_user_language calls for the
+    same batch are free. Unknown users / NULL language → DEFAULT_LANGUAGE
+    (not cached; the single-user path persists the default).
+    """
+    result: Dict[int, str] = {}
+    misses = []
+    for tid in dict.fromkeys(int(t) for t in telegram_ids):
+        lang = _cache_get(tid)
+        if lang is not None:
+            result[tid] = lang
+        else:
+            misses.append(tid)
+    if not misses:
+        return result
+
+    try:
+        fetched = await database.get_user_languages(misses)
+    except Exception as e:
+        logger.warning("Bulk language resolution failed (n=%s): %s", len(misses), e)
+        fetched = {}
+
+    fresh: Dict[int, str] = {}
+    for tid in misses:
+        lang = fetched.get(tid)
+        if lang:
+            _cache_put(tid, lang)
+            fresh[tid] = lang
+            result[tid] = lang
+        else:
+            result[tid] = DEFAULT_LANGUAGE
+    await _redis_put_many(fresh)
+    return result
@@ -24,6 +24,7 @@ from typing import Any, Optional
 
 import config
 import database
+from app.core.pool_monitor import acquire_connection
 from app.services import remnawave_api
 
 logger = logging.getLogger(__name__)
@@ -135,11 +136,14 @@ async def fetch_candidates(
     *,
     limit: Optional[int] = None,
     only_tg: Optional[int] = None,
+    role: str = "read",
 ) -> list[UserRow]:
-    """Собрать список юзеров для аудита из subscriptions + traffic_purchases."""
-    pool = await database.get_pool()
-    if pool is None:
-        raise RuntimeError("database pool not ready")
+    """Собрать список юзеров для аудита из subscriptions + traffic_purchases.
+
+    Полный скан — читаем с реплики (role="read"), если она есть.
+    role="write" — с основного пула: перечитка перед записью (apply_fix)
+    не должна видеть данные реплики с отставанием.
+    """
 
     # `subscriptions` не хранит period_days напрямую — берём из последнего
     # paid-события в subscription_history (action_type ∈ {purchase, renewal,
@@ -186,7 +190,8 @@ async def fetch_candidates(
     if limit is not None:
         sql += f" LIMIT {int(limit)}"
 
-    async with pool.acquire() as conn:
+    pool = None if role == "read" else await database.get_pool()
+    async with acquire_connection(pool, "traffic_audit_candidates", role=role) as conn:
         rows = await conn.fetch(sql, *params)
     return [
         UserRow(
@@ -423,7 +428,7 @@ async def apply_fix(result: AuditResult) -> dict[str, Any]:
     if result.kind != "mismatch" or result.shortfall_bytes <= SHORTFALL_TOLERANCE_BYTES:
         return {"ok": False, "reason": "not_a_mismatch"}
 
-    rows = await fetch_candidates(only_tg=result.tg, limit=1)
+    rows = await fetch_candidates(only_tg=result.tg, limit=1, role="write")
     if not rows:
         return {"ok": False, "reason": "user_vanished_from_db"}
     row = rows[0]
@@ -14,6 +14,8 @@ import config
 import database
 from aiogram import Bot
 
+from app.core.telegram_scheduler import Priority, with_send_priority
+
 logger = logging.getLogger(__name__)
 
 
@@ -42,6 +44,7 @@ async def _get_current_bypass_bytes(telegram_id: int) -> Optional[int]:
         return None
 
 
+@with_send_priority(Priority.PAYMENT)
 async def process_confirmed_payment(
     provider: str,
     purchase_id: str,
@@ -0,0 +1,173 @@
+"""
+Payment webhook inbox — ingest and dispatch (migration 084).
+
+accept():        endpoint side. Provider auth check, event key, INSERT,
+                 wake the worker. No purchase lookup, no Remnawave, no
+                 Telegram — the HTTP reply no longer waits on any of them.
+process_event(): worker side. Runs the provider's handle_webhook_event
+                 on the stored body (auth was checked at ingest).
+
+Event key = (provider, invoice_id, event_status): provider retries of the
+same event collapse into one row, while Pending → Paid for one invoice
+are two different events.
+"""
+from __future__ import annotations
+
+import asyncio
+import importlib
+import logging
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from app.services.payments.confirmation import TransientPaymentError
+
+logger = logging.getLogger(__name__)
+
+_wakeup: Optional[asyncio.Event] = None
+
+
+def _event() -> asyncio.Event:
+    global _wakeup
+    if _wakeup is None:
+        _wakeup = asyncio.Event()
+    return _wakeup
+
+
+def wake() -> None:
+    """Tell the worker there is fresh work (same process)."""
+    _event().set()
+
+
+async def wait_for_work(timeout: float) -> bool:
+    """Sleep until wake() or `timeout`. True when woken."""
+    ev = _event()
+    try:
+        await asyncio.wait_for(ev.wait(), timeout)
+        return True
+    except asyncio.TimeoutError:
+        return False
+    finally:
+        ev.clear()
+
+
+# ── Event keys ────────────────────────────────────────────────────────
+
+def _key_platega(body: dict) -> Tuple[Any, str]:
+    return body.get("id") or body.get("transactionId"), str(body.get("status") or "").lower()
+
+
+def _key_platega_subscription(body: dict) -> Tuple[Any, str]:
+    # Списание — по Id; статусные события подписки приходят без Id.
+    charge_id = body.get("Id") or body.get("id")
+    status = str(body.get("Status") or body.get("status") or "").strip().upper()
+    if charge_id:
+        return charge_id, status
+    sub_id = body.get("SubscriptionId") or body.get("subscriptionId")
+    return (f"sub:{sub_id}" if sub_id else None), status
+
+
+def _key_cryptobot(body: dict) -> Tuple[Any, str]:
+    payload = body.get("payload") or {}
+    if not isinstance(payload, dict):
+        return None, ""
+    return payload.get("invoice_id"), f"{body.get('update_type') or ''}:{payload.get('status') or ''}"
+
+
+def _key_lava(body: dict) -> Tuple[Any, str]:
+    return body.get("invoice_id") or body.get("order_id"), str(body.get("status") or "")
+
+
+def _key_wata(body: dict) -> Tuple[Any, str]:
+    invoice = body.get("transactionId") or body.get("id") or body.get("orderId")
+    return invoice, f"{body.get('kind') or ''}:{body.get('transactionStatus') or ''}"
+
+
+# provider → (service module, handler name, key(body))
+_PROVIDERS: Dict[str, Tuple[str, str, Callable[[dict], Tuple[Any, str]]]] = {
+    "platega": ("platega_service", "handle_webhook_event", _key_platega),
+    "platega_subscription": ("platega_service", "handle_subscription_webhook_event", _key_platega_subscription),
+    "cryptobot": ("cryptobot_service", "handle_webhook_event", _key_cryptobot),
+    "lava": ("lava_service", "handle_webhook_event", _key_lava),
+    "wata": ("wata_service", "handle_webhook_event", _key_wata),
+}
+
+
+async def _verify(provider: str, headers: dict, raw_body: bytes) -> bool:
+    if provider == "platega":
+        import platega_service
+        return platega_service.verify_webhook_auth(headers)
+    if provider == "platega_subscription":
+        import platega_service
+        return platega_service.verify_webhook_auth(headers, kind="sub webhook")
+    if provider == "cryptobot":
+        import cryptobot_service
+        return cryptobot_service.verify_webhook_auth(headers, raw_body)
+    if provider == "wata":
+        import wata_service
+        return await wata_service.verify_webhook_auth(headers, raw_body)
+    # Lava: подпись сейчас не проверяется и inline (статус перепроверяется
+    # через API в handle_webhook_event).
+    return True
+
+
+_UNAUTHORIZED = {"wata": "invalid_signature"}
+
+
+async def accept(provider: str, headers: dict, raw_body: bytes, body: dict) -> Optional[dict]:
+    """Verify and persist one webhook. Returns the HTTP reply body.
+
+    None means the event has no usable key — the caller processes it
+    inline the old way. Raises TransientPaymentError when the DB is down
+    (the endpoint answers 500 and the provider retries).
+    """
+    import database
+
+    if not database.DB_READY:
+        raise TransientPaymentError("DB not ready")
+    if not await _verify(provider, headers, raw_body):
+        return {"status": _UNAUTHORIZED.get(provider, "unauthorized")}
+
+    _, _, key_fn = _PROVIDERS[provider]
+    invoice_id, event_status = key_fn(body if isinstance(body, dict) else {})
+    if not invoice_id:
+        return None
+
+    try:
+        row_id = await database.enqueue_payment_event(provider, str(invoice_id), event_status, body)
+    except Exception as e:
+        raise TransientPaymentError(f"inbox insert failed: {e}") from e
+    if row_id is None:
+        logger.info(
+            "PAYMENT_INBOX_DUPLICATE: provider=%s invoice=%s event=%s",
+            provider, invoice_id, event_status,
+        )
+        return {"status": "accepted", "duplicate": True}
+    logger.info(
+        "PAYMENT_INBOX_ACCEPTED: id=%s provider=%s invoice=%s event=%s",
+        row_id, provider, invoice_id, event_status,
+    )
+    wake()
+    return {"status": "accepted"}
+
+
+async def enqueue_reconciled(provider: str, body: dict) -> bool:
+    """Feed an event found by polling (wata_reconciler) into the same inbox.
+
+    Shares the event key with the webhook, so if the webhook lands too
+    only one of them is processed. Returns False for a duplicate.
+    """
+    import database
+
+    invoice_id, event_status = _PROVIDERS[provider][2](body)
+    row_id = await database.enqueue_payment_event(
+        provider, str(invoice_id), event_status, body, source="reconciler",
+    )
+    if row_id is not None:
+        wake()
+    return row_id is not None
+
+
+async def process_event(event: Dict[str, Any], bot) -> dict:
+    """Run the provider handler on a stored event. Exceptions propagate."""
+    module_name, handler_name, _ = _PROVIDERS[event["provider"]]
+    handler = getattr(importlib.import_module(module_name), handler_name)
+    return await handler(event["body"], bot) or {}
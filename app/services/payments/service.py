@@ -455,7 +455,8 @@ async def finalize_subscription_payment(
     telegram_id: int,
     payment_provider: str,
     amount_rubles: float,
-    invoice_id: Optional[str] = None
+    invoice_id: Optional[str] = None,
+    remnawave_renew: bool = False,
 ) -> PaymentResult:
     """
     Finalize subscription payment.
@@ -473,6 +474,8 @@ async def finalize_subscription_payment(
         payment_provider: Payment provider name
         amount_rubles: Actual payment amount in rubles
         invoice_id: Optional invoice ID from payment provider
+        remnawave_renew: Queue the Remnawave bypass renew (outbox) in the
+            finalize transaction
         
     Returns:
         PaymentResult with subscription details
@@ -556,7 +559,8 @@ async def finalize_subscription_payment(
             purchase_id=purchase_id,
             payment_provider=payment_provider,
             amount_rubles=amount_rubles,
-            invoice_id=invoice_id
+            invoice_id=invoice_id,
+            remnawave_renew=remnawave_renew,
         )
         
         if not result or not result.get("success"):
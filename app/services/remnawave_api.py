@@ -32,16 +32,128 @@ Backwards-compat helpers:
     БД нет закешированного id (не забэкфильнутый юзер).
 """
 import logging
+import re
+import time
 from typing import Optional, Dict, Any, Union
 from urllib.parse import quote
 
 import httpx
 import config
+from app.core import metrics
 
 logger = logging.getLogger(__name__)
 
 _TIMEOUT = httpx.Timeout(connect=5.0, read=10.0, write=5.0, pool=5.0)
 
+# Один keep-alive клиент на процесс: раньше каждый _request открывал новый
+# AsyncClient → TCP+TLS handshake на КАЖДЫЙ get_user / PATCH / страницу
+# stream. Под payment-бурстом и в traffic_monitor/panel_traffic_audit это
+# была основная латентность. Закрывается в main.py shutdown через close().
+_client: Optional[httpx.AsyncClient] = None
+
+
+def _http2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def _get_client() -> httpx.AsyncClient:
+    """Process-wide httpx клиент с ограниченным keep-alive пулом.
+
+    HTTP/2 включается только при REMNAWAVE_HTTP2=true И установленном
+    пакете `h2` — иначе молча остаёмся на HTTP/1.1 (панель за nginx).
+    """
+    global _client
+    if _client is None or _client.is_closed:
+        http2 = bool(config.REMNAWAVE_HTTP2) and _http2_available()
+        _client = httpx.AsyncClient(
+            timeout=_TIMEOUT,
+            http2=http2,
+            limits=httpx.Limits(
+                max_keepalive_connections=config.REMNAWAVE_HTTP_MAX_KEEPALIVE,
+                max_connections=config.REMNAWAVE_HTTP_MAX_CONNECTIONS,
+                keepalive_expiry=30.0,
+            ),
+        )
+        logger.info(
+            "REMNAWAVE_CLIENT_CREATED http2=%s max_connections=%s keepalive=%s",
+            http2, config.REMNAWAVE_HTTP_MAX_CONNECTIONS, config.REMNAWAVE_HTTP_MAX_KEEPALIVE,
+        )
+    return _client
+
+
+async def close() -> None:
+    """Закрыть общий клиент (graceful shutdown)."""
+    global _client
+    if _client is not None:
+        try:
+            await _client.aclose()
+            logger.info("Remnawave HTTP client closed")
+        except Exception as e:
+            logger.warning("Remnawave HTTP client close error: %s", e)
+        finally:
+            _client = None
+
+
+# ── Latency counters ───────────────────────────────────────────────────
+# Per-endpoint: {"GET /api/users/{id}": {"count", "errors", "total_ms", "max_ms"}}.
+# Path нормализуется (query отрезается, numeric id / uuid → плейсхолдер),
+# чтобы кардинальность оставалась фиксированной.
+
+_latency: Dict[str, Dict[str, float]] = {}
+
+_NUMERIC_SEGMENT_RE = re.compile(r"/\d+(?=/|$)")
+_UUID_SEGMENT_RE = re.compile(
+    r"/[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}(?=/|$)"
+)
+
+
+def _endpoint_key(method: str, path: str) -> str:
+    bare = path.split("?", 1)[0]
+    bare = _UUID_SEGMENT_RE.sub("/{uuid}", bare)
+    bare = _NUMERIC_SEGMENT_RE.sub("/{id}", bare)
+    return f"{method.upper()} {bare}"
+
+
+def _record_latency(method: str, path: str, started: float, ok: bool) -> None:
+    elapsed = time.monotonic() - started
+    elapsed_ms = elapsed * 1000.0
+    key = _endpoint_key(method, path)
+    metrics.REMNAWAVE_SECONDS.observe(elapsed, endpoint=key)
+    if not ok:
+        metrics.REMNAWAVE_ERRORS.inc(endpoint=key)
+    stat = _latency.get(key)
+    if stat is None:
+        stat = {"count": 0, "errors": 0, "total_ms": 0.0, "max_ms": 0.0}
+        _latency[key] = stat
+    stat["count"] += 1
+    if not ok:
+        stat["errors"] += 1
+    stat["total_ms"] += elapsed_ms
+    if elapsed_ms > stat["max_ms"]:
+        stat["max_ms"] = elapsed_ms
+
+
+def get_latency_stats() -> Dict[str, Dict[str, float]]:
+    """Снимок счётчиков латентности по endpoint (для админки / диагностики)."""
+    out: Dict[str, Dict[str, float]] = {}
+    for key, stat in _latency.items():
+        count = int(stat["count"])
+        out[key] = {
+            "count": count,
+            "errors": int(stat["errors"]),
+            "avg_ms": round(stat["total_ms"] / count, 2) if count else 0.0,
+            "max_ms": round(stat["max_ms"], 2),
+        }
+    return out
+
+
+def reset_latency_stats() -> None:
+    _latency.clear()
+
 
 def _headers() -> dict:
     return {
@@ -64,9 +176,14 @@ async def _request(
 ) -> Optional[Dict[str, Any]]:
     """Send request to Remnawave API and unwrap {response: ...} envelope."""
     url = f"{config.REMNAWAVE_API_URL}{path}"
+    started = time.monotonic()
     try:
-        async with httpx.AsyncClient(timeout=_TIMEOUT) as client:
-            resp = await client.request(method, url, headers=_headers(), **kwargs)
+        try:
+            resp = await _get_client().request(method, url, headers=_headers(), **kwargs)
+        except Exception:
+            _record_latency(method, path, started, ok=False)
+            raise
+        _record_latency(method, path, started, ok=resp.status_code < 400)
 
         # 204/202 → успех без тела. Возвращаем sentinel-{}, чтобы caller
         # различил успех vs неудачу.
@@ -115,15 +232,18 @@ async def _request_raw(
         {"ok": bool, "status": int, "body": parsed-json-or-text, "response": unwrapped-or-None}
     """
     url = f"{config.REMNAWAVE_API_URL}{path}"
+    started = time.monotonic()
     try:
-        async with httpx.AsyncClient(timeout=_TIMEOUT) as client:
-            resp = await client.request(method, url, headers=_headers(), **kwargs)
+        resp = await _get_client().request(method, url, headers=_headers(), **kwargs)
     except httpx.TimeoutException:
+        _record_latency(method, path, started, ok=False)
         logger.error("REMNAWAVE_TIMEOUT: %s %s", method, path)
         return {"ok": False, "status": 0, "body": None, "response": None, "error": "timeout"}
     except Exception as e:
+        _record_latency(method, path, started, ok=False)
         logger.error("REMNAWAVE_ERROR: %s %s %s: %s", method, path, type(e).__name__, e)
         return {"ok": False, "status": 0, "body": None, "response": None, "error": str(e)}
+    _record_latency(method, path, started, ok=resp.status_code < 400)
 
     try:
         body: Any = resp.json()
@@ -394,24 +514,32 @@ async def _resolve_to_int_id(value: Union[str, int]) -> Optional[int]:
     return None
 
 
-async def get_all_users(
+async def scan_users(
+    on_page,
     page_size: int = 250,
     progress_cb=None,
-) -> Optional[list]:
-    """GET /api/users/stream с курсорной пагинацией (3.x).
+) -> Optional[int]:
+    """GET /api/users/stream с курсорной пагинацией (3.x), постранично.
 
     3.x перевёл общий scan на stream-endpoint. Default size = 250,
     max = 1000. Пагинация через `nextCursor` (integer, был string в 2.x).
 
+    on_page (sync или async) получает list юзеров каждой страницы — caller
+    сам решает что оставить (traffic_monitor держит только id→bytes, а не
+    полные entity на 20k юзеров).
+
     Retries: 3 попытки на страницу с exponential backoff.
 
     progress_cb (опциональный, sync или async) вызывается после каждой
     страницы с (collected, total_or_none).
+
+    Возвращает число просмотренных юзеров или None, если страница не
+    загрузилась после ретраев (частичный результат — не полный snapshot).
     """
     import asyncio
     if page_size > 1000:
         page_size = 1000
-    collected: list = []
+    seen = 0
     cursor: Optional[int] = None
     total: Optional[int] = None
     safety_pages = 0
@@ -443,13 +571,17 @@ async def get_all_users(
             next_cursor = None
         else:
             return None
-        collected.extend(batch)
+        seen += len(batch)
+        if asyncio.iscoroutinefunction(on_page):
+            await on_page(batch)
+        else:
+            on_page(batch)
         if progress_cb is not None:
             try:
                 if asyncio.iscoroutinefunction(progress_cb):
-                    await progress_cb(len(collected), total)
+                    await progress_cb(seen, total)
                 else:
-                    progress_cb(len(collected), total)
+                    progress_cb(seen, total)
             except Exception:
                 pass
         if not batch or next_cursor is None:
@@ -459,6 +591,22 @@ async def get_all_users(
         if safety_pages > 8000:  # 8000 * 250 = 2M records safety
             logger.error("REMNAWAVE_STREAM: aborted at 8000 pages")
             break
+    return seen
+
+
+async def get_all_users(
+    page_size: int = 250,
+    progress_cb=None,
+) -> Optional[list]:
+    """Все юзеры панели одним списком (обёртка над scan_users).
+
+    Возвращает None, если stream оборвался — caller не должен принимать
+    частичный список за полный snapshot.
+    """
+    collected: list = []
+    scanned = await scan_users(collected.extend, page_size=page_size, progress_cb=progress_cb)
+    if scanned is None:
+        return None
     return collected
 
 
@@ -635,12 +783,26 @@ async def delete_all_user_hwid_devices(user_id: Union[str, int]) -> bool:
     return await _hwid_delete("delete-all", {"userId": resolved})
 
 
-async def delete_user(user_id: Union[str, int]) -> Optional[Dict[str, Any]]:
-    """DELETE /api/users/{userId} (3.x). Возвращает 204 → {}."""
+async def delete_user(
+    user_id: Union[str, int],
+    *,
+    raw_response: bool = False,
+) -> Optional[Dict[str, Any]]:
+    """DELETE /api/users/{userId} (3.x). Возвращает 204 → {}.
+
+    raw_response=True — envelope _request_raw, чтобы caller отличил
+    «юзера уже нет» (404 / id не резолвится → status=404) от
+    транспортной ошибки (status=0) и 5xx.
+    """
     resolved = await _resolve_to_int_id(user_id)
     if resolved is None:
+        if raw_response:
+            return {"ok": False, "status": 404, "body": None, "response": None, "error": "unresolved"}
         return None
-    return await _request("DELETE", f"/api/users/{resolved}")
+    path = f"/api/users/{resolved}"
+    if raw_response:
+        return await _request_raw("DELETE", path)
+    return await _request("DELETE", path)
 
 
 # ── Search (3.x — только через stream) ────────────────────────────────
@@ -2,15 +2,18 @@
 High-level Remnawave operations (create / renew / delete / add_traffic).
 
 All public functions follow fire-and-forget pattern:
-- *_bg() variants schedule work as background tasks
-- Errors are logged but never raised to callers
+- *_bg() variants queue the mutation in remnawave_outbox (migration 083);
+  app/workers/remnawave_outbox applies it with retries. With
+  REMNAWAVE_OUTBOX_ENABLED=false they schedule a background task as before
+- Errors are logged but never raised to callers; mutations return False
+  when the panel call failed so the outbox can retry
 - Main subscription flow must never fail because of Remnawave
 """
 import asyncio
 import logging
 import uuid as uuid_lib
 from datetime import datetime, timezone, timedelta
-from typing import Any, Optional
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
 
 import config
 import database
@@ -93,22 +96,24 @@ async def create_remnawave_user(
     subscription_end: datetime,
     traffic_limit_override: Optional[int] = None,
     period_days: int = 30,
-) -> None:
+) -> bool:
     """Create a Remnawave user for the given subscriber.
 
     Args:
         traffic_limit_override: if set, use this instead of tariff-based limit.
             Used for auto-provisioning existing users with a smaller starter pack.
         period_days: subscription period for traffic calculation.
+
+    Returns False only when the panel call failed (outbox retries it).
     """
     if not config.REMNAWAVE_ENABLED:
-        return
+        return True
     if tariff == "trial" and not traffic_limit_override:
-        return  # Trial without explicit override gets no bypass
+        return True  # Trial without explicit override gets no bypass
 
     traffic_limit = traffic_limit_override or _traffic_limit_for_tariff(tariff, period_days)
     if traffic_limit <= 0:
-        return
+        return True
 
     try:
         short_uuid = str(uuid_lib.uuid4())[:12]
@@ -160,12 +165,15 @@ async def create_remnawave_user(
                     update_fields["trafficLimitBytes"] = int(traffic_limit)
                 if not existing.get("telegramId"):
                     update_fields["telegramId"] = int(telegram_id)
-                await remnawave_api.update_user(
+                updated = await remnawave_api.update_user(
                     int(existing_id) if existing_id is not None else existing_uuid,
                     **update_fields,
                 )
+                if updated is None:
+                    logger.warning("REMNAWAVE_USER_ADOPT_PATCH_FAILED: tg=%s", telegram_id)
+                    return False
                 await database.reset_traffic_notification_flags(telegram_id)
-                return
+                return True
 
         result = await remnawave_api.create_user(
             username=str(telegram_id),
@@ -194,14 +202,31 @@ async def create_remnawave_user(
                 "REMNAWAVE_USER_CREATED: tg=%s uuid=%s sub_url=%s tariff=%s limit=%d",
                 telegram_id, rmn_uuid[:8], sub_url, tariff, traffic_limit,
             )
-        else:
-            logger.warning("REMNAWAVE_USER_CREATE_FAILED: tg=%s", telegram_id)
+            return True
+        logger.warning("REMNAWAVE_USER_CREATE_FAILED: tg=%s", telegram_id)
+        return False
     except Exception as e:
         logger.error("REMNAWAVE_CREATE_ERROR: tg=%s %s: %s", telegram_id, type(e).__name__, e)
+        return False
 
 
-def create_remnawave_user_bg(telegram_id: int, tariff: str, subscription_end: datetime, period_days: int = 30) -> None:
-    _fire_and_forget(create_remnawave_user(telegram_id, tariff, subscription_end, period_days=period_days))
+def create_remnawave_user_bg(
+    telegram_id: int,
+    tariff: str,
+    subscription_end: datetime,
+    period_days: int = 30,
+    traffic_limit_override: Optional[int] = None,
+) -> None:
+    payload = {"tariff": tariff, "subscription_end": _iso(subscription_end), "period_days": period_days}
+    if traffic_limit_override:
+        payload["traffic_limit_override"] = int(traffic_limit_override)
+    _enqueue_bg(
+        telegram_id, "create", payload,
+        lambda: create_remnawave_user(
+            telegram_id, tariff, subscription_end,
+            traffic_limit_override=traffic_limit_override, period_days=period_days,
+        ),
+    )
 
 
 async def ensure_squad(telegram_id: int) -> None:
@@ -225,6 +250,12 @@ async def ensure_squad(telegram_id: int) -> None:
         logger.error("REMNAWAVE_ENSURE_SQUAD_ERROR: tg=%s %s", telegram_id, e)
 
 
+def ensure_squad_bg(telegram_id: int) -> None:
+    if not config.REMNAWAVE_SQUAD_UUID:
+        return
+    _enqueue_bg(telegram_id, "ensure_squad", None, lambda: ensure_squad(telegram_id))
+
+
 # ── Renew (extend traffic) ─────────────────────────────────────────────
 
 async def renew_remnawave_user(
@@ -232,30 +263,49 @@ async def renew_remnawave_user(
     tariff: str,
     subscription_end: datetime,
     period_days: int = 30,
-) -> None:
-    """Renew: add tariff traffic to current limit, update expiry."""
+    *,
+    traffic_add_override: Optional[int] = None,
+    expire_marker: Optional[str] = None,
+    checkpoint: Optional[Callable[..., Awaitable[None]]] = None,
+) -> bool:
+    """Renew: add tariff traffic to current limit, update expiry.
+
+    The outbox dispatcher passes `traffic_add_override` (several renewals
+    coalesced into one PATCH) and `checkpoint`, which persists the expireAt
+    this PATCH is about to set. On retry `expire_marker` is that value: if
+    the panel's expireAt equals it, the previous attempt landed and the
+    response was lost, so the traffic is not added twice. The traffic limit
+    is not used for this — add_bypass_traffic can raise it in between.
+    """
     if not config.REMNAWAVE_ENABLED:
-        return
+        return True
     if tariff == "trial":
-        return
+        return True
 
-    traffic_add = _traffic_limit_for_tariff(tariff, period_days)
+    if traffic_add_override is not None:
+        traffic_add = traffic_add_override
+    else:
+        traffic_add = _traffic_limit_for_tariff(tariff, period_days)
     if traffic_add <= 0:
-        return
+        return True
 
     try:
         rmn_uuid = await database.get_remnawave_uuid(telegram_id)
         if not rmn_uuid:
             # User has no Remnawave account yet — create one
-            await create_remnawave_user(telegram_id, tariff, subscription_end, period_days=period_days)
-            return
+            return await create_remnawave_user(
+                telegram_id, tariff, subscription_end,
+                traffic_limit_override=traffic_add_override, period_days=period_days,
+            )
 
         # Get current limit and add tariff traffic
         user_data = await _get_user_with_recovery(telegram_id, rmn_uuid)
         if not user_data:
             # User might have been deleted from Remnawave — recreate
-            await create_remnawave_user(telegram_id, tariff, subscription_end, period_days=period_days)
-            return
+            return await create_remnawave_user(
+                telegram_id, tariff, subscription_end,
+                traffic_limit_override=traffic_add_override, period_days=period_days,
+            )
 
         # Резолвим цель через numeric bypass id из БД — не через
         # user_data.get("uuid"), чтобы гарантированно попасть в bypass
@@ -265,23 +315,32 @@ async def renew_remnawave_user(
             user_data.get("uuid") or rmn_uuid
         )
         current_limit = user_data.get("trafficLimitBytes", 0)
-        new_limit = current_limit + traffic_add
-        # Bypass works by traffic (GB), not by date — keep expireAt far future
-        # so Remnawave is never marked expired while GB remain.
-        far_future = datetime.now(timezone.utc) + timedelta(days=3650)
-        expire_str = far_future.strftime("%Y-%m-%dT%H:%M:%SZ")
-
-        await remnawave_api.update_user(
-            api_target,
-            trafficLimitBytes=new_limit,
-            expireAt=expire_str,
+        if expire_marker is not None and _same_instant(user_data.get("expireAt"), expire_marker):
+            # Прошлая попытка дошла до панели (expireAt — наш), ответ потерялся.
+            new_limit = current_limit
+            expire_str = expire_marker
+        else:
+            new_limit = current_limit + traffic_add
+            # Bypass works by traffic (GB), not by date — keep expireAt far
+            # future so Remnawave is never marked expired while GB remain.
+            far_future = datetime.now(timezone.utc) + timedelta(days=3650)
+            expire_str = far_future.strftime("%Y-%m-%dT%H:%M:%SZ")
+            if checkpoint is not None:
+                await checkpoint(expire_marker=expire_str)
+
+        fields = {
+            "trafficLimitBytes": new_limit,
+            "expireAt": expire_str,
             # 3.x: hwidDeviceLimit — новое имя. Шлём оба для совместимости.
-            hwidDeviceLimit=_device_limit_for_tariff(tariff),
-            deviceLimit=_device_limit_for_tariff(tariff),
-        )
-        # Re-enable if disabled
+            "hwidDeviceLimit": _device_limit_for_tariff(tariff),
+            "deviceLimit": _device_limit_for_tariff(tariff),
+        }
+        # Re-enable if disabled — тем же PATCH'ем
         if user_data.get("status") != "ACTIVE":
-            await remnawave_api.update_user(api_target, status="ACTIVE")
+            fields["status"] = "ACTIVE"
+        if await remnawave_api.update_user(api_target, **fields) is None:
+            logger.warning("REMNAWAVE_RENEW_PATCH_FAILED: tg=%s target=%s", telegram_id, str(api_target)[:16])
+            return False
         # Ensure squad assigned (skip if already has one)
         if config.REMNAWAVE_SQUAD_UUID:
             squads = user_data.get("activeInternalSquads") or []
@@ -292,17 +351,23 @@ async def renew_remnawave_user(
             "REMNAWAVE_RENEWED: tg=%s target=%s old_limit=%d new_limit=%d",
             telegram_id, str(api_target)[:16], current_limit, new_limit,
         )
+        return True
     except Exception as e:
         logger.error("REMNAWAVE_RENEW_ERROR: tg=%s %s: %s", telegram_id, type(e).__name__, e)
+        return False
 
 
 def renew_remnawave_user_bg(telegram_id: int, tariff: str, subscription_end: datetime, period_days: int = 30) -> None:
-    _fire_and_forget(renew_remnawave_user(telegram_id, tariff, subscription_end, period_days=period_days))
+    _enqueue_bg(
+        telegram_id, "renew",
+        {"tariff": tariff, "subscription_end": _iso(subscription_end), "period_days": period_days},
+        lambda: renew_remnawave_user(telegram_id, tariff, subscription_end, period_days=period_days),
+    )
 
 
 # ── Disable (subscription expired) ─────────────────────────────────────
 
-async def extend_remnawave_for_bypass(telegram_id: int) -> None:
+async def extend_remnawave_for_bypass(telegram_id: int) -> bool:
     """Extend Remnawave expiry to far future for bypass-only mode.
 
     When main subscription expires but user has bypass traffic,
@@ -310,42 +375,47 @@ async def extend_remnawave_for_bypass(telegram_id: int) -> None:
     Otherwise Remnawave marks user as expired and bypass stops working.
     """
     if not config.REMNAWAVE_ENABLED:
-        return
+        return True
     try:
         rmn_uuid = await database.get_remnawave_uuid(telegram_id)
         if not rmn_uuid:
-            return
+            return True
         user_data = await _get_user_with_recovery(telegram_id, rmn_uuid)
         if not user_data:
-            return
+            # Панельного юзера нет — продлевать нечего, op завершён
+            # (иначе outbox ретраит его до dead).
+            return True
         api_uuid = user_data.get("uuid") or rmn_uuid
 
-        from datetime import timedelta
         far_future = (datetime.now(timezone.utc) + timedelta(days=3650)).strftime("%Y-%m-%dT%H:%M:%SZ")
-        await remnawave_api.update_user(api_uuid, expireAt=far_future, status="ACTIVE")
+        if await remnawave_api.update_user(api_uuid, expireAt=far_future, status="ACTIVE") is None:
+            return False
         logger.info("REMNAWAVE_BYPASS_EXTENDED: tg=%s uuid=%s — expiry set to +10 years", telegram_id, api_uuid[:8])
+        return True
     except Exception as e:
         logger.error("REMNAWAVE_BYPASS_EXTEND_ERROR: tg=%s %s: %s", telegram_id, type(e).__name__, e)
+        return False
 
 
 def extend_remnawave_for_bypass_bg(telegram_id: int) -> None:
-    _fire_and_forget(extend_remnawave_for_bypass(telegram_id))
+    _enqueue_bg(telegram_id, "extend_bypass", None, lambda: extend_remnawave_for_bypass(telegram_id))
 
 
-async def disable_remnawave_user(telegram_id: int) -> None:
+async def disable_remnawave_user(telegram_id: int) -> bool:
     """Disable Remnawave user when subscription expires.
 
     If user still has bypass traffic remaining — extend instead of disable.
     """
     if not config.REMNAWAVE_ENABLED:
-        return
+        return True
     try:
         rmn_uuid = await database.get_remnawave_uuid(telegram_id)
         if not rmn_uuid:
-            return
+            return True
         user_data = await _get_user_with_recovery(telegram_id, rmn_uuid)
         if not user_data:
-            return
+            # Панельного юзера нет — отключать нечего.
+            return True
         api_uuid = user_data.get("uuid") or rmn_uuid
 
         # Check if user still has bypass traffic — don't disable if GB remaining
@@ -354,42 +424,203 @@ async def disable_remnawave_user(telegram_id: int) -> None:
         if traffic_limit > 0 and traffic_used < traffic_limit:
             # User still has bypass GB — extend instead of disable
             far_future = (datetime.now(timezone.utc) + timedelta(days=3650)).strftime("%Y-%m-%dT%H:%M:%SZ")
-            await remnawave_api.update_user(api_uuid, expireAt=far_future, status="ACTIVE")
+            if await remnawave_api.update_user(api_uuid, expireAt=far_future, status="ACTIVE") is None:
+                return False
             logger.info("REMNAWAVE_KEPT_ACTIVE: tg=%s uuid=%s — bypass traffic remaining (%d/%d bytes)",
                         telegram_id, api_uuid[:8], traffic_used, traffic_limit)
-            return
+            return True
 
-        await remnawave_api.update_user(api_uuid, status="DISABLED")
+        if await remnawave_api.update_user(api_uuid, status="DISABLED") is None:
+            return False
         logger.info("REMNAWAVE_DISABLED: tg=%s uuid=%s", telegram_id, api_uuid[:8])
+        return True
     except Exception as e:
         logger.error("REMNAWAVE_DISABLE_ERROR: tg=%s %s: %s", telegram_id, type(e).__name__, e)
+        return False
 
 
 def disable_remnawave_user_bg(telegram_id: int) -> None:
-    _fire_and_forget(disable_remnawave_user(telegram_id))
+    _enqueue_bg(telegram_id, "disable", None, lambda: disable_remnawave_user(telegram_id))
 
 
 # ── Delete ─────────────────────────────────────────────────────────────
 
-async def delete_remnawave_user(telegram_id: int) -> None:
-    """Delete Remnawave user and clear DB reference."""
+async def delete_remnawave_user(telegram_id: int) -> bool:
+    """Delete Remnawave user and clear DB reference.
+
+    «Уже удалён» (404 / id не резолвится / 4xx) — тоже успех: uuid
+    чистим, op завершён. False — только транспорт и 5xx (outbox ретраит).
+    """
     if not config.REMNAWAVE_ENABLED:
-        return
+        return True
     try:
         rmn_uuid = await database.get_remnawave_uuid(telegram_id)
         if not rmn_uuid:
-            return
+            return True
         user_data = await _get_user_with_recovery(telegram_id, rmn_uuid)
         api_uuid = (user_data.get("uuid") if user_data else None) or rmn_uuid
-        await remnawave_api.delete_user(api_uuid)
+        raw = await remnawave_api.delete_user(api_uuid, raw_response=True) or {}
+        status = int(raw.get("status") or 0)
+        if not raw.get("ok") and (status == 0 or status >= 500):
+            return False
         await database.clear_remnawave_uuid(telegram_id)
-        logger.info("REMNAWAVE_DELETED: tg=%s uuid=%s", telegram_id, api_uuid[:8])
+        if raw.get("ok"):
+            logger.info("REMNAWAVE_DELETED: tg=%s uuid=%s", telegram_id, api_uuid[:8])
+        else:
+            logger.info("REMNAWAVE_ALREADY_GONE: tg=%s uuid=%s status=%s", telegram_id, api_uuid[:8], status)
+        return True
     except Exception as e:
         logger.error("REMNAWAVE_DELETE_ERROR: tg=%s %s: %s", telegram_id, type(e).__name__, e)
+        return False
 
 
 def delete_remnawave_user_bg(telegram_id: int) -> None:
-    _fire_and_forget(delete_remnawave_user(telegram_id))
+    _enqueue_bg(telegram_id, "delete", None, lambda: delete_remnawave_user(telegram_id))
+
+
+# ── Outbox (migration 083) ─────────────────────────────────────────────
+#
+# Платёжные / renew / grant пути и истечение подписки пишут строку в
+# remnawave_outbox в своей транзакции (database.enqueue_remnawave_renew,
+# enqueue_remnawave_op(..., conn=conn)). *_bg() — для остальных мест,
+# где транзакции под рукой нет: строка пишется сразу после commit'а.
+# Панельный вызов делает app/workers/remnawave_outbox. Порядок по юзеру —
+# по id строки.
+
+# Подряд идущие extend_bypass / disable: итог определяет последний
+# (оба выставляют expireAt/status целиком).
+_STATUS_OPS = ("extend_bypass", "disable")
+
+
+def _iso(value) -> Optional[str]:
+    return value.isoformat() if hasattr(value, "isoformat") else value
+
+
+def _parse_dt(value) -> Optional[datetime]:
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(str(value))
+    except ValueError:
+        return None
+
+
+def _same_instant(panel_value, marker: str) -> bool:
+    """Panel expireAt (может прийти с миллисекундами) == marker, до секунды."""
+    a = _parse_dt(str(panel_value or "").replace("Z", "+00:00"))
+    b = _parse_dt(marker.replace("Z", "+00:00"))
+    if a is None or b is None:
+        return False
+    return a.replace(microsecond=0) == b.replace(microsecond=0)
+
+
+def _enqueue_bg(telegram_id: int, op: str, payload: Optional[dict], fallback) -> None:
+    """Queue `op` in the outbox after the caller's commit; `fallback()` (old
+    in-process task) when the outbox is off or the insert fails.
+
+    Not crash-safe between commit and insert — callers holding the
+    transaction enqueue on its connection instead.
+    """
+    if not config.REMNAWAVE_ENABLED:
+        return
+    if not database.outbox_enabled():
+        _fire_and_forget(fallback())
+        return
+
+    async def _enqueue():
+        try:
+            await database.enqueue_remnawave_op(telegram_id, op, payload)
+        except Exception as e:
+            logger.warning(
+                "REMNAWAVE_OUTBOX_ENQUEUE_FAIL: tg=%s op=%s %s: %s — running inline",
+                telegram_id, op, type(e).__name__, e,
+            )
+            await fallback()
+
+    _fire_and_forget(_enqueue())
+
+
+def coalesce_ops(ops: List[Dict[str, Any]]) -> List[Tuple[str, Dict[str, Any], List[int]]]:
+    """Collapse one user's ops (id order) into [(op, payload, row_ids)].
+
+    - delete wins over everything before it;
+    - consecutive renews → one renew with summed traffic (latest tariff);
+      rows that carry a checkpoint (`expire_marker`) only merge with rows
+      holding the same checkpoint, i.e. the exact group of the failed try;
+    - a run of extend_bypass / disable → the last one;
+    - repeated create / ensure_squad → one.
+    """
+    last_delete = max((i for i, o in enumerate(ops) if o["op"] == "delete"), default=None)
+    if last_delete is not None:
+        dropped = [o["id"] for o in ops[:last_delete]]
+        ops = ops[last_delete:]
+    else:
+        dropped = []
+
+    groups: List[Tuple[str, Dict[str, Any], List[int]]] = []
+    for o in ops:
+        op, payload = o["op"], dict(o.get("payload") or {})
+        if op == "renew":
+            payload.setdefault("traffic_add", _traffic_limit_for_tariff(
+                payload.get("tariff") or "", int(payload.get("period_days") or 30),
+            ))
+        prev = groups[-1] if groups else None
+        if prev is not None:
+            prev_op, prev_payload, prev_ids = prev
+            if op == "renew" and prev_op == "renew" and \
+                    prev_payload.get("expire_marker") == payload.get("expire_marker"):
+                merged = dict(payload)
+                merged["traffic_add"] = int(prev_payload["traffic_add"]) + int(payload["traffic_add"])
+                groups[-1] = ("renew", merged, prev_ids + [o["id"]])
+                continue
+            if op in _STATUS_OPS and prev_op in _STATUS_OPS:
+                groups[-1] = (op, payload, prev_ids + [o["id"]])
+                continue
+            if op == prev_op and op in ("create", "delete", "ensure_squad"):
+                groups[-1] = (op, payload, prev_ids + [o["id"]])
+                continue
+        groups.append((op, payload, [o["id"]]))
+    if dropped and groups:
+        op, payload, ids = groups[0]
+        groups[0] = (op, payload, dropped + ids)
+    return groups
+
+
+async def apply_outbox_op(
+    telegram_id: int,
+    op: str,
+    payload: Dict[str, Any],
+    checkpoint: Optional[Callable[..., Awaitable[None]]] = None,
+) -> bool:
+    """Run one coalesced outbox op against the panel. False → retry later."""
+    end = _parse_dt(payload.get("subscription_end"))
+    period_days = int(payload.get("period_days") or 30)
+    if op == "create":
+        override = payload.get("traffic_limit_override")
+        return await create_remnawave_user(
+            telegram_id, payload.get("tariff") or "", end,
+            traffic_limit_override=int(override) if override else None,
+            period_days=period_days,
+        )
+    if op == "renew":
+        return await renew_remnawave_user(
+            telegram_id, payload.get("tariff") or "", end, period_days=period_days,
+            traffic_add_override=int(payload.get("traffic_add") or 0),
+            expire_marker=payload.get("expire_marker"),
+            checkpoint=checkpoint,
+        )
+    if op == "extend_bypass":
+        return await extend_remnawave_for_bypass(telegram_id)
+    if op == "disable":
+        return await disable_remnawave_user(telegram_id)
+    if op == "delete":
+        return await delete_remnawave_user(telegram_id)
+    if op == "ensure_squad":
+        # Best-effort, как и раньше: ошибки ensure_squad только логирует.
+        await ensure_squad(telegram_id)
+        return True
+    logger.error("REMNAWAVE_OUTBOX_UNKNOWN_OP: tg=%s op=%s", telegram_id, op)
+    return True
 
 
 # ── Add traffic (purchased pack) ──────────────────────────────────────
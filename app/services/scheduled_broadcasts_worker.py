@@ -1,6 +1,8 @@
 """
-Scheduled broadcasts worker — раз в минуту проверяет БД на «пора запускать»
-и создаёт обычные broadcast'ы через тот же путь, что и ручное создание.
+Scheduled broadcasts worker — проверяет БД на «пора запускать» и создаёт
+обычные broadcast'ы через тот же путь, что и ручное создание. Будится
+NOTIFY scheduled_broadcast и спит до ближайшего scheduled_at; без
+LISTEN/NOTIFY — poll раз в минуту.
 
 Идея: не дублировать send-логику. Мы просто вставляем строку в broadcasts,
 разрешаем сегмент, дёргаем send_broadcast — всё как admin вручную нажал бы
@@ -15,6 +17,7 @@ from __future__ import annotations
 
 import asyncio
 import logging
+from datetime import datetime, timezone
 from typing import Any, Dict
 
 from aiogram import Bot
@@ -22,7 +25,8 @@ from aiogram import Bot
 logger = logging.getLogger(__name__)
 
 
-POLL_INTERVAL_SECONDS = 60          # раз в минуту
+POLL_INTERVAL_SECONDS = 60          # раз в минуту (без LISTEN/NOTIFY)
+SAFETY_INTERVAL_SECONDS = 900       # с LISTEN/NOTIFY: страховочный poll
 MAX_BATCH_PER_TICK = 5              # не больше N задач за один tick
 
 
@@ -166,4 +170,30 @@ async def run_scheduled_broadcasts_worker(bot: Bot) -> None:
             return
         except Exception as e:
             logger.exception("SCHEDULED_BROADCASTS_WORKER_TICK_ERR: %s", e)
-        await asyncio.sleep(POLL_INTERVAL_SECONDS)
+        try:
+            await _wait_next_tick()
+        except asyncio.CancelledError:
+            logger.info("SCHEDULED_BROADCASTS_WORKER stopped")
+            return
+
+
+async def _wait_next_tick() -> None:
+    """Без LISTEN — старый poll раз в минуту. С LISTEN (migration 085) —
+    спим до ближайшего scheduled_at; новое / перенесённое задание будит
+    NOTIFY scheduled_broadcast, и срок пересчитывается."""
+    import database
+
+    delay = float(POLL_INTERVAL_SECONDS)
+    if database.listener_connected():
+        delay = float(SAFETY_INTERVAL_SECONDS)
+        try:
+            next_at = await database.get_next_scheduled_at()
+        except Exception as e:
+            logger.warning("SCHEDULED_BROADCASTS_WORKER next_at failed: %s", e)
+            next_at, delay = None, float(POLL_INTERVAL_SECONDS)
+        if next_at is not None:
+            until = (next_at - datetime.now(timezone.utc)).total_seconds()
+            # Всё ещё «пора» после tick'а — хвост батча или задание, которое
+            # не смогли перепланировать: обычный poll, не горячий цикл.
+            delay = min(delay, max(1.0, until)) if until > 0 else float(POLL_INTERVAL_SECONDS)
+    await database.wait_for_notify(database.CHANNEL_SCHEDULED_BROADCAST, delay)
@@ -174,6 +174,35 @@ async def get_url(telegram_id: int) -> Optional[str]:
     return build_public_url(row["token"])
 
 
+async def active_public_urls(since_hours: int, limit: int) -> list[str]:
+    """Aggregator URLs of users seen in the last `since_hours` (active pairs
+    only, most recent first). Для bulk pre-warm клиентских ссылок."""
+    if not config.SUB_AGGREGATOR_ENABLED or not config.SUB_AGGREGATOR_URL:
+        return []
+    if config.SUB_AGGREGATOR_ADMIN_ONLY:
+        url = await get_url(int(config.ADMIN_TELEGRAM_ID))
+        return [url] if url else []
+    if not database.DB_READY:
+        return []
+    pool = await database.get_pool()
+    if pool is None:
+        return []
+    async with pool.acquire() as conn:
+        rows = await conn.fetch(
+            """
+            SELECT p.token
+              FROM sub_pairs p
+              JOIN users u ON u.telegram_id = p.telegram_id
+             WHERE p.status = 'active'
+               AND u.last_seen_at >= (NOW() AT TIME ZONE 'UTC') - make_interval(hours => $1)
+             ORDER BY u.last_seen_at DESC
+             LIMIT $2
+            """,
+            int(since_hours), int(limit),
+        )
+    return [build_public_url(r["token"]) for r in rows]
+
+
 async def revoke(telegram_id: int) -> None:
     """Mark the user's pair revoked — aggregator will serve the stub link.
     Idempotent, no-op if the row doesn't exist."""
@@ -212,7 +241,7 @@ async def invalidate(token: str) -> bool:
         return True
     try:
         from app.api.sub_aggregator_route import clear_cache
-        clear_cache(token)
+        await clear_cache(token)
         return True
     except Exception as e:
         logger.warning("SUB_AGG_INVALIDATE_FAIL token=%s… err=%s", token[:6], str(e)[:120])
@@ -275,7 +275,8 @@ async def finalize_purchase(
     purchase_id: str,
     payment_provider: str,
     amount_rubles: float,
-    invoice_id: Optional[str] = None
+    invoice_id: Optional[str] = None,
+    remnawave_renew: bool = False,
 ) -> Dict[str, Any]:
     """
     Finalize a purchase after successful payment.
@@ -288,6 +289,7 @@ async def finalize_purchase(
         payment_provider: Payment provider ("telegram_payment", "platega", etc.)
         amount_rubles: Amount paid in rubles
         invoice_id: Optional invoice ID from payment provider
+        remnawave_renew: Queue the Remnawave bypass renew in the same transaction
         
     Returns:
         {
@@ -309,7 +311,8 @@ async def finalize_purchase(
             purchase_id=purchase_id,
             payment_provider=payment_provider,
             amount_rubles=amount_rubles,
-            invoice_id=invoice_id
+            invoice_id=invoice_id,
+            remnawave_renew=remnawave_renew,
         )
         
         if not result or not result.get("success"):
@@ -257,6 +257,12 @@ def log_worker_iteration_end(
     
     if kwargs:
         log_data.update(kwargs)
+
+    if outcome != "skipped" and duration_ms is not None:
+        from app.core import metrics
+        metrics.record_worker_iteration(
+            worker_name, duration_ms / 1000.0, items_processed or 0, outcome == "failed",
+        )
     
     # Emit as JSON with proper level field matching Python logging level
     if outcome == "failed":
@@ -6,11 +6,14 @@ Provides a singleton Redis connection pool used by:
 - Rate limiting
 - Health checks
 
+Long-lived SUBSCRIBE loops use a separate client (get_pubsub_redis) and
+iter_pubsub_messages, so an idle channel is not mistaken for an error.
+
 The client is lazy-initialized on first access and properly
 cleaned up during shutdown.
 """
 import logging
-from typing import Optional
+from typing import Any, AsyncIterator, Optional
 
 import redis.asyncio as aioredis
 
@@ -19,6 +22,12 @@ import config
 logger = logging.getLogger(__name__)
 
 _redis_client: Optional[aioredis.Redis] = None
+_pubsub_client: Optional[aioredis.Redis] = None
+
+# Pub/sub: PING раз в N секунд, чтобы мёртвый сокет всё-таки заметить
+PUBSUB_HEALTH_CHECK_INTERVAL = 30
+# Pub/sub: сколько ждать сообщение за один get_message()
+PUBSUB_POLL_TIMEOUT = 1.0
 
 
 def is_configured() -> bool:
@@ -50,6 +59,48 @@ async def get_redis() -> Optional[aioredis.Redis]:
     return _redis_client
 
 
+async def get_pubsub_redis() -> Optional[aioredis.Redis]:
+    """
+    Get or create the client for pub/sub listeners (singleton).
+
+    Unlike get_redis() it has no socket_timeout: a channel with no traffic
+    for 5s must not fail the read and force a resubscribe (messages
+    published during the reconnect are lost). health_check_interval keeps
+    a dead connection detectable.
+
+    Returns None if REDIS_URL is not configured.
+    """
+    global _pubsub_client
+
+    if not is_configured():
+        return None
+
+    if _pubsub_client is None:
+        _pubsub_client = aioredis.from_url(
+            config.REDIS_URL,
+            decode_responses=True,
+            socket_connect_timeout=5.0,
+            socket_timeout=None,
+            health_check_interval=PUBSUB_HEALTH_CHECK_INTERVAL,
+        )
+        logger.info("Redis pub/sub client created")
+
+    return _pubsub_client
+
+
+async def iter_pubsub_messages(pubsub, poll_timeout: float = PUBSUB_POLL_TIMEOUT) -> AsyncIterator[Any]:
+    """
+    Yield the data of every "message" on a subscribed PubSub.
+
+    Polls get_message(timeout=...) instead of listen(): an empty poll is
+    just idle, and each poll runs the connection health check.
+    """
+    while True:
+        message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=poll_timeout)
+        if message is not None and message.get("type") == "message":
+            yield message.get("data")
+
+
 async def ping() -> bool:
     """
     Check Redis connectivity.
@@ -72,8 +123,16 @@ async def ping() -> bool:
 
 
 async def close() -> None:
-    """Close the Redis client connection pool."""
-    global _redis_client
+    """Close the Redis client connection pools."""
+    global _redis_client, _pubsub_client
+
+    if _pubsub_client is not None:
+        try:
+            await _pubsub_client.aclose()
+        except Exception as e:
+            logger.warning("Redis pub/sub close error: %s", e)
+        finally:
+            _pubsub_client = None
 
     if _redis_client is not None:
         try:
@@ -0,0 +1,58 @@
+"""
+Analytics rollup worker — держит analytics_hourly / analytics_daily
+(migration 082) в актуальном состоянии.
+
+Каждый тик — database.refresh_analytics_rollups(): пересобирает часы
+от watermark'а минус REOPEN_HOURS до последнего закрытого часа и
+двигает watermark. Первый запуск делает backfill всей истории кусками
+по BACKFILL_STEP — пока `caught_up` False, крутимся без паузы.
+
+Дашборд от воркера не зависит по корректности: всё, что после
+watermark'а, читатели добирают из сырых таблиц. Если воркер лежит —
+дашборд просто медленнее.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+
+from app.core import metrics
+
+logger = logging.getLogger(__name__)
+
+ROLLUP_INTERVAL_SEC = 300          # обычный тик
+BACKFILL_PAUSE_SEC = 1.0           # пауза между кусками backfill'а
+
+
+async def analytics_rollup_task():
+    """Main loop: каждые 5 мин инкрементально обновляет роллапы."""
+    import database
+
+    logger.info("ANALYTICS_ROLLUP started (interval=%ds)", ROLLUP_INTERVAL_SEC)
+    while True:
+        delay = ROLLUP_INTERVAL_SEC
+        try:
+            async with metrics.worker_iteration("analytics_rollup") as it:
+                result = await database.refresh_analytics_rollups()
+                if result is not None:
+                    it.items = result["rows"]
+            if result is not None:
+                if result["rows"] or not result["caught_up"]:
+                    logger.info(
+                        "ANALYTICS_ROLLUP_REFRESHED from=%s to=%s rows=%d caught_up=%s",
+                        result["from"].isoformat(), result["to"].isoformat(),
+                        result["rows"], result["caught_up"],
+                    )
+                if not result["caught_up"]:
+                    delay = BACKFILL_PAUSE_SEC
+        except asyncio.CancelledError:
+            logger.info("ANALYTICS_ROLLUP stopped (cancelled)")
+            return
+        except Exception as e:
+            logger.error("ANALYTICS_ROLLUP_ITERATION_ERROR: %s", e, exc_info=True)
+
+        try:
+            await asyncio.sleep(delay)
+        except asyncio.CancelledError:
+            logger.info("ANALYTICS_ROLLUP stopped (cancelled)")
+            return
@@ -1,9 +1,9 @@
 """Модуль для отправки уведомлений о ферме"""
 import asyncio
-import json
 import logging
 import time
 from datetime import datetime, timedelta, timezone
+from typing import List
 from aiogram import Bot
 
 import database
@@ -38,13 +38,8 @@ async def farm_notifications_iteration(bot: Bot):
     
     for user in users:
         telegram_id = user["telegram_id"]
-        farm_plots = user["farm_plots"]
-        
-        # Parse JSONB if needed
-        if isinstance(farm_plots, str):
-            farm_plots = json.loads(farm_plots)
-        elif farm_plots is None:
-            continue
+        # list[FarmPlot] — jsonb декодирован кодеком пула
+        farm_plots: List[database.FarmPlot] = user["farm_plots"]
         
         changed = False
         
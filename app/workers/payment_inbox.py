@@ -0,0 +1,172 @@
+"""
+Payment inbox worker — обрабатывает события из payment_webhook_inbox
+(migration 084), которые endpoint'ы /webhooks/<provider> и
+wata_reconciler туда положили.
+
+Цикл: claim до CLAIM_BATCH созревших строк (FOR UPDATE SKIP LOCKED под
+lease), обработка через handle_webhook_event провайдера, не больше
+PAYMENT_INBOX_CONCURRENCY одновременно. Ждём wake() от endpoint'а или
+POLL_INTERVAL_SEC.
+
+Исходы (те же, что раньше превращались в HTTP-ответ):
+  dict                          → done, result = status
+  ValueError                    → done, 'already_processed'
+  TransientPaymentError/timeout → ретрай с экспоненциальной паузой,
+  прочие исключения               после MAX_ATTEMPTS — 'dead' + ERROR
+
+Двойного начисления нет: process_confirmed_payment идемпотентен
+(mark_pending_purchase_paid + SELECT FOR UPDATE в finalize_purchase).
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import random
+from typing import Any, Dict
+
+import config
+from app.core import metrics
+from app.services.payments import inbox
+from app.services.payments.confirmation import TransientPaymentError
+
+logger = logging.getLogger(__name__)
+
+POLL_INTERVAL_SEC = 2.0            # страховка, если wake() не пришёл (другой инстанс)
+CLAIM_BATCH = 20
+LEASE_SEC = 300
+EVENT_TIMEOUT_SEC = 120.0          # HTTP-лимит провайдера больше не давит
+MAX_ATTEMPTS = 10
+BACKOFF_BASE_SEC = 10              # 10s, 20s, 40s ... до BACKOFF_MAX_SEC
+BACKOFF_MAX_SEC = 1800
+PRUNE_INTERVAL_SEC = 3600
+
+EVENTS = metrics.Counter(
+    "payment_inbox_events", "Payment inbox events handled, by provider and outcome.",
+    ("provider", "outcome"),
+)
+
+
+def _backoff(attempts: int) -> float:
+    delay = min(BACKOFF_BASE_SEC * (2 ** max(0, attempts - 1)), BACKOFF_MAX_SEC)
+    return delay * random.uniform(0.8, 1.2)
+
+
+async def _log_pe(stage: str, provider: str, error_code: str | None, error_message: str) -> None:
+    try:
+        import database
+        await database.log_payment_error(
+            stage=stage,
+            payment_provider=provider,
+            error_code=error_code,
+            error_message=error_message[:500],
+        )
+    except Exception as e:
+        logger.warning("payment_errors log skipped (%s): %s", stage, e)
+
+
+async def _handle_event(event: Dict[str, Any], bot) -> None:
+    import database
+
+    provider = event["provider"]
+    try:
+        result = await asyncio.wait_for(inbox.process_event(event, bot), timeout=EVENT_TIMEOUT_SEC)
+        outcome = str(result.get("status") or "ok")
+    except ValueError as e:
+        # Идемпотентность: уже обработано (как 200 already_processed раньше).
+        logger.info("PAYMENT_INBOX: id=%s already processed: %s", event["id"], e)
+        outcome = "already_processed"
+    except Exception as e:
+        if isinstance(e, TransientPaymentError):
+            stage, code = "transient", None
+        elif isinstance(e, asyncio.TimeoutError):
+            stage, code = "timeout", None
+        else:
+            stage, code = "unhandled_exception", type(e).__name__
+        error = f"{stage}: {e}" if str(e) else stage
+        attempts = int(event["attempts"])
+        dead = await database.fail_payment_event(
+            event["id"], error, _backoff(attempts), MAX_ATTEMPTS, attempts=attempts,
+        )
+        if dead is None:
+            # Lease истёк, строку уже взял (или завершил) другой воркер.
+            EVENTS.inc(provider=provider, outcome="lease_lost")
+            logger.warning(
+                "PAYMENT_INBOX_LEASE_LOST: id=%s provider=%s invoice=%s attempt=%d err=%s",
+                event["id"], provider, event["invoice_id"], attempts, error,
+            )
+            return
+        EVENTS.inc(provider=provider, outcome="dead" if dead else "retry")
+        await _log_pe(f"inbox_{stage}", provider, code, error)
+        if dead:
+            logger.error(
+                "PAYMENT_INBOX_DEAD: id=%s provider=%s invoice=%s attempts=%d err=%s",
+                event["id"], provider, event["invoice_id"], attempts, error,
+            )
+        else:
+            logger.warning(
+                "PAYMENT_INBOX_RETRY: id=%s provider=%s invoice=%s attempt=%d err=%s",
+                event["id"], provider, event["invoice_id"], attempts, error,
+            )
+        return
+
+    await database.complete_payment_event(event["id"], outcome)
+    EVENTS.inc(provider=provider, outcome=outcome)
+    logger.info(
+        "PAYMENT_INBOX_DONE: id=%s provider=%s invoice=%s source=%s result=%s",
+        event["id"], provider, event["invoice_id"], event.get("source"), outcome,
+    )
+
+
+async def dispatch_once(bot) -> int:
+    """Claim and process one batch. Returns number of events handled."""
+    import database
+
+    events = await database.claim_payment_events(CLAIM_BATCH, LEASE_SEC)
+    if not events:
+        return 0
+    sem = asyncio.Semaphore(max(1, config.PAYMENT_INBOX_CONCURRENCY))
+
+    async def _guarded(event: Dict[str, Any]) -> None:
+        async with sem:
+            try:
+                await _handle_event(event, bot)
+            except Exception as e:
+                # Строка останется processing до конца lease и вернётся сама.
+                logger.error("PAYMENT_INBOX_EVENT_ERROR: id=%s %s", event["id"], e, exc_info=True)
+
+    await asyncio.gather(*(_guarded(e) for e in events))
+    return len(events)
+
+
+async def payment_inbox_task(bot):
+    """Main loop: разбирает inbox, пока есть работа; иначе ждёт wake()."""
+    import database
+
+    logger.info(
+        "PAYMENT_INBOX started (concurrency=%d, batch=%d)",
+        config.PAYMENT_INBOX_CONCURRENCY, CLAIM_BATCH,
+    )
+    loop = asyncio.get_running_loop()
+    next_prune = loop.time() + 60
+    while True:
+        handled = 0
+        try:
+            async with metrics.worker_iteration("payment_inbox") as it:
+                handled = it.items = await dispatch_once(bot)
+            if loop.time() >= next_prune:
+                next_prune = loop.time() + PRUNE_INTERVAL_SEC
+                pruned = await database.prune_payment_inbox(config.PAYMENT_INBOX_RETENTION_DAYS)
+                if pruned:
+                    logger.info("PAYMENT_INBOX_PRUNED: rows=%d", pruned)
+        except asyncio.CancelledError:
+            logger.info("PAYMENT_INBOX stopped (cancelled)")
+            return
+        except Exception as e:
+            logger.error("PAYMENT_INBOX_ITERATION_ERROR: %s", e, exc_info=True)
+        if handled:
+            continue
+        try:
+            await inbox.wait_for_work(POLL_INTERVAL_SEC)
+        except asyncio.CancelledError:
+            logger.info("PAYMENT_INBOX stopped (cancelled)")
+            return
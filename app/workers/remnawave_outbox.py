@@ -0,0 +1,125 @@
+"""
+Remnawave outbox dispatcher — применяет мутации bypass entity из
+remnawave_outbox (migration 083).
+
+Цикл: claim до CLAIM_USERS юзеров с созревшими строками (все их pending
+строки разом, под lease), склейка через remnawave_service.coalesce_ops,
+дальше по юзеру строго последовательно, между юзерами — не больше
+REMNAWAVE_OUTBOX_CONCURRENCY одновременно.
+
+Успешная операция сразу удаляет свои строки (до следующей — чтобы
+рестарт посреди юзера не повторял уже применённое). Неуспех: эта и все
+следующие операции юзера уходят в ретрай с экспоненциальной паузой
+(порядок сохраняется), после MAX_ATTEMPTS — в 'dead' с ERROR в лог.
+
+Падение процесса: lease (LEASE_SEC) истекает, строки берутся заново.
+renew при этом не удвоит трафик — см. checkpoint в renew_remnawave_user.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import random
+from typing import Any, Dict, List
+
+import config
+from app.core import metrics
+
+logger = logging.getLogger(__name__)
+
+POLL_INTERVAL_SEC = 1.0            # пауза, когда очередь пуста
+CLAIM_USERS = 50                   # юзеров на один claim
+LEASE_SEC = 300                    # с запасом на медленную панель
+MAX_ATTEMPTS = 8
+BACKOFF_BASE_SEC = 15              # 15s, 30s, 1m, 2m ... до BACKOFF_MAX_SEC
+BACKOFF_MAX_SEC = 1800
+
+
+def _backoff(attempts: int) -> float:
+    delay = min(BACKOFF_BASE_SEC * (2 ** max(0, attempts - 1)), BACKOFF_MAX_SEC)
+    return delay * random.uniform(0.8, 1.2)
+
+
+async def _dispatch_user(telegram_id: int, ops: List[Dict[str, Any]]) -> None:
+    import database
+    from app.services import remnawave_service
+
+    groups = remnawave_service.coalesce_ops(ops)
+    if len(groups) < len(ops):
+        logger.info(
+            "REMNAWAVE_OUTBOX_COALESCED: tg=%s rows=%d calls=%d",
+            telegram_id, len(ops), len(groups),
+        )
+    attempts = max(int(o["attempts"]) for o in ops)
+    for i, (op, payload, ids) in enumerate(groups):
+        async def checkpoint(_ids=ids, **fields):
+            await database.update_remnawave_op_payload(_ids, fields)
+
+        try:
+            ok = await remnawave_service.apply_outbox_op(telegram_id, op, payload, checkpoint)
+            error = "" if ok else "panel_call_failed"
+        except Exception as e:
+            ok, error = False, f"{type(e).__name__}: {e}"
+        if ok:
+            await database.complete_remnawave_ops(ids)
+            continue
+
+        pending = [row_id for _, _, g_ids in groups[i:] for row_id in g_ids]
+        dead = await database.fail_remnawave_ops(pending, error, _backoff(attempts), MAX_ATTEMPTS)
+        if dead:
+            logger.error(
+                "REMNAWAVE_OUTBOX_DEAD: tg=%s op=%s rows=%d attempts=%d err=%s",
+                telegram_id, op, dead, attempts, error,
+            )
+        else:
+            logger.warning(
+                "REMNAWAVE_OUTBOX_RETRY: tg=%s op=%s rows=%d attempt=%d err=%s",
+                telegram_id, op, len(pending), attempts, error,
+            )
+        return
+
+
+async def dispatch_once() -> int:
+    """Claim and apply one batch. Returns number of users handled."""
+    import database
+
+    claimed = await database.claim_remnawave_outbox(CLAIM_USERS, LEASE_SEC)
+    if not claimed:
+        return 0
+    sem = asyncio.Semaphore(max(1, config.REMNAWAVE_OUTBOX_CONCURRENCY))
+
+    async def _guarded(telegram_id: int, ops: List[Dict[str, Any]]) -> None:
+        async with sem:
+            try:
+                await _dispatch_user(telegram_id, ops)
+            except Exception as e:
+                # Строки останутся processing до конца lease и вернутся сами.
+                logger.error("REMNAWAVE_OUTBOX_USER_ERROR: tg=%s %s", telegram_id, e, exc_info=True)
+
+    await asyncio.gather(*(_guarded(tid, ops) for tid, ops in claimed.items()))
+    return len(claimed)
+
+
+async def remnawave_outbox_task():
+    """Main loop: разбирает очередь, пока есть работа; иначе спит POLL_INTERVAL_SEC."""
+    logger.info(
+        "REMNAWAVE_OUTBOX started (concurrency=%d, claim=%d users)",
+        config.REMNAWAVE_OUTBOX_CONCURRENCY, CLAIM_USERS,
+    )
+    while True:
+        handled = 0
+        try:
+            async with metrics.worker_iteration("remnawave_outbox") as it:
+                handled = it.items = await dispatch_once()
+        except asyncio.CancelledError:
+            logger.info("REMNAWAVE_OUTBOX stopped (cancelled)")
+            return
+        except Exception as e:
+            logger.error("REMNAWAVE_OUTBOX_ITERATION_ERROR: %s", e, exc_info=True)
+        if handled:
+            continue
+        try:
+            await asyncio.sleep(POLL_INTERVAL_SEC)
+        except asyncio.CancelledError:
+            logger.info("REMNAWAVE_OUTBOX stopped (cancelled)")
+            return
@@ -2,10 +2,17 @@
 Background worker: check traffic usage and send threshold notifications.
 
 Runs every 5 minutes. Gated by REMNAWAVE_ENABLED and DB_READY.
+
+Bulk mode (config.TRAFFIC_MONITOR_BULK, default on): один проход по
+/api/users/stream (несколько десятков страниц) → in-memory snapshot
+id/uuid → (used, limit) → join с get_active_remnawave_users(). Per-user
+GET остаётся только для юзеров, которых нет в snapshot, и как fallback
+если stream оборвался.
 """
 import asyncio
 import logging
-from typing import Optional
+import time
+from typing import Dict, Optional, Tuple
 
 from aiogram import Bot
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
@@ -37,36 +44,52 @@ async def _check_user_traffic(bot: Bot, telegram_id: int, rmn_uuid: str) -> None
             logger.warning("TRAFFIC_CHECK_NO_DATA: tg=%s uuid=%s", telegram_id, rmn_uuid[:8] if rmn_uuid else "N/A")
             return
 
-        used = traffic["usedTrafficBytes"]
-        limit = traffic["trafficLimitBytes"]
-        if limit <= 0:
-            return
+        await _evaluate_thresholds(
+            bot, telegram_id, traffic["usedTrafficBytes"], traffic["trafficLimitBytes"],
+        )
+    except Exception as e:
+        logger.warning("TRAFFIC_CHECK_ERROR: tg=%s %s: %s", telegram_id, type(e).__name__, e)
 
-        remaining = max(0, limit - used)
 
-        flags = await database.get_traffic_notification_flags(telegram_id)
-        if not flags:
-            return
+def _applicable_thresholds(limit: int):
+    """Пороги, актуальные для лимита юзера.
 
-        for threshold_bytes, flag_key in config.TRAFFIC_NOTIFY_THRESHOLDS:
-            # Порог должен быть строго меньше лимита юзера — иначе он
-            # триггерится СРАЗУ после активации: у trial'а лимит 500 МБ,
-            # но пороги 8/5/3/1 ГБ все ≥ 500 МБ, поэтому за первые
-            # 30 минут летели 6 уведомлений подряд с текстом «купите
-            # дополнительный трафик». Строгое неравенство также
-            # гарантирует что порог 500 МБ не сработает для юзера
-            # с лимитом ровно 500 МБ на моменте активации.
-            # Особый случай: порог 0 ГБ (закончился трафик) — всегда
-            # актуален, любой юзер должен узнать что доступ отключился.
-            if threshold_bytes > 0 and threshold_bytes >= limit:
-                continue
-            if remaining <= threshold_bytes and not flags.get(flag_key, False):
-                await _send_traffic_notification(bot, telegram_id, remaining, flag_key)
-                await database.set_traffic_notification_flag(telegram_id, flag_key)
-                break  # One notification per iteration
+    Порог должен быть строго меньше лимита юзера — иначе он
+    триггерится СРАЗУ после активации: у trial'а лимит 500 МБ,
+    но пороги 8/5/3/1 ГБ все ≥ 500 МБ, поэтому за первые
+    30 минут летели 6 уведомлений подряд с текстом «купите
+    дополнительный трафик». Строгое неравенство также
+    гарантирует что порог 500 МБ не сработает для юзера
+    с лимитом ровно 500 МБ на моменте активации.
+    Особый случай: порог 0 ГБ (закончился трафик) — всегда
+    актуален, любой юзер должен узнать что доступ отключился.
+    """
+    for threshold_bytes, flag_key in config.TRAFFIC_NOTIFY_THRESHOLDS:
+        if threshold_bytes > 0 and threshold_bytes >= limit:
+            continue
+        yield threshold_bytes, flag_key
 
-    except Exception as e:
-        logger.warning("TRAFFIC_CHECK_ERROR: tg=%s %s: %s", telegram_id, type(e).__name__, e)
+
+async def _evaluate_thresholds(bot: Bot, telegram_id: int, used: int, limit: int) -> None:
+    if limit <= 0:
+        return
+
+    remaining = max(0, limit - used)
+
+    # Флаги читаем только если хоть один порог вообще пересечён — в bulk
+    # режиме это отсекает DB-запрос для подавляющего большинства юзеров.
+    if not any(remaining <= t for t, _ in _applicable_thresholds(limit)):
+        return
+
+    flags = await database.get_traffic_notification_flags(telegram_id)
+    if not flags:
+        return
+
+    for threshold_bytes, flag_key in _applicable_thresholds(limit):
+        if remaining <= threshold_bytes and not flags.get(flag_key, False):
+            await _send_traffic_notification(bot, telegram_id, remaining, flag_key)
+            await database.set_traffic_notification_flag(telegram_id, flag_key)
+            break  # One notification per iteration
 
 
 async def _send_traffic_notification(
@@ -104,12 +127,82 @@ async def _send_traffic_notification(
         logger.warning("TRAFFIC_NOTIFICATION_FAIL: tg=%s %s: %s", telegram_id, type(e).__name__, e)
 
 
+async def _fetch_traffic_snapshot() -> Optional[Dict[str, Tuple[int, int]]]:
+    """Снять used/limit для всех юзеров панели через cursor-пагинацию stream.
+
+    Ключи — numeric id (str) и vless uuid, чтобы join работал и для
+    legacy-строк без забэкфильнутого remnawave_id. Храним только пару
+    int'ов, полные entity не держим. None → stream оборвался.
+    """
+    snapshot: Dict[str, Tuple[int, int]] = {}
+
+    def _on_page(batch: list) -> None:
+        for entity in batch:
+            if not isinstance(entity, dict):
+                continue
+            user_traffic = entity.get("userTraffic") or {}
+            used = user_traffic.get("usedTrafficBytes", entity.get("usedTrafficBytes", 0)) or 0
+            limit = entity.get("trafficLimitBytes", 0) or 0
+            pair = (int(used), int(limit))
+            if entity.get("id") is not None:
+                snapshot[str(entity["id"])] = pair
+            for key in ("uuid", "vlessUuid"):
+                if entity.get(key):
+                    snapshot[str(entity[key])] = pair
+
+    scanned = await remnawave_api.scan_users(_on_page, page_size=config.TRAFFIC_MONITOR_PAGE_SIZE)
+    if scanned is None:
+        return None
+    return snapshot
+
+
+async def _bulk_iteration(bot: Bot, users: list) -> bool:
+    """Bulk pass. False → snapshot недоступен, caller уходит в per-user."""
+    started = time.monotonic()
+    snapshot = await _fetch_traffic_snapshot()
+    if snapshot is None:
+        logger.warning("TRAFFIC_MONITOR_BULK_FAILED: falling back to per-user checks")
+        return False
+
+    unmatched = []
+    for user in users:
+        telegram_id = user["telegram_id"]
+        pair = None
+        if user.get("remnawave_id") is not None:
+            pair = snapshot.get(str(user["remnawave_id"]))
+        if pair is None:
+            pair = snapshot.get(str(user["remnawave_uuid"]))
+        if pair is None:
+            unmatched.append(user)
+            continue
+        try:
+            await _evaluate_thresholds(bot, telegram_id, pair[0], pair[1])
+        except Exception as e:
+            logger.warning("TRAFFIC_CHECK_ERROR: tg=%s %s: %s", telegram_id, type(e).__name__, e)
+
+    # Сущности, которых нет в snapshot (созданы во время прохода / id
+    # рассинхронизирован) — старым путём, их единицы.
+    for user in unmatched:
+        panel_ref = user.get("remnawave_id") or user["remnawave_uuid"]
+        await _check_user_traffic(bot, user["telegram_id"], panel_ref)
+        await asyncio.sleep(0.2)  # Rate limit API calls
+
+    logger.info(
+        "TRAFFIC_MONITOR_BULK: users=%d panel_keys=%d unmatched=%d elapsed=%.1fs",
+        len(users), len(snapshot), len(unmatched), time.monotonic() - started,
+    )
+    return True
+
+
 async def traffic_monitor_iteration(bot: Bot) -> None:
     """Single iteration: check all active Remnawave users."""
     users = await database.get_active_remnawave_users()
     if not users:
         return
 
+    if config.TRAFFIC_MONITOR_BULK and await _bulk_iteration(bot, users):
+        return
+
     for user in users:
         telegram_id = user["telegram_id"]
         # Prefer numeric id (3.x fast-path без UUID→id auto-resolve).
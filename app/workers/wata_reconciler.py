@@ -6,8 +6,9 @@ Wata payment reconciler — защита от потерянных webhook'ов.
 
 Решение: раз в 5 минут сканируем pending_purchases с непустым invoice_id,
 старше 5 мин и меньше суток. Для каждого дёргаем wata_service.check_link_status
-для сверки. Если status=Paid → финализируем через тот же process_confirmed_payment,
-что и обычный webhook.
+для сверки. Если status=Paid → кладём событие в payment inbox (migration 084),
+его финализирует тот же воркер, что и webhook'и; при PAYMENT_INBOX_ENABLED=false —
+напрямую через process_confirmed_payment.
 
 ## Защита от двойного начисления
 
@@ -36,6 +37,7 @@ from typing import Any, Dict
 logger = logging.getLogger(__name__)
 
 RECONCILER_INTERVAL_SEC = 120      # 2 минуты между итерациями (было 5)
+SAFETY_INTERVAL_SEC = 1800         # нет кандидатов + LISTEN жив → страховочный poll
 STALE_THRESHOLD_MIN = 2            # проверяем pending старше 2 мин (было 5)
 MAX_LOOKBACK_HOURS = 24            # не проверяем старше суток (там уже expired)
 MAX_BATCH = 20                     # лимит на одну итерацию (rate limit safety)
@@ -43,34 +45,58 @@ INTER_ITEM_SLEEP_SEC = 1.0         # пауза между Wata-запросам
 
 
 async def wata_reconciler_task(bot):
-    """Main loop: каждые 5 мин проверяет pending Wata покупки."""
+    """Main loop: проверяет pending Wata покупки.
+
+    С LISTEN/NOTIFY (migration 085) пустые итерации не крутятся каждые
+    RECONCILER_INTERVAL_SEC: NOTIFY pending_purchase_invoice назначает
+    проверку через STALE_THRESHOLD_MIN после выдачи invoice, а без
+    кандидатов остаётся только страховочный SAFETY_INTERVAL_SEC.
+    """
+    import database
+
     logger.info(
         "WATA_RECONCILER started (interval=%ds, stale_threshold=%dmin, batch=%d)",
         RECONCILER_INTERVAL_SEC, STALE_THRESHOLD_MIN, MAX_BATCH,
     )
+    loop = asyncio.get_running_loop()
+    next_check = loop.time() + RECONCILER_INTERVAL_SEC
     while True:
         try:
-            await asyncio.sleep(RECONCILER_INTERVAL_SEC)
+            timeout = max(0.0, next_check - loop.time())
+            if timeout and await database.wait_for_notify(database.CHANNEL_PURCHASE_INVOICE, timeout):
+                # Свежий invoice станет кандидатом через STALE_THRESHOLD_MIN.
+                next_check = min(next_check, loop.time() + STALE_THRESHOLD_MIN * 60 + 5)
+                continue
         except asyncio.CancelledError:
             logger.info("WATA_RECONCILER stopped (cancelled)")
             return
 
+        scanned = 0
         try:
             import wata_service
-            if not wata_service.is_enabled():
-                continue
-            await _reconcile_iteration(bot)
+            if wata_service.is_enabled():
+                scanned = await _reconcile_iteration(bot)
+        except asyncio.CancelledError:
+            logger.info("WATA_RECONCILER stopped (cancelled)")
+            return
         except Exception as e:
             logger.error("WATA_RECONCILER_ITERATION_ERROR: %s", e, exc_info=True)
+            scanned = 1
+        if scanned or not database.listener_connected():
+            next_check = loop.time() + RECONCILER_INTERVAL_SEC
+        else:
+            next_check = loop.time() + SAFETY_INTERVAL_SEC
 
 
-async def _reconcile_iteration(bot) -> None:
-    """Одна итерация: собрать stale pending → проверить каждый через Wata API."""
+async def _reconcile_iteration(bot) -> int:
+    """Одна итерация: собрать stale pending → проверить каждый через Wata API.
+
+    Возвращает число просмотренных кандидатов."""
     import database
 
     pool = await database.get_pool()
     if pool is None:
-        return
+        return 0
 
     threshold_max = datetime.now(timezone.utc) - timedelta(minutes=STALE_THRESHOLD_MIN)
     threshold_min = datetime.now(timezone.utc) - timedelta(hours=MAX_LOOKBACK_HOURS)
@@ -94,7 +120,7 @@ async def _reconcile_iteration(bot) -> None:
         )
 
     if not rows:
-        return
+        return 0
 
     logger.info(
         "WATA_RECONCILER: scanning %d stale pending purchases",
@@ -106,7 +132,7 @@ async def _reconcile_iteration(bot) -> None:
         try:
             outcome = await _check_and_finalize(bot, dict(row))
             checked += 1
-            if outcome == "finalized":
+            if outcome in ("finalized", "queued"):
                 finalized += 1
             else:
                 skipped += 1
@@ -129,12 +155,13 @@ async def _reconcile_iteration(bot) -> None:
             "WATA_RECONCILER_SUMMARY: checked=%d skipped=%d (all pending have no Paid tx yet)",
             checked, skipped,
         )
+    return len(rows)
 
 
 async def _check_and_finalize(bot, row: Dict[str, Any]) -> str:
     """Проверить один invoice через Wata; если Paid → финализировать.
 
-    Возвращает: "finalized" | "skipped" | "not_paid" | "not_wata".
+    Возвращает: "finalized" | "queued" | "skipped" | "not_paid" | "not_wata".
     """
     import wata_service
     from app.services.payments.confirmation import process_confirmed_payment
@@ -182,6 +209,26 @@ async def _check_and_finalize(bot, row: Dict[str, Any]) -> str:
     amount = _extract_amount(paid_tx) or (row["price_kopecks"] / 100.0)
     tx_id = paid_tx.get("id") or paid_tx.get("transactionId") or invoice_id
 
+    import database
+    if database.payment_inbox_enabled():
+        # Тот же путь, что у webhook'а: событие в payment inbox с тем же
+        # ключом (wata, tx, Payment:Paid). Если webhook всё-таки дошёл —
+        # INSERT no-op, обработка одна.
+        from app.services.payments import inbox
+        queued = await inbox.enqueue_reconciled("wata", {
+            "kind": "Payment",
+            "transactionStatus": "Paid",
+            "orderId": purchase_id,
+            "transactionId": str(tx_id),
+            "amount": float(amount),
+        })
+        logger.warning(
+            "WATA_RECONCILER_MISSED_WEBHOOK: purchase=%s tx=%s amount=%.2f — %s",
+            purchase_id, tx_id, amount,
+            "передано в payment inbox" if queued else "уже есть в payment inbox",
+        )
+        return "queued" if queued else "skipped"
+
     logger.warning(
         "WATA_RECONCILER_MISSED_WEBHOOK: purchase=%s tx=%s amount=%.2f — "
         "будет финализировано через process_confirmed_payment",
@@ -21,6 +21,7 @@ from app.utils.logging_helpers import (
 )
 from app.core.cooperative_yield import cooperative_yield
 from app.core.pool_monitor import acquire_connection
+from app.core.telegram_scheduler import Priority, pace, with_send_priority
 
 logger = logging.getLogger(__name__)
 
@@ -49,6 +50,7 @@ RENEWAL_WINDOW = timedelta(hours=RENEWAL_WINDOW_HOURS)
 MINIMUM_SAFE_SLEEP_ON_FAILURE = 300  # seconds (half of AUTO_RENEWAL_INTERVAL_SECONDS minimum)
 
 
+@with_send_priority(Priority.REMINDER)
 async def process_auto_renewals(bot: Bot):
     """
     Обработать автопродление подписок, которые истекают в течение RENEWAL_WINDOW
@@ -340,6 +342,12 @@ async def process_auto_renewals(bot: Bot):
                                 )
                                 continue
 
+                            # Remnawave bypass renew — outbox-строкой в этой же транзакции
+                            if tariff_type in ("basic", "plus"):
+                                await database.enqueue_remnawave_renew(
+                                    conn, telegram_id, tariff_type, expires_at, period_days
+                                )
+
                             expires_str = expires_at.strftime("%d.%m.%Y")
                             duration_days = duration.days
                             # Собираем payload для Phase B (после commit) — без Telegram и без вложенного acquire
@@ -398,7 +406,8 @@ async def process_auto_renewals(bot: Bot):
                     from app.services.remnawave_service import renew_remnawave_user_bg
                     _ar_tariff = item.get("tariff_type", "basic")
                     _ar_expires = item.get("expires_at")
-                    if _ar_tariff in ("basic", "plus") and _ar_expires:
+                    # С outbox renew уже поставлен в транзакции Phase A
+                    if _ar_tariff in ("basic", "plus") and _ar_expires and not database.outbox_enabled():
                         renew_remnawave_user_bg(item["telegram_id"], _ar_tariff, _ar_expires, period_days=item.get("period_days", 30))
                 except Exception as rmn_err:
                     logger.warning("REMNAWAVE_AUTORENEW_FAIL: tg=%s %s", item["telegram_id"], rmn_err)
@@ -432,7 +441,7 @@ async def process_auto_renewals(bot: Bot):
                     sent = await safe_send_message(bot, item["telegram_id"], text, reply_markup=keyboard)
                     if sent is None:
                         continue
-                    await asyncio.sleep(0.05)  # Telegram rate limit: max 20 msgs/sec
+                    await pace(0.05)  # Telegram rate limit: max 20 msgs/sec
                     # Explicit timeout for notification connection acquire (pool timeout is 10s)
                     notify_cm = acquire_connection(pool, "auto_renewal_notify")
                     try:
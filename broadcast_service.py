@@ -8,6 +8,7 @@ import time
 from aiogram import Bot
 from app.utils.telegram_safe import safe_send_message
 from app.utils.logging_helpers import generate_correlation_id, set_correlation_id
+from app.core.telegram_scheduler import Priority, pace, with_send_priority
 
 import database
 
@@ -29,6 +30,7 @@ def _format_completion_message(result: dict) -> str:
     )
 
 
+@with_send_priority(Priority.BROADCAST)
 async def run_no_subscription_broadcast(
     bot: Bot,
     text: str,
@@ -120,7 +122,7 @@ async def run_no_subscription_broadcast(
                 return
             try:
                 sent = await safe_send_message(bot, telegram_id, text)
-                await asyncio.sleep(0.07)
+                await pace(0.07)
                 msg_id = sent.message_id if sent else None
                 async with counters_lock:
                     if sent is not None:
@@ -424,6 +424,27 @@ if not WEBHOOK_SECRET:
 WEBHOOK_PORT = int(os.getenv("PORT") or env("WEBHOOK_PORT") or "8080")
 _log.info("Using WEBHOOK_URL from %s_WEBHOOK_URL", APP_ENV.upper())
 
+# Приём апдейтов (app/core/update_queue). По умолчанию "off" — хендлер
+# внутри HTTP-запроса, при падении процесса Telegram переотправит апдейт.
+# Opt-in: "redis" — webhook сразу отвечает 200, апдейт лежит в Redis stream
+# до конца обработки (переживает рестарт), нужен REDIS_URL; "memory" — то же
+# без durability: апдейты в буфере теряются при падении/редеплое.
+TELEGRAM_UPDATE_QUEUE = env("TELEGRAM_UPDATE_QUEUE", default="off").strip().lower()
+try:
+    TELEGRAM_UPDATE_WORKERS = int(
+        env("TELEGRAM_UPDATE_WORKERS", default="") or os.getenv("MAX_CONCURRENT_UPDATES", "20")
+    )
+except (TypeError, ValueError):
+    TELEGRAM_UPDATE_WORKERS = 20
+try:
+    TELEGRAM_UPDATE_QUEUE_MAX = int(env("TELEGRAM_UPDATE_QUEUE_MAX", default="10000"))
+except (TypeError, ValueError):
+    TELEGRAM_UPDATE_QUEUE_MAX = 10000
+try:
+    TELEGRAM_UPDATE_TIMEOUT = float(env("TELEGRAM_UPDATE_TIMEOUT", default="60"))
+except (TypeError, ValueError):
+    TELEGRAM_UPDATE_TIMEOUT = 60.0
+
 # Telegram Mini App deep-link settings (for t.me/<bot>/<app>?startapp=...)
 BOT_USERNAME = env("BOT_USERNAME", default="atlassecure_bot")
 MINI_APP_NAME = env("MINI_APP_NAME", default="app")
@@ -620,6 +641,72 @@ try:
 except (TypeError, ValueError):
     REMNAWAVE_BYPASS_DEVICE_LIMIT = 5
 
+# Keep-alive пул app/services/remnawave_api (один httpx клиент на процесс).
+# HTTP/2 требует пакет `h2`; без него флаг тихо игнорируется.
+try:
+    REMNAWAVE_HTTP_MAX_CONNECTIONS = int(env("REMNAWAVE_HTTP_MAX_CONNECTIONS", default="50"))
+except (TypeError, ValueError):
+    REMNAWAVE_HTTP_MAX_CONNECTIONS = 50
+try:
+    REMNAWAVE_HTTP_MAX_KEEPALIVE = int(env("REMNAWAVE_HTTP_MAX_KEEPALIVE", default="20"))
+except (TypeError, ValueError):
+    REMNAWAVE_HTTP_MAX_KEEPALIVE = 20
+REMNAWAVE_HTTP2 = _envbool("REMNAWAVE_HTTP2", False)
+
+# Outbox мутаций bypass entity (migration 083, app/workers/remnawave_outbox).
+# false — старый путь: asyncio-таска на каждый *_bg вызов.
+REMNAWAVE_OUTBOX_ENABLED = _envbool("REMNAWAVE_OUTBOX_ENABLED", True)
+try:
+    REMNAWAVE_OUTBOX_CONCURRENCY = int(env("REMNAWAVE_OUTBOX_CONCURRENCY", default="8"))
+except (TypeError, ValueError):
+    REMNAWAVE_OUTBOX_CONCURRENCY = 8
+
+# Inbox webhook'ов платёжных провайдеров (migration 084, app/workers/payment_inbox):
+# endpoint проверяет подпись, пишет событие и сразу отвечает 200.
+# false — старый путь: вся обработка внутри HTTP-запроса.
+PAYMENT_INBOX_ENABLED = _envbool("PAYMENT_INBOX_ENABLED", True)
+try:
+    PAYMENT_INBOX_CONCURRENCY = int(env("PAYMENT_INBOX_CONCURRENCY", default="4"))
+except (TypeError, ValueError):
+    PAYMENT_INBOX_CONCURRENCY = 4
+try:
+    PAYMENT_INBOX_RETENTION_DAYS = int(env("PAYMENT_INBOX_RETENTION_DAYS", default="30"))
+except (TypeError, ValueError):
+    PAYMENT_INBOX_RETENTION_DAYS = 30
+
+# LISTEN/NOTIFY-пробуждение воркеров (migration 085, database/notify.py).
+# Отдельное соединение вне пула; false — только старые интервалы.
+PG_NOTIFY_ENABLED = _envbool("PG_NOTIFY_ENABLED", True)
+
+# database.init_db: при совпадении schema fingerprint (migration 086) пропускаем
+# миграции и inline DDL. false — всегда полный путь.
+DB_SCHEMA_FAST_PATH = _envbool("DB_SCHEMA_FAST_PATH", True)
+
+# Read replica (database.core.get_read_pool): <ENV>_READ_DATABASE_URL включает
+# второй пул для тяжёлых read-only запросов. Реплика используется, пока
+# отставание ≤ READ_REPLICA_MAX_LAG_SECONDS; lag перемеряется раз в
+# READ_REPLICA_LAG_CHECK_SECONDS. Иначе — основной пул.
+try:
+    READ_REPLICA_MAX_LAG_SECONDS = float(env("READ_REPLICA_MAX_LAG_SECONDS", default="30"))
+except (TypeError, ValueError):
+    READ_REPLICA_MAX_LAG_SECONDS = 30.0
+try:
+    READ_REPLICA_LAG_CHECK_SECONDS = float(env("READ_REPLICA_LAG_CHECK_SECONDS", default="10"))
+except (TypeError, ValueError):
+    READ_REPLICA_LAG_CHECK_SECONDS = 10.0
+try:
+    READ_REPLICA_RETRY_SECONDS = float(env("READ_REPLICA_RETRY_SECONDS", default="60"))
+except (TypeError, ValueError):
+    READ_REPLICA_RETRY_SECONDS = 60.0
+
+# app/workers/traffic_monitor: bulk snapshot через /api/users/stream вместо
+# GET на каждого юзера. Page size ≤ 1000 (лимит панели).
+TRAFFIC_MONITOR_BULK = _envbool("TRAFFIC_MONITOR_BULK", True)
+try:
+    TRAFFIC_MONITOR_PAGE_SIZE = int(env("TRAFFIC_MONITOR_PAGE_SIZE", default="1000"))
+except (TypeError, ValueError):
+    TRAFFIC_MONITOR_PAGE_SIZE = 1000
+
 # Bypass far-future expireAt (TZ asks for 2099-12-31; bot historically uses
 # now+10 years which is functionally identical).  Configurable for tests.
 BYPASS_INFINITE_EXPIRE_ISO = env("BYPASS_INFINITE_EXPIRE", default="2099-12-31T23:59:59Z")
@@ -631,9 +718,55 @@ LEGACY_SAMOPIS_SUB_BASE_URL = env(
     default="",
 ).rstrip("/")
 
+# GET /metrics (Prometheus text format, app/core/metrics). METRICS_TOKEN —
+# Bearer-токен для scrape; без него endpoint отвечает только localhost.
+METRICS_ENABLED = _envbool("METRICS_ENABLED", True)
+METRICS_TOKEN = env("METRICS_TOKEN", default="")
+
 # Redis for FSM storage
 REDIS_URL = env("REDIS_URL", default="")
 
+# app/events.bus: "memory" — in-process (один процесс видит только свои
+# события); "redis" — плюс pub/sub через REDIS_URL, чтобы дашборд видел
+# события всех воркеров. Без REDIS_URL — откат на memory с warning.
+EVENT_BUS_BACKEND = env("EVENT_BUS_BACKEND", default="memory")
+
+# language_service: LRU+TTL кеш telegram_id → language перед БД.
+# LANGUAGE_CACHE_REDIS — дополнительно шарить через общий Redis (если задан).
+try:
+    LANGUAGE_CACHE_MAX_ENTRIES = int(env("LANGUAGE_CACHE_MAX_ENTRIES", default="100000"))
+except (TypeError, ValueError):
+    LANGUAGE_CACHE_MAX_ENTRIES = 100000
+try:
+    LANGUAGE_CACHE_TTL_SECONDS = float(env("LANGUAGE_CACHE_TTL_SECONDS", default="600"))
+except (TypeError, ValueError):
+    LANGUAGE_CACHE_TTL_SECONDS = 600.0
+LANGUAGE_CACHE_REDIS = _envbool("LANGUAGE_CACHE_REDIS", True)
+
+# LastSeenMiddleware: коалесцирование users.last_seen_at — flush раз в
+# N секунд или раньше, когда накопилось MAX_PENDING юзеров.
+try:
+    LAST_SEEN_FLUSH_INTERVAL = float(env("LAST_SEEN_FLUSH_INTERVAL", default="5"))
+except (TypeError, ValueError):
+    LAST_SEEN_FLUSH_INTERVAL = 5.0
+try:
+    LAST_SEEN_FLUSH_MAX_PENDING = int(env("LAST_SEEN_FLUSH_MAX_PENDING", default="5000"))
+except (TypeError, ValueError):
+    LAST_SEEN_FLUSH_MAX_PENDING = 5000
+
+# Global outbound Telegram scheduler (app/core/telegram_scheduler.py):
+# один token bucket на все send_*/delete_message процесса. Лимит бота ~30
+# msg/s — держим чуть ниже, чтобы не ловить RetryAfter на границе.
+TELEGRAM_SCHEDULER_ENABLED = _envbool("TELEGRAM_SCHEDULER_ENABLED", True)
+try:
+    TELEGRAM_GLOBAL_RATE = float(env("TELEGRAM_GLOBAL_RATE", default="28"))
+except (TypeError, ValueError):
+    TELEGRAM_GLOBAL_RATE = 28.0
+try:
+    TELEGRAM_GLOBAL_BURST = int(env("TELEGRAM_GLOBAL_BURST", default="30"))
+except (TypeError, ValueError):
+    TELEGRAM_GLOBAL_BURST = 30
+
 
 # ─────────────────────────────────────────────────────────────────────────
 # Sub-aggregator service — константы (без ENV).
@@ -661,3 +794,25 @@ SUB_AGGREGATOR_INTERNAL_SECRET = ""  # заполни после генерац
 # Пусто → агрегатор качает URL как есть (без подмены host).
 SUB_AGGREGATOR_UPSTREAM_HOST = "sub.atlassecure.ru"
 
+# Incy crypt1: пул долгоживущих `node scripts/incy_encode.mjs --serve`
+# (app/services/incy_crypto). 0 — старый режим, отдельный node на каждый
+# encode. INCY_PREWARM_HOURS > 0 — на старте прогреть ссылки юзеров,
+# заходивших за последние N часов.
+try:
+    INCY_SIDECAR_POOL_SIZE = int(env("INCY_SIDECAR_POOL_SIZE", default="2"))
+except (TypeError, ValueError):
+    INCY_SIDECAR_POOL_SIZE = 2
+try:
+    INCY_PREWARM_HOURS = int(env("INCY_PREWARM_HOURS", default="24"))
+except (TypeError, ValueError):
+    INCY_PREWARM_HOURS = 24
+
+# Общий L2-кеш агрегатора в Redis (body + pair, gzip) + pub/sub инвалидация
+# между воркерами. Работает только при заданном REDIS_URL; без него — чистый
+# in-process кеш, как раньше.
+SUB_AGGREGATOR_REDIS_L2 = True
+
+# Фоновое упреждающее обновление самых часто опрашиваемых token'ов
+# агрегатора (refresh-ahead, см. run_refresh_ahead). False → только SWR.
+SUB_AGGREGATOR_REFRESH_AHEAD = True
+
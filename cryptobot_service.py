@@ -154,15 +154,29 @@ async def process_webhook_data(headers: dict, raw_body: bytes, body: dict, bot:
         logger.warning("CryptoBot webhook: DB not ready — returning 500 for retry")
         raise TransientPaymentError("DB not ready")
 
-    # Verify signature
+    if not verify_webhook_auth(headers, raw_body):
+        return {"status": "unauthorized"}
+
+    return await handle_webhook_event(body, bot)
+
+
+def verify_webhook_auth(headers: dict, raw_body: bytes) -> bool:
+    """Check the crypto-pay-api-signature header against the raw body."""
     signature = headers.get("crypto-pay-api-signature", "")
     if not signature:
         logger.warning("CryptoBot webhook: missing signature header")
-        return {"status": "unauthorized"}
+        return False
     if not verify_webhook_signature(raw_body, signature):
         logger.warning("CryptoBot webhook: signature verification failed")
-        return {"status": "unauthorized"}
+        return False
+    return True
+
 
+async def handle_webhook_event(body: dict, bot: Bot) -> dict:
+    """Business part of the webhook, after the signature check.
+
+    Called inline by process_webhook_data and by the payment inbox worker.
+    """
     update_type = body.get("update_type")
     if update_type != "invoice_paid":
         logger.info(f"CryptoBot webhook: ignoring update_type={update_type}")
@@ -43,6 +43,7 @@ _sys.modules[__name__].__class__ = _DatabaseModuleProxy
 # via __getattr__ above so that `database.DB_READY = True` in main.py works.
 from database.core import (  # noqa: F401
     get_pool,
+    get_read_pool,
     close_pool,
     init_db,
     ensure_db_ready,
@@ -101,6 +102,7 @@ from database.users import (  # noqa: F401
     get_referral_statistics,
     process_referral_reward,
     update_user_language,
+    get_user_languages,
     update_username,
 )
 
@@ -120,6 +122,9 @@ from database.subscriptions import (  # noqa: F401
     has_trial_used,
     get_trial_info,
     get_active_paid_subscription,
+    fetch_expired_for_cleanup,
+    expire_subscriptions_bulk,
+    _log_fast_expiry_audit_bulk,
     mark_trial_used,
     is_eligible_for_trial,
     is_trial_available,
@@ -157,6 +162,8 @@ from database.subscriptions import (  # noqa: F401
     consume_promocode_atomic,
     is_user_first_purchase,
     get_subscriptions_for_reminders,
+    get_subscriptions_due_for_reminders,
+    reschedule_reminders,
     get_admin_stats,
     get_admin_referral_stats,
     get_admin_referral_detail,
@@ -258,6 +265,8 @@ from database.bypass_gift_links import (  # noqa: F401
 
 # Farm storm: scheduling, shield, execution
 from database.farm import (  # noqa: F401
+    FarmPlot,
+    empty_farm_plot,
     get_pending_storm,
     mark_storm_announced,
     mark_storm_executed,
@@ -267,6 +276,7 @@ from database.farm import (  # noqa: F401
     apply_storm_shield_atomic,
     execute_storm_for_user,
     touch_last_seen,
+    touch_last_seen_bulk,
     STORM_ANNOUNCE_BEFORE_HOURS,
     STORM_MIN_INTERVAL_DAYS,
     STORM_MAX_INTERVAL_DAYS,
@@ -277,6 +287,11 @@ from database.admin import (  # noqa: F401
     expire_old_pending_purchases,
     get_all_users_for_export,
     get_active_subscriptions_for_export,
+    stream_export_rows,
+    iter_users_for_export,
+    iter_active_subscriptions_for_export,
+    iter_payments_for_export,
+    iter_broadcast_log_for_export,
     get_subscription_history,
     get_user_extended_stats,
     get_business_metrics,
@@ -304,7 +319,12 @@ from database.admin import (  # noqa: F401
     insert_admin_broadcast_record,
     update_admin_broadcast_record,
     get_users_by_segment,
+    iter_users_by_segment,
+    count_users_by_segment,
+    user_in_segment,
+    segment_sql,
     log_broadcast_send,
+    log_broadcast_sends_bulk,
     get_broadcast_stats,
     get_recent_broadcasts,
     get_broadcast_message_ids,
@@ -366,6 +386,7 @@ from database.scheduled_broadcasts import (  # noqa: F401
     cancel_scheduled_broadcast,
     mark_ran_and_reschedule,
     fetch_due_scheduled,
+    get_next_scheduled_at,
 )
 
 
@@ -378,3 +399,43 @@ from database.reconciliation import (  # noqa: F401
     list_over_issuance_log,
     record_over_issuance,
 )
+
+# Dashboard analytics rollups (migration 082)
+from database.analytics import (  # noqa: F401
+    refresh_analytics_rollups,
+    rebuild_analytics_rollups,
+)
+
+# Remnawave provisioning outbox (migration 083)
+from database.remnawave_outbox import (  # noqa: F401
+    outbox_enabled,
+    enqueue_remnawave_op,
+    enqueue_remnawave_ops,
+    enqueue_remnawave_renew,
+    claim_remnawave_outbox,
+    complete_remnawave_ops,
+    update_remnawave_op_payload,
+    fail_remnawave_ops,
+)
+
+# Payment provider webhook inbox (migration 084)
+from database.payment_inbox import (  # noqa: F401
+    payment_inbox_enabled,
+    enqueue_payment_event,
+    claim_payment_events,
+    complete_payment_event,
+    fail_payment_event,
+    prune_payment_inbox,
+)
+
+# LISTEN/NOTIFY wakeups for background workers (migration 085)
+from database.notify import (  # noqa: F401
+    CHANNEL_ACTIVATION,
+    CHANNEL_SCHEDULED_BROADCAST,
+    CHANNEL_PURCHASE_INVOICE,
+    listener_connected,
+    wait_for_notify,
+    notify as pg_notify,
+    start_listener as start_notify_listener,
+    stop_listener as stop_notify_listener,
+)
@@ -9,6 +9,7 @@ import asyncpg
 import logging
 import random
 import uuid as uuid_lib
+from dataclasses import dataclass
 from datetime import datetime, timedelta, timezone
 from typing import Optional, Dict, Any, Tuple, TYPE_CHECKING, List
 import config
@@ -16,10 +17,13 @@ import vpn_utils
 import database.core as _core
 from database.core import (
     get_pool,
+    get_read_pool,
     _to_db_utc, _from_db_utc, _ensure_utc,
     _generate_subscription_uuid, safe_int,
     retry_async,
 )
+from database.analytics import EPOCH, fetch_facts, get_rollup_watermark
+from database.remnawave_outbox import enqueue_remnawave_renew
 
 if TYPE_CHECKING:
     from aiogram import Bot
@@ -84,6 +88,62 @@ async def get_active_subscriptions_for_export() -> list:
         return [dict(row) for row in rows]
 
 
+EXPORT_PREFETCH_ROWS = 1000
+
+
+async def stream_export_rows(query: str, *args, prefetch: int = EXPORT_PREFETCH_ROWS):
+    """Стрим строк экспорта через server-side cursor.
+
+    В отличие от get_*_for_export не держит таблицу в памяти: asyncpg
+    тянет по `prefetch` строк, память ограничена размером чанка. Курсор
+    живёт в read-only REPEATABLE READ транзакции — консистентный снимок
+    на всю выгрузку. Соединение занято, пока потребитель итерирует; при
+    закрытии генератора (обрыв скачивания) оно возвращается в пул.
+    Берётся из get_read_pool(): долгая выгрузка не держит соединение
+    основного пула (read-only снимок на standby допустим).
+    """
+    pool = await get_read_pool()
+    async with pool.acquire() as conn:
+        async with conn.transaction(isolation="repeatable_read", readonly=True):
+            async for row in conn.cursor(query, *args, prefetch=prefetch):
+                yield row
+
+
+def iter_users_for_export():
+    """Стрим всех пользователей (как get_all_users_for_export)."""
+    return stream_export_rows("SELECT * FROM users ORDER BY created_at DESC")
+
+
+def iter_active_subscriptions_for_export():
+    """Стрим активных подписок (как get_active_subscriptions_for_export)."""
+    return stream_export_rows(
+        "SELECT * FROM subscriptions WHERE expires_at > $1 ORDER BY expires_at DESC",
+        _to_db_utc(datetime.now(timezone.utc)),
+    )
+
+
+def iter_payments_for_export(since: Optional[datetime] = None, status: Optional[str] = None):
+    """Стрим платежей (новые первыми), опционально с created_at >= since и по статусу."""
+    return stream_export_rows(
+        """SELECT * FROM payments
+           WHERE ($1::timestamp IS NULL OR created_at >= $1)
+             AND ($2::text IS NULL OR status = $2)
+           ORDER BY id DESC""",
+        _to_db_utc(since) if since else None, status,
+    )
+
+
+def iter_broadcast_log_for_export(broadcast_id: Optional[int] = None):
+    """Стрим broadcast_log — целиком или по одной рассылке."""
+    return stream_export_rows(
+        """SELECT id, broadcast_id, telegram_id, status, variant, message_id, sent_at
+           FROM broadcast_log
+           WHERE ($1::int IS NULL OR broadcast_id = $1)
+           ORDER BY id""",
+        broadcast_id,
+    )
+
+
 # Функция get_vpn_keys_stats удалена - больше не используется
 # VPN-ключи теперь создаются динамически через Outline API, статистика по пулу не актуальна
 
@@ -647,6 +707,20 @@ async def get_active_paid_subscriptions_count() -> int:
         return 0
 
 
+def _sum_facts(rows, key) -> List[Tuple[Any, int, int]]:
+    """Group rollup rows by key(row) → [(key, count, amount)] sorted by amount desc."""
+    acc: Dict[Any, List[int]] = {}
+    for r in rows:
+        slot = acc.setdefault(key(r), [0, 0])
+        slot[0] += int(r["cnt"])
+        slot[1] += int(r["amount"])
+    return sorted(
+        ((k, c, a) for k, (c, a) in acc.items()),
+        key=lambda item: item[2],
+        reverse=True,
+    )
+
+
 async def get_revenue_for_period(
     hours: int,
     since: Optional[datetime] = None,
@@ -658,6 +732,8 @@ async def get_revenue_for_period(
 
     Returns totals (rubles) + counts split by purchase_type so the
     UI can render a single KPI for the period plus a small breakdown.
+    Reads the hourly/daily rollups (database.analytics) plus the raw
+    tail after the watermark.
     """
     pool = await get_pool()
     if pool is None:
@@ -667,41 +743,21 @@ async def get_revenue_for_period(
             "avg_check_rubles": 0.0,
             "by_type": {},
         }
-    if since is None:
-        since = datetime.now(timezone.utc) - timedelta(hours=hours)
-    since = _to_db_utc(since)
+    now = datetime.now(timezone.utc)
+    since = _ensure_utc(since) if since is not None else now - timedelta(hours=hours)
     async with pool.acquire() as conn:
-        row = await conn.fetchrow(
-            """SELECT
-                   COALESCE(SUM(price_kopecks), 0)::BIGINT AS total_kopecks,
-                   COUNT(*)::BIGINT AS count
-               FROM pending_purchases
-               WHERE status = 'paid' AND created_at >= $1""",
-            since,
-        )
-        by_type_rows = await conn.fetch(
-            """SELECT
-                   COALESCE(purchase_type, 'subscription') AS purchase_type,
-                   COUNT(*)::BIGINT AS count,
-                   COALESCE(SUM(price_kopecks), 0)::BIGINT AS revenue_kopecks
-               FROM pending_purchases
-               WHERE status = 'paid' AND created_at >= $1
-               GROUP BY purchase_type
-               ORDER BY revenue_kopecks DESC""",
-            since,
-        )
-    total = int(row["total_kopecks"]) if row else 0
-    count = int(row["count"]) if row else 0
+        wm = await get_rollup_watermark(conn)
+        rows = await fetch_facts(conn, since, ["source"], ["purchase"], watermark=wm, now=now)
+    by_type = _sum_facts(rows, lambda r: r["source"] or "subscription")
+    total = sum(kop for _, _, kop in by_type)
+    count = sum(c for _, c, _ in by_type)
     return {
         "revenue_rubles": total / 100,
         "payments_count": count,
         "avg_check_rubles": (total / 100 / count) if count else 0.0,
         "by_type": {
-            r["purchase_type"]: {
-                "count": int(r["count"]),
-                "revenue_rubles": int(r["revenue_kopecks"]) / 100,
-            }
-            for r in by_type_rows
+            k: {"count": c, "revenue_rubles": kop / 100}
+            for k, c, kop in by_type
         },
     }
 
@@ -753,11 +809,15 @@ async def get_payments_breakdown(hours: int) -> Dict[str, Any]:
 
     Используется в дашборде для «что купили сегодня/за N часов»:
     админ видит, кто платит, чем и за что.
+
+    Один запрос к роллапам (provider × tariff × purchase_type), все
+    разрезы досчитываются здесь же.
     """
     pool = await get_pool()
     if pool is None:
         return {}
-    since = _to_db_utc(datetime.now(timezone.utc) - timedelta(hours=hours))
+    now = datetime.now(timezone.utc)
+    since = now - timedelta(hours=hours)
     out: Dict[str, Any] = {
         "hours": hours,
         "total": {"count": 0, "revenue_rubles": 0.0},
@@ -766,115 +826,56 @@ async def get_payments_breakdown(hours: int) -> Dict[str, Any]:
         "by_tariff": [],
         "by_apple_nominal": [],
     }
-    async with pool.acquire() as conn:
-        try:
-            total = await conn.fetchrow(
-                """SELECT COUNT(*)::BIGINT AS count,
-                          COALESCE(SUM(price_kopecks), 0)::BIGINT AS revenue_kop
-                   FROM pending_purchases
-                   WHERE status = 'paid' AND created_at >= $1""",
-                since,
-            )
-            out["total"] = {
-                "count": int(total["count"] or 0),
-                "revenue_rubles": int(total["revenue_kop"] or 0) / 100,
-            }
-        except Exception as e:
-            logger.warning("breakdown total_failed: %s", e)
-
-        # by_provider
-        try:
-            rows = await conn.fetch(
-                """SELECT COALESCE(payment_provider, 'unknown') AS k,
-                          COUNT(*)::BIGINT AS c,
-                          COALESCE(SUM(price_kopecks), 0)::BIGINT AS rev
-                   FROM pending_purchases
-                   WHERE status = 'paid' AND created_at >= $1
-                   GROUP BY k
-                   ORDER BY rev DESC""",
-                since,
-            )
-            out["by_provider"] = [
-                {"provider": r["k"], "count": int(r["c"]),
-                 "revenue_rubles": int(r["rev"]) / 100}
-                for r in rows
-            ]
-        except Exception as e:
-            logger.warning("breakdown by_provider failed: %s", e)
-
-        # by_type (subscription / apple_id / steam / spotify / ...)
-        try:
-            rows = await conn.fetch(
-                """SELECT COALESCE(purchase_type, 'unknown') AS k,
-                          COUNT(*)::BIGINT AS c,
-                          COALESCE(SUM(price_kopecks), 0)::BIGINT AS rev
-                   FROM pending_purchases
-                   WHERE status = 'paid' AND created_at >= $1
-                   GROUP BY k
-                   ORDER BY rev DESC""",
-                since,
+    try:
+        async with pool.acquire() as conn:
+            wm = await get_rollup_watermark(conn)
+            rows = await fetch_facts(
+                conn, since, ["provider", "tariff", "source"], ["purchase"],
+                watermark=wm, now=now,
             )
-            out["by_type"] = [
-                {"purchase_type": r["k"], "count": int(r["c"]),
-                 "revenue_rubles": int(r["rev"]) / 100}
-                for r in rows
-            ]
-        except Exception as e:
-            logger.warning("breakdown by_type failed: %s", e)
+    except Exception as e:
+        logger.warning("breakdown failed: %s", e)
+        return out
 
-        # by_tariff (top-15 по revenue)
-        try:
-            rows = await conn.fetch(
-                """SELECT COALESCE(tariff, 'unknown') AS k,
-                          COUNT(*)::BIGINT AS c,
-                          COALESCE(SUM(price_kopecks), 0)::BIGINT AS rev
-                   FROM pending_purchases
-                   WHERE status = 'paid' AND created_at >= $1
-                   GROUP BY k
-                   ORDER BY rev DESC
-                   LIMIT 15""",
-                since,
-            )
-            out["by_tariff"] = [
-                {"tariff": r["k"], "count": int(r["c"]),
-                 "revenue_rubles": int(r["rev"]) / 100}
-                for r in rows
-            ]
-        except Exception as e:
-            logger.warning("breakdown by_tariff failed: %s", e)
+    by_provider = _sum_facts(rows, lambda r: r["provider"] or "unknown")
+    out["total"] = {
+        "count": sum(c for _, c, _ in by_provider),
+        "revenue_rubles": sum(kop for _, _, kop in by_provider) / 100,
+    }
+    out["by_provider"] = [
+        {"provider": k, "count": c, "revenue_rubles": kop / 100}
+        for k, c, kop in by_provider
+    ]
+    # by_type (subscription / apple_id / steam / spotify / ...)
+    out["by_type"] = [
+        {"purchase_type": k, "count": c, "revenue_rubles": kop / 100}
+        for k, c, kop in _sum_facts(rows, lambda r: r["source"] or "unknown")
+    ]
+    # by_tariff (top-15 по revenue)
+    out["by_tariff"] = [
+        {"tariff": k, "count": c, "revenue_rubles": kop / 100}
+        for k, c, kop in _sum_facts(rows, lambda r: r["tariff"] or "unknown")[:15]
+    ]
 
-        # by_apple_nominal — только apple_id_ строки, распарсим tariff
-        # apple_id_{region}_{nominal} → region + nominal.
+    # by_apple_nominal — только apple_id_ строки, распарсим tariff
+    # apple_id_{region}_{nominal} → region + nominal.
+    apple = []
+    apple_rows = [r for r in rows if (r["tariff"] or "").startswith("apple_id_")]
+    for t, c, kop in _sum_facts(apple_rows, lambda r: r["tariff"]):
+        parts = t.split("_")
+        region = parts[2] if len(parts) >= 3 else "?"
+        nominal_raw = parts[3] if len(parts) >= 4 else "0"
         try:
-            rows = await conn.fetch(
-                """SELECT tariff, COUNT(*)::BIGINT AS c,
-                          COALESCE(SUM(price_kopecks), 0)::BIGINT AS rev
-                   FROM pending_purchases
-                   WHERE status = 'paid' AND created_at >= $1
-                     AND tariff LIKE 'apple_id_%'
-                   GROUP BY tariff
-                   ORDER BY rev DESC""",
-                since,
-            )
-            apple = []
-            for r in rows:
-                t = str(r["tariff"] or "")
-                parts = t.split("_")
-                region = parts[2] if len(parts) >= 3 else "?"
-                nominal_raw = parts[3] if len(parts) >= 4 else "0"
-                try:
-                    nominal = int(nominal_raw)
-                except ValueError:
-                    nominal = 0
-                apple.append({
-                    "region": region,
-                    "nominal": nominal,
-                    "count": int(r["c"]),
-                    "revenue_rubles": int(r["rev"]) / 100,
-                })
-            out["by_apple_nominal"] = apple
-        except Exception as e:
-            logger.warning("breakdown by_apple_nominal failed: %s", e)
+            nominal = int(nominal_raw)
+        except ValueError:
+            nominal = 0
+        apple.append({
+            "region": region,
+            "nominal": nominal,
+            "count": c,
+            "revenue_rubles": kop / 100,
+        })
+    out["by_apple_nominal"] = apple
     return out
 
 
@@ -1283,77 +1284,71 @@ async def get_purchase_breakdown() -> Dict[str, Any]:
 
 
 async def get_extended_bot_stats() -> Dict[str, Any]:
-    """Расширенная статистика бота для мониторинга."""
+    """Расширенная статистика бота для мониторинга.
+
+    Счётчики состояния (подписки, триалы) — один round-trip по одному
+    проходу users / subscriptions; выручка и новые юзеры — из роллапов.
+    """
     pool = await get_pool()
     async with pool.acquire() as conn:
         now = datetime.now(timezone.utc)
         now_db = _to_db_utc(now)
 
-        total_users = await conn.fetchval("SELECT COUNT(*) FROM users")
-
-        # Active subscriptions
-        active_subs = await conn.fetchval(
-            "SELECT COUNT(*) FROM subscriptions WHERE expires_at > $1", now_db
-        )
-
-        # Expired and not renewed (churn)
-        expired_subs = await conn.fetchval(
-            "SELECT COUNT(*) FROM subscriptions WHERE expires_at <= $1", now_db
+        state = await conn.fetchrow(
+            """SELECT u.total_users, u.total_trial,
+                      s.active_subs, s.expired_subs, s.users_with_sub, s.avg_subs,
+                      (SELECT COUNT(*) FROM broadcasts) AS total_broadcasts
+               FROM (SELECT COUNT(*) AS total_users,
+                            COUNT(*) FILTER (WHERE trial_used_at IS NOT NULL) AS total_trial
+                     FROM users) u,
+                    (SELECT COUNT(*) FILTER (WHERE expires_at > $1) AS active_subs,
+                            COUNT(*) FILTER (WHERE expires_at <= $1) AS expired_subs,
+                            -- conversion: users who have at least one subscription
+                            COUNT(DISTINCT telegram_id) AS users_with_sub,
+                            -- average subscriptions per paying user
+                            ROUND(COUNT(*)::numeric / NULLIF(COUNT(DISTINCT telegram_id), 0), 1) AS avg_subs
+                     FROM subscriptions) s""",
+            now_db,
         )
-
-        # Trial stats
-        total_trial = await conn.fetchval(
-            "SELECT COUNT(*) FROM users WHERE trial_used_at IS NOT NULL"
-        )
-
-        # Conversion: users who have at least one subscription
-        users_with_sub = await conn.fetchval(
-            "SELECT COUNT(DISTINCT telegram_id) FROM subscriptions"
-        )
-
+        total_users = state["total_users"] or 0
+        active_subs = state["active_subs"] or 0
+        expired_subs = state["expired_subs"] or 0
+        total_trial = state["total_trial"] or 0
+        users_with_sub = state["users_with_sub"] or 0
+        avg_subs = state["avg_subs"]
+
+        wm = await get_rollup_watermark(conn)
         # Revenue (sum of approved payments)
-        total_revenue = await conn.fetchval(
-            "SELECT COALESCE(SUM(amount), 0) FROM payments WHERE status = 'approved'"
-        ) or 0
-
-        # Revenue last 30 days (MRR estimate)
-        mrr_since = _to_db_utc(now - timedelta(days=30))
-        mrr = await conn.fetchval(
-            "SELECT COALESCE(SUM(amount), 0) FROM payments WHERE status = 'approved' AND created_at >= $1",
-            mrr_since
-        ) or 0
-
-        # New users today
-        today_start = _to_db_utc(now.replace(hour=0, minute=0, second=0, microsecond=0))
-        new_today = await conn.fetchval(
-            "SELECT COUNT(*) FROM users WHERE created_at >= $1", today_start
-        )
-
-        # Broadcasts sent
-        total_broadcasts = await conn.fetchval("SELECT COUNT(*) FROM broadcasts")
-
-        # Average subscriptions per paying user
-        avg_subs = await conn.fetchval(
-            "SELECT ROUND(AVG(cnt), 1) FROM (SELECT COUNT(*) as cnt FROM subscriptions GROUP BY telegram_id) sub"
+        all_time = await fetch_facts(conn, EPOCH, ["metric"], ["payment"], watermark=wm, now=now)
+        total_revenue = sum(int(r["amount"]) for r in all_time)
+
+        # Revenue last 30 days (MRR estimate) + new users today (UTC)
+        recent = await fetch_facts(
+            conn, now - timedelta(days=30),
+            ["metric", "ts >= date_trunc('day', NOW() AT TIME ZONE 'UTC') AT TIME ZONE 'UTC' AS today"],
+            ["payment", "user"],
+            watermark=wm, now=now,
         )
+        mrr = sum(int(r["amount"]) for r in recent if r["metric"] == "payment")
+        new_today = sum(int(r["cnt"]) for r in recent if r["metric"] == "user" and r["today"])
 
         conversion_rate = round((users_with_sub / total_users * 100), 1) if total_users > 0 else 0
         trial_rate = round((total_trial / total_users * 100), 1) if total_users > 0 else 0
         churn_rate = round((expired_subs / (active_subs + expired_subs) * 100), 1) if (active_subs + expired_subs) > 0 else 0
 
         return {
-            "total_users": total_users or 0,
-            "active_subs": active_subs or 0,
-            "expired_subs": expired_subs or 0,
-            "total_trial": total_trial or 0,
+            "total_users": total_users,
+            "active_subs": active_subs,
+            "expired_subs": expired_subs,
+            "total_trial": total_trial,
             "trial_rate": trial_rate,
-            "users_with_sub": users_with_sub or 0,
+            "users_with_sub": users_with_sub,
             "conversion_rate": conversion_rate,
             "churn_rate": churn_rate,
             "total_revenue": total_revenue,
             "mrr": mrr,
-            "new_today": new_today or 0,
-            "total_broadcasts": total_broadcasts or 0,
+            "new_today": new_today,
+            "total_broadcasts": state["total_broadcasts"] or 0,
             "avg_subs_per_user": float(avg_subs) if avg_subs else 0,
         }
 
@@ -1484,532 +1479,467 @@ async def update_admin_broadcast_record(broadcast_id: int, success_count: int, f
         logger.warning(f"Failed to update admin_broadcast record: {e}")
 
 
+_NOW_UTC = "(NOW() AT TIME ZONE 'UTC')"
+# COALESCE: trial_expires_at добавлен в схему users позже, чем
+# trial_used_at. У старых триалов поле могло быть NULL. Fallback на
+# trial_used_at + 3 дня (продолжительность триала — см.
+# app/handlers/callbacks/subscription.py:143).
+_TRIAL_END = "COALESCE(u.trial_expires_at, u.trial_used_at + INTERVAL '3 days')"
+_NO_ACTIVE_PAID = f"""NOT EXISTS (
+    SELECT 1 FROM subscriptions s
+    WHERE s.telegram_id = u.telegram_id
+      AND s.source = 'payment'
+      AND s.expires_at > {_NOW_UTC}
+)"""
+_NO_ACTIVE_ANY = f"""NOT EXISTS (
+    SELECT 1 FROM subscriptions s
+    WHERE s.telegram_id = u.telegram_id
+      AND s.expires_at > {_NOW_UTC}
+)"""
+_NEVER_PAID = """NOT EXISTS (
+    SELECT 1 FROM subscriptions s
+    WHERE s.telegram_id = u.telegram_id
+      AND s.source = 'payment'
+)"""
+
+
+@dataclass(frozen=True)
+class SegmentSQL:
+    """Сегмент как SQL-предикат: FROM `source` WHERE `where`, id в `id_col`.
+
+    Один источник истины для всех сегментов get_users_by_segment; из него
+    строятся три запроса — список id, COUNT и EXISTS для одного юзера.
+    Предикаты без параметров (дни — только int из ключа сегмента), поэтому
+    их можно комбинировать через and_().
+    """
+    source: str
+    id_col: str
+    where: str
+    distinct: bool = False
+
+    def ids_sql(self) -> str:
+        select = f"DISTINCT {self.id_col}" if self.distinct else self.id_col
+        return f"SELECT {select} AS telegram_id FROM {self.source} WHERE {self.where}"
+
+    def count_sql(self) -> str:
+        expr = f"COUNT(DISTINCT {self.id_col})" if self.distinct else "COUNT(*)"
+        return f"SELECT {expr} FROM {self.source} WHERE {self.where}"
+
+    def exists_sql(self) -> str:
+        # $1 = telegram_id; для users-сегментов это index lookup по PK.
+        return (
+            f"SELECT EXISTS (SELECT 1 FROM {self.source} "
+            f"WHERE {self.id_col} = $1 AND ({self.where}))"
+        )
+
+    def and_(self, predicate: str) -> "SegmentSQL":
+        return SegmentSQL(self.source, self.id_col, f"({self.where}) AND ({predicate})", self.distinct)
+
+
+def _users(where: str) -> SegmentSQL:
+    return SegmentSQL("users u", "u.telegram_id", where)
+
+
+def segment_sql(segment: str) -> Optional[SegmentSQL]:
+    """SQL-определение сегмента получателей (None — сегмент неизвестен).
+
+    Сегменты:
+        - all_users            — все
+        - active_subscriptions — активная подписка
+        - no_subscription      — нет активной подписки (включая истёкшие)
+        - no_remnawave         — никогда не имели entity в Remnawave
+                                 (ни premium, ни bypass)
+        - expired_1d / expired_2d / expired_3d — подписка истекла
+                                 ровно N полных суток назад
+                                 (и сейчас нет активной)
+        - started_7d_cold      — холодные лиды: запустили бот за
+                                 последние 7 суток (users.created_at)
+                                 и до сих пор без активной подписки
+                                 И без bypass-entity.
+        - trial_ends_in_1d     — у юзера ИДЁТ триал и закончится
+                                 в ближайшие 24 часа
+                                 (trial_expires_at ∈ (NOW, NOW+24h])
+        - trial_expired_6h / 1d / 2d / 3d
+                               — триал закончился N времени назад
+                                 по фиксированному бакету:
+                                   6h → [NOW-7h, NOW-6h)
+                                   1d → [NOW-2d, NOW-1d)
+                                   2d → [NOW-3d, NOW-2d)
+                                   3d → [NOW-4d, NOW-3d)
+                                 И сейчас нет активной подписки.
+        - paid_expired_1d      — платная (subscriptions.source='payment')
+                                 истекла ровно 1 сутки назад
+                                 (expires_at ∈ [NOW-2d, NOW-1d))
+                                 и сейчас нет активной подписки
+        … и реактивационные / апселл-сегменты ниже.
+
+    ВАЖНО про tz: users.trial_expires_at / subscriptions.expires_at —
+    TIMESTAMP без TZ, в БД хранится naive UTC (см. _to_db_utc). NOW()
+    возвращает TIMESTAMPTZ в session-TZ; implicit cast TIMESTAMP→TIMESTAMPTZ
+    интерпретирует TIMESTAMP в session-TZ и даёт сдвиг, если session-TZ ≠
+    UTC. Используем `NOW() AT TIME ZONE 'UTC'` — это TIMESTAMP-без-TZ в UTC,
+    сравнение надёжно без implicit cast в любой session-TZ.
+    """
+    if segment == "all_users":
+        return _users("TRUE")
+    if segment == "active_subscriptions":
+        return _users(f"""EXISTS (
+            SELECT 1 FROM subscriptions s
+            WHERE s.telegram_id = u.telegram_id
+              AND s.expires_at > {_NOW_UTC}
+        )""")
+    if segment == "no_subscription":
+        return _users(_NO_ACTIVE_ANY)
+    if segment == "no_remnawave":
+        # Users who never had ANY Remnawave entity — neither premium
+        # nor bypass. They've never been provisioned on the panel.
+        return _users("""NOT EXISTS (
+            SELECT 1 FROM subscriptions s
+            WHERE s.telegram_id = u.telegram_id
+              AND (s.remnawave_premium_uuid IS NOT NULL
+                   OR s.remnawave_uuid IS NOT NULL)
+        )""")
+    if segment == "started_7d_cold":
+        # Холодные лиды для прогрева: запустили бот не позже 7 суток
+        # назад и до сих пор ничего не купили — ни подписку, ни
+        # bypass-ГБ. Условия:
+        #   1) users.created_at >= NOW() - 7 days  → свежий старт
+        #   2) NO subscription row с expires_at > NOW()  → нет
+        #      активной подписки
+        #   3) NO subscription row с remnawave_uuid или
+        #      remnawave_premium_uuid → не сидит на bypass-only
+        #      ключах, оставшихся от триала / прошлой покупки.
+        # 1 + 3 — то самое «никаких ключей вообще».
+        return _users("""u.created_at >= NOW() - INTERVAL '7 days'
+            AND NOT EXISTS (
+                SELECT 1 FROM subscriptions s
+                WHERE s.telegram_id = u.telegram_id
+                  AND (
+                      s.expires_at > NOW()
+                      OR s.remnawave_uuid IS NOT NULL
+                      OR s.remnawave_premium_uuid IS NOT NULL
+                  )
+            )""")
+    if segment == "trial_ends_in_1d":
+        # Идёт триал, до конца ≤ 24 часа. Цель — пуш с напоминанием
+        # «триал заканчивается, оформи подписку».
+        return _users(f"""u.trial_used_at IS NOT NULL
+            AND {_TRIAL_END} >  {_NOW_UTC}
+            AND {_TRIAL_END} <= {_NOW_UTC} + INTERVAL '24 hours'""")
+    if segment in ("trial_expired_6h", "trial_expired_1d", "trial_expired_2d", "trial_expired_3d"):
+        # Триал закончился N времени назад (фиксированный бакет).
+        # Исключаем только тех, у кого есть активная **платная**
+        # подписка — это юзеры, успешно конвертнувшиеся, им пуш
+        # «триал истёк, купи подписку» уже не нужен. Активные
+        # bypass-only/gift/admin_grant не считаем — у них нет
+        # основной подписки, и наш пуш им релевантен.
+        #   trial_expired_6h → [NOW-7h, NOW-6h)
+        #   trial_expired_1d → [NOW-2d, NOW-1d)
+        #   trial_expired_2d → [NOW-3d, NOW-2d)
+        #   trial_expired_3d → [NOW-4d, NOW-3d)
+        if segment == "trial_expired_6h":
+            upper_sql = f"{_NOW_UTC} - INTERVAL '6 hours'"
+            lower_sql = f"{_NOW_UTC} - INTERVAL '7 hours'"
+        else:
+            days = int(segment.split("_")[-1].rstrip("d"))
+            upper_sql = f"{_NOW_UTC} - INTERVAL '{days} days'"
+            lower_sql = f"{_NOW_UTC} - INTERVAL '{days + 1} days'"
+        return _users(f"""u.trial_used_at IS NOT NULL
+            AND {_TRIAL_END} <= {upper_sql}
+            AND {_TRIAL_END} >  {lower_sql}
+            AND {_NO_ACTIVE_PAID}""")
+    if segment in ("paid_expired_1d", "paid_expired_7d", "paid_expired_14d",
+                   "paid_expired_60d", "paid_expired_90d",
+                   "paid_expired_180d", "paid_expired_365d",
+                   "paid_expired_730d"):
+        # Платная (source='payment') истекла ровно N суток назад
+        # (24-час бакет [NOW-(N+1)d, NOW-Nd)) — и сейчас нет активной
+        # ПЛАТНОЙ. Churn-окно, классическая точка реактивации.
+        # (Активный bypass/gift тут не считаем — юзер всё равно без
+        # основной подписки.)
+        days = int(segment.split("_")[-1].rstrip("d"))
+        return _users(f"""EXISTS (
+                SELECT 1 FROM subscriptions s
+                WHERE s.telegram_id = u.telegram_id
+                  AND s.source = 'payment'
+                  AND s.expires_at <= {_NOW_UTC} - INTERVAL '{days} days'
+                  AND s.expires_at >  {_NOW_UTC} - INTERVAL '{days + 1} days'
+            )
+            AND {_NO_ACTIVE_PAID}""")
+    if segment in ("paid_expired_30d", "paid_lapsed_any"):
+        # Реактивационные сегменты по subscription_history:
+        #   paid_expired_30d → последний end_date платной транзакции
+        #                      попал в [NOW-30d, NOW-1d], и сейчас
+        #                      нет активной подписки в subscriptions.
+        #   paid_lapsed_any  → когда-либо платил (purchase / renewal /
+        #                      auto_renew) и сейчас неактивен —
+        #                      максимальная реактивационная аудитория.
+        #
+        # Почему через subscription_history, а не subscriptions:
+        # в subscriptions хранится ТЕКУЩЕЕ состояние подписки;
+        # при renewal expires_at UPDATEится в будущее, а старое
+        # значение не сохраняется. История истёкших — только в
+        # subscription_history (см. column end_date).
+        #
+        # action_type для платных: purchase, renewal, auto_renew
+        # (не 'payment' — то поле в subscriptions.source).
+        window = (
+            f"p.last_paid_end BETWEEN {_NOW_UTC} - INTERVAL '30 days' "
+            f"AND {_NOW_UTC} - INTERVAL '1 day'"
+            if segment == "paid_expired_30d"
+            else "TRUE"
+        )
+        return SegmentSQL(
+            """(SELECT telegram_id, MAX(end_date) AS last_paid_end
+                FROM subscription_history
+                WHERE action_type IN ('purchase', 'renewal', 'auto_renew')
+                GROUP BY telegram_id) p""",
+            "p.telegram_id",
+            f"""{window}
+            AND NOT EXISTS (
+                SELECT 1 FROM subscriptions s
+                WHERE s.telegram_id = p.telegram_id
+                  AND s.expires_at > {_NOW_UTC}
+            )""",
+        )
+    if segment in ("paid_bought_within_7d", "paid_bought_within_14d",
+                   "paid_bought_within_30d"):
+        # Юзер оформил платную подписку в течение последних N дней.
+        # Читаем историю успешных платежей (status IN 'paid','approved').
+        # Кумулятивное окно (NOT ровно-N-суток бакет) — все, кто
+        # покупал хотя бы раз за N дней.
+        days = int(segment.split("_")[-1].rstrip("d"))
+        return SegmentSQL(
+            "payments p", "p.telegram_id",
+            f"""p.status IN ('paid', 'approved')
+            AND p.created_at >= {_NOW_UTC} - INTERVAL '{days} days'""",
+            distinct=True,
+        )
+    if segment == "trial_active_any":
+        # Все юзеры у которых СЕЙЧАС идёт триал (не истёк, платной ещё нет).
+        # Целевая аудитория для мидл-триал коммуникаций (день 2 из 3 и т.п.).
+        return _users(f"""u.trial_used_at IS NOT NULL
+            AND {_TRIAL_END} > {_NOW_UTC}
+            AND {_NO_ACTIVE_PAID}""")
+    if segment == "trial_activated_today":
+        # Активировали триал в течение последних 24 часов. Свежая ЦА
+        # для welcome-серии, объяснения features и т.п.
+        return _users(f"""u.trial_used_at IS NOT NULL
+            AND u.trial_used_at >= {_NOW_UTC} - INTERVAL '24 hours'""")
+    if segment in ("trial_active_day1", "trial_active_day2", "trial_active_day3"):
+        # Триал активен И его активировали N-1..N дней назад.
+        # Классические welcome-day2/day3 коммуникации:
+        #   day1 → [NOW-24h, NOW]                → «первый день»
+        #   day2 → [NOW-48h, NOW-24h)            → «уже 2 дня с нами»
+        #   day3 → [NOW-72h, NOW-48h)            → «завтра закончится»
+        # Ограничение trial_expires_at > NOW отсеивает истекшие триалы.
+        day = int(segment.split("_")[-1].replace("day", ""))
+        return _users(f"""u.trial_used_at IS NOT NULL
+            AND u.trial_used_at <= {_NOW_UTC} - INTERVAL '{day - 1} hours' * 24
+            AND u.trial_used_at >  {_NOW_UTC} - INTERVAL '{day} hours' * 24
+            AND {_TRIAL_END} > {_NOW_UTC}
+            AND {_NO_ACTIVE_PAID}""")
+    if segment in ("paid_expires_in_1d", "paid_expires_in_3d",
+                   "paid_expires_in_7d", "paid_expires_in_14d", "expires_in_3d"):
+        # Платная подписка сейчас активна, кончается в течение N суток.
+        # Точка renewal-подсказки — юзер ещё внутри, есть время оформить.
+        # source='payment' — исключаем trial/admin_grant/gift (у них другой
+        # renewal-flow). expires_in_3d — исторический алиас paid_expires_in_3d.
+        days = int(segment.rsplit("_", 1)[-1].rstrip("d"))
+        return SegmentSQL(
+            "subscriptions s", "s.telegram_id",
+            f"""s.source = 'payment'
+            AND s.expires_at > {_NOW_UTC}
+            AND s.expires_at <= {_NOW_UTC} + INTERVAL '{days} days'""",
+            distinct=True,
+        )
+    if segment == "trial_expired_within_6m":
+        # КУМУЛЯТИВНОЕ окно: юзер активировал триал, тот истёк В ЛЮБОЙ
+        # момент последних 180 дней (не exact-day bucket, а всё окно),
+        # и с тех пор так и не купил → сейчас нет активной подписки.
+        #
+        # Смысл: покрывает всех «отвалившихся после триала за полгода».
+        # Обычные trial_expired_Nd таргетируют точечно (N-ый день),
+        # а этот — «все, кто когда-либо за полгода не сконвертился».
+        return _users(f"""u.trial_used_at IS NOT NULL
+            AND {_TRIAL_END} <= {_NOW_UTC}
+            AND {_TRIAL_END} >  {_NOW_UTC} - INTERVAL '180 days'
+            AND {_NEVER_PAID}
+            AND {_NO_ACTIVE_ANY}""")
+    if segment in ("trial_expired_7d", "trial_expired_14d",
+                   "trial_expired_30d", "trial_expired_60d",
+                   "trial_expired_90d", "trial_expired_180d",
+                   "trial_expired_365d"):
+        # Триал истёк N дней назад — И пользователь никогда не покупал
+        # (нет ни одной строки в subscriptions с source='payment').
+        # Это чистая «холодная реактивация» — прошло много времени,
+        # человек не сконвертился, шлём ему повторный оффер.
+        # Бакеты 24-часовые, окно вокруг ровно N-дневной точки:
+        #   trial_expired_7d  → (NOW-8d,  NOW-7d]
+        #   trial_expired_30d → (NOW-31d, NOW-30d]
+        days = int(segment.split("_")[-1].rstrip("d"))
+        return _users(f"""u.trial_used_at IS NOT NULL
+            AND {_TRIAL_END} <= {_NOW_UTC} - INTERVAL '{days} days'
+            AND {_TRIAL_END} >  {_NOW_UTC} - INTERVAL '{days + 1} days'
+            AND {_NEVER_PAID}
+            AND {_NO_ACTIVE_ANY}""")
+    if segment in ("started_1d_cold", "started_3d_cold",
+                   "started_14d_cold", "started_30d_cold"):
+        # Холодные лиды — старт был не позднее N суток назад,
+        # и до сих пор ноль активности (нет подписки, нет ключей,
+        # нет триала). Cumulative-окно: включает всех, кто нажал
+        # /start в диапазоне [NOW-N days, NOW]. Смысл — «свежие
+        # молчуны» для прогрева. started_1d_cold = сегодняшние.
+        days = int(segment.split("_")[1].rstrip("d"))
+        return _users(f"""u.created_at >= NOW() - INTERVAL '{days} days'
+            AND u.trial_used_at IS NULL
+            AND NOT EXISTS (
+                SELECT 1 FROM subscriptions s
+                WHERE s.telegram_id = u.telegram_id
+                  AND (
+                      s.expires_at > {_NOW_UTC}
+                      OR s.remnawave_uuid IS NOT NULL
+                      OR s.remnawave_premium_uuid IS NOT NULL
+                  )
+            )""")
+    if segment == "vip_active":
+        # VIP-пользователи (users.is_vip=TRUE) — для эксклюзивных
+        # приглашений/апселлов/фидбека.
+        return _users("u.is_vip = TRUE")
+    if segment in ("combo_active", "basic_active", "plus_active"):
+        # Активные подписки типа:
+        #   combo_active → combo_basic / combo_plus — апселл на большие
+        #                  GB-паки обхода / доп. устройств;
+        #   basic_active → апселл на Plus/Combo;
+        #   plus_active  → upsell на Combo или продление на 1 год.
+        types = {
+            "combo_active": "('combo_basic','combo_plus')",
+            "basic_active": "('basic')",
+            "plus_active": "('plus')",
+        }[segment]
+        return SegmentSQL(
+            "subscriptions s", "s.telegram_id",
+            f"s.expires_at > {_NOW_UTC} AND s.subscription_type IN {types}",
+            distinct=True,
+        )
+    if segment == "discount_active":
+        # У пользователя действует персональная скидка
+        # (user_discounts) — стоит напомнить использовать её.
+        return SegmentSQL(
+            "user_discounts ud", "ud.telegram_id",
+            f"(ud.expires_at IS NULL OR ud.expires_at > {_NOW_UTC})",
+            distinct=True,
+        )
+    if segment == "has_balance_50plus":
+        # На балансе > 50₽. Напомнить использовать балансовый чекаут.
+        return _users("COALESCE(u.balance_kopecks, 0) >= 5000")
+    if segment == "bought_proxy":
+        # Купил standalone Telegram MT Прокси (users.proxy_purchased_at IS NOT NULL).
+        # Колонка из миграции 051 — до неё запросы ловят UndefinedColumnError.
+        return _users("u.proxy_purchased_at IS NOT NULL")
+    if segment in ("expired_1d", "expired_2d", "expired_3d"):
+        # User's MOST RECENT subscription expired exactly N full days
+        # ago (24-hour bucket). MAX(expires_at) делает выборку
+        # устойчивой к history-rows (renewal flow создаёт несколько
+        # subscription_row). Также неявно исключает юзеров с активной
+        # подпиской — если их max в прошлом, активной нет.
+        days = int(segment.split("_")[1].rstrip("d"))
+        last_expiry = "(SELECT MAX(s.expires_at) FROM subscriptions s WHERE s.telegram_id = u.telegram_id)"
+        return _users(f"""{last_expiry} >= {_NOW_UTC} - {days + 1} * INTERVAL '1 day'
+            AND {last_expiry} <  {_NOW_UTC} - {days} * INTERVAL '1 day'""")
+    return None
+
+
+def _segment_or_warn(segment: str) -> Optional[SegmentSQL]:
+    seg = segment_sql(segment)
+    if seg is None:
+        logging.warning(f"Unknown segment: {segment}, returning empty list")
+    return seg
+
+
+def _warn_missing_column(segment: str, e: Exception) -> None:
+    # bought_proxy до миграции 051 (users.proxy_purchased_at) и т.п. —
+    # не роняем роут segments_list, отдаём пустой сегмент.
+    logging.warning(f"{segment} segment: {e} — migration not applied, returning empty result")
+
+
 async def get_users_by_segment(segment: str) -> list:
-    """Получить список Telegram ID пользователей по сегменту
+    """Получить список Telegram ID пользователей по сегменту.
 
-    Args:
-        segment: Сегмент получателей:
-            - all_users            — все
-            - active_subscriptions — активная подписка
-            - no_subscription      — нет активной подписки (включая истёкшие)
-            - no_remnawave         — никогда не имели entity в Remnawave
-                                     (ни premium, ни bypass)
-            - expired_1d / expired_2d / expired_3d — подписка истекла
-                                     ровно N полных суток назад
-                                     (и сейчас нет активной)
-            - started_7d_cold      — холодные лиды: запустили бот за
-                                     последние 7 суток (users.created_at)
-                                     и до сих пор без активной подписки
-                                     И без bypass-entity.
-            - trial_ends_in_1d     — у юзера ИДЁТ триал и закончится
-                                     в ближайшие 24 часа
-                                     (trial_expires_at ∈ (NOW, NOW+24h])
-            - trial_expired_6h / 1d / 2d / 3d
-                                   — триал закончился N времени назад
-                                     по фиксированному бакету:
-                                       6h → [NOW-7h, NOW-6h)
-                                       1d → [NOW-2d, NOW-1d)
-                                       2d → [NOW-3d, NOW-2d)
-                                       3d → [NOW-4d, NOW-3d)
-                                     И сейчас нет активной подписки.
-            - paid_expired_1d      — платная (subscriptions.source='payment')
-                                     истекла ровно 1 сутки назад
-                                     (expires_at ∈ [NOW-2d, NOW-1d))
-                                     и сейчас нет активной подписки
+    Определения сегментов — segment_sql(). Для больших сегментов
+    предпочтительнее iter_users_by_segment (стрим) / count_users_by_segment /
+    user_in_segment (EXISTS для одного юзера).
 
     Returns:
-        Список Telegram ID пользователей
+        Список Telegram ID пользователей ([] для неизвестного сегмента)
     """
-    pool = await get_pool()
+    seg = _segment_or_warn(segment)
+    if seg is None:
+        return []
+    pool = await get_read_pool()
     async with pool.acquire() as conn:
-        if segment == "all_users":
-            rows = await conn.fetch("SELECT telegram_id FROM users")
-            return [row["telegram_id"] for row in rows]
-        elif segment == "active_subscriptions":
-            now = _to_db_utc(datetime.now(timezone.utc))
-            rows = await conn.fetch(
-                """SELECT DISTINCT u.telegram_id
-                   FROM users u
-                   INNER JOIN subscriptions s ON u.telegram_id = s.telegram_id
-                   WHERE s.expires_at > $1""",
-                now
-            )
-            return [row["telegram_id"] for row in rows]
-        elif segment == "no_subscription":
-            now = _to_db_utc(datetime.now(timezone.utc))
-            rows = await conn.fetch(
-                """SELECT u.telegram_id FROM users u
-                   WHERE NOT EXISTS (
-                       SELECT 1 FROM subscriptions s
-                       WHERE s.telegram_id = u.telegram_id AND s.expires_at > $1
-                   )""",
-                now
-            )
-            return [row["telegram_id"] for row in rows]
-        elif segment == "no_remnawave":
-            # Users who never had ANY Remnawave entity — neither premium
-            # nor bypass. They've never been provisioned on the panel.
-            rows = await conn.fetch(
-                """SELECT u.telegram_id FROM users u
-                   WHERE NOT EXISTS (
-                       SELECT 1 FROM subscriptions s
-                       WHERE s.telegram_id = u.telegram_id
-                         AND (s.remnawave_premium_uuid IS NOT NULL
-                              OR s.remnawave_uuid IS NOT NULL)
-                   )"""
-            )
-            return [row["telegram_id"] for row in rows]
-        elif segment == "started_7d_cold":
-            # Холодные лиды для прогрева: запустили бот не позже 7 суток
-            # назад и до сих пор ничего не купили — ни подписку, ни
-            # bypass-ГБ. Условия:
-            #   1) users.created_at >= NOW() - 7 days  → свежий старт
-            #   2) NO subscription row с expires_at > NOW()  → нет
-            #      активной подписки
-            #   3) NO subscription row с remnawave_uuid или
-            #      remnawave_premium_uuid → не сидит на bypass-only
-            #      ключах, оставшихся от триала / прошлой покупки.
-            # 1 + 3 — то самое «никаких ключей вообще».
-            rows = await conn.fetch(
-                """SELECT u.telegram_id FROM users u
-                   WHERE u.created_at >= NOW() - INTERVAL '7 days'
-                     AND NOT EXISTS (
-                         SELECT 1 FROM subscriptions s
-                         WHERE s.telegram_id = u.telegram_id
-                           AND (
-                               s.expires_at > NOW()
-                               OR s.remnawave_uuid IS NOT NULL
-                               OR s.remnawave_premium_uuid IS NOT NULL
-                           )
-                     )"""
-            )
-            return [row["telegram_id"] for row in rows]
-        elif segment == "trial_ends_in_1d":
-            # Идёт триал, до конца ≤ 24 часа. Цель — пуш с напоминанием
-            # «триал заканчивается, оформи подписку».
-            #
-            # ВАЖНО про tz: users.trial_expires_at — TIMESTAMP без TZ,
-            # в БД хранится naive UTC (см. _to_db_utc). NOW() возвращает
-            # TIMESTAMPTZ в session-TZ; implicit cast TIMESTAMP→TIMESTAMPTZ
-            # интерпретирует TIMESTAMP в session-TZ и даёт сдвиг, если
-            # session-TZ ≠ UTC. Используем `NOW() AT TIME ZONE 'UTC'` —
-            # это TIMESTAMP-без-TZ в UTC, сравнение с trial_expires_at
-            # надёжно без implicit cast в любой session-TZ.
-            #
-            # COALESCE: trial_expires_at добавлен в схему users позже,
-            # чем trial_used_at. У старых триалов поле могло быть NULL.
-            # Fallback на trial_used_at + 3 дня (продолжительность
-            # триала — см. app/handlers/callbacks/subscription.py:143).
-            rows = await conn.fetch(
-                """SELECT u.telegram_id FROM users u
-                   WHERE u.trial_used_at IS NOT NULL
-                     AND COALESCE(u.trial_expires_at, u.trial_used_at + INTERVAL '3 days')
-                           >  (NOW() AT TIME ZONE 'UTC')
-                     AND COALESCE(u.trial_expires_at, u.trial_used_at + INTERVAL '3 days')
-                           <= (NOW() AT TIME ZONE 'UTC') + INTERVAL '24 hours'"""
-            )
-            return [row["telegram_id"] for row in rows]
-        elif segment in ("trial_expired_6h", "trial_expired_1d", "trial_expired_2d", "trial_expired_3d"):
-            # Триал закончился N времени назад (фиксированный бакет).
-            # Исключаем только тех, у кого есть активная **платная**
-            # подписка — это юзеры, успешно конвертнувшиеся, им пуш
-            # «триал истёк, купи подписку» уже не нужен. Активные
-            # bypass-only/gift/admin_grant не считаем — у них нет
-            # основной подписки, и наш пуш им релевантен.
-            #   trial_expired_6h → [NOW-7h, NOW-6h)
-            #   trial_expired_1d → [NOW-2d, NOW-1d)
-            #   trial_expired_2d → [NOW-3d, NOW-2d)
-            #   trial_expired_3d → [NOW-4d, NOW-3d)
-            # См. коммент про tz и COALESCE в trial_ends_in_1d.
-            if segment == "trial_expired_6h":
-                upper_sql = "(NOW() AT TIME ZONE 'UTC') - INTERVAL '6 hours'"
-                lower_sql = "(NOW() AT TIME ZONE 'UTC') - INTERVAL '7 hours'"
-            else:
-                days = int(segment.split("_")[-1].rstrip("d"))
-                upper_sql = f"(NOW() AT TIME ZONE 'UTC') - INTERVAL '{days} days'"
-                lower_sql = f"(NOW() AT TIME ZONE 'UTC') - INTERVAL '{days + 1} days'"
-            rows = await conn.fetch(
-                f"""SELECT u.telegram_id FROM users u
-                    WHERE u.trial_used_at IS NOT NULL
-                      AND COALESCE(u.trial_expires_at, u.trial_used_at + INTERVAL '3 days')
-                            <= {upper_sql}
-                      AND COALESCE(u.trial_expires_at, u.trial_used_at + INTERVAL '3 days')
-                            >  {lower_sql}
-                      AND NOT EXISTS (
-                          SELECT 1 FROM subscriptions s
-                          WHERE s.telegram_id = u.telegram_id
-                            AND s.source = 'payment'
-                            AND s.expires_at > (NOW() AT TIME ZONE 'UTC')
-                      )"""
-            )
-            return [row["telegram_id"] for row in rows]
-        elif segment == "paid_expired_1d":
-            # Платная подписка (source='payment') истекла ровно
-            # 1 сутки назад (бакет [NOW-2d, NOW-1d)). И сейчас нет
-            # активной ПЛАТНОЙ — это churn-окно, классическая точка
-            # реактивации. (Активный bypass/gift тут не считаем —
-            # юзер всё равно без основной подписки.)
-            # См. коммент про tz в trial_ends_in_1d.
-            rows = await conn.fetch(
-                """SELECT u.telegram_id FROM users u
-                   WHERE EXISTS (
-                       SELECT 1 FROM subscriptions s
-                       WHERE s.telegram_id = u.telegram_id
-                         AND s.source = 'payment'
-                         AND s.expires_at <= (NOW() AT TIME ZONE 'UTC') - INTERVAL '1 day'
-                         AND s.expires_at >  (NOW() AT TIME ZONE 'UTC') - INTERVAL '2 days'
-                   )
-                     AND NOT EXISTS (
-                       SELECT 1 FROM subscriptions s2
-                       WHERE s2.telegram_id = u.telegram_id
-                         AND s2.source = 'payment'
-                         AND s2.expires_at > (NOW() AT TIME ZONE 'UTC')
-                   )"""
-            )
-            return [row["telegram_id"] for row in rows]
-        elif segment in ("paid_expired_30d", "paid_lapsed_any"):
-            # Реактивационные сегменты по subscription_history:
-            #   paid_expired_30d → последний end_date платной транзакции
-            #                      попал в [NOW-30d, NOW-1d], и сейчас
-            #                      нет активной подписки в subscriptions.
-            #   paid_lapsed_any  → когда-либо платил (purchase / renewal /
-            #                      auto_renew) и сейчас неактивен —
-            #                      максимальная реактивационная аудитория.
-            #
-            # Почему через subscription_history, а не subscriptions:
-            # в subscriptions хранится ТЕКУЩЕЕ состояние подписки;
-            # при renewal expires_at UPDATEится в будущее, а старое
-            # значение не сохраняется. История истёкших — только в
-            # subscription_history (см. column end_date).
-            #
-            # action_type для платных: purchase, renewal, auto_renew
-            # (не 'payment' — то поле в subscriptions.source).
-            window_clause = (
-                "AND last_paid_end BETWEEN "
-                "(NOW() AT TIME ZONE 'UTC') - INTERVAL '30 days' "
-                "AND (NOW() AT TIME ZONE 'UTC') - INTERVAL '1 day'"
-                if segment == "paid_expired_30d"
-                else ""
-            )
-            rows = await conn.fetch(
-                f"""WITH paid_history AS (
-                       SELECT telegram_id, MAX(end_date) AS last_paid_end
-                       FROM subscription_history
-                       WHERE action_type IN ('purchase', 'renewal', 'auto_renew')
-                       GROUP BY telegram_id
-                   )
-                   SELECT p.telegram_id FROM paid_history p
-                   WHERE 1=1 {window_clause}
-                     AND NOT EXISTS (
-                         SELECT 1 FROM subscriptions s
-                         WHERE s.telegram_id = p.telegram_id
-                           AND s.expires_at > (NOW() AT TIME ZONE 'UTC')
-                     )"""
-            )
-            return [row["telegram_id"] for row in rows]
-        elif segment in ("paid_bought_within_7d", "paid_bought_within_14d",
-                         "paid_bought_within_30d"):
-            # Юзер оформил платную подписку в течение последних N дней.
-            # Читаем историю успешных платежей (status IN 'paid','approved').
-            # Кумулятивное окно (NOT ровно-N-суток бакет) — все, кто
-            # покупал хотя бы раз за N дней. Дубли по telegram_id
-            # убираются через DISTINCT.
-            days = int(segment.split("_")[-1].rstrip("d"))
-            rows = await conn.fetch(
-                f"""SELECT DISTINCT p.telegram_id
-                    FROM payments p
-                    WHERE p.status IN ('paid', 'approved')
-                      AND p.created_at >= (NOW() AT TIME ZONE 'UTC') - INTERVAL '{days} days'"""
-            )
-            return [row["telegram_id"] for row in rows]
-        elif segment == "trial_active_any":
-            # Все юзеры у которых СЕЙЧАС идёт триал (не истёк, платной ещё нет).
-            # Целевая аудитория для мидл-триал коммуникаций (день 2 из 3 и т.п.).
-            rows = await conn.fetch(
-                """SELECT u.telegram_id FROM users u
-                   WHERE u.trial_used_at IS NOT NULL
-                     AND COALESCE(u.trial_expires_at, u.trial_used_at + INTERVAL '3 days')
-                           > (NOW() AT TIME ZONE 'UTC')
-                     AND NOT EXISTS (
-                         SELECT 1 FROM subscriptions s
-                         WHERE s.telegram_id = u.telegram_id
-                           AND s.source = 'payment'
-                           AND s.expires_at > (NOW() AT TIME ZONE 'UTC')
-                     )"""
-            )
-            return [row["telegram_id"] for row in rows]
-        elif segment == "trial_activated_today":
-            # Активировали триал в течение последних 24 часов. Свежая ЦА
-            # для welcome-серии, объяснения features и т.п.
-            rows = await conn.fetch(
-                """SELECT telegram_id FROM users
-                   WHERE trial_used_at IS NOT NULL
-                     AND trial_used_at >= (NOW() AT TIME ZONE 'UTC') - INTERVAL '24 hours'"""
-            )
-            return [row["telegram_id"] for row in rows]
-        elif segment in ("trial_active_day1", "trial_active_day2",
-                         "trial_active_day3"):
-            # Триал активен И его активировали N-1..N дней назад.
-            # Классические welcome-day2/day3 коммуникации:
-            #   day1 → [NOW-24h, NOW]                → «первый день»
-            #   day2 → [NOW-48h, NOW-24h)            → «уже 2 дня с нами»
-            #   day3 → [NOW-72h, NOW-48h)            → «завтра закончится»
-            # Ограничение trial_expires_at > NOW отсеивает истекшие триалы.
-            day = int(segment.split("_")[-1].replace("day", ""))
-            rows = await conn.fetch(
-                f"""SELECT u.telegram_id FROM users u
-                    WHERE u.trial_used_at IS NOT NULL
-                      AND u.trial_used_at <= (NOW() AT TIME ZONE 'UTC') - INTERVAL '{day - 1} hours' * 24
-                      AND u.trial_used_at >  (NOW() AT TIME ZONE 'UTC') - INTERVAL '{day} hours' * 24
-                      AND COALESCE(u.trial_expires_at, u.trial_used_at + INTERVAL '3 days')
-                            > (NOW() AT TIME ZONE 'UTC')
-                      AND NOT EXISTS (
-                          SELECT 1 FROM subscriptions s
-                          WHERE s.telegram_id = u.telegram_id
-                            AND s.source = 'payment'
-                            AND s.expires_at > (NOW() AT TIME ZONE 'UTC')
-                      )"""
-            )
-            return [row["telegram_id"] for row in rows]
-        elif segment in ("paid_expires_in_1d", "paid_expires_in_3d",
-                         "paid_expires_in_7d", "paid_expires_in_14d"):
-            # Платная подписка сейчас активна, кончается в течение N суток.
-            # Точка renewal-подсказки — юзер ещё внутри, есть время оформить.
-            # source='payment' — исключаем trial/admin_grant/gift (у них другой
-            # renewal-flow).
-            days = int(segment.rsplit("_", 1)[-1].rstrip("d"))
-            rows = await conn.fetch(
-                f"""SELECT DISTINCT s.telegram_id FROM subscriptions s
-                    WHERE s.source = 'payment'
-                      AND s.expires_at > (NOW() AT TIME ZONE 'UTC')
-                      AND s.expires_at <= (NOW() AT TIME ZONE 'UTC') + INTERVAL '{days} days'"""
-            )
-            return [row["telegram_id"] for row in rows]
-        elif segment == "trial_expired_within_6m":
-            # КУМУЛЯТИВНОЕ окно: юзер активировал триал, тот истёк В ЛЮБОЙ
-            # момент последних 180 дней (не exact-day bucket, а всё окно),
-            # и с тех пор так и не купил → сейчас нет активной подписки.
-            #
-            # Смысл: покрывает всех «отвалившихся после триала за полгода».
-            # Обычные trial_expired_Nd таргетируют точечно (N-ый день),
-            # а этот — «все, кто когда-либо за полгода не сконвертился».
-            #
-            # Условия:
-            #   trial_used_at IS NOT NULL
-            #   AND trial_expires_at ∈ [NOW-180d, NOW]  (истёк за полгода)
-            #   AND нет ни одной s.source='payment' (никогда не покупал)
-            #   AND нет ни одной активной подписки
-            rows = await conn.fetch(
-                """SELECT u.telegram_id FROM users u
-                   WHERE u.trial_used_at IS NOT NULL
-                     AND COALESCE(u.trial_expires_at, u.trial_used_at + INTERVAL '3 days')
-                           <= (NOW() AT TIME ZONE 'UTC')
-                     AND COALESCE(u.trial_expires_at, u.trial_used_at + INTERVAL '3 days')
-                           >  (NOW() AT TIME ZONE 'UTC') - INTERVAL '180 days'
-                     AND NOT EXISTS (
-                         SELECT 1 FROM subscriptions s
-                         WHERE s.telegram_id = u.telegram_id
-                           AND s.source = 'payment'
-                     )
-                     AND NOT EXISTS (
-                         SELECT 1 FROM subscriptions s
-                         WHERE s.telegram_id = u.telegram_id
-                           AND s.expires_at > (NOW() AT TIME ZONE 'UTC')
-                     )"""
-            )
-            return [row["telegram_id"] for row in rows]
-        elif segment in ("trial_expired_7d", "trial_expired_14d",
-                         "trial_expired_30d", "trial_expired_60d",
-                         "trial_expired_90d", "trial_expired_180d",
-                         "trial_expired_365d"):
-            # Триал истёк N дней назад — И пользователь никогда не покупал
-            # (нет ни одной строки в subscriptions с source='payment').
-            # Это чистая «холодная реактивация» — прошло много времени,
-            # человек не сконвертился, шлём ему повторный оффер.
-            # Бакеты 24-часовые, окно вокруг ровно N-дневной точки:
-            #   trial_expired_7d  → (NOW-8d,  NOW-7d]
-            #   trial_expired_14d → (NOW-15d, NOW-14d]
-            #   trial_expired_30d → (NOW-31d, NOW-30d]
-            #   trial_expired_90d → (NOW-91d, NOW-90d]
-            # См. коммент про tz в trial_ends_in_1d.
-            days = int(segment.split("_")[-1].rstrip("d"))
-            rows = await conn.fetch(
-                f"""SELECT u.telegram_id FROM users u
-                    WHERE u.trial_used_at IS NOT NULL
-                      AND COALESCE(u.trial_expires_at, u.trial_used_at + INTERVAL '3 days')
-                            <= (NOW() AT TIME ZONE 'UTC') - INTERVAL '{days} days'
-                      AND COALESCE(u.trial_expires_at, u.trial_used_at + INTERVAL '3 days')
-                            >  (NOW() AT TIME ZONE 'UTC') - INTERVAL '{days + 1} days'
-                      AND NOT EXISTS (
-                          SELECT 1 FROM subscriptions s
-                          WHERE s.telegram_id = u.telegram_id
-                            AND s.source = 'payment'
-                      )
-                      AND NOT EXISTS (
-                          SELECT 1 FROM subscriptions s
-                          WHERE s.telegram_id = u.telegram_id
-                            AND s.expires_at > (NOW() AT TIME ZONE 'UTC')
-                      )"""
-            )
-            return [row["telegram_id"] for row in rows]
-        elif segment in ("started_1d_cold", "started_3d_cold",
-                         "started_14d_cold", "started_30d_cold"):
-            # Холодные лиды — старт был не позднее N суток назад,
-            # и до сих пор ноль активности (нет подписки, нет ключей,
-            # нет триала). Cumulative-окно: включает всех, кто нажал
-            # /start в диапазоне [NOW-N days, NOW]. Смысл — «свежие
-            # молчуны» для прогрева. started_1d_cold = сегодняшние.
-            days = int(segment.split("_")[1].rstrip("d"))
-            rows = await conn.fetch(
-                f"""SELECT u.telegram_id FROM users u
-                    WHERE u.created_at >= NOW() - INTERVAL '{days} days'
-                      AND u.trial_used_at IS NULL
-                      AND NOT EXISTS (
-                          SELECT 1 FROM subscriptions s
-                          WHERE s.telegram_id = u.telegram_id
-                            AND (
-                                s.expires_at > (NOW() AT TIME ZONE 'UTC')
-                                OR s.remnawave_uuid IS NOT NULL
-                                OR s.remnawave_premium_uuid IS NOT NULL
-                            )
-                      )"""
-            )
-            return [row["telegram_id"] for row in rows]
-        elif segment in ("paid_expired_7d", "paid_expired_14d",
-                         "paid_expired_60d", "paid_expired_90d",
-                         "paid_expired_180d", "paid_expired_365d",
-                         "paid_expired_730d"):
-            # Платная (source='payment') истекла ровно N суток назад
-            # (24-час бакет [NOW-(N+1)d, NOW-Nd)) — сейчас нет активной
-            # ПЛАТНОЙ. Классическая точка реактивации, аналог paid_expired_1d
-            # для более далёких окон.
-            # См. tz-коммент в trial_ends_in_1d.
-            days = int(segment.split("_")[-1].rstrip("d"))
-            rows = await conn.fetch(
-                f"""SELECT u.telegram_id FROM users u
-                    WHERE EXISTS (
-                        SELECT 1 FROM subscriptions s
-                        WHERE s.telegram_id = u.telegram_id
-                          AND s.source = 'payment'
-                          AND s.expires_at <= (NOW() AT TIME ZONE 'UTC') - INTERVAL '{days} days'
-                          AND s.expires_at >  (NOW() AT TIME ZONE 'UTC') - INTERVAL '{days + 1} days'
-                    )
-                      AND NOT EXISTS (
-                        SELECT 1 FROM subscriptions s2
-                        WHERE s2.telegram_id = u.telegram_id
-                          AND s2.source = 'payment'
-                          AND s2.expires_at > (NOW() AT TIME ZONE 'UTC')
-                    )"""
-            )
-            return [row["telegram_id"] for row in rows]
-        elif segment == "vip_active":
-            # VIP-пользователи (users.is_vip=TRUE) — для эксклюзивных
-            # приглашений/апселлов/фидбека.
-            rows = await conn.fetch(
-                """SELECT telegram_id FROM users
-                   WHERE is_vip = TRUE"""
-            )
-            return [row["telegram_id"] for row in rows]
-        elif segment == "combo_active":
-            # Активные подписки типа combo_basic / combo_plus — целевая
-            # для апселла на большие GB-паки обхода / доп. устройств.
-            rows = await conn.fetch(
-                """SELECT DISTINCT s.telegram_id
-                   FROM subscriptions s
-                   WHERE s.expires_at > (NOW() AT TIME ZONE 'UTC')
-                     AND s.subscription_type IN ('combo_basic','combo_plus')"""
-            )
-            return [row["telegram_id"] for row in rows]
-        elif segment == "basic_active":
-            # Активные Basic — целевая для апселла на Plus/Combo.
-            rows = await conn.fetch(
-                """SELECT DISTINCT s.telegram_id
-                   FROM subscriptions s
-                   WHERE s.expires_at > (NOW() AT TIME ZONE 'UTC')
-                     AND s.subscription_type = 'basic'"""
-            )
-            return [row["telegram_id"] for row in rows]
-        elif segment == "plus_active":
-            # Активные Plus — целевая для upsell на Combo или продление на 1 год.
-            rows = await conn.fetch(
-                """SELECT DISTINCT s.telegram_id
-                   FROM subscriptions s
-                   WHERE s.expires_at > (NOW() AT TIME ZONE 'UTC')
-                     AND s.subscription_type = 'plus'"""
-            )
-            return [row["telegram_id"] for row in rows]
-        elif segment == "discount_active":
-            # У пользователя действует персональная скидка
-            # (user_discounts) — стоит напомнить использовать её.
-            rows = await conn.fetch(
-                """SELECT DISTINCT ud.telegram_id
-                   FROM user_discounts ud
-                   WHERE (ud.expires_at IS NULL
-                          OR ud.expires_at > (NOW() AT TIME ZONE 'UTC'))"""
-            )
-            return [row["telegram_id"] for row in rows]
-        elif segment == "has_balance_50plus":
-            # На балансе > 50₽. Напомнить использовать балансовый чекаут.
-            rows = await conn.fetch(
-                """SELECT telegram_id FROM users
-                   WHERE COALESCE(balance_kopecks, 0) >= 5000"""
-            )
-            return [row["telegram_id"] for row in rows]
-        elif segment == "expires_in_3d":
-            # Активная подписка (любого типа) закончится в ближайшие
-            # 72 часа — точка «продли/переоформи». Мощная реактивационная
-            # аудитория, пока люди ещё внутри.
-            rows = await conn.fetch(
-                """SELECT DISTINCT s.telegram_id FROM subscriptions s
-                   WHERE s.expires_at > (NOW() AT TIME ZONE 'UTC')
-                     AND s.expires_at <= (NOW() AT TIME ZONE 'UTC') + INTERVAL '3 days'
-                     AND s.source = 'payment'"""
-            )
-            return [row["telegram_id"] for row in rows]
-        elif segment == "bought_proxy":
-            # Купил standalone Telegram MT Прокси (users.proxy_purchased_at IS NOT NULL).
-            # Tolerates missing column: если миграция 051 ещё не проехала,
-            # asyncpg кидает UndefinedColumnError — возвращаем пустой список,
-            # чтобы не ронять роут segments_list.
-            try:
-                rows = await conn.fetch(
-                    """SELECT telegram_id FROM users
-                       WHERE proxy_purchased_at IS NOT NULL"""
-                )
-            except asyncpg.UndefinedColumnError:
-                logging.warning(
-                    "bought_proxy segment: users.proxy_purchased_at missing "
-                    "— migration 051 not applied, returning empty list"
-                )
-                return []
-            return [row["telegram_id"] for row in rows]
-        elif segment in ("expired_1d", "expired_2d", "expired_3d"):
-            # User's MOST RECENT subscription expired exactly N full days
-            # ago (24-hour bucket). MAX(expires_at) делает выборку
-            # устойчивой к history-rows (renewal flow создаёт несколько
-            # subscription_row). Также неявно исключает юзеров с активной
-            # подпиской — если их max в прошлом, активной нет.
-            #
-            # ВАЖНО про tz: см. коммент в trial_ends_in_1d. Используем
-            # `(NOW() AT TIME ZONE 'UTC')` чтобы сравнение TIMESTAMP-без-TZ
-            # работало стабильно в любой session-TZ.
-            days = int(segment.split("_")[1].rstrip("d"))
-            rows = await conn.fetch(
-                """SELECT u.telegram_id FROM users u
-                   WHERE (
-                       SELECT MAX(s.expires_at) FROM subscriptions s
-                       WHERE s.telegram_id = u.telegram_id
-                   ) >= (NOW() AT TIME ZONE 'UTC') - $1 * INTERVAL '1 day'
-                     AND (
-                       SELECT MAX(s.expires_at) FROM subscriptions s
-                       WHERE s.telegram_id = u.telegram_id
-                   ) <  (NOW() AT TIME ZONE 'UTC') - $2 * INTERVAL '1 day'""",
-                days + 1, days,
-            )
-            return [row["telegram_id"] for row in rows]
-        else:
-            logging.warning(f"Unknown segment: {segment}, returning empty list")
+        try:
+            rows = await conn.fetch(seg.ids_sql())
+        except asyncpg.UndefinedColumnError as e:
+            _warn_missing_column(segment, e)
             return []
+        return [row["telegram_id"] for row in rows]
+
+
+async def iter_users_by_segment(segment: str, batch_size: int = 5000):
+    """Стрим Telegram ID сегмента через server-side cursor.
+
+    Память ∝ batch_size, а не размеру сегмента. Соединение держится, пока
+    вызывающий итерирует — не делать медленных операций (HTTP, send)
+    между шагами; для рассылок собрать id пачкой или использовать
+    get_users_by_segment.
+    """
+    seg = _segment_or_warn(segment)
+    if seg is None:
+        return
+    pool = await get_read_pool()
+    async with pool.acquire() as conn:
+        async with conn.transaction(readonly=True):
+            try:
+                async for row in conn.cursor(seg.ids_sql(), prefetch=batch_size):
+                    yield row["telegram_id"]
+            except asyncpg.UndefinedColumnError as e:
+                _warn_missing_column(segment, e)
+
+
+async def count_users_by_segment(segment: str) -> int:
+    """Размер сегмента одним COUNT (для дашборда), без выгрузки id."""
+    seg = _segment_or_warn(segment)
+    if seg is None:
+        return 0
+    pool = await get_read_pool()
+    async with pool.acquire() as conn:
+        try:
+            return int(await conn.fetchval(seg.count_sql()) or 0)
+        except asyncpg.UndefinedColumnError as e:
+            _warn_missing_column(segment, e)
+            return 0
+
+
+async def user_in_segment(telegram_id: int, segment: str) -> Optional[bool]:
+    """Входит ли один юзер в сегмент — EXISTS с предикатом по его id.
+
+    Основной пул, не реплика: решение «слать / не слать» принимается в
+    момент отправки, а юзер мог только что оплатить или истечь.
+
+    Returns: None если сегмент неизвестен (решение fail-open/closed — на
+    вызывающем).
+    """
+    seg = segment_sql(segment)
+    if seg is None:
+        return None
+    pool = await get_pool()
+    async with pool.acquire() as conn:
+        try:
+            return bool(await conn.fetchval(seg.exists_sql(), int(telegram_id)))
+        except asyncpg.UndefinedColumnError as e:
+            _warn_missing_column(segment, e)
+            return False
 
 
 async def log_broadcast_send(broadcast_id: int, telegram_id: int, status: str, variant: str = None, message_id: int = None):
@@ -2031,6 +1961,31 @@ async def log_broadcast_send(broadcast_id: int, telegram_id: int, status: str, v
         )
 
 
+async def log_broadcast_sends_bulk(records: List[Tuple[int, int, str, Optional[str], Optional[int]]]) -> int:
+    """Записать пачку результатов отправки одним COPY.
+
+    Args:
+        records: список (broadcast_id, telegram_id, status, variant, message_id)
+
+    Returns:
+        Количество записанных строк
+
+    Один pool checkout + COPY на batch вместо INSERT на каждого получателя —
+    на 100k-рассылке это 500 round-trip'ов вместо 100k. sent_at берётся из
+    DEFAULT колонки.
+    """
+    if not records:
+        return 0
+    pool = await get_pool()
+    async with pool.acquire() as conn:
+        await conn.copy_records_to_table(
+            "broadcast_log",
+            records=records,
+            columns=["broadcast_id", "telegram_id", "status", "variant", "message_id"],
+        )
+    return len(records)
+
+
 async def get_broadcast_stats(broadcast_id: int) -> Dict[str, int]:
     """Получить статистику отправки уведомления
     
@@ -2328,7 +2283,13 @@ async def get_ab_test_stats(broadcast_id: int) -> Optional[Dict[str, Any]]:
         }
 
 
-async def admin_grant_access_atomic(telegram_id: int, days: int, admin_telegram_id: int, tariff: str = "basic") -> Tuple[datetime, str]:
+async def admin_grant_access_atomic(
+    telegram_id: int,
+    days: int,
+    admin_telegram_id: int,
+    tariff: str = "basic",
+    remnawave_renew: bool = False,
+) -> Tuple[datetime, str]:
     """Атомарно выдать доступ пользователю на N дней (админ)
 
     Two-phase activation: Phase 1 add_vless_user outside tx, Phase 2 grant_access inside tx.
@@ -2339,6 +2300,9 @@ async def admin_grant_access_atomic(telegram_id: int, days: int, admin_telegram_
         days: Количество дней доступа (1, 7 или 14)
         admin_telegram_id: Telegram ID администратора
         tariff: "basic" или "plus" — тип тарифа для VPN API и подписки
+        remnawave_renew: поставить renew bypass-юзера Remnawave в outbox в этой
+            же транзакции (при выключенном outbox вызывающий сам делает
+            renew_remnawave_user_bg)
 
     Returns:
         Tuple[datetime, str]: (expires_at, vpn_key)
@@ -2445,6 +2409,8 @@ async def admin_grant_access_atomic(telegram_id: int, days: int, admin_telegram_
                         tariff=tariff_normalized,
                     )
                     expires_at = result["subscription_end"]
+                    if remnawave_renew:
+                        await enqueue_remnawave_renew(conn, telegram_id, tariff_normalized, expires_at, days)
                     if result.get("vless_url"):
                         final_vpn_key = result["vless_url"]
                     else:
@@ -2547,7 +2513,8 @@ async def finalize_balance_purchase(
     amount_rubles: float,
     description: Optional[str] = None,
     promo_code: Optional[str] = None,
-    country: Optional[str] = None
+    country: Optional[str] = None,
+    remnawave_renew: bool = False,
 ) -> Dict[str, Any]:
     """
     Атомарно обработать покупку подписки с баланса.
@@ -2565,6 +2532,9 @@ async def finalize_balance_purchase(
         amount_rubles: Сумма платежа в рублях
         description: Описание платежа (опционально)
         promo_code: Промокод (опционально, потребляется внутри транзакции)
+        remnawave_renew: поставить renew bypass-юзера Remnawave в outbox в этой
+            же транзакции (не для trial/biz; при выключенном outbox вызывающий
+            сам делает renew_remnawave_user_bg)
     
     Returns:
         {
@@ -2764,6 +2734,11 @@ async def finalize_balance_purchase(
                 subscription_type_ret = (grant_result.get("subscription_type") or "basic").strip().lower()
                 if subscription_type_ret not in config.VALID_SUBSCRIPTION_TYPES:
                     subscription_type_ret = "basic"
+
+                # Remnawave bypass renew — outbox-строкой в этой же транзакции
+                if remnawave_renew and subscription_type_ret not in ("trial",) + config.BIZ_TARIFFS:
+                    await enqueue_remnawave_renew(conn, telegram_id, subscription_type_ret, expires_at, period_days)
+
                 vpn_key_plus_ret = grant_result.get("vpn_key_plus") or grant_result.get("vless_url_plus")
                 ret_val = {
                     "success": True,
@@ -3953,81 +3928,63 @@ async def fix_bypass_overwrite_victim(telegram_id: int) -> Dict[str, Any]:
     }
 
 
+def _series_point() -> Dict[str, int]:
+    return {"revenue_kopecks": 0, "payments_count": 0, "new_users": 0, "new_subs": 0, "new_paid_subs": 0}
+
+
+def _add_series_fact(point: Dict[str, int], r) -> None:
+    metric, cnt = r["metric"], int(r["cnt"])
+    if metric == "payment":
+        point["revenue_kopecks"] += int(r["amount"])
+        point["payments_count"] += cnt
+    elif metric == "user":
+        point["new_users"] += cnt
+    elif metric == "subscription":
+        point["new_subs"] += cnt
+        if r["source"] == "payment":
+            point["new_paid_subs"] += cnt
+
+
+def _series_row(point: Dict[str, int]) -> Dict[str, Any]:
+    return {
+        "revenue_rubles": float(point["revenue_kopecks"]) / 100.0,
+        "payments_count": point["payments_count"],
+        "new_users": point["new_users"],
+        "new_subscriptions": point["new_subs"],
+        "new_paid_subscriptions": point["new_paid_subs"],
+    }
+
+
 async def get_daily_timeseries(days: int) -> Dict[str, Any]:
     """Daily аггрегаты за последние `days` суток UTC.
 
     Один payload — три серии: revenue, new_users, new_subscriptions.
-    Все пустые дни в окне присутствуют с нулями (через generate_series),
-    чтобы фронту не приходилось их добивать самому — графики получают
-    непрерывный X.
+    Все пустые дни в окне присутствуют с нулями, чтобы фронту не
+    приходилось их добивать самому — графики получают непрерывный X.
 
-    Используем UTC-cast явно (`AT TIME ZONE 'UTC'`), а не голый NOW(),
-    чтобы границы дня не съезжали при session-TZ ≠ UTC. См. tz-коммент
-    в get_users_by_segment.
+    Границы суток — UTC (ts в роллапах — aware UTC, день берём через
+    `AT TIME ZONE 'UTC'`), так что session-TZ ≠ UTC ничего не сдвигает.
+    Целые дни читаются из analytics_daily, сегодняшний — из часовых
+    строк + сырой хвост после watermark'а.
     """
-    pool = await get_pool()
+    pool = await get_read_pool()
+    now = datetime.now(timezone.utc)
+    first = now.replace(hour=0, minute=0, second=0, microsecond=0) - timedelta(days=days - 1)
     async with pool.acquire() as conn:
-        rows = await conn.fetch(
-            """
-            WITH days AS (
-                SELECT generate_series(
-                    DATE_TRUNC('day', (NOW() AT TIME ZONE 'UTC')) - ($1::int - 1) * INTERVAL '1 day',
-                    DATE_TRUNC('day', (NOW() AT TIME ZONE 'UTC')),
-                    INTERVAL '1 day'
-                )::date AS day
-            ),
-            pay AS (
-                SELECT DATE_TRUNC('day', created_at AT TIME ZONE 'UTC')::date AS day,
-                       COALESCE(SUM(amount), 0)::bigint AS revenue_kopecks,
-                       COUNT(*)::int AS payments_count
-                FROM payments
-                WHERE status = 'approved'
-                  AND created_at >= (NOW() AT TIME ZONE 'UTC') - $1::int * INTERVAL '1 day'
-                GROUP BY 1
-            ),
-            usr AS (
-                SELECT DATE_TRUNC('day', created_at AT TIME ZONE 'UTC')::date AS day,
-                       COUNT(*)::int AS new_users
-                FROM users
-                WHERE created_at >= (NOW() AT TIME ZONE 'UTC') - $1::int * INTERVAL '1 day'
-                GROUP BY 1
-            ),
-            sub AS (
-                SELECT DATE_TRUNC('day', activated_at AT TIME ZONE 'UTC')::date AS day,
-                       COUNT(*)::int AS new_subs,
-                       COUNT(*) FILTER (WHERE source = 'payment')::int AS new_paid_subs
-                FROM subscriptions
-                WHERE activated_at IS NOT NULL
-                  AND activated_at >= (NOW() AT TIME ZONE 'UTC') - $1::int * INTERVAL '1 day'
-                GROUP BY 1
-            )
-            SELECT
-                d.day,
-                COALESCE(pay.revenue_kopecks, 0)  AS revenue_kopecks,
-                COALESCE(pay.payments_count, 0)   AS payments_count,
-                COALESCE(usr.new_users, 0)        AS new_users,
-                COALESCE(sub.new_subs, 0)         AS new_subs,
-                COALESCE(sub.new_paid_subs, 0)    AS new_paid_subs
-            FROM days d
-            LEFT JOIN pay ON pay.day = d.day
-            LEFT JOIN usr ON usr.day = d.day
-            LEFT JOIN sub ON sub.day = d.day
-            ORDER BY d.day
-            """,
-            days,
+        wm = await get_rollup_watermark(conn)
+        rows = await fetch_facts(
+            conn, first,
+            ["(ts AT TIME ZONE 'UTC')::date AS day", "metric", "source"],
+            ["payment", "user", "subscription"],
+            watermark=wm, now=now,
         )
 
-    series = [
-        {
-            "date": r["day"].isoformat(),
-            "revenue_rubles": float(r["revenue_kopecks"]) / 100.0,
-            "payments_count": int(r["payments_count"]),
-            "new_users": int(r["new_users"]),
-            "new_subscriptions": int(r["new_subs"]),
-            "new_paid_subscriptions": int(r["new_paid_subs"]),
-        }
-        for r in rows
-    ]
+    points = {(first + timedelta(days=i)).date(): _series_point() for i in range(days)}
+    for r in rows:
+        point = points.get(r["day"])
+        if point is not None:
+            _add_series_fact(point, r)
+    series = [{"date": day.isoformat(), **_series_row(p)} for day, p in points.items()]
     return {"days": days, "series": series}
 
 
@@ -4039,67 +3996,24 @@ async def get_hourly_timeseries(days: int) -> Dict[str, Any]:
     конвертации в МСК — админу удобнее видеть пики в местном времени,
     чем в UTC.
 
-    Используем `generate_series(0, 23)` для гарантии полных 24 точек
-    даже если в каком-то часу не было активности.
+    Читаем только часовые роллапы (daily=False): МСК — целый сдвиг от
+    UTC, так что час бакета однозначно даёт МСК-час. Все 24 точки
+    присутствуют даже если в каком-то часу не было активности.
     """
     pool = await get_pool()
+    now = datetime.now(timezone.utc)
     async with pool.acquire() as conn:
-        rows = await conn.fetch(
-            """
-            WITH hrs AS (
-                SELECT generate_series(0, 23) AS hour
-            ),
-            pay AS (
-                SELECT EXTRACT(HOUR FROM created_at AT TIME ZONE 'Europe/Moscow')::int AS hour,
-                       COALESCE(SUM(amount), 0)::bigint AS revenue_kopecks,
-                       COUNT(*)::int AS payments_count
-                FROM payments
-                WHERE status = 'approved'
-                  AND created_at >= (NOW() AT TIME ZONE 'UTC') - $1::int * INTERVAL '1 day'
-                GROUP BY 1
-            ),
-            usr AS (
-                SELECT EXTRACT(HOUR FROM created_at AT TIME ZONE 'Europe/Moscow')::int AS hour,
-                       COUNT(*)::int AS new_users
-                FROM users
-                WHERE created_at >= (NOW() AT TIME ZONE 'UTC') - $1::int * INTERVAL '1 day'
-                GROUP BY 1
-            ),
-            sub AS (
-                SELECT EXTRACT(HOUR FROM activated_at AT TIME ZONE 'Europe/Moscow')::int AS hour,
-                       COUNT(*)::int AS new_subs,
-                       COUNT(*) FILTER (WHERE source = 'payment')::int AS new_paid_subs
-                FROM subscriptions
-                WHERE activated_at IS NOT NULL
-                  AND activated_at >= (NOW() AT TIME ZONE 'UTC') - $1::int * INTERVAL '1 day'
-                GROUP BY 1
-            )
-            SELECT
-                hrs.hour,
-                COALESCE(pay.revenue_kopecks, 0) AS revenue_kopecks,
-                COALESCE(pay.payments_count, 0)  AS payments_count,
-                COALESCE(usr.new_users, 0)       AS new_users,
-                COALESCE(sub.new_subs, 0)        AS new_subs,
-                COALESCE(sub.new_paid_subs, 0)   AS new_paid_subs
-            FROM hrs
-            LEFT JOIN pay ON pay.hour = hrs.hour
-            LEFT JOIN usr ON usr.hour = hrs.hour
-            LEFT JOIN sub ON sub.hour = hrs.hour
-            ORDER BY hrs.hour
-            """,
-            days,
+        wm = await get_rollup_watermark(conn)
+        rows = await fetch_facts(
+            conn, now - timedelta(days=days),
+            ["EXTRACT(HOUR FROM ts AT TIME ZONE 'Europe/Moscow')::int AS hour", "metric", "source"],
+            ["payment", "user", "subscription"],
+            watermark=wm, now=now, daily=False,
         )
-    series = [
-        {
-            "hour": int(r["hour"]),
-            "revenue_rubles": float(r["revenue_kopecks"]) / 100.0,
-            "payments_count": int(r["payments_count"]),
-            "new_users": int(r["new_users"]),
-            "new_subscriptions": int(r["new_subs"]),
-            "new_paid_subscriptions": int(r["new_paid_subs"]),
-        }
-        for r in rows
-    ]
+    points = [_series_point() for _ in range(24)]
+    for r in rows:
+        _add_series_fact(points[int(r["hour"])], r)
+    series = [{"hour": hour, **_series_row(p)} for hour, p in enumerate(points)]
     return {"days": days, "tz": "Europe/Moscow", "series": series}
 
 
@@ -4552,7 +4466,11 @@ async def get_gift_subscription(gift_code: str) -> Optional[Dict[str, Any]]:
     return d
 
 
-async def activate_gift_subscription(gift_code: str, activated_by: int) -> Dict[str, Any]:
+async def activate_gift_subscription(
+    gift_code: str,
+    activated_by: int,
+    remnawave_renew: bool = False,
+) -> Dict[str, Any]:
     """
     Активирует подарочную подписку для пользователя.
 
@@ -4560,6 +4478,10 @@ async def activate_gift_subscription(gift_code: str, activated_by: int) -> Dict[
     - Phase 1: Проверяем подписку, при необходимости создаём UUID через VPN API (вне транзакции)
     - Phase 2: Атомарно обновляем подарок + выдаём доступ через grant_access (внутри транзакции)
 
+    remnawave_renew: для basic/plus поставить renew bypass-юзера Remnawave в
+    outbox в транзакции Phase 2 (при выключенном outbox вызывающий сам делает
+    renew_remnawave_user_bg).
+
     Returns:
         {"success": bool, "error": str | None, "tariff": str, "period_days": int}
     """
@@ -4677,6 +4599,8 @@ async def activate_gift_subscription(gift_code: str, activated_by: int) -> Dict[
                 _caller_holds_transaction=True,
                 pre_provisioned_uuid=pre_provisioned,
             )
+            if remnawave_renew and tariff in ("basic", "plus") and grant_result.get("subscription_end"):
+                await enqueue_remnawave_renew(conn, activated_by, tariff, grant_result["subscription_end"])
 
     logger.info(
         f"GIFT_ACTIVATED code={gift_code} by={activated_by} "
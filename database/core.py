@@ -4,6 +4,8 @@ import os
 import sys
 import hashlib
 import base64
+import inspect
+import time
 import uuid as uuid_lib
 import random
 import json
@@ -14,6 +16,7 @@ import config
 import vpn_utils
 from app.utils.retry import retry_async
 from app.core.system_state import ComponentStatus
+from app.core import metrics
 # outline_api removed - use vpn_utils instead
 
 if TYPE_CHECKING:
@@ -92,7 +95,8 @@ def _normalize_subscription_row(row: Optional[Dict[str, Any]]) -> Optional[Dict[
         return None
     d = dict(row)
     for k in ("expires_at", "trial_expires_at", "created_at", "activated_at", "last_reminder_at",
-              "last_auto_renewal_at", "last_notification_sent_at", "first_traffic_at"):
+              "last_auto_renewal_at", "last_notification_sent_at", "first_traffic_at",
+              "next_reminder_due_at"):
         if k in d and d[k] is not None and isinstance(d[k], datetime):
             d[k] = _from_db_utc(d[k])
     return d
@@ -228,6 +232,49 @@ async def is_payment_notification_sent(
 # Используем префикс окружения (STAGE_DATABASE_URL / PROD_DATABASE_URL)
 DATABASE_URL = config.env("DATABASE_URL")
 
+# ====================================================================================
+# JSON/JSONB CODECS — декодирование один раз, в драйвере
+# ====================================================================================
+# Без кодека asyncpg отдаёт json/jsonb строкой, и каждый вызывающий делал
+# json.loads сам. Кодек регистрируется в init каждого соединения пула:
+# чтение → dict/list, запись принимает dict/list или уже готовый JSON-текст
+# (str передаётся как есть — старые вызовы с json.dumps(...) не ломаются).
+# orjson, если установлен; иначе stdlib json.
+try:
+    import orjson as _orjson
+except ImportError:
+    _orjson = None
+
+
+if _orjson is not None:
+    _ORJSON_OPTS = _orjson.OPT_NON_STR_KEYS
+
+    def _json_loads(text: str) -> Any:
+        return _orjson.loads(text)
+
+    def _json_dumps(value: Any) -> str:
+        return _orjson.dumps(value, default=str, option=_ORJSON_OPTS).decode()
+else:
+    _json_loads = json.loads
+
+    def _json_dumps(value: Any) -> str:
+        return json.dumps(value, default=str, separators=(",", ":"))
+
+
+def _encode_json(value: Any) -> str:
+    if isinstance(value, str):
+        return value
+    return _json_dumps(value)
+
+
+async def _init_connection(conn: asyncpg.Connection) -> None:
+    """Pool `init` hook: json/jsonb codecs for every new connection."""
+    for typename in ("jsonb", "json"):
+        await conn.set_type_codec(
+            typename, schema="pg_catalog", encoder=_encode_json, decoder=_json_loads,
+        )
+
+
 # ====================================================================================
 # DB POOL CONFIG — Production-safe, ENV-overridable, single source of truth
 # ====================================================================================
@@ -250,6 +297,7 @@ def _get_pool_config() -> dict:
         "max_inactive_connection_lifetime": 300,
         "timeout": int(os.getenv("DB_POOL_ACQUIRE_TIMEOUT", "15")),
         "command_timeout": int(os.getenv("DB_POOL_COMMAND_TIMEOUT", "30")),
+        "init": _init_connection,
     }
 
 
@@ -309,6 +357,7 @@ async def get_pool() -> asyncpg.Pool:
 async def close_pool():
     """Закрыть пул соединений"""
     global _pool, DB_READY
+    await _close_read_pool()
     if _pool:
         await _pool.close()
         _pool = None
@@ -316,6 +365,143 @@ async def close_pool():
         logger.info("Database connection pool closed")
 
 
+# ====================================================================================
+# READ REPLICA: отдельный пул для тяжёлых read-only запросов
+# ====================================================================================
+# Дашборд-аналитика, выгрузки и аудит-сканы не должны отнимать соединения
+# у финализации платежей. Если задан <ENV>_READ_DATABASE_URL, такие функции
+# берут get_read_pool(): реплика, пока её отставание ≤
+# READ_REPLICA_MAX_LAG_SECONDS; иначе (нет URL, реплика недоступна или
+# отстала) — основной пул. Писать через read pool нельзя.
+READ_DATABASE_URL = config.env("READ_DATABASE_URL")
+
+_read_pool: Optional[asyncpg.Pool] = None
+_replica_refresh: Optional[asyncio.Task] = None
+_replica_lag: Optional[float] = None       # секунды; None — неизвестно
+_replica_checked_at: float = 0.0
+_replica_retry_at: float = 0.0
+_replica_fresh: bool = False
+_read_routed: Dict[str, int] = {}
+
+_REPLICA_LAG_SQL = """
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE EXTRACT(EPOCH FROM NOW() - pg_last_xact_replay_timestamp())
+    END
+"""
+
+
+def _get_read_pool_config() -> dict:
+    pool_config = _get_pool_config()
+    pool_config["min_size"] = int(os.getenv("DB_READ_POOL_MIN_SIZE", "1"))
+    pool_config["max_size"] = int(os.getenv("DB_READ_POOL_MAX_SIZE", "10"))
+    return pool_config
+
+
+async def _refresh_replica() -> None:
+    """Create the replica pool and/or re-measure lag.
+
+    Runs as a background task (get_read_pool never awaits it): while the
+    replica is being (re)connected, reads go to the primary instead of
+    waiting out the connect timeout.
+    """
+    global _read_pool, _replica_lag, _replica_checked_at, _replica_retry_at, _replica_fresh
+    now = time.monotonic()
+    _replica_checked_at = now
+    if _read_pool is None:
+        if now < _replica_retry_at:
+            return
+        pool_config = _get_read_pool_config()
+        try:
+            _read_pool = await asyncpg.create_pool(READ_DATABASE_URL, **pool_config)
+        except Exception as e:
+            _replica_retry_at = now + config.READ_REPLICA_RETRY_SECONDS
+            logger.warning("DB_READ_REPLICA_UNAVAILABLE: %s — reads go to primary", e)
+            return
+        logger.info(
+            "DB_READ_POOL_CONFIG min=%s max=%s", pool_config["min_size"], pool_config["max_size"],
+        )
+
+    try:
+        async with _read_pool.acquire(timeout=5) as conn:
+            lag = await conn.fetchval(_REPLICA_LAG_SQL, timeout=5)
+        _replica_lag = float(lag) if lag is not None else None
+    except Exception as e:
+        _replica_lag = None
+        logger.warning("DB_READ_REPLICA_LAG_CHECK_FAILED: %s", e)
+
+    fresh = _replica_lag is not None and _replica_lag <= config.READ_REPLICA_MAX_LAG_SECONDS
+    if fresh != _replica_fresh:
+        _replica_fresh = fresh
+        if fresh:
+            logger.info("DB_READ_REPLICA_IN_USE lag=%.1fs", _replica_lag)
+        else:
+            logger.warning(
+                "DB_READ_REPLICA_FALLBACK lag=%s max=%ss — reads go to primary",
+                "unknown" if _replica_lag is None else f"{_replica_lag:.1f}s",
+                config.READ_REPLICA_MAX_LAG_SECONDS,
+            )
+
+
+async def get_read_pool() -> asyncpg.Pool:
+    """Пул для тяжёлых read-only запросов: реплика, если свежая, иначе основной.
+
+    Данные могут отставать на READ_REPLICA_MAX_LAG_SECONDS — не использовать
+    для чтения, за которым следует запись (баланс, финализация платежа).
+    """
+    global _replica_refresh
+    if READ_DATABASE_URL:
+        if (
+            time.monotonic() - _replica_checked_at >= config.READ_REPLICA_LAG_CHECK_SECONDS
+            and (_replica_refresh is None or _replica_refresh.done())
+        ):
+            # Не ждём: до окончания проверки — по последнему известному
+            # состоянию (при первом вызове — основной пул).
+            _replica_refresh = asyncio.create_task(_refresh_replica())
+        if _read_pool is not None and _replica_fresh:
+            _read_routed["replica"] = _read_routed.get("replica", 0) + 1
+            return _read_pool
+    _read_routed["primary"] = _read_routed.get("primary", 0) + 1
+    return await get_pool()
+
+
+async def _close_read_pool() -> None:
+    global _read_pool, _replica_fresh, _replica_lag, _replica_checked_at, _replica_refresh
+    task, _replica_refresh = _replica_refresh, None
+    if task is not None and not task.done():
+        task.cancel()
+        try:
+            await task
+        except (asyncio.CancelledError, Exception):
+            pass
+    pool, _read_pool = _read_pool, None
+    _replica_fresh, _replica_lag, _replica_checked_at = False, None, 0.0
+    if pool is not None:
+        await pool.close()
+        logger.info("Read replica pool closed")
+
+
+def _read_pool_families():
+    if not READ_DATABASE_URL:
+        return []
+    families = [
+        ("db_read_routed", "counter", "get_read_pool() calls, by pool actually used.",
+         [({"target": t}, n) for t, n in _read_routed.items()]),
+        ("db_read_replica_fresh", "gauge", "1 while the replica lag is within READ_REPLICA_MAX_LAG_SECONDS.",
+         [({}, 1.0 if _replica_fresh else 0.0)]),
+    ]
+    if _replica_lag is not None:
+        families.append(
+            ("db_read_replica_lag_seconds", "gauge", "Last measured replica replay lag.",
+             [({}, _replica_lag)]),
+        )
+    return families
+
+
+metrics.register_collector(_read_pool_families)
+
+
 def ensure_db_ready() -> bool:
     """
     Проверка готовности базы данных перед выполнением операций
@@ -399,7 +585,9 @@ async def init_db() -> bool:
     if not DATABASE_URL:
         logger.error("DATABASE_URL not configured")
         return False
-    
+
+    timer = _StartupTimer()
+
     # 1️⃣ AT THE VERY TOP: Explicit DB connectivity probe
     try:
         conn = await asyncpg.connect(DATABASE_URL)
@@ -409,6 +597,7 @@ async def init_db() -> bool:
     except Exception as e:
         logger.error(f"DB connectivity probe failed: {e}")
         return False
+    timer.mark("probe")
     
     # 2️⃣ CREATE POOL — AND NOTHING ELSE (single source of truth via _get_pool_config)
     pool_config = _get_pool_config()
@@ -422,693 +611,62 @@ async def init_db() -> bool:
     except Exception as e:
         logger.error(f"Failed to create database pool: {e}")
         return False
+    timer.mark("pool")
     
     # 3️⃣ FORCE EVENT LOOP YIELD (CRITICAL — DO NOT SKIP)
     await asyncio.sleep(0)
-    
-    # 4️⃣ ONLY AFTER yield — RUN MIGRATIONS
-    try:
-        import migrations
-        migrations_success = await migrations.run_migrations_safe(_pool)
-        if not migrations_success:
-            logger.error("Migration execution failed")
-            return False
-        logger.info("Database migrations applied successfully")
-    except Exception as e:
-        logger.error(f"Migration execution failed: {e}")
-        return False
 
-    # 4b️⃣ RECREATE POOL after migrations (asyncpg prepared statement cache fix)
-    # Schema changes can invalidate cached prepared statements; fresh pool clears cache.
-    try:
-        await _pool.close()
-        _pool = await asyncpg.create_pool(DATABASE_URL, **pool_config)
-        logger.info(
-            "DB_POOL_RECREATED_AFTER_MIGRATIONS min=%s max=%s acquire_timeout=%s command_timeout=%s",
-            pool_config["min_size"], pool_config["max_size"],
-            pool_config["timeout"], pool_config["command_timeout"],
-        )
-    except Exception as e:
-        logger.error(f"Failed to recreate pool after migrations: {e}")
-        return False
-
-    # 5️⃣ IF migrations_success IS FALSE → already returned False above
-    # Now proceed with table creation (pool.acquire() is safe after yield)
-    # STRICT PATTERN: async with pool.acquire() as conn
-    async with _pool.acquire() as conn:
-        # ── Fast-fail on schema locks ──────────────────────────────────
-        # Migrations 001–053 have already created every table and column
-        # below. The 100+ `CREATE TABLE / ALTER TABLE … IF NOT EXISTS`
-        # statements that follow are idempotent legacy fallbacks for
-        # bootstrapping a virgin DB. Each one still asks Postgres for
-        # ACCESS EXCLUSIVE LOCK on its table — and on a 350k-user prod
-        # base, if even one transaction (autovacuum, idle-in-tx) holds
-        # a conflicting lock, the ALTER blocks indefinitely. Once asyncpg's
-        # client-side command_timeout (30s) fires it CANCELS the query
-        # and releases the connection back to the pool — the next
-        # `conn.execute()` then crashes with InterfaceError.
-        #
-        # Server-side lock_timeout/statement_timeout make any stuck
-        # statement fail as a normal query error in a few seconds,
-        # caught by the surrounding try/except and the loop moves on.
-        # Connection stays healthy.
+    # 3b️⃣ SCHEMA FINGERPRINT: набор миграций и inline DDL не менялись с
+    # последнего успешного старта → миграции, пересоздание пула и ~100
+    # DDL-запросов пропускаем (migration 086).
+    fingerprint = _schema_fingerprint()
+    fast_path = False
+    if fingerprint and config.DB_SCHEMA_FAST_PATH:
         try:
-            await conn.execute("SET lock_timeout = '5s'")
-            await conn.execute("SET statement_timeout = '20s'")
+            async with _pool.acquire() as conn:
+                fast_path = await _stored_schema_fingerprint(conn) == fingerprint
         except Exception as e:
-            logger.warning("Failed to set statement/lock timeouts: %s", e)
-
-        # Таблица users
-        await conn.execute("""
-            CREATE TABLE IF NOT EXISTS users (
-                id SERIAL PRIMARY KEY,
-                telegram_id BIGINT UNIQUE NOT NULL,
-                username TEXT,
-                language TEXT DEFAULT 'ru',
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
-
-        # Миграция: добавляем referral_level, если его нет
-        try:
-            await conn.execute("ALTER TABLE users ADD COLUMN IF NOT EXISTS referral_level TEXT DEFAULT 'base' CHECK (referral_level IN ('base', 'vip'))")
-        except Exception:
-            pass
-        
-        # Таблица pending_purchases - контекст покупки для защиты от устаревших кнопок
-        await conn.execute("""
-            CREATE TABLE IF NOT EXISTS pending_purchases (
-                id SERIAL PRIMARY KEY,
-                purchase_id TEXT UNIQUE NOT NULL,
-                telegram_id BIGINT NOT NULL,
-                tariff TEXT NOT NULL CHECK (tariff IN ('basic', 'plus', 'biz_starter', 'biz_team', 'biz_business', 'biz_pro', 'biz_enterprise', 'biz_ultimate')),
-                period_days INTEGER NOT NULL,
-                price_kopecks INTEGER NOT NULL,
-                promo_code TEXT,
-                status TEXT DEFAULT 'pending' CHECK (status IN ('pending', 'paid', 'expired')),
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                expires_at TIMESTAMP
-            )
-        """)
-        
-        # Миграция: устанавливаем expires_at для существующих pending purchases с NULL expires_at
-        try:
-            await conn.execute("""
-                UPDATE pending_purchases 
-                SET expires_at = created_at + INTERVAL '30 minutes'
-                WHERE expires_at IS NULL
-                AND status = 'pending'
-            """)
-        except Exception:
-            pass
-        
-        # Создаем индексы для быстрого поиска
-        try:
-            await conn.execute("CREATE INDEX IF NOT EXISTS idx_pending_purchases_status ON pending_purchases(status)")
-            await conn.execute("CREATE INDEX IF NOT EXISTS idx_pending_purchases_telegram_id ON pending_purchases(telegram_id)")
-            await conn.execute("CREATE INDEX IF NOT EXISTS idx_pending_purchases_purchase_id ON pending_purchases(purchase_id)")
-            await conn.execute("CREATE INDEX IF NOT EXISTS idx_pending_purchases_expires_at ON pending_purchases(expires_at)")
-        except Exception:
-            # Индексы уже существуют
-            pass
-        
-        # Таблица payments
-        await conn.execute("""
-            CREATE TABLE IF NOT EXISTS payments (
-                id SERIAL PRIMARY KEY,
-                telegram_id BIGINT NOT NULL,
-                tariff TEXT NOT NULL,
-                amount INTEGER,
-                status TEXT DEFAULT 'pending',
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                purchase_id TEXT
-            )
-        """)
-        
-        # P0 HOTFIX: Ensure idempotency columns exist (migration 012 compatibility)
-        # These columns are added by migration 012, but if table is recreated,
-        # we need to add them here to prevent schema drift
-        try:
-            await conn.execute("""
-                ALTER TABLE payments
-                ADD COLUMN IF NOT EXISTS telegram_payment_charge_id TEXT
-            """)
-            await conn.execute("""
-                ALTER TABLE payments
-                ADD COLUMN IF NOT EXISTS cryptobot_payment_id TEXT
-            """)
-        except Exception:
-            # Columns may already exist or migration handles this
-            pass
-
-        # SECURITY: Unique constraint on purchase_id for approved/paid payments (idempotency)
-        try:
-            await conn.execute("""
-                CREATE UNIQUE INDEX IF NOT EXISTS idx_payments_unique_purchase_approved
-                ON payments(purchase_id)
-                WHERE purchase_id IS NOT NULL AND status IN ('approved', 'paid')
-            """)
-        except Exception:
-            pass
-
-        # Таблица subscriptions
-        await conn.execute("""
-            CREATE TABLE IF NOT EXISTS subscriptions (
-                id SERIAL PRIMARY KEY,
-                telegram_id BIGINT UNIQUE NOT NULL,
-                outline_key_id INTEGER,
-                vpn_key TEXT,
-                expires_at TIMESTAMP NOT NULL,
-                reminder_sent BOOLEAN DEFAULT FALSE,
-                reminder_3d_sent BOOLEAN DEFAULT FALSE,
-                reminder_24h_sent BOOLEAN DEFAULT FALSE,
-                reminder_3h_sent BOOLEAN DEFAULT FALSE,
-                reminder_6h_sent BOOLEAN DEFAULT FALSE,
-                admin_grant_days INTEGER DEFAULT NULL,
-                auto_renew BOOLEAN DEFAULT FALSE
-            )
-        """)
-        
-        # Миграция: добавляем auto_renew, если его нет
-        try:
-            await conn.execute("ALTER TABLE subscriptions ADD COLUMN IF NOT EXISTS auto_renew BOOLEAN DEFAULT FALSE")
-        except Exception:
-            pass
-        
-        # Миграция: добавляем поле для защиты от повторного автопродления
-        try:
-            await conn.execute("ALTER TABLE subscriptions ADD COLUMN IF NOT EXISTS last_auto_renewal_at TIMESTAMP")
-        except Exception:
-            pass
-        
-        # Миграция: добавляем last_notification_sent_at для автопродления
-        try:
-            await conn.execute("ALTER TABLE subscriptions ADD COLUMN IF NOT EXISTS last_notification_sent_at TIMESTAMP")
-        except Exception:
-            pass
-        
-        # Миграция: добавляем новые поля для напоминаний, если их нет
-        try:
-            await conn.execute("ALTER TABLE subscriptions ADD COLUMN IF NOT EXISTS reminder_3d_sent BOOLEAN DEFAULT FALSE")
-            await conn.execute("ALTER TABLE subscriptions ADD COLUMN IF NOT EXISTS reminder_24h_sent BOOLEAN DEFAULT FALSE")
-            await conn.execute("ALTER TABLE subscriptions ADD COLUMN IF NOT EXISTS outline_key_id INTEGER")
-            # Делаем vpn_key nullable для поддержки старых записей
-            await conn.execute("ALTER TABLE subscriptions ALTER COLUMN vpn_key DROP NOT NULL")
-            await conn.execute("ALTER TABLE subscriptions ADD COLUMN IF NOT EXISTS reminder_3h_sent BOOLEAN DEFAULT FALSE")
-            await conn.execute("ALTER TABLE subscriptions ADD COLUMN IF NOT EXISTS reminder_6h_sent BOOLEAN DEFAULT FALSE")
-            
-            # Trial notification flags (без миграции - используем существующую структуру)
-            await conn.execute("ALTER TABLE subscriptions ADD COLUMN IF NOT EXISTS trial_notif_6h_sent BOOLEAN DEFAULT FALSE")
-            await conn.execute("ALTER TABLE subscriptions ADD COLUMN IF NOT EXISTS trial_notif_18h_sent BOOLEAN DEFAULT FALSE")
-            await conn.execute("ALTER TABLE subscriptions ADD COLUMN IF NOT EXISTS trial_notif_30h_sent BOOLEAN DEFAULT FALSE")
-            await conn.execute("ALTER TABLE subscriptions ADD COLUMN IF NOT EXISTS trial_notif_42h_sent BOOLEAN DEFAULT FALSE")
-            await conn.execute("ALTER TABLE subscriptions ADD COLUMN IF NOT EXISTS trial_notif_54h_sent BOOLEAN DEFAULT FALSE")
-            await conn.execute("ALTER TABLE subscriptions ADD COLUMN IF NOT EXISTS trial_notif_60h_sent BOOLEAN DEFAULT FALSE")
-            await conn.execute("ALTER TABLE subscriptions ADD COLUMN IF NOT EXISTS trial_notif_71h_sent BOOLEAN DEFAULT FALSE")
-            await conn.execute("ALTER TABLE subscriptions ADD COLUMN IF NOT EXISTS admin_grant_days INTEGER DEFAULT NULL")
-            # Поля для умных уведомлений
-            await conn.execute("ALTER TABLE subscriptions ADD COLUMN IF NOT EXISTS activated_at TIMESTAMP")
-            await conn.execute("ALTER TABLE subscriptions ADD COLUMN IF NOT EXISTS last_bytes BIGINT DEFAULT 0")
-            await conn.execute("ALTER TABLE subscriptions ADD COLUMN IF NOT EXISTS first_traffic_at TIMESTAMP")
-            await conn.execute("ALTER TABLE subscriptions ADD COLUMN IF NOT EXISTS smart_notif_no_traffic_20m_sent BOOLEAN DEFAULT FALSE")
-            await conn.execute("ALTER TABLE subscriptions ADD COLUMN IF NOT EXISTS smart_notif_no_traffic_24h_sent BOOLEAN DEFAULT FALSE")
-            await conn.execute("ALTER TABLE subscriptions ADD COLUMN IF NOT EXISTS smart_notif_first_connection_sent BOOLEAN DEFAULT FALSE")
-            await conn.execute("ALTER TABLE subscriptions ADD COLUMN IF NOT EXISTS smart_notif_3days_usage_sent BOOLEAN DEFAULT FALSE")
-            await conn.execute("ALTER TABLE subscriptions ADD COLUMN IF NOT EXISTS smart_notif_7days_before_expiry_sent BOOLEAN DEFAULT FALSE")
-            await conn.execute("ALTER TABLE subscriptions ADD COLUMN IF NOT EXISTS smart_notif_expiry_day_sent BOOLEAN DEFAULT FALSE")
-            await conn.execute("ALTER TABLE subscriptions ADD COLUMN IF NOT EXISTS smart_notif_expired_24h_sent BOOLEAN DEFAULT FALSE")
-            await conn.execute("ALTER TABLE subscriptions ADD COLUMN IF NOT EXISTS smart_notif_vip_offer_sent BOOLEAN DEFAULT FALSE")
-            # Поле для anti-spam защиты (минимальный интервал между уведомлениями)
-            await conn.execute("ALTER TABLE subscriptions ADD COLUMN IF NOT EXISTS last_notification_sent_at TIMESTAMP")
-            
-            # Xray Core migration: добавляем uuid, status, source для VLESS
-            await conn.execute("ALTER TABLE subscriptions ADD COLUMN IF NOT EXISTS uuid TEXT")
-            await conn.execute("ALTER TABLE subscriptions ADD COLUMN IF NOT EXISTS status TEXT DEFAULT 'active'")
-            await conn.execute("ALTER TABLE subscriptions ADD COLUMN IF NOT EXISTS source TEXT DEFAULT 'payment'")
-        except Exception:
-            # Колонки уже существуют
-            pass
-        
-        # Миграция: добавляем поле notification_sent в payments для идемпотентности уведомлений
-        try:
-            await conn.execute("ALTER TABLE payments ADD COLUMN IF NOT EXISTS notification_sent BOOLEAN DEFAULT FALSE")
-            await conn.execute("ALTER TABLE payments ADD COLUMN IF NOT EXISTS paid_at TIMESTAMP")
-        except Exception:
-            pass
-        
-        # Миграция: добавляем поля для delayed activation (premium flow)
-        try:
-            await conn.execute("ALTER TABLE subscriptions ADD COLUMN IF NOT EXISTS activation_status TEXT DEFAULT 'active'")
-            await conn.execute("ALTER TABLE subscriptions ADD COLUMN IF NOT EXISTS activation_attempts INTEGER DEFAULT 0")
-            await conn.execute("ALTER TABLE subscriptions ADD COLUMN IF NOT EXISTS last_activation_error TEXT")
-        except Exception:
-            pass
+            logger.warning("Schema fingerprint check failed, running full init: %s", e)
+    timer.mark("fingerprint")
 
-        # Миграция 032: subscription_type для VPN API tariff (basic / plus)
-        try:
-            await conn.execute("ALTER TABLE subscriptions ADD COLUMN IF NOT EXISTS subscription_type TEXT DEFAULT 'basic'")
-        except Exception:
-            pass
-
-        # Миграция 033: vpn_key_plus для Plus (второй vless-ключ)
-        try:
-            await conn.execute("ALTER TABLE subscriptions ADD COLUMN IF NOT EXISTS vpn_key_plus TEXT")
-        except Exception:
-            pass
-
-        # Миграция 045: вторая Remnawave entity для премиум-тарифа (MainServer squad).
-        # remnawave_uuid остаётся для bypass-тарифа; remnawave_premium_uuid
-        # хранится для безлимитных основных серверов.
-        try:
-            await conn.execute("ALTER TABLE subscriptions ADD COLUMN IF NOT EXISTS remnawave_premium_uuid TEXT")
-            await conn.execute("ALTER TABLE subscriptions ADD COLUMN IF NOT EXISTS samopis_migrated_at TIMESTAMPTZ")
-            # Миграция 046: кэш subscriptionUrl, чтобы fallback-роутер не
-            # дёргал панель на каждый /sub/{uuid} запрос.
-            await conn.execute("ALTER TABLE subscriptions ADD COLUMN IF NOT EXISTS remnawave_premium_sub_url TEXT")
-            # Миграция 047: кэш shortUuid для пересборки sub URL при
-            # необходимости (Remnawave v2.7+ разделил uuid / vlessUuid / shortUuid).
-            await conn.execute("ALTER TABLE subscriptions ADD COLUMN IF NOT EXISTS remnawave_premium_short_uuid TEXT")
-            # Миграция 048: симметричный кэш sub_url / short_uuid для bypass-entity
-            # (нужно после Task 2 cut-over чтобы UI мог отдавать обе ссылки без
-            # лишних round-trip'ов к панели).
-            await conn.execute("ALTER TABLE subscriptions ADD COLUMN IF NOT EXISTS remnawave_bypass_sub_url TEXT")
-            await conn.execute("ALTER TABLE subscriptions ADD COLUMN IF NOT EXISTS remnawave_bypass_short_uuid TEXT")
-            # Миграция 049: маркер для одноразовой рассылки уведомления о
-            # миграции инфраструктуры (Task 3).  Background-сендер фильтрует
-            # по этому полю чтобы не задвоить.
-            await conn.execute("ALTER TABLE subscriptions ADD COLUMN IF NOT EXISTS migration_notice_sent_at TIMESTAMPTZ")
-            await conn.execute(
-                "CREATE INDEX IF NOT EXISTS idx_subscriptions_remnawave_premium_uuid "
-                "ON subscriptions(remnawave_premium_uuid) WHERE remnawave_premium_uuid IS NOT NULL"
-            )
-        except Exception:
-            pass
-        
-        # Миграция: добавляем поле balance в users (хранится в копейках как INTEGER)
-        try:
-            await conn.execute("ALTER TABLE users ADD COLUMN IF NOT EXISTS balance INTEGER NOT NULL DEFAULT 0")
-        except Exception:
-            pass
-        
-        # Trial usage tracking (без миграций - используем ALTER TABLE IF NOT EXISTS)
-        try:
-            await conn.execute("ALTER TABLE users ADD COLUMN IF NOT EXISTS trial_used_at TIMESTAMP")
-            await conn.execute("ALTER TABLE users ADD COLUMN IF NOT EXISTS trial_expires_at TIMESTAMP")
-            await conn.execute("ALTER TABLE users ADD COLUMN IF NOT EXISTS trial_completed_sent BOOLEAN DEFAULT FALSE")
-            await conn.execute("ALTER TABLE users ADD COLUMN IF NOT EXISTS smart_offer_sent BOOLEAN DEFAULT FALSE")
-            await conn.execute("ALTER TABLE users ADD COLUMN IF NOT EXISTS special_offer_created_at TIMESTAMP")
-        except Exception:
-            pass
-        
-        # Таблица balance_transactions
-        await conn.execute("""
-            CREATE TABLE IF NOT EXISTS balance_transactions (
-                id SERIAL PRIMARY KEY,
-                user_id BIGINT NOT NULL,
-                amount NUMERIC NOT NULL,
-                type TEXT NOT NULL,
-                source TEXT,
-                description TEXT,
-                related_user_id BIGINT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
-        
-        # Миграция: добавляем related_user_id, если его нет
-        try:
-            await conn.execute("ALTER TABLE balance_transactions ADD COLUMN IF NOT EXISTS related_user_id BIGINT")
-        except Exception:
-            pass
-        
-        # Миграция: добавляем поле source в balance_transactions, если его нет
-        try:
-            await conn.execute("ALTER TABLE balance_transactions ADD COLUMN IF NOT EXISTS source TEXT")
-            # Меняем тип amount на NUMERIC для точности
-            await conn.execute("ALTER TABLE balance_transactions ALTER COLUMN amount TYPE NUMERIC USING amount::NUMERIC")
-        except Exception:
-            # Колонка уже существует или ошибка миграции
-            pass
-        
-        # Миграция: добавляем поля для реферальной программы
-        try:
-            await conn.execute("ALTER TABLE users ADD COLUMN IF NOT EXISTS referral_code TEXT")
-            # Добавляем referrer_id (или referred_by для обратной совместимости)
-            await conn.execute("ALTER TABLE users ADD COLUMN IF NOT EXISTS referrer_id BIGINT")
-            # Если есть referred_by, но нет referrer_id - копируем данные
-            await conn.execute("""
-                UPDATE users 
-                SET referrer_id = referred_by 
-                WHERE referrer_id IS NULL AND referred_by IS NOT NULL
-            """)
-            # Создаем индекс для быстрого поиска по referral_code
-            await conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_users_referral_code ON users(referral_code) WHERE referral_code IS NOT NULL")
-            # Создаем индекс для быстрого поиска по referrer_id
-            await conn.execute("CREATE INDEX IF NOT EXISTS idx_users_referrer_id ON users(referrer_id) WHERE referrer_id IS NOT NULL")
-        except Exception:
-            # Колонки уже существуют
-            pass
-        
-        # Таблица referrals (партнёрская программа)
-        await conn.execute("""
-            CREATE TABLE IF NOT EXISTS referrals (
-                id SERIAL PRIMARY KEY,
-                referrer_user_id BIGINT NOT NULL,
-                referred_user_id BIGINT NOT NULL,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                is_rewarded BOOLEAN DEFAULT FALSE,
-                reward_amount INTEGER DEFAULT 0,
-                UNIQUE (referred_user_id)
-            )
-        """)
-        
-        # Создаём индекс для быстрого поиска по партнёру
-        try:
-            await conn.execute("CREATE INDEX IF NOT EXISTS idx_referrals_referrer ON referrals(referrer_user_id)")
-        except Exception:
-            pass
-        
-        # Миграция: переименовываем колонки, если они еще старые
-        try:
-            await conn.execute("ALTER TABLE referrals RENAME COLUMN referrer_id TO referrer_user_id")
-        except Exception:
-            pass
-        try:
-            await conn.execute("ALTER TABLE referrals RENAME COLUMN referred_id TO referred_user_id")
-        except Exception:
-            pass
-        try:
-            await conn.execute("ALTER TABLE referrals RENAME COLUMN rewarded TO is_rewarded")
-        except Exception:
-            pass
-        try:
-            await conn.execute("ALTER TABLE referrals ADD COLUMN IF NOT EXISTS reward_amount INTEGER DEFAULT 0")
-        except Exception:
-            pass
-        try:
-            await conn.execute("ALTER TABLE referrals ADD COLUMN IF NOT EXISTS first_paid_at TIMESTAMP")
-        except Exception:
-            pass
-        
-        # Таблица referral_rewards - история всех начислений реферального кешбэка
-        await conn.execute("""
-            CREATE TABLE IF NOT EXISTS referral_rewards (
-                id SERIAL PRIMARY KEY,
-                referrer_id BIGINT NOT NULL,
-                buyer_id BIGINT NOT NULL,
-                purchase_id TEXT,
-                purchase_amount INTEGER NOT NULL,
-                percent INTEGER NOT NULL,
-                reward_amount INTEGER NOT NULL,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
-        
-        # Создаём индексы для быстрого поиска
-        try:
-            await conn.execute("CREATE INDEX IF NOT EXISTS idx_referral_rewards_referrer ON referral_rewards(referrer_id)")
-            await conn.execute("CREATE INDEX IF NOT EXISTS idx_referral_rewards_buyer ON referral_rewards(buyer_id)")
-            # Частичный уникальный индекс для предотвращения дубликатов начислений по одному purchase_id
-            await conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_referral_rewards_unique_buyer_purchase ON referral_rewards(buyer_id, purchase_id) WHERE purchase_id IS NOT NULL")
-            await conn.execute("CREATE INDEX IF NOT EXISTS idx_referral_rewards_purchase_id ON referral_rewards(purchase_id) WHERE purchase_id IS NOT NULL")
-            await conn.execute("CREATE INDEX IF NOT EXISTS idx_referral_rewards_created_at ON referral_rewards(created_at)")
-        except Exception:
-            pass
-        
-        # Таблица vpn_keys
-        await conn.execute("""
-            CREATE TABLE IF NOT EXISTS vpn_keys (
-                id SERIAL PRIMARY KEY,
-                vpn_key TEXT UNIQUE NOT NULL,
-                is_used BOOLEAN DEFAULT FALSE,
-                assigned_to BIGINT,
-                assigned_at TIMESTAMP
-            )
-        """)
-        
-        # Таблица audit_log
-        await conn.execute("""
-            CREATE TABLE IF NOT EXISTS audit_log (
-                id SERIAL PRIMARY KEY,
-                action TEXT NOT NULL,
-                telegram_id BIGINT NOT NULL,
-                target_user BIGINT,
-                details TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
-        
-        # Миграция: добавляем колонки для VPN lifecycle audit (если их нет)
-        try:
-            await conn.execute("ALTER TABLE audit_log ADD COLUMN IF NOT EXISTS uuid TEXT")
-            await conn.execute("ALTER TABLE audit_log ADD COLUMN IF NOT EXISTS source TEXT")
-            await conn.execute("ALTER TABLE audit_log ADD COLUMN IF NOT EXISTS result TEXT CHECK (result IN ('success', 'error'))")
-            # STEP 5 — PART C: CORRELATION & TRACEABILITY
-            # Add correlation_id column for traceability
-            await conn.execute("ALTER TABLE audit_log ADD COLUMN IF NOT EXISTS correlation_id TEXT")
-            # Создаём индекс для быстрого поиска по UUID
-            await conn.execute("CREATE INDEX IF NOT EXISTS idx_audit_log_uuid ON audit_log(uuid) WHERE uuid IS NOT NULL")
-            # Создаём индекс для быстрого поиска по action
-            await conn.execute("CREATE INDEX IF NOT EXISTS idx_audit_log_action ON audit_log(action)")
-            # Создаём индекс для быстрого поиска по source
-            await conn.execute("CREATE INDEX IF NOT EXISTS idx_audit_log_source ON audit_log(source) WHERE source IS NOT NULL")
-            # STEP 5 — PART C: CORRELATION & TRACEABILITY
-            # Index for correlation_id for fast incident timeline reconstruction
-            await conn.execute("CREATE INDEX IF NOT EXISTS idx_audit_log_correlation_id ON audit_log(correlation_id) WHERE correlation_id IS NOT NULL")
-        except Exception:
-            # Колонки уже существуют
-            pass
-        
-        # Таблица subscription_history
-        await conn.execute("""
-            CREATE TABLE IF NOT EXISTS subscription_history (
-                id SERIAL PRIMARY KEY,
-                telegram_id BIGINT NOT NULL,
-                vpn_key TEXT NOT NULL,
-                start_date TIMESTAMP NOT NULL,
-                end_date TIMESTAMP NOT NULL,
-                action_type TEXT NOT NULL,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
-        
-        # Таблица broadcasts
-        await conn.execute("""
-            CREATE TABLE IF NOT EXISTS broadcasts (
-                id SERIAL PRIMARY KEY,
-                title TEXT NOT NULL,
-                message TEXT,
-                message_a TEXT,
-                message_b TEXT,
-                is_ab_test BOOLEAN DEFAULT FALSE,
-                type TEXT NOT NULL,
-                segment TEXT NOT NULL,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                sent_by BIGINT NOT NULL
-            )
-        """)
-        
-        # Добавляем колонки для миграции
-        try:
-            await conn.execute("ALTER TABLE broadcasts ADD COLUMN IF NOT EXISTS segment TEXT")
-            await conn.execute("ALTER TABLE broadcasts ADD COLUMN IF NOT EXISTS is_ab_test BOOLEAN DEFAULT FALSE")
-            await conn.execute("ALTER TABLE broadcasts ADD COLUMN IF NOT EXISTS message_a TEXT")
-            await conn.execute("ALTER TABLE broadcasts ADD COLUMN IF NOT EXISTS message_b TEXT")
-        except Exception:
-            # Колонки уже существуют или таблицы нет
-            pass
-        
-        # Таблица broadcast_log
-        await conn.execute("""
-            CREATE TABLE IF NOT EXISTS broadcast_log (
-                id SERIAL PRIMARY KEY,
-                broadcast_id INTEGER NOT NULL REFERENCES broadcasts(id) ON DELETE CASCADE,
-                telegram_id BIGINT NOT NULL,
-                status TEXT NOT NULL,
-                variant TEXT,
-                message_id BIGINT,
-                sent_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
-
-        # Добавляем колонку variant для миграции
-        try:
-            await conn.execute("ALTER TABLE broadcast_log ADD COLUMN IF NOT EXISTS variant TEXT")
-        except Exception:
-            # Колонка уже существует или таблицы нет
-            pass
-
-        # Добавляем колонку message_id для миграции
-        try:
-            await conn.execute("ALTER TABLE broadcast_log ADD COLUMN IF NOT EXISTS message_id BIGINT")
-        except Exception:
-            pass
-
-        # Таблица broadcast_discounts (скидки для кнопок уведомлений)
-        await conn.execute("""
-            CREATE TABLE IF NOT EXISTS broadcast_discounts (
-                id SERIAL PRIMARY KEY,
-                broadcast_id INTEGER NOT NULL UNIQUE REFERENCES broadcasts(id) ON DELETE CASCADE,
-                discount_percent INTEGER NOT NULL,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
-
-        # Таблица incident_settings (режим инцидента)
-        await conn.execute("""
-            CREATE TABLE IF NOT EXISTS incident_settings (
-                id SERIAL PRIMARY KEY,
-                is_active BOOLEAN DEFAULT FALSE,
-                incident_text TEXT,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
-        
-        # Таблица user_discounts (персональные скидки)
-        await conn.execute("""
-            CREATE TABLE IF NOT EXISTS user_discounts (
-                id SERIAL PRIMARY KEY,
-                telegram_id BIGINT UNIQUE NOT NULL,
-                discount_percent INTEGER NOT NULL,
-                expires_at TIMESTAMP NULL,
-                created_by BIGINT NOT NULL,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
-        
-        # Таблица user_traffic_discounts (промо-скидки на трафик из рассылок)
-        await conn.execute("""
-            CREATE TABLE IF NOT EXISTS user_traffic_discounts (
-                id SERIAL PRIMARY KEY,
-                telegram_id BIGINT UNIQUE NOT NULL,
-                discount_percent INTEGER NOT NULL,
-                expires_at TIMESTAMP NULL,
-                created_by BIGINT NOT NULL,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
-
-        # Таблица vip_users (VIP-статус)
-        await conn.execute("""
-            CREATE TABLE IF NOT EXISTS vip_users (
-                telegram_id BIGINT UNIQUE NOT NULL PRIMARY KEY,
-                granted_by BIGINT NOT NULL,
-                granted_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
-        
-        # Таблица promo_codes (промокоды)
-        await conn.execute("""
-            CREATE TABLE IF NOT EXISTS promo_codes (
-                code TEXT UNIQUE NOT NULL PRIMARY KEY,
-                discount_percent INTEGER NOT NULL,
-                max_uses INTEGER NULL,
-                used_count INTEGER DEFAULT 0,
-                is_active BOOLEAN DEFAULT TRUE,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
-        
-        # Таблица promo_usage_logs (логи использования промокодов)
-        await conn.execute("""
-            CREATE TABLE IF NOT EXISTS promo_usage_logs (
-                id SERIAL PRIMARY KEY,
-                promo_code TEXT NOT NULL,
-                telegram_id BIGINT NOT NULL,
-                tariff TEXT NOT NULL,
-                discount_percent INTEGER NOT NULL,
-                price_before INTEGER NOT NULL,
-                price_after INTEGER NOT NULL,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
-        
-        # Создаём одну строку, если её нет
-        existing = await conn.fetchval("SELECT COUNT(*) FROM incident_settings")
-        if existing == 0:
-            await conn.execute("""
-                INSERT INTO incident_settings (is_active, incident_text)
-                VALUES (FALSE, NULL)
-            """)
-        
-        # Инициализируем промокоды, если их нет
-        await _init_promo_codes(conn)
-
-        # Миграция 034: расширяем CHECK constraint для бизнес-тарифов в pending_purchases
-        try:
-            await conn.execute("""
-                ALTER TABLE pending_purchases DROP CONSTRAINT IF EXISTS pending_purchases_tariff_check
-            """)
-            await conn.execute("""
-                ALTER TABLE pending_purchases ADD CONSTRAINT pending_purchases_tariff_check
-                CHECK (tariff IS NULL OR tariff IN ('basic', 'plus', 'biz_starter', 'biz_team', 'biz_business', 'biz_pro', 'biz_enterprise', 'biz_ultimate', 'telegram_premium') OR tariff LIKE 'traffic_%' OR tariff LIKE 'apple_id_%')
-            """)
-        except Exception:
-            pass
-
-        # Миграция 035: добавляем колонку country для бизнес-тарифов
-        try:
-            await conn.execute("ALTER TABLE subscriptions ADD COLUMN IF NOT EXISTS country TEXT")
-        except Exception:
-            pass
-        try:
-            await conn.execute("ALTER TABLE pending_purchases ADD COLUMN IF NOT EXISTS country TEXT")
-        except Exception:
-            pass
-
-        # Миграция 036: is_combo и is_bypass_only для комбо/bypass подписок
-        try:
-            await conn.execute("ALTER TABLE subscriptions ADD COLUMN IF NOT EXISTS is_combo BOOLEAN DEFAULT FALSE")
-        except Exception:
-            pass
-        try:
-            await conn.execute("ALTER TABLE subscriptions ADD COLUMN IF NOT EXISTS is_bypass_only BOOLEAN DEFAULT FALSE")
-        except Exception:
-            pass
-
-        # Миграция 037: is_combo для pending_purchases
+    if fast_path:
+        logger.info("DB_SCHEMA_FAST_PATH fingerprint=%s — migrations and inline DDL skipped", fingerprint[:12])
+    else:
+        # 4️⃣ ONLY AFTER yield — RUN MIGRATIONS
         try:
-            await conn.execute("ALTER TABLE pending_purchases ADD COLUMN IF NOT EXISTS is_combo BOOLEAN DEFAULT FALSE")
-        except Exception:
-            pass
+            import migrations
+            migrations_success = await migrations.run_migrations_safe(_pool)
+            if not migrations_success:
+                logger.error("Migration execution failed")
+                return False
+            logger.info("Database migrations applied successfully")
+        except Exception as e:
+            logger.error(f"Migration execution failed: {e}")
+            return False
+        timer.mark("migrations")
 
-        # Миграция 038: traffic_notified_8gb и traffic_notified_5gb
+        # 4b️⃣ RECREATE POOL after migrations (asyncpg prepared statement cache fix)
+        # Schema changes can invalidate cached prepared statements; fresh pool clears cache.
         try:
-            await conn.execute("ALTER TABLE users ADD COLUMN IF NOT EXISTS traffic_notified_8gb BOOLEAN DEFAULT FALSE")
-            await conn.execute("ALTER TABLE users ADD COLUMN IF NOT EXISTS traffic_notified_5gb BOOLEAN DEFAULT FALSE")
-        except Exception:
-            pass
-
-        # Таблица gift_subscriptions — подарочные подписки
-        await conn.execute("""
-            CREATE TABLE IF NOT EXISTS gift_subscriptions (
-                id SERIAL PRIMARY KEY,
-                gift_code TEXT UNIQUE NOT NULL,
-                buyer_telegram_id BIGINT NOT NULL,
-                tariff TEXT NOT NULL,
-                period_days INTEGER NOT NULL,
-                price_kopecks INTEGER NOT NULL,
-                purchase_id TEXT,
-                status TEXT DEFAULT 'pending' CHECK (status IN ('pending', 'paid', 'activated', 'expired')),
-                activated_by BIGINT,
-                activated_at TIMESTAMP,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                expires_at TIMESTAMP
+            await _pool.close()
+            _pool = await asyncpg.create_pool(DATABASE_URL, **pool_config)
+            logger.info(
+                "DB_POOL_RECREATED_AFTER_MIGRATIONS min=%s max=%s acquire_timeout=%s command_timeout=%s",
+                pool_config["min_size"], pool_config["max_size"],
+                pool_config["timeout"], pool_config["command_timeout"],
             )
-        """)
-        try:
-            await conn.execute("CREATE INDEX IF NOT EXISTS idx_gift_subscriptions_code ON gift_subscriptions(gift_code)")
-            await conn.execute("CREATE INDEX IF NOT EXISTS idx_gift_subscriptions_buyer ON gift_subscriptions(buyer_telegram_id)")
-            await conn.execute("CREATE INDEX IF NOT EXISTS idx_gift_subscriptions_status ON gift_subscriptions(status)")
-        except Exception:
-            pass
-
-        # Миграция: purchase_type для gift в pending_purchases
-        try:
-            await conn.execute("ALTER TABLE pending_purchases ADD COLUMN IF NOT EXISTS purchase_type TEXT DEFAULT 'subscription'")
-        except Exception:
-            pass
+        except Exception as e:
+            logger.error(f"Failed to recreate pool after migrations: {e}")
+            return False
+        timer.mark("pool_recreate")
 
-        logger.info("Database tables initialized")
+    # 5️⃣ IF migrations_success IS FALSE → already returned False above
+    # Now proceed with table creation (pool.acquire() is safe after yield)
+    # STRICT PATTERN: async with pool.acquire() as conn
+    async with _pool.acquire() as conn:
+        if not fast_path:
+            await _ensure_inline_schema(conn)
+            timer.mark("inline_ddl")
         
         # ====================================================================================
         # КРИТИЧНО: Проверяем существование всех критичных таблиц после миграций
@@ -1171,12 +729,762 @@ async def init_db() -> bool:
         # ТОЛЬКО ПОСЛЕ ПРОВЕРКИ ВСЕХ ТАБЛИЦ И users устанавливаем DB_READY = True
         DB_READY = True
         logger.info("Database fully initialized")
-        
+        timer.mark("verify")
+
+        # Отпечаток пишем только после полного успешного прохода — при
+        # сбое посередине следующий старт снова пойдёт полным путём.
+        if not fast_path and fingerprint:
+            try:
+                await _store_schema_fingerprint(conn, fingerprint)
+            except Exception as e:
+                logger.warning("Failed to store schema fingerprint: %s", e)
+
         # SystemState recalculation removed - no longer needed
-        
+
+        timer.report(fast_path)
         return True
 
 
+# ====================================================================================
+# STARTUP FAST PATH: schema fingerprint + timing report
+# ====================================================================================
+
+class _StartupTimer:
+    """Длительность фаз init_db → лог DB_INIT_TIMING и gauge на /metrics."""
+
+    def __init__(self) -> None:
+        self._started = self._last = time.monotonic()
+        self.phases: Dict[str, float] = {}
+
+    def mark(self, phase: str) -> None:
+        now = time.monotonic()
+        self.phases[phase] = now - self._last
+        self._last = now
+
+    def report(self, fast_path: bool) -> None:
+        global INIT_TIMINGS
+        total = time.monotonic() - self._started
+        INIT_TIMINGS = dict(self.phases, total=total)
+        logger.info(
+            "DB_INIT_TIMING path=%s total_ms=%.0f %s",
+            "fast" if fast_path else "full", total * 1000,
+            " ".join(f"{k}_ms={v * 1000:.0f}" for k, v in self.phases.items()),
+        )
+
+
+# Последний успешный init_db: {phase: seconds, "total": seconds}
+INIT_TIMINGS: Dict[str, float] = {}
+
+
+def _schema_fingerprint() -> Optional[str]:
+    """sha256 по файлам миграций и исходнику inline DDL.
+
+    None (нет исходников — например, только .pyc) → всегда полный путь.
+    """
+    import migrations
+    h = hashlib.sha256()
+    try:
+        for _, path in migrations.get_migration_files():
+            h.update(path.name.encode())
+            h.update(b"\0")
+            h.update(path.read_bytes())
+            h.update(b"\0")
+        for fn in (_ensure_inline_schema, _init_promo_codes):
+            h.update(inspect.getsource(fn).encode())
+    except (OSError, TypeError) as e:
+        logger.warning("Schema fingerprint unavailable: %s", e)
+        return None
+    return h.hexdigest()
+
+
+async def _stored_schema_fingerprint(conn) -> Optional[str]:
+    if await conn.fetchval("SELECT to_regclass('public.schema_fingerprint')") is None:
+        return None
+    return await conn.fetchval("SELECT fingerprint FROM schema_fingerprint WHERE id = 1")
+
+
+async def _store_schema_fingerprint(conn, fingerprint: str) -> None:
+    await conn.execute(
+        """INSERT INTO schema_fingerprint (id, fingerprint, updated_at)
+           VALUES (1, $1, NOW())
+           ON CONFLICT (id) DO UPDATE
+              SET fingerprint = EXCLUDED.fingerprint, updated_at = EXCLUDED.updated_at""",
+        fingerprint,
+    )
+
+
+def _init_timing_families():
+    if not INIT_TIMINGS:
+        return []
+    return [(
+        "db_init_phase_seconds", "gauge", "Duration of init_db phases at the last successful start.",
+        [({"phase": k}, v) for k, v in INIT_TIMINGS.items()],
+    )]
+
+
+metrics.register_collector(_init_timing_families)
+
+
+async def _ensure_inline_schema(conn) -> None:
+    """Idempotent legacy DDL + seed data (bootstrap of a virgin DB).
+
+    Runs only when the schema fingerprint changed (see init_db).
+    """
+    # ── Fast-fail on schema locks ──────────────────────────────────
+    # Migrations 001–053 have already created every table and column
+    # below. The 100+ `CREATE TABLE / ALTER TABLE … IF NOT EXISTS`
+    # statements that follow are idempotent legacy fallbacks for
+    # bootstrapping a virgin DB. Each one still asks Postgres for
+    # ACCESS EXCLUSIVE LOCK on its table — and on a 350k-user prod
+    # base, if even one transaction (autovacuum, idle-in-tx) holds
+    # a conflicting lock, the ALTER blocks indefinitely. Once asyncpg's
+    # client-side command_timeout (30s) fires it CANCELS the query
+    # and releases the connection back to the pool — the next
+    # `conn.execute()` then crashes with InterfaceError.
+    #
+    # Server-side lock_timeout/statement_timeout make any stuck
+    # statement fail as a normal query error in a few seconds,
+    # caught by the surrounding try/except and the loop moves on.
+    # Connection stays healthy.
+    try:
+        await conn.execute("SET lock_timeout = '5s'")
+        await conn.execute("SET statement_timeout = '20s'")
+    except Exception as e:
+        logger.warning("Failed to set statement/lock timeouts: %s", e)
+
+    # Таблица users
+    await conn.execute("""
+        CREATE TABLE IF NOT EXISTS users (
+            id SERIAL PRIMARY KEY,
+            telegram_id BIGINT UNIQUE NOT NULL,
+            username TEXT,
+            language TEXT DEFAULT 'ru',
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
+    # Миграция: добавляем referral_level, если его нет
+    try:
+        await conn.execute("ALTER TABLE users ADD COLUMN IF NOT EXISTS referral_level TEXT DEFAULT 'base' CHECK (referral_level IN ('base', 'vip'))")
+    except Exception:
+        pass
+
+    # Таблица pending_purchases - контекст покупки для защиты от устаревших кнопок
+    await conn.execute("""
+        CREATE TABLE IF NOT EXISTS pending_purchases (
+            id SERIAL PRIMARY KEY,
+            purchase_id TEXT UNIQUE NOT NULL,
+            telegram_id BIGINT NOT NULL,
+            tariff TEXT NOT NULL CHECK (tariff IN ('basic', 'plus', 'biz_starter', 'biz_team', 'biz_business', 'biz_pro', 'biz_enterprise', 'biz_ultimate')),
+            period_days INTEGER NOT NULL,
+            price_kopecks INTEGER NOT NULL,
+            promo_code TEXT,
+            status TEXT DEFAULT 'pending' CHECK (status IN ('pending', 'paid', 'expired')),
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            expires_at TIMESTAMP
+        )
+    """)
+
+    # Миграция: устанавливаем expires_at для существующих pending purchases с NULL expires_at
+    try:
+        await conn.execute("""
+            UPDATE pending_purchases 
+            SET expires_at = created_at + INTERVAL '30 minutes'
+            WHERE expires_at IS NULL
+            AND status = 'pending'
+        """)
+    except Exception:
+        pass
+
+    # Создаем индексы для быстрого поиска
+    try:
+        await conn.execute("CREATE INDEX IF NOT EXISTS idx_pending_purchases_status ON pending_purchases(status)")
+        await conn.execute("CREATE INDEX IF NOT EXISTS idx_pending_purchases_telegram_id ON pending_purchases(telegram_id)")
+        await conn.execute("CREATE INDEX IF NOT EXISTS idx_pending_purchases_purchase_id ON pending_purchases(purchase_id)")
+        await conn.execute("CREATE INDEX IF NOT EXISTS idx_pending_purchases_expires_at ON pending_purchases(expires_at)")
+    except Exception:
+        # Индексы уже существуют
+        pass
+
+    # Таблица payments
+    await conn.execute("""
+        CREATE TABLE IF NOT EXISTS payments (
+            id SERIAL PRIMARY KEY,
+            telegram_id BIGINT NOT NULL,
+            tariff TEXT NOT NULL,
+            amount INTEGER,
+            status TEXT DEFAULT 'pending',
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            purchase_id TEXT
+        )
+    """)
+
+    # P0 HOTFIX: Ensure idempotency columns exist (migration 012 compatibility)
+    # These columns are added by migration 012, but if table is recreated,
+    # we need to add them here to prevent schema drift
+    try:
+        await conn.execute("""
+            ALTER TABLE payments
+            ADD COLUMN IF NOT EXISTS telegram_payment_charge_id TEXT
+        """)
+        await conn.execute("""
+            ALTER TABLE payments
+            ADD COLUMN IF NOT EXISTS cryptobot_payment_id TEXT
+        """)
+    except Exception:
+        # Columns may already exist or migration handles this
+        pass
+
+    # SECURITY: Unique constraint on purchase_id for approved/paid payments (idempotency)
+    try:
+        await conn.execute("""
+            CREATE UNIQUE INDEX IF NOT EXISTS idx_payments_unique_purchase_approved
+            ON payments(purchase_id)
+            WHERE purchase_id IS NOT NULL AND status IN ('approved', 'paid')
+        """)
+    except Exception:
+        pass
+
+    # Таблица subscriptions
+    await conn.execute("""
+        CREATE TABLE IF NOT EXISTS subscriptions (
+            id SERIAL PRIMARY KEY,
+            telegram_id BIGINT UNIQUE NOT NULL,
+            outline_key_id INTEGER,
+            vpn_key TEXT,
+            expires_at TIMESTAMP NOT NULL,
+            reminder_sent BOOLEAN DEFAULT FALSE,
+            reminder_3d_sent BOOLEAN DEFAULT FALSE,
+            reminder_24h_sent BOOLEAN DEFAULT FALSE,
+            reminder_3h_sent BOOLEAN DEFAULT FALSE,
+            reminder_6h_sent BOOLEAN DEFAULT FALSE,
+            admin_grant_days INTEGER DEFAULT NULL,
+            auto_renew BOOLEAN DEFAULT FALSE
+        )
+    """)
+
+    # Миграция: добавляем auto_renew, если его нет
+    try:
+        await conn.execute("ALTER TABLE subscriptions ADD COLUMN IF NOT EXISTS auto_renew BOOLEAN DEFAULT FALSE")
+    except Exception:
+        pass
+
+    # Миграция: добавляем поле для защиты от повторного автопродления
+    try:
+        await conn.execute("ALTER TABLE subscriptions ADD COLUMN IF NOT EXISTS last_auto_renewal_at TIMESTAMP")
+    except Exception:
+        pass
+
+    # Миграция: добавляем last_notification_sent_at для автопродления
+    try:
+        await conn.execute("ALTER TABLE subscriptions ADD COLUMN IF NOT EXISTS last_notification_sent_at TIMESTAMP")
+    except Exception:
+        pass
+
+    # Миграция: добавляем новые поля для напоминаний, если их нет
+    try:
+        await conn.execute("ALTER TABLE subscriptions ADD COLUMN IF NOT EXISTS reminder_3d_sent BOOLEAN DEFAULT FALSE")
+        await conn.execute("ALTER TABLE subscriptions ADD COLUMN IF NOT EXISTS reminder_24h_sent BOOLEAN DEFAULT FALSE")
+        await conn.execute("ALTER TABLE subscriptions ADD COLUMN IF NOT EXISTS outline_key_id INTEGER")
+        # Делаем vpn_key nullable для поддержки старых записей
+        await conn.execute("ALTER TABLE subscriptions ALTER COLUMN vpn_key DROP NOT NULL")
+        await conn.execute("ALTER TABLE subscriptions ADD COLUMN IF NOT EXISTS reminder_3h_sent BOOLEAN DEFAULT FALSE")
+        await conn.execute("ALTER TABLE subscriptions ADD COLUMN IF NOT EXISTS reminder_6h_sent BOOLEAN DEFAULT FALSE")
+
+        # Trial notification flags (без миграции - используем существующую структуру)
+        await conn.execute("ALTER TABLE subscriptions ADD COLUMN IF NOT EXISTS trial_notif_6h_sent BOOLEAN DEFAULT FALSE")
+        await conn.execute("ALTER TABLE subscriptions ADD COLUMN IF NOT EXISTS trial_notif_18h_sent BOOLEAN DEFAULT FALSE")
+        await conn.execute("ALTER TABLE subscriptions ADD COLUMN IF NOT EXISTS trial_notif_30h_sent BOOLEAN DEFAULT FALSE")
+        await conn.execute("ALTER TABLE subscriptions ADD COLUMN IF NOT EXISTS trial_notif_42h_sent BOOLEAN DEFAULT FALSE")
+        await conn.execute("ALTER TABLE subscriptions ADD COLUMN IF NOT EXISTS trial_notif_54h_sent BOOLEAN DEFAULT FALSE")
+        await conn.execute("ALTER TABLE subscriptions ADD COLUMN IF NOT EXISTS trial_notif_60h_sent BOOLEAN DEFAULT FALSE")
+        await conn.execute("ALTER TABLE subscriptions ADD COLUMN IF NOT EXISTS trial_notif_71h_sent BOOLEAN DEFAULT FALSE")
+        await conn.execute("ALTER TABLE subscriptions ADD COLUMN IF NOT EXISTS admin_grant_days INTEGER DEFAULT NULL")
+        # Поля для умных уведомлений
+        await conn.execute("ALTER TABLE subscriptions ADD COLUMN IF NOT EXISTS activated_at TIMESTAMP")
+        await conn.execute("ALTER TABLE subscriptions ADD COLUMN IF NOT EXISTS last_bytes BIGINT DEFAULT 0")
+        await conn.execute("ALTER TABLE subscriptions ADD COLUMN IF NOT EXISTS first_traffic_at TIMESTAMP")
+        await conn.execute("ALTER TABLE subscriptions ADD COLUMN IF NOT EXISTS smart_notif_no_traffic_20m_sent BOOLEAN DEFAULT FALSE")
+        await conn.execute("ALTER TABLE subscriptions ADD COLUMN IF NOT EXISTS smart_notif_no_traffic_24h_sent BOOLEAN DEFAULT FALSE")
+        await conn.execute("ALTER TABLE subscriptions ADD COLUMN IF NOT EXISTS smart_notif_first_connection_sent BOOLEAN DEFAULT FALSE")
+        await conn.execute("ALTER TABLE subscriptions ADD COLUMN IF NOT EXISTS smart_notif_3days_usage_sent BOOLEAN DEFAULT FALSE")
+        await conn.execute("ALTER TABLE subscriptions ADD COLUMN IF NOT EXISTS smart_notif_7days_before_expiry_sent BOOLEAN DEFAULT FALSE")
+        await conn.execute("ALTER TABLE subscriptions ADD COLUMN IF NOT EXISTS smart_notif_expiry_day_sent BOOLEAN DEFAULT FALSE")
+        await conn.execute("ALTER TABLE subscriptions ADD COLUMN IF NOT EXISTS smart_notif_expired_24h_sent BOOLEAN DEFAULT FALSE")
+        await conn.execute("ALTER TABLE subscriptions ADD COLUMN IF NOT EXISTS smart_notif_vip_offer_sent BOOLEAN DEFAULT FALSE")
+        # Поле для anti-spam защиты (минимальный интервал между уведомлениями)
+        await conn.execute("ALTER TABLE subscriptions ADD COLUMN IF NOT EXISTS last_notification_sent_at TIMESTAMP")
+
+        # Xray Core migration: добавляем uuid, status, source для VLESS
+        await conn.execute("ALTER TABLE subscriptions ADD COLUMN IF NOT EXISTS uuid TEXT")
+        await conn.execute("ALTER TABLE subscriptions ADD COLUMN IF NOT EXISTS status TEXT DEFAULT 'active'")
+        await conn.execute("ALTER TABLE subscriptions ADD COLUMN IF NOT EXISTS source TEXT DEFAULT 'payment'")
+    except Exception:
+        # Колонки уже существуют
+        pass
+
+    # Миграция: добавляем поле notification_sent в payments для идемпотентности уведомлений
+    try:
+        await conn.execute("ALTER TABLE payments ADD COLUMN IF NOT EXISTS notification_sent BOOLEAN DEFAULT FALSE")
+        await conn.execute("ALTER TABLE payments ADD COLUMN IF NOT EXISTS paid_at TIMESTAMP")
+    except Exception:
+        pass
+
+    # Миграция: добавляем поля для delayed activation (premium flow)
+    try:
+        await conn.execute("ALTER TABLE subscriptions ADD COLUMN IF NOT EXISTS activation_status TEXT DEFAULT 'active'")
+        await conn.execute("ALTER TABLE subscriptions ADD COLUMN IF NOT EXISTS activation_attempts INTEGER DEFAULT 0")
+        await conn.execute("ALTER TABLE subscriptions ADD COLUMN IF NOT EXISTS last_activation_error TEXT")
+    except Exception:
+        pass
+
+    # Миграция 032: subscription_type для VPN API tariff (basic / plus)
+    try:
+        await conn.execute("ALTER TABLE subscriptions ADD COLUMN IF NOT EXISTS subscription_type TEXT DEFAULT 'basic'")
+    except Exception:
+        pass
+
+    # Миграция 033: vpn_key_plus для Plus (второй vless-ключ)
+    try:
+        await conn.execute("ALTER TABLE subscriptions ADD COLUMN IF NOT EXISTS vpn_key_plus TEXT")
+    except Exception:
+        pass
+
+    # Миграция 045: вторая Remnawave entity для премиум-тарифа (MainServer squad).
+    # remnawave_uuid остаётся для bypass-тарифа; remnawave_premium_uuid
+    # хранится для безлимитных основных серверов.
+    try:
+        await conn.execute("ALTER TABLE subscriptions ADD COLUMN IF NOT EXISTS remnawave_premium_uuid TEXT")
+        await conn.execute("ALTER TABLE subscriptions ADD COLUMN IF NOT EXISTS samopis_migrated_at TIMESTAMPTZ")
+        # Миграция 046: кэш subscriptionUrl, чтобы fallback-роутер не
+        # дёргал панель на каждый /sub/{uuid} запрос.
+        await conn.execute("ALTER TABLE subscriptions ADD COLUMN IF NOT EXISTS remnawave_premium_sub_url TEXT")
+        # Миграция 047: кэш shortUuid для пересборки sub URL при
+        # необходимости (Remnawave v2.7+ разделил uuid / vlessUuid / shortUuid).
+        await conn.execute("ALTER TABLE subscriptions ADD COLUMN IF NOT EXISTS remnawave_premium_short_uuid TEXT")
+        # Миграция 048: симметричный кэш sub_url / short_uuid для bypass-entity
+        # (нужно после Task 2 cut-over чтобы UI мог отдавать обе ссылки без
+        # лишних round-trip'ов к панели).
+        await conn.execute("ALTER TABLE subscriptions ADD COLUMN IF NOT EXISTS remnawave_bypass_sub_url TEXT")
+        await conn.execute("ALTER TABLE subscriptions ADD COLUMN IF NOT EXISTS remnawave_bypass_short_uuid TEXT")
+        # Миграция 049: маркер для одноразовой рассылки уведомления о
+        # миграции инфраструктуры (Task 3).  Background-сендер фильтрует
+        # по этому полю чтобы не задвоить.
+        await conn.execute("ALTER TABLE subscriptions ADD COLUMN IF NOT EXISTS migration_notice_sent_at TIMESTAMPTZ")
+        await conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_subscriptions_remnawave_premium_uuid "
+            "ON subscriptions(remnawave_premium_uuid) WHERE remnawave_premium_uuid IS NOT NULL"
+        )
+    except Exception:
+        pass
+
+    # Миграция: добавляем поле balance в users (хранится в копейках как INTEGER)
+    try:
+        await conn.execute("ALTER TABLE users ADD COLUMN IF NOT EXISTS balance INTEGER NOT NULL DEFAULT 0")
+    except Exception:
+        pass
+
+    # Trial usage tracking (без миграций - используем ALTER TABLE IF NOT EXISTS)
+    try:
+        await conn.execute("ALTER TABLE users ADD COLUMN IF NOT EXISTS trial_used_at TIMESTAMP")
+        await conn.execute("ALTER TABLE users ADD COLUMN IF NOT EXISTS trial_expires_at TIMESTAMP")
+        await conn.execute("ALTER TABLE users ADD COLUMN IF NOT EXISTS trial_completed_sent BOOLEAN DEFAULT FALSE")
+        await conn.execute("ALTER TABLE users ADD COLUMN IF NOT EXISTS smart_offer_sent BOOLEAN DEFAULT FALSE")
+        await conn.execute("ALTER TABLE users ADD COLUMN IF NOT EXISTS special_offer_created_at TIMESTAMP")
+    except Exception:
+        pass
+
+    # Таблица balance_transactions
+    await conn.execute("""
+        CREATE TABLE IF NOT EXISTS balance_transactions (
+            id SERIAL PRIMARY KEY,
+            user_id BIGINT NOT NULL,
+            amount NUMERIC NOT NULL,
+            type TEXT NOT NULL,
+            source TEXT,
+            description TEXT,
+            related_user_id BIGINT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
+    # Миграция: добавляем related_user_id, если его нет
+    try:
+        await conn.execute("ALTER TABLE balance_transactions ADD COLUMN IF NOT EXISTS related_user_id BIGINT")
+    except Exception:
+        pass
+
+    # Миграция: добавляем поле source в balance_transactions, если его нет
+    try:
+        await conn.execute("ALTER TABLE balance_transactions ADD COLUMN IF NOT EXISTS source TEXT")
+        # Меняем тип amount на NUMERIC для точности
+        await conn.execute("ALTER TABLE balance_transactions ALTER COLUMN amount TYPE NUMERIC USING amount::NUMERIC")
+    except Exception:
+        # Колонка уже существует или ошибка миграции
+        pass
+
+    # Миграция: добавляем поля для реферальной программы
+    try:
+        await conn.execute("ALTER TABLE users ADD COLUMN IF NOT EXISTS referral_code TEXT")
+        # Добавляем referrer_id (или referred_by для обратной совместимости)
+        await conn.execute("ALTER TABLE users ADD COLUMN IF NOT EXISTS referrer_id BIGINT")
+        # Если есть referred_by, но нет referrer_id - копируем данные
+        await conn.execute("""
+            UPDATE users 
+            SET referrer_id = referred_by 
+            WHERE referrer_id IS NULL AND referred_by IS NOT NULL
+        """)
+        # Создаем индекс для быстрого поиска по referral_code
+        await conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_users_referral_code ON users(referral_code) WHERE referral_code IS NOT NULL")
+        # Создаем индекс для быстрого поиска по referrer_id
+        await conn.execute("CREATE INDEX IF NOT EXISTS idx_users_referrer_id ON users(referrer_id) WHERE referrer_id IS NOT NULL")
+    except Exception:
+        # Колонки уже существуют
+        pass
+
+    # Таблица referrals (партнёрская программа)
+    await conn.execute("""
+        CREATE TABLE IF NOT EXISTS referrals (
+            id SERIAL PRIMARY KEY,
+            referrer_user_id BIGINT NOT NULL,
+            referred_user_id BIGINT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            is_rewarded BOOLEAN DEFAULT FALSE,
+            reward_amount INTEGER DEFAULT 0,
+            UNIQUE (referred_user_id)
+        )
+    """)
+
+    # Создаём индекс для быстрого поиска по партнёру
+    try:
+        await conn.execute("CREATE INDEX IF NOT EXISTS idx_referrals_referrer ON referrals(referrer_user_id)")
+    except Exception:
+        pass
+
+    # Миграция: переименовываем колонки, если они еще старые
+    try:
+        await conn.execute("ALTER TABLE referrals RENAME COLUMN referrer_id TO referrer_user_id")
+    except Exception:
+        pass
+    try:
+        await conn.execute("ALTER TABLE referrals RENAME COLUMN referred_id TO referred_user_id")
+    except Exception:
+        pass
+    try:
+        await conn.execute("ALTER TABLE referrals RENAME COLUMN rewarded TO is_rewarded")
+    except Exception:
+        pass
+    try:
+        await conn.execute("ALTER TABLE referrals ADD COLUMN IF NOT EXISTS reward_amount INTEGER DEFAULT 0")
+    except Exception:
+        pass
+    try:
+        await conn.execute("ALTER TABLE referrals ADD COLUMN IF NOT EXISTS first_paid_at TIMESTAMP")
+    except Exception:
+        pass
+
+    # Таблица referral_rewards - история всех начислений реферального кешбэка
+    await conn.execute("""
+        CREATE TABLE IF NOT EXISTS referral_rewards (
+            id SERIAL PRIMARY KEY,
+            referrer_id BIGINT NOT NULL,
+            buyer_id BIGINT NOT NULL,
+            purchase_id TEXT,
+            purchase_amount INTEGER NOT NULL,
+            percent INTEGER NOT NULL,
+            reward_amount INTEGER NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
+    # Создаём индексы для быстрого поиска
+    try:
+        await conn.execute("CREATE INDEX IF NOT EXISTS idx_referral_rewards_referrer ON referral_rewards(referrer_id)")
+        await conn.execute("CREATE INDEX IF NOT EXISTS idx_referral_rewards_buyer ON referral_rewards(buyer_id)")
+        # Частичный уникальный индекс для предотвращения дубликатов начислений по одному purchase_id
+        await conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_referral_rewards_unique_buyer_purchase ON referral_rewards(buyer_id, purchase_id) WHERE purchase_id IS NOT NULL")
+        await conn.execute("CREATE INDEX IF NOT EXISTS idx_referral_rewards_purchase_id ON referral_rewards(purchase_id) WHERE purchase_id IS NOT NULL")
+        await conn.execute("CREATE INDEX IF NOT EXISTS idx_referral_rewards_created_at ON referral_rewards(created_at)")
+    except Exception:
+        pass
+
+    # Таблица vpn_keys
+    await conn.execute("""
+        CREATE TABLE IF NOT EXISTS vpn_keys (
+            id SERIAL PRIMARY KEY,
+            vpn_key TEXT UNIQUE NOT NULL,
+            is_used BOOLEAN DEFAULT FALSE,
+            assigned_to BIGINT,
+            assigned_at TIMESTAMP
+        )
+    """)
+
+    # Таблица audit_log
+    await conn.execute("""
+        CREATE TABLE IF NOT EXISTS audit_log (
+            id SERIAL PRIMARY KEY,
+            action TEXT NOT NULL,
+            telegram_id BIGINT NOT NULL,
+            target_user BIGINT,
+            details TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
+    # Миграция: добавляем колонки для VPN lifecycle audit (если их нет)
+    try:
+        await conn.execute("ALTER TABLE audit_log ADD COLUMN IF NOT EXISTS uuid TEXT")
+        await conn.execute("ALTER TABLE audit_log ADD COLUMN IF NOT EXISTS source TEXT")
+        await conn.execute("ALTER TABLE audit_log ADD COLUMN IF NOT EXISTS result TEXT CHECK (result IN ('success', 'error'))")
+        # STEP 5 — PART C: CORRELATION & TRACEABILITY
+        # Add correlation_id column for traceability
+        await conn.execute("ALTER TABLE audit_log ADD COLUMN IF NOT EXISTS correlation_id TEXT")
+        # Создаём индекс для быстрого поиска по UUID
+        await conn.execute("CREATE INDEX IF NOT EXISTS idx_audit_log_uuid ON audit_log(uuid) WHERE uuid IS NOT NULL")
+        # Создаём индекс для быстрого поиска по action
+        await conn.execute("CREATE INDEX IF NOT EXISTS idx_audit_log_action ON audit_log(action)")
+        # Создаём индекс для быстрого поиска по source
+        await conn.execute("CREATE INDEX IF NOT EXISTS idx_audit_log_source ON audit_log(source) WHERE source IS NOT NULL")
+        # STEP 5 — PART C: CORRELATION & TRACEABILITY
+        # Index for correlation_id for fast incident timeline reconstruction
+        await conn.execute("CREATE INDEX IF NOT EXISTS idx_audit_log_correlation_id ON audit_log(correlation_id) WHERE correlation_id IS NOT NULL")
+    except Exception:
+        # Колонки уже существуют
+        pass
+
+    # Таблица subscription_history
+    await conn.execute("""
+        CREATE TABLE IF NOT EXISTS subscription_history (
+            id SERIAL PRIMARY KEY,
+            telegram_id BIGINT NOT NULL,
+            vpn_key TEXT NOT NULL,
+            start_date TIMESTAMP NOT NULL,
+            end_date TIMESTAMP NOT NULL,
+            action_type TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
+    # Таблица broadcasts
+    await conn.execute("""
+        CREATE TABLE IF NOT EXISTS broadcasts (
+            id SERIAL PRIMARY KEY,
+            title TEXT NOT NULL,
+            message TEXT,
+            message_a TEXT,
+            message_b TEXT,
+            is_ab_test BOOLEAN DEFAULT FALSE,
+            type TEXT NOT NULL,
+            segment TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            sent_by BIGINT NOT NULL
+        )
+    """)
+
+    # Добавляем колонки для миграции
+    try:
+        await conn.execute("ALTER TABLE broadcasts ADD COLUMN IF NOT EXISTS segment TEXT")
+        await conn.execute("ALTER TABLE broadcasts ADD COLUMN IF NOT EXISTS is_ab_test BOOLEAN DEFAULT FALSE")
+        await conn.execute("ALTER TABLE broadcasts ADD COLUMN IF NOT EXISTS message_a TEXT")
+        await conn.execute("ALTER TABLE broadcasts ADD COLUMN IF NOT EXISTS message_b TEXT")
+    except Exception:
+        # Колонки уже существуют или таблицы нет
+        pass
+
+    # Таблица broadcast_log
+    await conn.execute("""
+        CREATE TABLE IF NOT EXISTS broadcast_log (
+            id SERIAL PRIMARY KEY,
+            broadcast_id INTEGER NOT NULL REFERENCES broadcasts(id) ON DELETE CASCADE,
+            telegram_id BIGINT NOT NULL,
+            status TEXT NOT NULL,
+            variant TEXT,
+            message_id BIGINT,
+            sent_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
+    # Добавляем колонку variant для миграции
+    try:
+        await conn.execute("ALTER TABLE broadcast_log ADD COLUMN IF NOT EXISTS variant TEXT")
+    except Exception:
+        # Колонка уже существует или таблицы нет
+        pass
+
+    # Добавляем колонку message_id для миграции
+    try:
+        await conn.execute("ALTER TABLE broadcast_log ADD COLUMN IF NOT EXISTS message_id BIGINT")
+    except Exception:
+        pass
+
+    # Таблица broadcast_discounts (скидки для кнопок уведомлений)
+    await conn.execute("""
+        CREATE TABLE IF NOT EXISTS broadcast_discounts (
+            id SERIAL PRIMARY KEY,
+            broadcast_id INTEGER NOT NULL UNIQUE REFERENCES broadcasts(id) ON DELETE CASCADE,
+            discount_percent INTEGER NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
+    # Таблица incident_settings (режим инцидента)
+    await conn.execute("""
+        CREATE TABLE IF NOT EXISTS incident_settings (
+            id SERIAL PRIMARY KEY,
+            is_active BOOLEAN DEFAULT FALSE,
+            incident_text TEXT,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
+    # Таблица user_discounts (персональные скидки)
+    await conn.execute("""
+        CREATE TABLE IF NOT EXISTS user_discounts (
+            id SERIAL PRIMARY KEY,
+            telegram_id BIGINT UNIQUE NOT NULL,
+            discount_percent INTEGER NOT NULL,
+            expires_at TIMESTAMP NULL,
+            created_by BIGINT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
+    # Таблица user_traffic_discounts (промо-скидки на трафик из рассылок)
+    await conn.execute("""
+        CREATE TABLE IF NOT EXISTS user_traffic_discounts (
+            id SERIAL PRIMARY KEY,
+            telegram_id BIGINT UNIQUE NOT NULL,
+            discount_percent INTEGER NOT NULL,
+            expires_at TIMESTAMP NULL,
+            created_by BIGINT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
+    # Таблица vip_users (VIP-статус)
+    await conn.execute("""
+        CREATE TABLE IF NOT EXISTS vip_users (
+            telegram_id BIGINT UNIQUE NOT NULL PRIMARY KEY,
+            granted_by BIGINT NOT NULL,
+            granted_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
+    # Таблица promo_codes (промокоды)
+    await conn.execute("""
+        CREATE TABLE IF NOT EXISTS promo_codes (
+            code TEXT UNIQUE NOT NULL PRIMARY KEY,
+            discount_percent INTEGER NOT NULL,
+            max_uses INTEGER NULL,
+            used_count INTEGER DEFAULT 0,
+            is_active BOOLEAN DEFAULT TRUE,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
+    # Таблица promo_usage_logs (логи использования промокодов)
+    await conn.execute("""
+        CREATE TABLE IF NOT EXISTS promo_usage_logs (
+            id SERIAL PRIMARY KEY,
+            promo_code TEXT NOT NULL,
+            telegram_id BIGINT NOT NULL,
+            tariff TEXT NOT NULL,
+            discount_percent INTEGER NOT NULL,
+            price_before INTEGER NOT NULL,
+            price_after INTEGER NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
+    # Создаём одну строку, если её нет
+    existing = await conn.fetchval("SELECT COUNT(*) FROM incident_settings")
+    if existing == 0:
+        await conn.execute("""
+            INSERT INTO incident_settings (is_active, incident_text)
+            VALUES (FALSE, NULL)
+        """)
+
+    # Инициализируем промокоды, если их нет
+    await _init_promo_codes(conn)
+
+    # Миграция 034: расширяем CHECK constraint для бизнес-тарифов в pending_purchases
+    try:
+        await conn.execute("""
+            ALTER TABLE pending_purchases DROP CONSTRAINT IF EXISTS pending_purchases_tariff_check
+        """)
+        await conn.execute("""
+            ALTER TABLE pending_purchases ADD CONSTRAINT pending_purchases_tariff_check
+            CHECK (tariff IS NULL OR tariff IN ('basic', 'plus', 'biz_starter', 'biz_team', 'biz_business', 'biz_pro', 'biz_enterprise', 'biz_ultimate', 'telegram_premium') OR tariff LIKE 'traffic_%' OR tariff LIKE 'apple_id_%')
+        """)
+    except Exception:
+        pass
+
+    # Миграция 035: добавляем колонку country для бизнес-тарифов
+    try:
+        await conn.execute("ALTER TABLE subscriptions ADD COLUMN IF NOT EXISTS country TEXT")
+    except Exception:
+        pass
+    try:
+        await conn.execute("ALTER TABLE pending_purchases ADD COLUMN IF NOT EXISTS country TEXT")
+    except Exception:
+        pass
+
+    # Миграция 036: is_combo и is_bypass_only для комбо/bypass подписок
+    try:
+        await conn.execute("ALTER TABLE subscriptions ADD COLUMN IF NOT EXISTS is_combo BOOLEAN DEFAULT FALSE")
+    except Exception:
+        pass
+    try:
+        await conn.execute("ALTER TABLE subscriptions ADD COLUMN IF NOT EXISTS is_bypass_only BOOLEAN DEFAULT FALSE")
+    except Exception:
+        pass
+
+    # Миграция 037: is_combo для pending_purchases
+    try:
+        await conn.execute("ALTER TABLE pending_purchases ADD COLUMN IF NOT EXISTS is_combo BOOLEAN DEFAULT FALSE")
+    except Exception:
+        pass
+
+    # Миграция 038: traffic_notified_8gb и traffic_notified_5gb
+    try:
+        await conn.execute("ALTER TABLE users ADD COLUMN IF NOT EXISTS traffic_notified_8gb BOOLEAN DEFAULT FALSE")
+        await conn.execute("ALTER TABLE users ADD COLUMN IF NOT EXISTS traffic_notified_5gb BOOLEAN DEFAULT FALSE")
+    except Exception:
+        pass
+
+    # Таблица gift_subscriptions — подарочные подписки
+    await conn.execute("""
+        CREATE TABLE IF NOT EXISTS gift_subscriptions (
+            id SERIAL PRIMARY KEY,
+            gift_code TEXT UNIQUE NOT NULL,
+            buyer_telegram_id BIGINT NOT NULL,
+            tariff TEXT NOT NULL,
+            period_days INTEGER NOT NULL,
+            price_kopecks INTEGER NOT NULL,
+            purchase_id TEXT,
+            status TEXT DEFAULT 'pending' CHECK (status IN ('pending', 'paid', 'activated', 'expired')),
+            activated_by BIGINT,
+            activated_at TIMESTAMP,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            expires_at TIMESTAMP
+        )
+    """)
+    try:
+        await conn.execute("CREATE INDEX IF NOT EXISTS idx_gift_subscriptions_code ON gift_subscriptions(gift_code)")
+        await conn.execute("CREATE INDEX IF NOT EXISTS idx_gift_subscriptions_buyer ON gift_subscriptions(buyer_telegram_id)")
+        await conn.execute("CREATE INDEX IF NOT EXISTS idx_gift_subscriptions_status ON gift_subscriptions(status)")
+    except Exception:
+        pass
+
+    # Миграция: purchase_type для gift в pending_purchases
+    try:
+        await conn.execute("ALTER TABLE pending_purchases ADD COLUMN IF NOT EXISTS purchase_type TEXT DEFAULT 'subscription'")
+    except Exception:
+        pass
+
+    logger.info("Database tables initialized")
+
+
 async def _init_promo_codes(conn):
     """Инициализация промокодов в базе данных"""
     # Check if promo_codes has id/deleted_at (post-021 schema)
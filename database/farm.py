@@ -7,11 +7,10 @@ RUB (tiered by plant reward); unshielded growing plots die at execution
 time — unless the user was OFFLINE during the warning window, in which
 case the plot is auto-harvested at 50% reward to the user's balance.
 """
-import json
 import logging
 import random
 from datetime import datetime, timedelta, timezone
-from typing import Any, Dict, List, Optional, Tuple
+from typing import Any, Dict, List, Optional, Tuple, TypedDict
 
 import database.core as _core
 from database.core import get_pool, _to_db_utc, _from_db_utc
@@ -27,6 +26,48 @@ STORM_MAX_INTERVAL_DAYS = 10
 STORM_ANNOUNCE_BEFORE_HOURS = 24
 
 
+# ──────────────────────────────────────────────────────────────────────
+# Plot shape
+# ──────────────────────────────────────────────────────────────────────
+
+class FarmPlot(TypedDict, total=False):
+    """One element of users.farm_plots (JSONB array).
+
+    Decoded by the pool's jsonb codec straight into this shape — handlers
+    mutate it in place and hand the list back to save_farm_plots().
+    Timestamps are ISO-8601 strings, as stored.
+    """
+    plot_id: int
+    status: str                      # empty | growing | ready | dead
+    plant_type: Optional[str]
+    planted_at: Optional[str]
+    ready_at: Optional[str]
+    dead_at: Optional[str]
+    notified_ready: bool
+    notified_12h: bool
+    notified_dead: bool
+    water_used_at: Optional[str]
+    fertilizer_used_at: Optional[str]
+    storm_shielded: bool
+
+
+def empty_farm_plot(plot_id: int) -> FarmPlot:
+    """Fresh empty plot (new user, bought plot, storm auto-harvest)."""
+    return {
+        "plot_id": plot_id,
+        "status": "empty",
+        "plant_type": None,
+        "planted_at": None,
+        "ready_at": None,
+        "dead_at": None,
+        "notified_ready": False,
+        "notified_12h": False,
+        "notified_dead": False,
+        "water_used_at": None,
+        "fertilizer_used_at": None,
+    }
+
+
 # ──────────────────────────────────────────────────────────────────────
 # Storm schedule
 # ──────────────────────────────────────────────────────────────────────
@@ -192,17 +233,7 @@ async def list_users_with_growing_plots() -> List[Dict[str, Any]]:
                      WHERE p->>'status' = 'growing'
                  )"""
         )
-        result = []
-        for row in rows:
-            plots = row["farm_plots"]
-            if isinstance(plots, str):
-                plots = json.loads(plots)
-            result.append({
-                "telegram_id": row["telegram_id"],
-                "farm_plots": plots,
-                "last_seen_at": row["last_seen_at"],
-            })
-        return result
+        return [dict(row) for row in rows]
 
 
 async def apply_storm_shield_atomic(
@@ -237,9 +268,7 @@ async def apply_storm_shield_atomic(
         )
         if not row:
             return False, "user_not_found"
-        plots = row["farm_plots"]
-        if isinstance(plots, str):
-            plots = json.loads(plots)
+        plots: List[FarmPlot] = row["farm_plots"]
         if not isinstance(plots, list):
             return False, "plot_not_found"
 
@@ -274,7 +303,7 @@ async def apply_storm_shield_atomic(
         plots[target_idx] = {**target, "storm_shielded": True}
         await c.execute(
             "UPDATE users SET farm_plots = $1::jsonb WHERE telegram_id = $2",
-            json.dumps(plots), telegram_id,
+            plots, telegram_id,
         )
         logger.info(
             "FARM_STORM_SHIELD_APPLIED user=%s plot=%s cost_kopecks=%s via_balance=%s",
@@ -297,7 +326,7 @@ async def apply_storm_shield_atomic(
 
 async def execute_storm_for_user(
     telegram_id: int,
-    farm_plots: List[Dict[str, Any]],
+    farm_plots: List[FarmPlot],
     last_seen_at: Optional[datetime],
     announced_at: datetime,
     plant_rewards: Dict[str, int],
@@ -344,7 +373,7 @@ async def execute_storm_for_user(
     killed_plants: List[Tuple[int, str]] = []
     autoharv_plants: List[Tuple[int, str, int]] = []
 
-    new_plots = []
+    new_plots: List[FarmPlot] = []
     for p in farm_plots:
         if p.get("status") != "growing":
             new_plots.append(p)
@@ -373,20 +402,7 @@ async def execute_storm_for_user(
             autoharv += 1
             autoharv_kopecks += half
             autoharv_plants.append((plot_id, plant_type, half))
-            new_plots.append({
-                "plot_id": plot_id,
-                "status": "empty",
-                "plant_type": None,
-                "planted_at": None,
-                "ready_at": None,
-                "dead_at": None,
-                "notified_ready": False,
-                "notified_12h": False,
-                "notified_dead": False,
-                "water_used_at": None,
-                "fertilizer_used_at": None,
-                "storm_shielded": False,
-            })
+            new_plots.append({**empty_farm_plot(plot_id), "storm_shielded": False})
 
     if killed == 0 and shielded == 0 and autoharv == 0:
         return empty_result
@@ -396,7 +412,7 @@ async def execute_storm_for_user(
             await conn.execute("SELECT pg_advisory_xact_lock($1)", telegram_id)
             await conn.execute(
                 "UPDATE users SET farm_plots = $1::jsonb WHERE telegram_id = $2",
-                json.dumps(new_plots), telegram_id,
+                new_plots, telegram_id,
             )
             if autoharv_kopecks > 0:
                 await conn.execute(
@@ -445,3 +461,29 @@ async def touch_last_seen(telegram_id: int) -> None:
             )
     except Exception as e:
         logger.warning("touch_last_seen failed user=%s err=%s", telegram_id, type(e).__name__)
+
+
+async def touch_last_seen_bulk(touches: Dict[int, datetime]) -> int:
+    """Stamp last_seen_at for many users in one UPDATE ... FROM unnest().
+
+    touches: telegram_id → aware-UTC timestamp of the latest interaction.
+    GREATEST() keeps an out-of-order flush from moving last_seen_at back.
+    Returns number of users in the batch; raises on DB errors so the
+    caller (LastSeenBuffer) can decide whether to retry.
+    """
+    if not touches or not _core.DB_READY:
+        return 0
+    pool = await get_pool()
+    if pool is None:
+        return 0
+    ids = list(touches.keys())
+    stamps = [_to_db_utc(touches[tid]) for tid in ids]
+    async with pool.acquire() as conn:
+        await conn.execute(
+            """UPDATE users AS u
+                  SET last_seen_at = GREATEST(COALESCE(u.last_seen_at, v.ts), v.ts)
+                 FROM unnest($1::bigint[], $2::timestamp[]) AS v(telegram_id, ts)
+                WHERE u.telegram_id = v.telegram_id""",
+            ids, stamps,
+        )
+    return len(ids)
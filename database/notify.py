@@ -0,0 +1,150 @@
+"""PostgreSQL LISTEN/NOTIFY wakeups for background workers (migration 085).
+
+One dedicated asyncpg connection (outside the pool: LISTEN state does not
+survive a pool release) listens on CHANNELS. Triggers from migration 085
+fire pg_notify after commit; `wait_for_notify(channel, timeout)` returns
+as soon as one arrives, or after `timeout` as the safety-net poll.
+
+After every (re)connect all channels are signalled once, so workers
+catch up on anything committed while the listener was down.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+from typing import Dict, Optional
+
+import asyncpg
+
+import config
+import database.core as _core
+from app.core import metrics
+
+logger = logging.getLogger(__name__)
+
+CHANNEL_ACTIVATION = "activation_pending"
+CHANNEL_SCHEDULED_BROADCAST = "scheduled_broadcast"
+CHANNEL_PURCHASE_INVOICE = "pending_purchase_invoice"
+CHANNELS = (CHANNEL_ACTIVATION, CHANNEL_SCHEDULED_BROADCAST, CHANNEL_PURCHASE_INVOICE)
+
+KEEPALIVE_SEC = 60.0               # SELECT 1 — ловим полуоткрытое соединение
+RECONNECT_MIN_SEC = 1.0
+RECONNECT_MAX_SEC = 60.0
+
+_events: Dict[str, asyncio.Event] = {}
+_conn: Optional[asyncpg.Connection] = None
+_task: Optional[asyncio.Task] = None
+_received: Dict[str, int] = {}
+
+
+def _event(channel: str) -> asyncio.Event:
+    ev = _events.get(channel)
+    if ev is None:
+        ev = _events[channel] = asyncio.Event()
+    return ev
+
+
+def listener_connected() -> bool:
+    """True while LISTEN is active — workers may then use their long safety interval."""
+    return _conn is not None and not _conn.is_closed()
+
+
+def _on_notify(connection, pid, channel, payload) -> None:
+    _received[channel] = _received.get(channel, 0) + 1
+    _event(channel).set()
+
+
+def _signal_all() -> None:
+    for channel in CHANNELS:
+        _event(channel).set()
+
+
+async def wait_for_notify(channel: str, timeout: float) -> bool:
+    """Sleep until a NOTIFY on `channel` or `timeout` seconds. True when notified."""
+    ev = _event(channel)
+    try:
+        await asyncio.wait_for(ev.wait(), timeout)
+        return True
+    except asyncio.TimeoutError:
+        return False
+    finally:
+        ev.clear()
+
+
+async def notify(channel: str, payload: str = "", *, conn=None) -> None:
+    """Explicit pg_notify (delivered on commit of `conn`'s transaction)."""
+    if conn is not None:
+        await conn.execute("SELECT pg_notify($1, $2)", channel, payload)
+        return
+    pool = await _core.get_pool()
+    async with pool.acquire() as c:
+        await c.execute("SELECT pg_notify($1, $2)", channel, payload)
+
+
+async def _listen_forever() -> None:
+    global _conn
+    delay = RECONNECT_MIN_SEC
+    while True:
+        conn = None
+        lost = asyncio.get_running_loop().create_future()
+        try:
+            conn = await asyncpg.connect(_core.DATABASE_URL, timeout=10)
+            conn.add_termination_listener(
+                lambda _c: lost.done() or lost.set_result(None)
+            )
+            for channel in CHANNELS:
+                await conn.add_listener(channel, _on_notify)
+            _conn = conn
+            delay = RECONNECT_MIN_SEC
+            logger.info("PG_NOTIFY listening on %s", ", ".join(CHANNELS))
+            _signal_all()
+            while not lost.done():
+                try:
+                    await asyncio.wait_for(asyncio.shield(lost), KEEPALIVE_SEC)
+                except asyncio.TimeoutError:
+                    await conn.fetchval("SELECT 1", timeout=10)
+            logger.warning("PG_NOTIFY connection lost, reconnecting")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning("PG_NOTIFY listener error: %s (retry in %.0fs)", e, delay)
+        finally:
+            _conn = None
+            if conn is not None and not conn.is_closed():
+                conn.terminate()
+        await asyncio.sleep(delay)
+        delay = min(delay * 2, RECONNECT_MAX_SEC)
+
+
+def start_listener() -> Optional[asyncio.Task]:
+    """Start the LISTEN task (idempotent). No-op when disabled or without DATABASE_URL."""
+    global _task
+    if not config.PG_NOTIFY_ENABLED or not _core.DATABASE_URL:
+        return None
+    if _task is None or _task.done():
+        _task = asyncio.create_task(_listen_forever(), name="pg_notify_listener")
+    return _task
+
+
+async def stop_listener() -> None:
+    global _task
+    task, _task = _task, None
+    if task is None:
+        return
+    task.cancel()
+    try:
+        await task
+    except (asyncio.CancelledError, Exception):
+        pass
+
+
+def _families():
+    return [
+        ("pg_notify_connected", "gauge", "1 while the LISTEN connection is up.",
+         [({}, 1.0 if listener_connected() else 0.0)]),
+        ("pg_notify_received", "counter", "NOTIFY messages received, by channel.",
+         [({"channel": ch}, n) for ch, n in _received.items()]),
+    ]
+
+
+metrics.register_collector(_families)
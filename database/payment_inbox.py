@@ -0,0 +1,156 @@
+"""Durable inbox for payment provider webhooks (migration 084).
+
+The webhook endpoint verifies the provider signature, stores the event
+with `enqueue_payment_event` and answers 200 right away. The worker
+(app/workers/payment_inbox.py) claims due rows with FOR UPDATE SKIP
+LOCKED under a lease, runs the provider handler and marks them done, or
+backs off / buries them as 'dead'.
+
+An event is identified by (provider, invoice_id, event_status); the same
+event delivered twice is stored once.
+"""
+from __future__ import annotations
+
+import json
+import logging
+from typing import Any, Dict, List, Optional
+
+import config
+import database.core as _core
+from database.core import get_pool
+
+logger = logging.getLogger(__name__)
+
+
+def payment_inbox_enabled() -> bool:
+    return bool(config.PAYMENT_INBOX_ENABLED)
+
+
+async def enqueue_payment_event(
+    provider: str,
+    invoice_id: str,
+    event_status: str,
+    body: Dict[str, Any],
+    *,
+    source: str = "webhook",
+) -> Optional[int]:
+    """Store one provider event. Returns the new row id, or None for a duplicate."""
+    pool = await get_pool()
+    if pool is None:
+        raise RuntimeError("DB pool is not available")
+    async with pool.acquire() as conn:
+        return await conn.fetchval(
+            """INSERT INTO payment_webhook_inbox (provider, invoice_id, event_status, source, body)
+               VALUES ($1, $2, $3, $4, $5::jsonb)
+               ON CONFLICT (provider, invoice_id, event_status) DO NOTHING
+               RETURNING id""",
+            provider, str(invoice_id), event_status or "", source,
+            json.dumps(body, default=str),
+        )
+
+
+def _decode(row) -> Dict[str, Any]:
+    item = dict(row)
+    body = item.get("body")
+    if isinstance(body, str):
+        try:
+            item["body"] = json.loads(body)
+        except ValueError:
+            item["body"] = {}
+    return item
+
+
+async def claim_payment_events(limit: int, lease_seconds: int) -> List[Dict[str, Any]]:
+    """Lease up to `limit` due events (oldest first).
+
+    Rows left in 'processing' by a crashed worker come back once their
+    lease expires. Returns [] when the DB is not ready.
+    """
+    if not _core.DB_READY:
+        return []
+    pool = await get_pool()
+    if pool is None:
+        return []
+    async with pool.acquire() as conn:
+        rows = await conn.fetch(
+            """WITH due AS (
+                   SELECT id FROM payment_webhook_inbox
+                    WHERE status IN ('pending', 'processing')
+                      AND next_attempt_at <= NOW()
+                    ORDER BY id
+                    LIMIT $1
+                    FOR UPDATE SKIP LOCKED
+               )
+               UPDATE payment_webhook_inbox i
+                  SET status = 'processing',
+                      attempts = i.attempts + 1,
+                      next_attempt_at = NOW() + make_interval(secs => $2)
+                 FROM due
+                WHERE i.id = due.id
+               RETURNING i.id, i.provider, i.invoice_id, i.event_status, i.source,
+                         i.body, i.attempts, i.created_at""",
+            limit, float(lease_seconds),
+        )
+    return [_decode(r) for r in sorted(rows, key=lambda r: r["id"])]
+
+
+async def complete_payment_event(event_id: int, result: str) -> None:
+    pool = await get_pool()
+    async with pool.acquire() as conn:
+        await conn.execute(
+            """UPDATE payment_webhook_inbox
+                  SET status = 'done', result = $2, last_error = NULL, processed_at = NOW()
+                WHERE id = $1 AND status = 'processing'""",
+            event_id, (result or "")[:64],
+        )
+
+
+async def fail_payment_event(
+    event_id: int,
+    error: str,
+    delay_seconds: float,
+    max_attempts: int,
+    attempts: int,
+) -> Optional[bool]:
+    """Back to 'pending' after `delay_seconds`, or 'dead' once attempts run out.
+
+    Only touches the row while it is still this claim's lease (`attempts`
+    as returned by claim_payment_events): a handler that overran LEASE_SEC
+    must not reset a row another worker re-claimed or already completed.
+
+    Returns True when the event went dead, None when the lease was lost.
+    """
+    pool = await get_pool()
+    async with pool.acquire() as conn:
+        status = await conn.fetchval(
+            """UPDATE payment_webhook_inbox
+                  SET status = CASE WHEN attempts >= $3 THEN 'dead' ELSE 'pending' END,
+                      next_attempt_at = NOW() + make_interval(secs => $2),
+                      last_error = $4
+                WHERE id = $1 AND status = 'processing' AND attempts = $5
+               RETURNING status""",
+            event_id, float(delay_seconds), max_attempts, (error or "")[:500], int(attempts),
+        )
+    if status is None:
+        return None
+    return status == "dead"
+
+
+async def prune_payment_inbox(retention_days: int) -> int:
+    """Drop done events older than `retention_days` (dead rows stay for review)."""
+    if not _core.DB_READY:
+        return 0
+    pool = await get_pool()
+    if pool is None:
+        return 0
+    async with pool.acquire() as conn:
+        result = await conn.execute(
+            """DELETE FROM payment_webhook_inbox
+                WHERE status = 'done'
+                  AND processed_at < NOW() - make_interval(days => $1)""",
+            int(retention_days),
+        )
+    try:
+        return int(result.split()[-1])
+    except (AttributeError, ValueError, IndexError):
+        return 0
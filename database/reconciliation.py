@@ -32,7 +32,7 @@ from typing import Any, Dict, List, Optional
 
 import asyncpg
 
-from database.core import get_pool, _to_db_utc, _from_db_utc
+from database.core import get_pool, get_read_pool, _to_db_utc, _from_db_utc
 
 logger = logging.getLogger(__name__)
 
@@ -188,7 +188,7 @@ async def find_over_issuance_candidates(limit: int = 200) -> List[Dict[str, Any]
     those users don't own a `tg_<id>_premium` entity, so they never appear
     in this list.
     """
-    pool = await get_pool()
+    pool = await get_read_pool()
     if pool is None:
         return []
     now = datetime.now(timezone.utc)
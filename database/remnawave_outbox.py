@@ -0,0 +1,208 @@
+"""Transactional outbox for Remnawave bypass-entity mutations (migration 083).
+
+Producers call `enqueue_remnawave_op(..., conn=conn)` inside the same
+transaction that changes the subscription, so the panel side effect is
+committed (or rolled back) together with it. The dispatcher
+(app/workers/remnawave_outbox.py) claims whole users at a time — every
+pending op of a user goes to one worker in id order, so ops for one user
+never run concurrently or out of order.
+
+Rows are deleted once applied; failures go back to 'pending' with a
+backoff, or to 'dead' after the attempt limit.
+"""
+from __future__ import annotations
+
+import json
+import logging
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import config
+import database.core as _core
+from database.core import get_pool
+
+logger = logging.getLogger(__name__)
+
+OPS = ("create", "renew", "extend_bypass", "disable", "delete", "ensure_squad")
+
+# Ключ pg_try_advisory_xact_lock(int, int): claim сериализуется между
+# инстансами. Двухаргументная форма — отдельное пространство от
+# pg_advisory_xact_lock(telegram_id).
+_CLAIM_LOCK = (0x524D4E, 1)
+
+
+def outbox_enabled() -> bool:
+    """Outbox only makes sense when there is a panel to talk to."""
+    return bool(config.REMNAWAVE_ENABLED and config.REMNAWAVE_OUTBOX_ENABLED)
+
+
+async def enqueue_remnawave_ops(
+    conn,
+    items: Iterable[Tuple[int, str, Optional[Dict[str, Any]]]],
+) -> int:
+    """Insert (telegram_id, op, payload) rows on the caller's connection/transaction."""
+    rows = [(int(tid), op, json.dumps(payload or {}, default=str)) for tid, op, payload in items]
+    for _, op, _ in rows:
+        if op not in OPS:
+            raise ValueError(f"unknown remnawave outbox op: {op}")
+    if not rows:
+        return 0
+    await conn.execute(
+        """INSERT INTO remnawave_outbox (telegram_id, op, payload)
+           SELECT t.telegram_id, t.op, t.payload::jsonb
+             FROM unnest($1::bigint[], $2::text[], $3::text[]) AS t(telegram_id, op, payload)""",
+        [r[0] for r in rows], [r[1] for r in rows], [r[2] for r in rows],
+    )
+    return len(rows)
+
+
+async def enqueue_remnawave_op(
+    telegram_id: int,
+    op: str,
+    payload: Optional[Dict[str, Any]] = None,
+    *,
+    conn=None,
+) -> None:
+    """Queue one panel mutation. Pass `conn` to join the caller's transaction."""
+    if conn is not None:
+        await enqueue_remnawave_ops(conn, [(telegram_id, op, payload)])
+        return
+    pool = await get_pool()
+    if pool is None:
+        raise RuntimeError("DB pool is not available")
+    async with pool.acquire() as c:
+        await enqueue_remnawave_ops(c, [(telegram_id, op, payload)])
+
+
+async def enqueue_remnawave_renew(
+    conn,
+    telegram_id: int,
+    tariff: str,
+    subscription_end,
+    period_days: int = 30,
+) -> bool:
+    """Queue a bypass renew on the caller's transaction (payment / renew /
+    grant paths), with the payload renew_remnawave_user_bg would write.
+
+    False when the outbox is off — the caller keeps the post-commit
+    renew_remnawave_user_bg path.
+    """
+    if not outbox_enabled():
+        return False
+    end = subscription_end.isoformat() if hasattr(subscription_end, "isoformat") else subscription_end
+    await enqueue_remnawave_ops(conn, [(
+        telegram_id, "renew",
+        {"tariff": tariff, "subscription_end": end, "period_days": period_days},
+    )])
+    return True
+
+
+def _decode(row) -> Dict[str, Any]:
+    item = dict(row)
+    payload = item.get("payload")
+    if isinstance(payload, str):
+        try:
+            item["payload"] = json.loads(payload)
+        except ValueError:
+            item["payload"] = {}
+    return item
+
+
+async def claim_remnawave_outbox(max_users: int, lease_seconds: int) -> Dict[int, List[Dict[str, Any]]]:
+    """Lease every pending op of up to `max_users` users with something due.
+
+    A user is skipped while another dispatcher holds a live lease on any of
+    their ops, or while any of their ops is still backing off — a newer op
+    waits behind the failed one instead of running ahead of it. Returns {telegram_id: [ops in id order]}; empty when the DB
+    is not ready or another instance is claiming right now.
+    """
+    if not _core.DB_READY:
+        return {}
+    pool = await get_pool()
+    if pool is None:
+        return {}
+    async with pool.acquire() as conn:
+        async with conn.transaction():
+            if not await conn.fetchval("SELECT pg_try_advisory_xact_lock($1, $2)", *_CLAIM_LOCK):
+                return {}
+            rows = await conn.fetch(
+                """WITH due AS (
+                       SELECT DISTINCT o.telegram_id
+                         FROM remnawave_outbox o
+                        WHERE o.status IN ('pending', 'processing')
+                          AND o.next_attempt_at <= NOW()
+                          AND NOT EXISTS (
+                              SELECT 1 FROM remnawave_outbox p
+                               WHERE p.telegram_id = o.telegram_id
+                                 AND p.status IN ('pending', 'processing')
+                                 AND p.next_attempt_at > NOW()
+                          )
+                        LIMIT $1
+                   )
+                   UPDATE remnawave_outbox o
+                      SET status = 'processing',
+                          attempts = o.attempts + 1,
+                          next_attempt_at = NOW() + make_interval(secs => $2)
+                     FROM due
+                    WHERE o.telegram_id = due.telegram_id
+                      AND o.status IN ('pending', 'processing')
+                      AND o.next_attempt_at <= NOW()
+                   RETURNING o.id, o.telegram_id, o.op, o.payload, o.attempts, o.created_at""",
+                max_users, float(lease_seconds),
+            )
+    claimed: Dict[int, List[Dict[str, Any]]] = {}
+    for row in sorted(rows, key=lambda r: r["id"]):
+        claimed.setdefault(row["telegram_id"], []).append(_decode(row))
+    return claimed
+
+
+async def complete_remnawave_ops(ids: List[int]) -> None:
+    """Applied — drop the rows."""
+    if not ids:
+        return
+    pool = await get_pool()
+    async with pool.acquire() as conn:
+        await conn.execute(
+            "DELETE FROM remnawave_outbox WHERE id = ANY($1::bigint[]) AND status = 'processing'",
+            ids,
+        )
+
+
+async def update_remnawave_op_payload(ids: List[int], fields: Dict[str, Any]) -> None:
+    """Merge checkpoint fields into the payload of claimed rows (see renew)."""
+    if not ids:
+        return
+    pool = await get_pool()
+    async with pool.acquire() as conn:
+        await conn.execute(
+            "UPDATE remnawave_outbox SET payload = payload || $2::jsonb WHERE id = ANY($1::bigint[])",
+            ids, json.dumps(fields, default=str),
+        )
+
+
+async def fail_remnawave_ops(
+    ids: List[int],
+    error: str,
+    delay_seconds: float,
+    max_attempts: int,
+) -> int:
+    """Back to 'pending' after `delay_seconds`, or 'dead' once attempts run out.
+
+    Returns how many rows went dead.
+    """
+    if not ids:
+        return 0
+    pool = await get_pool()
+    async with pool.acquire() as conn:
+        dead = await conn.fetchval(
+            """WITH upd AS (
+                   UPDATE remnawave_outbox
+                      SET status = CASE WHEN attempts >= $3 THEN 'dead' ELSE 'pending' END,
+                          next_attempt_at = NOW() + make_interval(secs => $2),
+                          last_error = $4
+                    WHERE id = ANY($1::bigint[])
+                   RETURNING status
+               )
+               SELECT COUNT(*) FILTER (WHERE status = 'dead') FROM upd""",
+            ids, float(delay_seconds), max_attempts, (error or "")[:500],
+        )
+    return int(dead or 0)
@@ -215,6 +215,16 @@ async def mark_ran_and_reschedule(
             )
 
 
+async def get_next_scheduled_at() -> Optional[datetime]:
+    """Ближайший scheduled_at среди активных заданий (None — заданий нет).
+    Воркер спит до него, если LISTEN/NOTIFY жив (migration 085)."""
+    pool = await get_pool()
+    async with pool.acquire() as conn:
+        return await conn.fetchval(
+            "SELECT MIN(scheduled_at) FROM scheduled_broadcasts WHERE is_active"
+        )
+
+
 async def fetch_due_scheduled(limit: int = 10) -> List[Dict[str, Any]]:
     """Кандидаты на запуск — scheduled_at <= NOW, is_active=TRUE.
     Использует SKIP LOCKED, чтобы несколько worker'ов не хватали одну и ту же
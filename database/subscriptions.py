@@ -58,11 +58,13 @@ def _notify_watchdog_expires_at(
         pass
 from database.core import (
     get_pool,
+    get_read_pool,
     _to_db_utc, _from_db_utc, _ensure_utc,
     _normalize_subscription_row, _generate_subscription_uuid,
     safe_int, mark_payment_notification_sent,
     retry_async,
 )
+from database.remnawave_outbox import enqueue_remnawave_op, enqueue_remnawave_renew, outbox_enabled
 
 if TYPE_CHECKING:
     from aiogram import Bot
@@ -339,12 +341,16 @@ async def check_and_disable_expired_subscription(telegram_id: int) -> bool:
                         "EXPIRY_TRANSITION_TO_BYPASS_ONLY user=%s — Remnawave stays active",
                         telegram_id,
                     )
-                    # Extend Remnawave expiry so bypass keeps working
-                    try:
-                        from app.services.remnawave_service import extend_remnawave_for_bypass_bg
-                        extend_remnawave_for_bypass_bg(telegram_id)
-                    except Exception as rmn_err:
-                        logger.warning("REMNAWAVE_BYPASS_EXTEND_FAIL: tg=%s %s", telegram_id, rmn_err)
+                    # Extend Remnawave expiry so bypass keeps working —
+                    # outbox-строкой в этой же транзакции.
+                    if outbox_enabled():
+                        await enqueue_remnawave_op(telegram_id, "extend_bypass", conn=conn)
+                    else:
+                        try:
+                            from app.services.remnawave_service import extend_remnawave_for_bypass_bg
+                            extend_remnawave_for_bypass_bg(telegram_id)
+                        except Exception as rmn_err:
+                            logger.warning("REMNAWAVE_BYPASS_EXTEND_FAIL: tg=%s %s", telegram_id, rmn_err)
                 return rows > 0
 
             result = await conn.execute(
@@ -366,11 +372,14 @@ async def check_and_disable_expired_subscription(telegram_id: int) -> bool:
                 # немедленно инвалидируется даже если DB.expires_at
                 # разошёлся с panel.expireAt (см. audit bucket
                 # `panel_ahead_of_paid` в admin/audit_subs).
-                try:
-                    from app.services.remnawave_service import disable_remnawave_user_bg
-                    disable_remnawave_user_bg(telegram_id)
-                except Exception as rmn_err:
-                    logger.warning("REMNAWAVE_EXPIRY_HOOK_FAIL: tg=%s %s", telegram_id, rmn_err)
+                if outbox_enabled():
+                    await enqueue_remnawave_op(telegram_id, "disable", conn=conn)
+                else:
+                    try:
+                        from app.services.remnawave_service import disable_remnawave_user_bg
+                        disable_remnawave_user_bg(telegram_id)
+                    except Exception as rmn_err:
+                        logger.warning("REMNAWAVE_EXPIRY_HOOK_FAIL: tg=%s %s", telegram_id, rmn_err)
                 try:
                     import asyncio as _aio
                     from app.services import remnawave_premium
@@ -668,6 +677,118 @@ async def get_active_paid_subscription(conn, telegram_id: int, now: datetime):
     """, telegram_id, _to_db_utc(now))
 
 
+async def fetch_expired_for_cleanup(conn, now: datetime, after_id: int, limit: int) -> list:
+    """Stage 1 fast_expiry_cleanup: одна keyset-страница истёкших подписок с UUID.
+
+    Пользователи с активной платной подпиской отсекаются в том же запросе
+    (NOT EXISTS вместо get_active_paid_subscription на каждую строку).
+    has_remnawave — снимок для логов; решение bypass-only принимает
+    expire_subscriptions_bulk по актуальной строке.
+    """
+    now_db = _to_db_utc(now)
+    return await conn.fetch(
+        """SELECT s.id, s.telegram_id, s.uuid, s.expires_at, s.source,
+                  (s.remnawave_uuid IS NOT NULL) AS has_remnawave
+           FROM subscriptions s
+           WHERE s.status = 'active'
+             AND s.expires_at < $1
+             AND s.uuid IS NOT NULL
+             AND s.id > $2
+             AND NOT EXISTS (
+                 SELECT 1 FROM subscriptions p
+                 WHERE p.telegram_id = s.telegram_id
+                   AND p.source != 'trial'
+                   AND p.status = 'active'
+                   AND p.expires_at > $1
+             )
+           ORDER BY s.id ASC
+           LIMIT $3""",
+        now_db, after_id, limit,
+    )
+
+
+async def expire_subscriptions_bulk(
+    conn,
+    items: List[Tuple[int, str]],
+    now: datetime,
+    bypass_expires_at: datetime,
+) -> list:
+    """Stage 3 fast_expiry_cleanup: все переходы чанка одним UPDATE.
+
+    items — (telegram_id, uuid) с уже снятым на панели UUID. Строка с
+    remnawave_uuid уходит в bypass-only (Xray снят, Remnawave живёт до
+    bypass_expires_at), остальные — в status='expired'. Guard тот же, что
+    у старого построчного recheck: UUID не сменился, подписка активна и
+    всё ещё истекла (продлённые между stage 1 и 3 не трогаем).
+
+    Returns: строки (telegram_id, uuid, expires_at, bypass_only) реально
+    перешедших подписок; expires_at — значение ДО перехода.
+    """
+    if not items:
+        return []
+    tids = [int(tid) for tid, _ in items]
+    uuids = [str(u) for _, u in items]
+    return await conn.fetch(
+        """WITH t AS (
+               SELECT * FROM unnest($1::bigint[], $2::text[]) AS t(telegram_id, uuid)
+           ), prev AS (
+               SELECT s.id, s.expires_at, t.uuid
+               FROM subscriptions s
+               JOIN t ON t.telegram_id = s.telegram_id AND t.uuid = s.uuid
+               WHERE s.status = 'active' AND s.expires_at < $3
+               FOR UPDATE OF s
+           )
+           UPDATE subscriptions s
+           SET uuid = NULL,
+               vpn_key = NULL,
+               vpn_key_plus = CASE WHEN s.remnawave_uuid IS NOT NULL THEN NULL ELSE s.vpn_key_plus END,
+               status = CASE WHEN s.remnawave_uuid IS NOT NULL THEN s.status ELSE 'expired' END,
+               is_bypass_only = CASE WHEN s.remnawave_uuid IS NOT NULL THEN TRUE ELSE s.is_bypass_only END,
+               expires_at = CASE WHEN s.remnawave_uuid IS NOT NULL THEN $4 ELSE s.expires_at END,
+               source = CASE WHEN s.remnawave_uuid IS NOT NULL THEN 'bypass_only' ELSE s.source END
+           FROM prev
+           WHERE s.id = prev.id
+           RETURNING s.telegram_id, prev.uuid, prev.expires_at,
+                     (s.remnawave_uuid IS NOT NULL) AS bypass_only""",
+        tids, uuids, _to_db_utc(now), _to_db_utc(bypass_expires_at),
+    )
+
+
+async def _log_fast_expiry_audit_bulk(conn, actor_id: int, expired: list) -> None:
+    """Аудит stage 3 пачкой: uuid_fast_deleted + vpn_expire на каждую строку.
+
+    Вызывать внутри транзакции UPDATE'а. Свой savepoint: сбой аудита не
+    откатывает переходы (как и _log_audit_event_atomic — never throws).
+    """
+    if not expired:
+        return
+    tids, previews, details_fd, details_lc = [], [], [], []
+    for row in expired:
+        uuid = row["uuid"]
+        preview = f"{uuid[:8]}..." if uuid and len(uuid) > 8 else (uuid or None)
+        exp = row["expires_at"].isoformat() if row["expires_at"] else None
+        tids.append(row["telegram_id"])
+        previews.append(preview)
+        details_fd.append(f"Fast-deleted expired UUID {preview}, expired_at={exp}")
+        details_lc.append(f"Subscription expired and UUID removed, expires_at={exp}")
+    try:
+        async with conn.transaction():
+            await conn.execute(
+                """INSERT INTO audit_log (action, telegram_id, target_user, details)
+                   SELECT 'uuid_fast_deleted', $1, t.tid, t.details
+                   FROM unnest($2::bigint[], $3::text[]) AS t(tid, details)""",
+                actor_id, tids, details_fd,
+            )
+            await conn.execute(
+                """INSERT INTO audit_log (action, telegram_id, target_user, uuid, source, result, details)
+                   SELECT 'vpn_expire', t.tid, t.tid, t.uuid, 'auto-expiry', 'success', t.details
+                   FROM unnest($1::bigint[], $2::text[], $3::text[]) AS t(tid, uuid, details)""",
+                tids, previews, details_lc,
+            )
+    except Exception as e:
+        logger.warning(f"fast expiry bulk audit failed (rows={len(tids)}): {e}")
+
+
 async def mark_trial_used(telegram_id: int, trial_expires_at: datetime) -> bool:
     """Пометить trial как использованный
     
@@ -3352,6 +3473,93 @@ async def get_subscriptions_for_reminders() -> list:
         return [_normalize_subscription_row(row) for row in rows]
 
 
+async def get_subscriptions_due_for_reminders(
+    now: datetime,
+    after: Optional[tuple] = None,
+    limit: int = 500,
+) -> Optional[list]:
+    """Страница подписок с next_reminder_due_at <= now (migration 080).
+
+    Keyset-пагинация по (next_reminder_due_at, telegram_id) через частичный
+    индекс idx_subscriptions_next_reminder_due: цена ∝ числу напоминаний
+    к отправке, а не размеру активной базы. after — (due_at, telegram_id)
+    последней строки предыдущей страницы.
+
+    Returns:
+        Список подписок в формате get_subscriptions_for_reminders;
+        None — колонки/индекса ещё нет (caller падает на полный скан).
+    """
+    if not _core.DB_READY:
+        logger.warning("DB not ready, get_subscriptions_due_for_reminders skipped")
+        return []
+    pool = await get_pool()
+    if pool is None:
+        logger.warning("Pool is None, get_subscriptions_due_for_reminders skipped")
+        return []
+    after_due, after_tid = after if after else (None, None)
+    async with pool.acquire() as conn:
+        try:
+            rows = await conn.fetch(
+                """
+                SELECT s.*,
+                       (SELECT action_type FROM subscription_history
+                        WHERE telegram_id = s.telegram_id
+                        ORDER BY created_at DESC LIMIT 1) as last_action_type
+                FROM subscriptions s
+                JOIN users u ON s.telegram_id = u.telegram_id
+                WHERE s.next_reminder_due_at IS NOT NULL
+                  AND s.next_reminder_due_at <= $1
+                  AND s.expires_at > $1
+                  AND COALESCE(u.is_reachable, TRUE) = TRUE
+                  AND ($2::timestamp IS NULL
+                       OR (s.next_reminder_due_at, s.telegram_id) > ($2::timestamp, $3::bigint))
+                ORDER BY s.next_reminder_due_at, s.telegram_id
+                LIMIT $4
+                """,
+                _to_db_utc(now),
+                _to_db_utc(after_due) if after_due is not None else None,
+                after_tid,
+                limit,
+            )
+        except asyncpg.UndefinedColumnError:
+            logger.warning("DB_SCHEMA_OUTDATED: next_reminder_due_at missing, reminders fall back to full scan")
+            return None
+        return [_normalize_subscription_row(row) for row in rows]
+
+
+async def reschedule_reminders(telegram_ids: List[int], now: datetime) -> int:
+    """Сдвинуть next_reminder_due_at на следующее окно для подписок, которые
+    воркер оценил в момент now и по которым ничего не отправил (окно не
+    подошло по типу подписки / флаг уже стоит). Без этого строка оставалась
+    бы «due» и выбиралась каждым тиком до конца окна."""
+    if not telegram_ids or not _core.DB_READY:
+        return 0
+    pool = await get_pool()
+    if pool is None:
+        return 0
+    async with pool.acquire() as conn:
+        try:
+            result = await conn.execute(
+                """
+                UPDATE subscriptions
+                SET next_reminder_due_at = subscription_next_reminder_due(
+                        expires_at, source, subscription_type,
+                        reminder_7d_sent, reminder_3d_sent, reminder_1d_sent,
+                        reminder_24h_sent, reminder_6h_sent, reminder_3h_sent,
+                        $2::timestamp, TRUE)
+                WHERE telegram_id = ANY($1::bigint[])
+                """,
+                list(telegram_ids),
+                _to_db_utc(now),
+            )
+        except (asyncpg.UndefinedColumnError, asyncpg.UndefinedFunctionError):
+            return 0
+    try:
+        return int(result.split()[-1])
+    except (ValueError, IndexError, AttributeError):
+        return 0
+
+
 async def get_admin_stats() -> Dict[str, int]:
     """Получить статистику для админ-дашборда
 
@@ -3438,7 +3646,7 @@ async def get_admin_referral_stats(
         logger.warning("DB not ready (degraded mode), get_admin_referral_stats skipped")
         return []
     
-    pool = await get_pool()
+    pool = await get_read_pool()
     if pool is None:
         return []
     
@@ -4420,7 +4628,8 @@ async def finalize_purchase(
     purchase_id: str,
     payment_provider: str,
     amount_rubles: float,
-    invoice_id: Optional[str] = None
+    invoice_id: Optional[str] = None,
+    remnawave_renew: bool = False,
 ) -> Dict[str, Any]:
     """
     ЕДИНАЯ ФУНКЦИЯ ФИНАЛИЗАЦИИ ПОКУПКИ (SINGLE SOURCE OF TRUTH)
@@ -4443,6 +4652,9 @@ async def finalize_purchase(
         payment_provider: 'telegram_payment', 'platega', 'telegram_stars', etc.
         amount_rubles: Сумма оплаты в рублях
         invoice_id: ID инвойса (опционально)
+        remnawave_renew: поставить renew bypass-юзера Remnawave в outbox в этой
+            же транзакции (не для trial/biz и combo; при выключенном outbox
+            вызывающий сам делает renew_remnawave_user_bg)
     
     Returns:
         {
@@ -4953,6 +5165,11 @@ async def finalize_purchase(
                     error_msg = f"grant_access returned None expires_at: purchase_id={purchase_id}, user={telegram_id}"
                     logger.error(f"finalize_purchase: {error_msg}")
                     raise Exception(error_msg)
+
+                # Remnawave bypass renew — outbox-строкой в этой же транзакции
+                _rmn_tariff = (tariff_type or "basic").strip().lower()
+                if remnawave_renew and not is_combo_purchase and _rmn_tariff not in ("trial",) + config.BIZ_TARIFFS:
+                    await enqueue_remnawave_renew(conn, telegram_id, _rmn_tariff, expires_at, period_days)
             
                 # Проверяем action для обработки pending activation
                 action = grant_result.get("action")
@@ -7,7 +7,6 @@ DB_READY accessed via _core.DB_READY to get live value (not stale import-time co
 import asyncpg
 import base64
 import hashlib
-import json
 import logging
 import uuid as uuid_lib
 from datetime import datetime, timedelta, timezone
@@ -19,6 +18,7 @@ from database.core import (
     _to_db_utc, _from_db_utc, _ensure_utc,
     retry_async,
 )
+from database.farm import FarmPlot, empty_farm_plot
 
 logger = logging.getLogger(__name__)
 
@@ -141,7 +141,7 @@ async def increase_balance(telegram_id: int, amount: float, source: str = "teleg
                 return False
 
 
-async def get_farm_data(telegram_id: int) -> Tuple[List[Dict[str, Any]], int, int]:
+async def get_farm_data(telegram_id: int) -> Tuple[List[FarmPlot], int, int]:
     """
     Получить данные фермы пользователя
     
@@ -167,54 +167,22 @@ async def get_farm_data(telegram_id: int) -> Tuple[List[Dict[str, Any]], int, in
         )
         if row is None:
             # Initialize default farm data
-            default_plots = []
-            for i in range(1):
-                default_plots.append({
-                    "plot_id": i,
-                    "status": "empty",
-                    "plant_type": None,
-                    "planted_at": None,
-                    "ready_at": None,
-                    "dead_at": None,
-                    "notified_ready": False,
-                    "notified_12h": False,
-                    "notified_dead": False,
-                    "water_used_at": None,
-                    "fertilizer_used_at": None
-                })
+            default_plots = [empty_farm_plot(0)]
             await conn.execute(
                 "INSERT INTO users (telegram_id, farm_plots, farm_plot_count, balance) VALUES ($1, $2::jsonb, $3, $4) ON CONFLICT (telegram_id) DO UPDATE SET farm_plots = $2::jsonb, farm_plot_count = $3",
-                telegram_id, json.dumps(default_plots), 1, 0
+                telegram_id, default_plots, 1, 0
             )
             return (default_plots, 1, 0)
         
-        farm_plots = row.get("farm_plots")
-        if farm_plots is None:
-            farm_plots = []
-        elif isinstance(farm_plots, str):
-            farm_plots = json.loads(farm_plots)
+        # jsonb-кодек пула уже отдал list[dict]
+        farm_plots: List[FarmPlot] = row["farm_plots"] or []
         
         # Ensure plot 0 always exists for every user (free first plot)
-        if not farm_plots or len(farm_plots) == 0:
-            default_plots = [
-                {
-                    "plot_id": 0,
-                    "status": "empty",
-                    "plant_type": None,
-                    "planted_at": None,
-                    "ready_at": None,
-                    "dead_at": None,
-                    "notified_ready": False,
-                    "notified_12h": False,
-                    "notified_dead": False,
-                    "water_used_at": None,
-                    "fertilizer_used_at": None,
-                }
-            ]
-            farm_plots = default_plots
+        if not farm_plots:
+            farm_plots = [empty_farm_plot(0)]
             await conn.execute(
                 "UPDATE users SET farm_plots = $1::jsonb, farm_plot_count = 1 WHERE telegram_id = $2",
-                json.dumps(farm_plots), telegram_id
+                farm_plots, telegram_id
             )
         
         plot_count = row.get("farm_plot_count", 1)
@@ -225,7 +193,7 @@ async def get_farm_data(telegram_id: int) -> Tuple[List[Dict[str, Any]], int, in
         return (farm_plots, plot_count, balance)
 
 
-async def save_farm_plots(telegram_id: int, farm_plots: List[Dict[str, Any]]) -> None:
+async def save_farm_plots(telegram_id: int, farm_plots: List[FarmPlot]) -> None:
     """
     Сохранить данные грядок пользователя
     
@@ -245,7 +213,7 @@ async def save_farm_plots(telegram_id: int, farm_plots: List[Dict[str, Any]]) ->
     async with pool.acquire() as conn:
         await conn.execute(
             "UPDATE users SET farm_plots = $1::jsonb WHERE telegram_id = $2",
-            json.dumps(farm_plots), telegram_id
+            farm_plots, telegram_id
         )
 
 
@@ -291,12 +259,18 @@ async def get_users_with_active_farm() -> List[Dict[str, Any]]:
         return []
     
     async with pool.acquire() as conn:
+        # Фильтр по статусу в SQL: у каждого игрока есть грядка 0, и без
+        # него сюда попадали все фермы, включая пустые.
         rows = await conn.fetch(
-            """SELECT telegram_id, farm_plots, farm_plot_count 
-               FROM users 
-               WHERE farm_plots != '[]'::jsonb 
-                 AND farm_plots IS NOT NULL
-                 AND jsonb_array_length(farm_plots) > 0"""
+            """SELECT telegram_id, farm_plots, farm_plot_count
+               FROM users
+               WHERE farm_plots IS NOT NULL
+                 AND jsonb_typeof(farm_plots) = 'array'
+                 AND EXISTS (
+                     SELECT 1
+                     FROM jsonb_array_elements(farm_plots) p
+                     WHERE p->>'status' IN ('growing', 'ready')
+                 )"""
         )
         return [dict(row) for row in rows]
 
@@ -632,18 +606,98 @@ async def find_user_by_id_or_username(telegram_id: Optional[int] = None, usernam
             return None
 
 
+_SEARCH_COLUMNS = """u.telegram_id,
+           u.username,
+           u.language,
+           u.created_at"""
+
+# has_active_sub считается только для строк, прошедших LIMIT.
+_SEARCH_WRAP = """SELECT r.*,
+           EXISTS (
+               SELECT 1 FROM subscriptions s
+               WHERE s.telegram_id = r.telegram_id
+                 AND s.status = 'active'
+                 AND s.expires_at > NOW()
+           ) AS has_active_sub
+       FROM ({inner}) r"""
+
+# Короче — подстрока по trigram-индексу не работает (нет ни одной
+# триграммы), такие запросы идут только по префиксу.
+SEARCH_TRGM_MIN_LEN = 3
+
+
+def _prefix_upper_bound(prefix: str) -> str:
+    """Наименьшая строка больше всех строк с префиксом `prefix`
+    (в побайтовом порядке text_pattern_ops)."""
+    return prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+
+def _like_escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def build_user_search_query(query: str, limit: int = 25) -> Optional[Tuple[str, list]]:
+    """SQL + args для search_users_dashboard (None — пустой запрос).
+
+    Путь выбирается по строке так, чтобы каждый шёл по индексу из
+    миграции 081 и останавливался после `limit` строк:
+      * только цифры → префикс telegram_id::text;
+      * 1-2 символа  → префикс lower(username);
+      * 3+ символа   → сначала префикс lower(username), затем (если
+        не набралось limit) подстрока username ILIKE по GIN pg_trgm.
+    Префиксы — range `~>=~ / ~<~` + ORDER BY ... USING ~<~: btree
+    text_pattern_ops отдаёт строки уже в нужном порядке, и индекс
+    берётся даже в generic-плане prepared statement'а (LIKE $1 — нет).
+    Ветки склеены UNION ALL под общим LIMIT: Append исполняет их по
+    очереди, и если префикс набрал limit, trigram-ветка не запускается.
+    """
+    q = (query or "").strip().lstrip("@")
+    if not q:
+        return None
+    if q.isdigit():
+        inner = f"""SELECT {_SEARCH_COLUMNS}
+               FROM users u
+               WHERE u.telegram_id::text ~>=~ $1
+                 AND u.telegram_id::text ~<~ $2
+               ORDER BY u.telegram_id::text USING ~<~
+               LIMIT $3"""
+        return _SEARCH_WRAP.format(inner=inner), [q, _prefix_upper_bound(q), limit]
+    q_lower = q.lower()
+    prefix = f"""(SELECT {_SEARCH_COLUMNS}
+               FROM users u
+               WHERE u.username IS NOT NULL
+                 AND lower(u.username) ~>=~ $1
+                 AND lower(u.username) ~<~ $2
+               ORDER BY lower(u.username) USING ~<~
+               LIMIT $3)"""
+    if len(q) < SEARCH_TRGM_MIN_LEN:
+        return _SEARCH_WRAP.format(inner=prefix), [q_lower, _prefix_upper_bound(q_lower), limit]
+    inner = f"""{prefix}
+           UNION ALL
+           (SELECT {_SEARCH_COLUMNS}
+               FROM users u
+               WHERE u.username ILIKE $4
+                 AND NOT (lower(u.username) ~>=~ $1 AND lower(u.username) ~<~ $2)
+               ORDER BY u.created_at DESC NULLS LAST
+               LIMIT $3)
+           LIMIT $3"""
+    return _SEARCH_WRAP.format(inner=inner), [
+        q_lower, _prefix_upper_bound(q_lower), limit, f"%{_like_escape(q)}%",
+    ]
+
+
 async def search_users_dashboard(query: str, limit: int = 25) -> list:
-    """Substring search across all users for the admin dashboard.
-
-    Matches either telegram_id (treated as text, so prefix typing
-    works) or username (case-insensitive substring). Returns up to
-    `limit` rows ranked by relevance:
-        1. exact telegram_id  → top
-        2. exact username (case-insensitive)
-        3. telegram_id / username starting with `q`
-        4. anywhere-substring
-    Tie-break by newest first so freshly registered users surface
-    above stale ghosts.
+    """Search across all users for the admin dashboard.
+
+    Digits match telegram_id by prefix (typing "123" finds
+    tg:1234567890); text matches username — by prefix for 1-2
+    characters, case-insensitive substring from 3 (pg_trgm).
+    See build_user_search_query for the index behind each path.
+    Returns up to `limit` rows ranked by relevance:
+        1. telegram_id / username starting with `q`, in index order
+           (an exact match sorts first)
+        2. anywhere-substring, newest first so freshly registered
+           users surface above stale ghosts.
 
     Each row carries the minimum the UI needs to render a result
     list: telegram_id, username, language, created_at, and a
@@ -652,39 +706,12 @@ async def search_users_dashboard(query: str, limit: int = 25) -> list:
     pool = await get_pool()
     if pool is None:
         return []
-    q = (query or "").strip().lstrip("@")
-    if not q:
+    built = build_user_search_query(query, limit)
+    if built is None:
         return []
-    pattern_any = f"%{q}%"
-    pattern_prefix = f"{q}%"
+    sql, args = built
     async with pool.acquire() as conn:
-        rows = await conn.fetch(
-            """SELECT
-                   u.telegram_id,
-                   u.username,
-                   u.language,
-                   u.created_at,
-                   EXISTS (
-                       SELECT 1 FROM subscriptions s
-                       WHERE s.telegram_id = u.telegram_id
-                         AND s.status = 'active'
-                         AND s.expires_at > NOW()
-                   ) AS has_active_sub
-               FROM users u
-               WHERE CAST(u.telegram_id AS TEXT) ILIKE $1
-                  OR u.username ILIKE $1
-               ORDER BY
-                   CASE
-                       WHEN CAST(u.telegram_id AS TEXT) = $2 THEN 0
-                       WHEN LOWER(u.username) = LOWER($2) THEN 1
-                       WHEN CAST(u.telegram_id AS TEXT) ILIKE $3 THEN 2
-                       WHEN u.username ILIKE $3 THEN 3
-                       ELSE 4
-                   END,
-                   u.created_at DESC NULLS LAST
-               LIMIT $4""",
-            pattern_any, q, pattern_prefix, limit,
-        )
+        rows = await conn.fetch(sql, *args)
     return [dict(r) for r in rows]
 
 
@@ -1976,13 +2003,39 @@ async def process_referral_reward(
 
 
 async def update_user_language(telegram_id: int, language: str):
-    """Обновить язык пользователя"""
+    """Обновить язык пользователя (и сбросить кеш language_service)"""
     pool = await get_pool()
     async with pool.acquire() as conn:
         await conn.execute(
             "UPDATE users SET language = $1 WHERE telegram_id = $2",
             language, telegram_id
         )
+    try:
+        from app.services.language_service import invalidate_user_language
+        await invalidate_user_language(telegram_id)
+    except Exception:
+        pass
+
+
+async def get_user_languages(telegram_ids: List[int]) -> Dict[int, Optional[str]]:
+    """Язык для набора пользователей одним запросом.
+
+    Только существующие пользователи попадают в результат; language может
+    быть None (колонка не заполнена).
+    """
+    if not telegram_ids:
+        return {}
+    if not _core.DB_READY:
+        return {}
+    pool = await get_pool()
+    if pool is None:
+        return {}
+    async with pool.acquire() as conn:
+        rows = await conn.fetch(
+            "SELECT telegram_id, language FROM users WHERE telegram_id = ANY($1::bigint[])",
+            list(telegram_ids),
+        )
+    return {int(r["telegram_id"]): r["language"] for r in rows}
 
 
 async def update_username(telegram_id: int, username: Optional[str]):
@@ -9,13 +9,28 @@ Fast Expiry Cleanup - автоматическое отключение истё
 - Использует UTC время для сравнения дат
 - Идемпотентна (безопасно запускать несколько раз)
 - Устойчива к сетевым ошибкам (повтор в следующем цикле)
+
+Конвейер по чанкам (BATCH_SIZE строк):
+1. Stage 1 — один set-based SELECT (database.fetch_expired_for_cleanup):
+   истёкшие активные подписки с UUID, без пользователей с активной
+   платной подпиской.
+2. Stage 2 — снятие UUID на панели параллельно, не больше
+   REMOVAL_CONCURRENCY запросов одновременно, под-чанками по REMOVAL_CHUNK.
+3. Stage 3 — переходы под-чанка (expired / bypass-only) одним UPDATE
+   (database.expire_subscriptions_bulk) + аудит пачкой в той же транзакции.
+Stage 2+3 под-чанка идут одной shielded-задачей: снятые на панели UUID
+всегда доезжают до БД, даже если итерацию оборвал внешний таймаут.
+Бюджет MAX_ITERATION_SECONDS проверяется и внутри stage 2 — после дедлайна
+новые запросы к панели не начинаются (строки подберёт следующий цикл).
+Уведомления bypass-only уходят фоновой задачей и не держат итерацию.
 """
 import asyncio
 import logging
 import os
 import random
 import time
-from datetime import datetime, timezone
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional
 import asyncpg
 import database
 import config
@@ -25,17 +40,25 @@ from app.utils.logging_helpers import (
     log_worker_iteration_end,
     classify_error,
 )
-from app.core.cooperative_yield import cooperative_yield
 from app.core.pool_monitor import acquire_connection
 from app.utils.telegram_safe import safe_send_message
-from app.services.language_service import resolve_user_language
+from app.services.language_service import resolve_languages
+from app.core.telegram_scheduler import Priority, send_priority
 from app import i18n
 
 logger = logging.getLogger(__name__)
 
 # Event loop protection: max iteration time (prevents 300s blocking)
 MAX_ITERATION_SECONDS = int(os.getenv("FAST_EXPIRY_MAX_ITERATION_SECONDS", "15"))
-BATCH_SIZE = 100
+BATCH_SIZE = 500
+# Stage 2: одновременных запросов к панели на снятие UUID
+REMOVAL_CONCURRENCY = max(1, int(os.getenv("FAST_EXPIRY_REMOVAL_CONCURRENCY", "8")))
+# Stage 2+3: строк на под-чанк (снятие на панели → UPDATE в БД)
+REMOVAL_CHUNK = max(REMOVAL_CONCURRENCY, int(os.getenv("FAST_EXPIRY_REMOVAL_CHUNK", "50")))
+# Фоновая рассылка bypass-only уведомлений (темп всё равно задаёт telegram_scheduler)
+NOTIFY_CONCURRENCY = 5
+# Bypass-only: Xray снят, Remnawave-трафик живёт «бессрочно»
+BYPASS_ONLY_DAYS = 3650
 _worker_lock = asyncio.Lock()
 
 # Интервал проверки: 1-5 минут (настраивается через переменную окружения)
@@ -49,6 +72,220 @@ CLEANUP_INTERVAL_SECONDS = max(60, min(300, CLEANUP_INTERVAL_SECONDS))
 MINIMUM_SAFE_SLEEP_ON_FAILURE = 10  # seconds
 
 
+# Фоновые задачи уведомлений (strong refs, чтобы GC не снял их на полпути)
+_notify_tasks: set = set()
+# Под-чанки stage 2+3, переживающие отмену итерации (strong refs)
+_chunk_tasks: set = set()
+
+
+def _uuid_preview(uuid) -> str:
+    return f"{uuid[:8]}..." if uuid and len(uuid) > 8 else (uuid or "N/A")
+
+
+async def _remove_one(row, semaphore: asyncio.Semaphore, deadline: Optional[float] = None) -> bool:
+    """Stage 2 для одной строки. True → UUID снят (или API выключен) и строку можно переводить в БД.
+
+    deadline (time.monotonic()): после него новый запрос к панели не начинается.
+    """
+    telegram_id = row["telegram_id"]
+    uuid = row["uuid"]
+    expires_at = row["expires_at"]
+    uuid_preview = _uuid_preview(uuid)
+    async with semaphore:
+        if deadline is not None and time.monotonic() >= deadline:
+            logger.debug(
+                f"cleanup: DEADLINE_SKIP [user={telegram_id}, uuid={uuid_preview}] - will retry in next cycle"
+            )
+            return False
+        try:
+            logger.info(
+                f"cleanup: REMOVING_UUID [user={telegram_id}, uuid={uuid_preview}, "
+                f"expires_at={expires_at.isoformat() if expires_at else None}]"
+            )
+            uuid_removed = await vpn_service.remove_uuid_if_needed(
+                uuid=uuid,
+                subscription_status='active',
+                subscription_expired=True
+            )
+        except vpn_service.VPNRemovalError as e:
+            logger.error(
+                f"cleanup: VPN_REMOVAL_ERROR [user={telegram_id}, uuid={uuid_preview}, error={str(e)}, "
+                f"error_type={type(e).__name__}] - will retry in next cycle"
+            )
+            try:
+                await database._log_vpn_lifecycle_audit_async(
+                    action="vpn_expire",
+                    telegram_id=telegram_id,
+                    uuid=uuid,
+                    source="auto-expiry",
+                    result="error",
+                    details=f"Failed to remove UUID via VPN API: {str(e)}, will retry"
+                )
+            except Exception:
+                pass
+            return False
+        except ValueError as e:
+            logger.error(
+                f"cleanup: VALUE_ERROR [user={telegram_id}, uuid={uuid_preview}, error={str(e)}]"
+            )
+            return False
+        except Exception as e:
+            logger.error(
+                f"cleanup: UNEXPECTED_ERROR [user={telegram_id}, uuid={uuid_preview}, "
+                f"error={str(e)}, error_type={type(e).__name__}] - will retry in next cycle"
+            )
+            logger.exception(f"cleanup: EXCEPTION_TRACEBACK [user={telegram_id}, uuid={uuid_preview}]")
+            return False
+
+    if uuid_removed:
+        logger.info(f"cleanup: VPN_API_REMOVED [user={telegram_id}, uuid={uuid_preview}]")
+        return True
+    if not vpn_service.is_vpn_api_available():
+        logger.warning(
+            f"cleanup: VPN_API_DISABLED [user={telegram_id}, uuid={uuid_preview}] - "
+            "VPN API is not configured, UUID removal skipped but DB will be cleaned"
+        )
+        return True
+    logger.debug(
+        f"cleanup: UUID_REMOVAL_SKIPPED [user={telegram_id}, uuid={uuid_preview}] - "
+        "Service layer decided not to remove UUID"
+    )
+    return False
+
+
+async def _remove_uuids(rows, deadline: Optional[float] = None) -> List:
+    """Stage 2: снятие UUID на панели для чанка с ограниченным параллелизмом."""
+    if not rows:
+        return []
+    semaphore = asyncio.Semaphore(REMOVAL_CONCURRENCY)
+    results = await asyncio.gather(*(_remove_one(row, semaphore, deadline) for row in rows))
+    return [row for row, ok in zip(rows, results) if ok]
+
+
+async def _apply_transitions(pool, rows, now_utc: datetime) -> List:
+    """Stage 3: один UPDATE на чанк + аудит пачкой в той же транзакции.
+
+    Returns: строки реально перешедших подписок (см. expire_subscriptions_bulk).
+    """
+    if not rows:
+        return []
+    items = [(row["telegram_id"], row["uuid"]) for row in rows]
+    # POOL_STABILITY: DB update with dedicated short-lived conn (no conn held during HTTP).
+    try:
+        async with acquire_connection(pool, "fast_expiry_update") as conn:
+            async with conn.transaction():
+                expired = await database.expire_subscriptions_bulk(
+                    conn, items, now_utc, now_utc + timedelta(days=BYPASS_ONLY_DAYS)
+                )
+                await database._log_fast_expiry_audit_bulk(conn, config.ADMIN_TELEGRAM_ID, expired)
+                if database.outbox_enabled():
+                    # Extend Remnawave для bypass-only — outbox-строками в этой же транзакции
+                    await database.enqueue_remnawave_ops(
+                        conn, [(row["telegram_id"], "extend_bypass", None) for row in expired if row["bypass_only"]],
+                    )
+    except (asyncpg.PostgresError, asyncio.TimeoutError) as e:
+        logger.warning(f"fast_expiry_cleanup: Database temporarily unavailable during DB update: {type(e).__name__}: {str(e)[:100]}")
+        return []
+    except Exception as e:
+        logger.error(f"fast_expiry_cleanup: Unexpected error during DB update: {type(e).__name__}: {str(e)[:100]}")
+        logger.debug("fast_expiry_cleanup: Full traceback for DB update", exc_info=True)
+        return []
+
+    done = {(row["telegram_id"], row["uuid"]) for row in expired}
+    for telegram_id, uuid in items:
+        if (telegram_id, uuid) not in done:
+            logger.warning(
+                f"cleanup: SKIP_RENEWED_OR_CLEANED [user={telegram_id}, uuid={_uuid_preview(uuid)}] - "
+                "subscription was renewed or UUID updated by another process"
+            )
+    for row in expired:
+        uuid_preview = _uuid_preview(row["uuid"])
+        expires_at = row["expires_at"].isoformat() if row["expires_at"] else None
+        if row["bypass_only"]:
+            logger.info(
+                f"cleanup: TRANSITION_TO_BYPASS_ONLY [user={row['telegram_id']}, uuid={uuid_preview}] "
+                f"— Remnawave stays active, Xray removed"
+            )
+        logger.info(
+            f"cleanup: SUBSCRIPTION_EXPIRED [user={row['telegram_id']}, uuid={uuid_preview}, "
+            f"expires_at={expires_at}]"
+        )
+    return expired
+
+
+async def _process_chunk(pool, bot, rows, now_utc: datetime, deadline: float) -> List:
+    """Stage 2 + Stage 3 для под-чанка: переходы применяются ко всем UUID,
+    которые успели снять на панели."""
+    removed = await _remove_uuids(rows, deadline)
+    expired = await _apply_transitions(pool, removed, now_utc)
+    _after_transitions(bot, expired)
+    return expired
+
+
+async def _process_batch(pool, bot, batch, now_utc: datetime, deadline: float) -> None:
+    """Stage 2+3 по под-чанкам REMOVAL_CHUNK с проверкой дедлайна между ними.
+
+    Каждый под-чанк — отдельная задача под asyncio.shield: отмена итерации
+    (wait_for) не обрывает её между снятием на панели и UPDATE в БД, иначе
+    строки остались бы 'active' и снимались бы заново каждый цикл.
+    """
+    for start in range(0, len(batch), REMOVAL_CHUNK):
+        if time.monotonic() >= deadline:
+            logger.warning("Fast expiry cleanup iteration time limit reached inside stage 2, breaking early")
+            return
+        task = asyncio.create_task(
+            _process_chunk(pool, bot, batch[start:start + REMOVAL_CHUNK], now_utc, deadline)
+        )
+        _chunk_tasks.add(task)
+        task.add_done_callback(_chunk_tasks.discard)
+        await asyncio.shield(task)
+
+
+def _after_transitions(bot, expired) -> None:
+    """Побочные эффекты после commit: уведомления bypass-only (и продление
+    Remnawave, если outbox выключен)."""
+    bypass_ids = [row["telegram_id"] for row in expired if row["bypass_only"]]
+    if not bypass_ids:
+        return
+    if not database.outbox_enabled():
+        # С outbox продление уже поставлено в _apply_transitions.
+        try:
+            from app.services.remnawave_service import extend_remnawave_for_bypass_bg
+            for telegram_id in bypass_ids:
+                # Extend Remnawave expiry so bypass keeps working
+                extend_remnawave_for_bypass_bg(telegram_id)
+        except Exception as rmn_err:
+            logger.warning(f"REMNAWAVE_BYPASS_EXTEND_FAIL: users={len(bypass_ids)} {rmn_err}")
+    if bot:
+        # Отдельной задачей: таймаут итерации не должен обрывать рассылку.
+        task = asyncio.create_task(_notify_bypass_only(bot, bypass_ids))
+        _notify_tasks.add(task)
+        task.add_done_callback(_notify_tasks.discard)
+
+
+async def _notify_bypass_only(bot, telegram_ids: List[int]) -> None:
+    from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
+
+    langs = await resolve_languages(telegram_ids)
+    semaphore = asyncio.Semaphore(NOTIFY_CONCURRENCY)
+
+    async def _send(telegram_id: int) -> None:
+        async with semaphore:
+            try:
+                lang = langs.get(telegram_id, "ru")
+                bypass_text = i18n.get_text(lang, "traffic.subscription_expired_bypass_active")
+                bypass_kb = InlineKeyboardMarkup(inline_keyboard=[
+                    [InlineKeyboardButton(text=i18n.get_text(lang, "traffic.buy_traffic_btn"), callback_data="buy_traffic")],
+                    [InlineKeyboardButton(text=i18n.get_text(lang, "traffic.buy_subscription"), callback_data="menu_buy_vpn")],
+                ])
+                await safe_send_message(bot, telegram_id, bypass_text, parse_mode="HTML", reply_markup=bypass_kb)
+            except Exception as notif_err:
+                logger.warning(f"cleanup: failed to send bypass-only notification to {telegram_id}: {notif_err}")
+
+    with send_priority(Priority.REMINDER):
+        await asyncio.gather(*(_send(tid) for tid in telegram_ids))
+
+
 async def fast_expiry_cleanup_task(bot=None):
     """
     Fast Expiry Cleanup Task
@@ -56,15 +293,15 @@ async def fast_expiry_cleanup_task(bot=None):
     Автоматическая фоновая задача для отключения истёкших VPN подписок.
     Работает асинхронно, не блокирует основной event loop бота.
     
-    Логика:
+    Логика (по чанкам, см. docstring модуля):
     1. Находит все подписки где:
        - status = 'active'
        - expires_at (subscription_end) < текущее UTC время
        - uuid IS NOT NULL
-    2. Для каждой подписки:
-       - Вызывает POST {XRAY_API_URL}/remove-user/{uuid} с заголовком X-API-Key
-       - Если API вызов успешен - обновляет статус на 'expired' и очищает uuid/vpn_key
-    3. Защита от повторного удаления: проверка что UUID всё ещё существует перед обновлением БД
+       - у пользователя нет активной платной подписки
+    2. Для чанка параллельно снимает UUID на панели (REMOVAL_CONCURRENCY)
+    3. Снятые UUID переводит в 'expired' / bypass-only одним UPDATE;
+       guard в UPDATE: UUID не сменился и подписка не продлена
     4. При ошибке сети - НЕ очищает БД, повторит в следующем цикле
     
     Идемпотентность:
@@ -158,264 +395,40 @@ async def fast_expiry_cleanup_task(bot=None):
 
                     try:
                         last_seen_id = 0
+                        deadline = time.monotonic() + MAX_ITERATION_SECONDS
                         while True:
-                            # POOL_STABILITY: Fetch batch with short-lived conn; release immediately (no HTTP inside).
+                            if time.monotonic() >= deadline:
+                                logger.warning("Fast expiry cleanup iteration time limit reached, breaking early")
+                                break
+
+                            # Stage 1: одна keyset-страница; paid-пользователи отсечены в SQL.
+                            # POOL_STABILITY: short-lived conn, no HTTP inside.
                             async with acquire_connection(pool, "fast_expiry_fetch") as conn:
-                                rows = await conn.fetch(
-                                    """SELECT id, telegram_id, uuid, vpn_key, expires_at, status, source 
-                                       FROM subscriptions 
-                                       WHERE status = 'active'
-                                       AND expires_at < $1
-                                       AND uuid IS NOT NULL
-                                       AND id > $2
-                                       ORDER BY id ASC
-                                       LIMIT $3""",
-                                    database._to_db_utc(now_utc), last_seen_id, BATCH_SIZE
+                                rows = await database.fetch_expired_for_cleanup(
+                                    conn, now_utc, last_seen_id, BATCH_SIZE
                                 )
                             if not rows:
                                 break
-
+                            last_seen_id = rows[-1]["id"]
                             logger.info(f"cleanup: FOUND_EXPIRED [count={len(rows)}]")
-                            loop_start = time.monotonic()
-                            for i, row in enumerate(rows):
-                                if i > 0 and i % 20 == 0:
-                                    await cooperative_yield()
-                                if time.monotonic() - loop_start > MAX_ITERATION_SECONDS:
-                                    logger.warning("Fast expiry cleanup iteration time limit reached, breaking early")
-                                    break
-                                items_processed += 1
-                                telegram_id = row["telegram_id"]
-                                uuid = row["uuid"]
-                                expires_at = row["expires_at"]
-                                source = row.get("source", "unknown")
-
-                                # ЗАЩИТА: Проверяем что подписка действительно истекла (используем UTC)
-                                expires_at_aware = database._from_db_utc(expires_at) if expires_at else None
-                                if expires_at_aware is not None and expires_at_aware >= now_utc:
-                                    logger.warning(
-                                        f"cleanup: SKIP_NOT_EXPIRED [user={telegram_id}, expires_at={expires_at.isoformat()}, "
-                                        f"now={now_utc.isoformat()}]"
-                                    )
-                                    continue
-
-                                # Canonical guard: paid subscription ALWAYS overrides trial (short-lived conn only).
-                                async with acquire_connection(pool, "fast_expiry_paid_check") as conn_check:
-                                    active_paid = await database.get_active_paid_subscription(conn_check, telegram_id, now_utc)
-                                if active_paid:
-                                    paid_expires_at = active_paid["expires_at"]
-                                    logger.info(
-                                        f"SKIP_TRIAL_EXPIRY_PAID_USER: user_id={telegram_id}, "
-                                        f"trial_expires_at={expires_at.isoformat() if expires_at else None}, "
-                                        f"paid_expires_at={paid_expires_at.isoformat() if paid_expires_at else None}, "
-                                        f"expired_subscription_source={source} - "
-                                        "User has active paid subscription, skipping expired subscription cleanup"
-                                    )
-                                    continue
 
+                            batch = []
+                            for row in rows:
+                                uuid = row["uuid"]
                                 if uuid in processing_uuids:
-                                    uuid_preview = f"{uuid[:8]}..." if uuid and len(uuid) > 8 else (uuid or "N/A")
                                     logger.debug(
-                                        f"cleanup: SKIP_ALREADY_PROCESSING [user={telegram_id}, uuid={uuid_preview}] - "
+                                        f"cleanup: SKIP_ALREADY_PROCESSING [user={row['telegram_id']}, uuid={_uuid_preview(uuid)}] - "
                                         "UUID already being processed"
                                     )
                                     continue
-
                                 processing_uuids.add(uuid)
-                                uuid_preview = f"{uuid[:8]}..." if uuid and len(uuid) > 8 else (uuid or "N/A")
-
-                                try:
-                                    logger.info(
-                                        f"cleanup: REMOVING_UUID [user={telegram_id}, uuid={uuid_preview}, "
-                                        f"expires_at={expires_at.isoformat()}]"
-                                    )
-                                    # POOL_STABILITY: VPN HTTP call OUTSIDE any DB connection.
-                                    uuid_removed = await vpn_service.remove_uuid_if_needed(
-                                        uuid=uuid,
-                                        subscription_status='active',
-                                        subscription_expired=True
-                                    )
-                                    if uuid_removed:
-                                        logger.info(f"cleanup: VPN_API_REMOVED [user={telegram_id}, uuid={uuid_preview}]")
-                                    else:
-                                        vpn_api_disabled = not vpn_service.is_vpn_api_available()
-                                        if vpn_api_disabled:
-                                            logger.warning(
-                                                f"cleanup: VPN_API_DISABLED [user={telegram_id}, uuid={uuid_preview}] - "
-                                                "VPN API is not configured, UUID removal skipped but DB will be cleaned"
-                                            )
-                                        else:
-                                            logger.debug(
-                                                f"cleanup: UUID_REMOVAL_SKIPPED [user={telegram_id}, uuid={uuid_preview}] - "
-                                                "Service layer decided not to remove UUID"
-                                            )
-                                            processing_uuids.discard(uuid)
-                                            continue
-
-                                    try:
-                                        await database._log_vpn_lifecycle_audit_async(
-                                            action="vpn_expire",
-                                            telegram_id=telegram_id,
-                                            uuid=uuid,
-                                            source="auto-expiry",
-                                            result="success",
-                                            details=f"Auto-expired subscription, expires_at={expires_at.isoformat()}"
-                                        )
-                                    except Exception as e:
-                                        logger.warning(f"Failed to log VPN expire audit (non-blocking): {e}")
-
-                                    # POOL_STABILITY: DB update with dedicated short-lived conn (no conn held during HTTP).
-                                    try:
-                                        async with acquire_connection(pool, "fast_expiry_update") as conn:
-                                            async with conn.transaction():
-                                                check_row = await conn.fetchrow(
-                                                    """SELECT uuid, expires_at, status 
-                                                       FROM subscriptions 
-                                                       WHERE telegram_id = $1 
-                                                       AND uuid = $2 
-                                                       AND status = 'active'""",
-                                                    telegram_id, uuid
-                                                )
-                                                if check_row:
-                                                    check_expires_at = database._from_db_utc(check_row["expires_at"]) if check_row["expires_at"] else None
-                                                    if check_expires_at is not None and check_expires_at >= now_utc:
-                                                        logger.warning(
-                                                            f"cleanup: SKIP_RENEWED [user={telegram_id}, uuid={uuid_preview}, "
-                                                            f"expires_at={check_expires_at.isoformat()}] - subscription was renewed"
-                                                        )
-                                                    else:
-                                                        # Check if user has Remnawave bypass traffic
-                                                        # If yes: transition to bypass-only (keep Remnawave active)
-                                                        has_remnawave = await conn.fetchval(
-                                                            "SELECT remnawave_uuid FROM subscriptions WHERE telegram_id = $1 AND remnawave_uuid IS NOT NULL",
-                                                            telegram_id,
-                                                        )
-
-                                                        if has_remnawave:
-                                                            # Bypass GB must keep working — transition to bypass-only
-                                                            from datetime import timedelta
-                                                            far_future = database._to_db_utc(now_utc + timedelta(days=3650))
-                                                            update_result = await conn.execute(
-                                                                """UPDATE subscriptions
-                                                                   SET uuid = NULL, vpn_key = NULL, vpn_key_plus = NULL,
-                                                                       is_bypass_only = TRUE,
-                                                                       expires_at = $3,
-                                                                       source = 'bypass_only'
-                                                                   WHERE telegram_id = $1
-                                                                   AND uuid = $2
-                                                                   AND status = 'active'""",
-                                                                telegram_id, uuid, far_future,
-                                                            )
-                                                            if update_result == "UPDATE 1":
-                                                                logger.info(
-                                                                    f"cleanup: TRANSITION_TO_BYPASS_ONLY [user={telegram_id}, uuid={uuid_preview}] "
-                                                                    f"— Remnawave stays active, Xray removed"
-                                                                )
-                                                                # Extend Remnawave expiry so bypass keeps working
-                                                                try:
-                                                                    from app.services.remnawave_service import extend_remnawave_for_bypass_bg
-                                                                    extend_remnawave_for_bypass_bg(telegram_id)
-                                                                except Exception as rmn_err:
-                                                                    logger.warning(f"REMNAWAVE_BYPASS_EXTEND_FAIL: tg={telegram_id} {rmn_err}")
-                                                                # Notify user
-                                                                if bot:
-                                                                    try:
-                                                                        from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
-                                                                        lang = await resolve_user_language(telegram_id)
-                                                                        bypass_text = i18n.get_text(lang, "traffic.subscription_expired_bypass_active")
-                                                                        bypass_kb = InlineKeyboardMarkup(inline_keyboard=[
-                                                                            [InlineKeyboardButton(text=i18n.get_text(lang, "traffic.buy_traffic_btn"), callback_data="buy_traffic")],
-                                                                            [InlineKeyboardButton(text=i18n.get_text(lang, "traffic.buy_subscription"), callback_data="menu_buy_vpn")],
-                                                                        ])
-                                                                        await safe_send_message(bot, telegram_id, bypass_text, parse_mode="HTML", reply_markup=bypass_kb)
-                                                                    except Exception as notif_err:
-                                                                        logger.warning(f"cleanup: failed to send bypass-only notification to {telegram_id}: {notif_err}")
-                                                        else:
-                                                            update_result = await conn.execute(
-                                                                """UPDATE subscriptions
-                                                                   SET status = 'expired', uuid = NULL, vpn_key = NULL
-                                                                   WHERE telegram_id = $1
-                                                                   AND uuid = $2
-                                                                   AND status = 'active'""",
-                                                                telegram_id, uuid
-                                                            )
-                                                        if update_result == "UPDATE 1":
-                                                            logger.info(
-                                                                f"cleanup: SUBSCRIPTION_EXPIRED [user={telegram_id}, uuid={uuid_preview}, "
-                                                                f"expires_at={expires_at.isoformat()}]"
-                                                            )
-                                                            import config
-                                                            await database._log_audit_event_atomic(
-                                                                conn,
-                                                                "uuid_fast_deleted",
-                                                                config.ADMIN_TELEGRAM_ID,
-                                                                telegram_id,
-                                                                f"Fast-deleted expired UUID {uuid_preview}, expired_at={expires_at.isoformat()}"
-                                                            )
-                                                            try:
-                                                                await database._log_vpn_lifecycle_audit_async(
-                                                                    action="vpn_expire",
-                                                                    telegram_id=telegram_id,
-                                                                    uuid=uuid,
-                                                                    source="auto-expiry",
-                                                                    result="success",
-                                                                    details=f"Subscription expired and UUID removed, expires_at={expires_at.isoformat()}"
-                                                                )
-                                                            except Exception as e:
-                                                                logger.warning(f"Failed to log VPN expire audit (non-blocking): {e}")
-                                                            logger.info(
-                                                                f"cleanup: SUCCESS [user={telegram_id}, uuid={uuid_preview}, "
-                                                                f"expires_at={expires_at.isoformat()}]"
-                                                            )
-                                                        else:
-                                                            logger.warning(
-                                                                f"cleanup: UPDATE_FAILED [user={telegram_id}, uuid={uuid_preview}, "
-                                                                f"update_result={update_result}] - UUID may have been updated by another process"
-                                                            )
-                                                else:
-                                                    logger.debug(
-                                                        f"cleanup: UUID_ALREADY_CLEANED [user={telegram_id}, uuid={uuid_preview}] - "
-                                                        "UUID was already removed or subscription is no longer active"
-                                                    )
-                                    except (asyncpg.PostgresError, asyncio.TimeoutError) as e:
-                                        logger.warning(f"fast_expiry_cleanup: Database temporarily unavailable during DB update: {type(e).__name__}: {str(e)[:100]}")
-                                    except Exception as e:
-                                        logger.error(f"fast_expiry_cleanup: Unexpected error during DB update: {type(e).__name__}: {str(e)[:100]}")
-                                        logger.debug(f"fast_expiry_cleanup: Full traceback for DB update", exc_info=True)
-
-                                except vpn_service.VPNRemovalError as e:
-                                    logger.error(
-                                        f"cleanup: VPN_REMOVAL_ERROR [user={telegram_id}, uuid={uuid_preview}, error={str(e)}, "
-                                        f"error_type={type(e).__name__}] - will retry in next cycle"
-                                    )
-                                    try:
-                                        await database._log_vpn_lifecycle_audit_async(
-                                            action="vpn_expire",
-                                            telegram_id=telegram_id,
-                                            uuid=uuid,
-                                            source="auto-expiry",
-                                            result="error",
-                                            details=f"Failed to remove UUID via VPN API: {str(e)}, will retry"
-                                        )
-                                    except Exception:
-                                        pass
-
-                                except ValueError as e:
-                                    logger.error(
-                                        f"cleanup: VALUE_ERROR [user={telegram_id}, uuid={uuid_preview}, error={str(e)}]"
-                                    )
-
-                                except Exception as e:
-                                    logger.error(
-                                        f"cleanup: UNEXPECTED_ERROR [user={telegram_id}, uuid={uuid_preview}, "
-                                        f"error={str(e)}, error_type={type(e).__name__}] - will retry in next cycle"
-                                    )
-                                    logger.exception(f"cleanup: EXCEPTION_TRACEBACK [user={telegram_id}, uuid={uuid_preview}]")
-
-                                finally:
-                                    processing_uuids.discard(uuid)
+                                batch.append(row)
+                            items_processed += len(batch)
 
-                            if rows:
-                                last_seen_id = rows[-1]["id"]
+                            # Stage 2: панель — параллельно, не больше REMOVAL_CONCURRENCY запросов.
+                            # Stage 3: переходы под-чанка одним UPDATE + пачка аудита.
+                            # POOL_STABILITY: VPN HTTP calls OUTSIDE any DB connection.
+                            await _process_batch(pool, bot, batch, now_utc, deadline)
                             await asyncio.sleep(0)
 
                     # STEP 2.3 — OBSERVABILITY: Log once per worker cycle (after all batches)
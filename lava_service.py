@@ -215,6 +215,14 @@ async def process_webhook_data(headers: dict, body: dict, bot: Bot) -> dict:
         logger.error("Lava webhook: service not configured")
         return {"status": "disabled"}
 
+    return await handle_webhook_event(body, bot)
+
+
+async def handle_webhook_event(body: dict, bot: Bot) -> dict:
+    """Business part of the webhook (status re-check via Lava API, confirm).
+
+    Called inline by process_webhook_data and by the payment inbox worker.
+    """
     invoice_id = body.get("invoice_id")
     order_id = body.get("order_id")
     status = body.get("status")
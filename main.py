@@ -125,6 +125,17 @@ async def main():
 
     # Инициализация бота и диспетчера
     bot = Bot(token=config.BOT_TOKEN)
+    if config.TELEGRAM_SCHEDULER_ENABLED:
+        from app.core.telegram_scheduler import TelegramSendSchedulerMiddleware
+        bot.session.middleware(TelegramSendSchedulerMiddleware())
+        logger.info(
+            "TELEGRAM_SCHEDULER=on rate=%s/s burst=%s",
+            config.TELEGRAM_GLOBAL_RATE, config.TELEGRAM_GLOBAL_BURST,
+        )
+    if config.METRICS_ENABLED:
+        # После scheduler'а: меряем сам вызов Bot API, без ожидания токена.
+        from app.core.metrics_middleware import TelegramApiMetricsMiddleware
+        bot.session.middleware(TelegramApiMetricsMiddleware())
     if config.REDIS_URL:
         storage = RedisStorage.from_url(config.REDIS_URL)
         logger.info("FSM_STORAGE=redis (configured)")
@@ -173,9 +184,14 @@ async def main():
     # 2. Rate limiting
     dp.message.middleware(GlobalRateLimitMiddleware())
     dp.callback_query.middleware(GlobalRateLimitMiddleware())
-    # 3. last_seen_at bump (fire-and-forget) for the Farm storm online/offline split
+    # 3. last_seen_at bump (coalesced, flushed in bulk) for the Farm storm online/offline split
     dp.message.middleware(LastSeenMiddleware())
     dp.callback_query.middleware(LastSeenMiddleware())
+    # 4. Латентность хендлеров по модулю роутера → /metrics
+    if config.METRICS_ENABLED:
+        from app.core.metrics_middleware import UpdateMetricsMiddleware
+        for _event in ("message", "callback_query", "pre_checkout_query", "inline_query", "my_chat_member"):
+            dp.observers[_event].middleware(UpdateMetricsMiddleware(_event))
 
     # Регистрация handlers
     dp.include_router(root_router)
@@ -218,6 +234,10 @@ async def main():
             logger.error(f"Failed to send degraded mode notification: {e}")
         # Продолжаем запуск бота в деградированном режиме
 
+    # LISTEN/NOTIFY для воркеров (migration 085): своё соединение, само
+    # переподключается — в degraded mode поднимется вместе с БД.
+    database.start_notify_listener()
+
     # ADVISORY_LOCK_FIX: single-instance guard via PostgreSQL (1s max wait to avoid startup delay).
     # H4 fix: Use try/finally to ensure connection is released on exception
     global instance_lock_conn
@@ -285,6 +305,13 @@ async def main():
         else:
             logger.warning("Traffic monitor task skipped (DB not ready)")
 
+    # Coalesced users.last_seen_at writer (LastSeenMiddleware buffer).
+    # Cancellation at shutdown triggers the final flush before the pool closes.
+    from app.core.last_seen_middleware import last_seen_buffer
+    last_seen_flush_task = asyncio.create_task(last_seen_buffer.run(), name="last_seen_flush")
+    background_tasks.append(last_seen_flush_task)
+    logger.info("last_seen flush task started (interval=%ss)", config.LAST_SEEN_FLUSH_INTERVAL)
+
     # Запуск фоновой задачи для health-check
     healthcheck_task = asyncio.create_task(healthcheck.health_check_task(bot))
     background_tasks.append(healthcheck_task)
@@ -332,6 +359,19 @@ async def main():
     # so the selftest doesn't tell us anything actionable. The
     # underlying `_spawn` / `selftest` are still callable for the day
     # we switch back — re-instate this hook then.
+
+    # Incy sidecar pool: прогреваем _link_cache ссылками активных юзеров,
+    # чтобы первый экран профиля после деплоя не ждал encode. Заодно
+    # поднимает node-процессы (или выключает sidecar, если node/пакета нет).
+    if config.INCY_SIDECAR_POOL_SIZE > 0 and config.INCY_PREWARM_HOURS > 0:
+        async def _incy_prewarm():
+            from app.services import incy_crypto
+            try:
+                await incy_crypto.prewarm_active_users(config.INCY_PREWARM_HOURS)
+            except Exception as e:
+                logger.warning("INCY_PREWARM_FAILED: %s", e)
+
+        background_tasks.append(asyncio.create_task(_incy_prewarm(), name="incy_prewarm"))
     
     # ====================================================================================
     # HTTP Health Check Server
@@ -533,6 +573,41 @@ async def main():
         except Exception as e:
             logger.warning("Wata reconciler failed to start: %s", e)
 
+    # Роллапы аналитики дашборда (migration 082) — каждые 5 минут
+    analytics_rollup_task_instance = None
+    if database.DB_READY:
+        try:
+            from app.workers.analytics_rollup import analytics_rollup_task
+            analytics_rollup_task_instance = asyncio.create_task(analytics_rollup_task())
+            background_tasks.append(analytics_rollup_task_instance)
+            logger.info("Analytics rollup task started (interval=5min)")
+        except Exception as e:
+            logger.warning("Analytics rollup task failed to start: %s", e)
+
+    # Outbox мутаций Remnawave (migration 083). Стартует и при недоступной
+    # БД: claim ждёт DB_READY сам, а *_bg до этого идут старым путём.
+    remnawave_outbox_task_instance = None
+    if config.REMNAWAVE_ENABLED and config.REMNAWAVE_OUTBOX_ENABLED:
+        try:
+            from app.workers.remnawave_outbox import remnawave_outbox_task
+            remnawave_outbox_task_instance = asyncio.create_task(remnawave_outbox_task())
+            background_tasks.append(remnawave_outbox_task_instance)
+            logger.info("Remnawave outbox dispatcher started")
+        except Exception as e:
+            logger.warning("Remnawave outbox dispatcher failed to start: %s", e)
+
+    # Inbox webhook'ов платёжных провайдеров (migration 084). Как и outbox,
+    # стартует без БД: claim ждёт DB_READY, а endpoint'ы до этого отвечают 500.
+    payment_inbox_task_instance = None
+    if config.PAYMENT_INBOX_ENABLED:
+        try:
+            from app.workers.payment_inbox import payment_inbox_task
+            payment_inbox_task_instance = asyncio.create_task(payment_inbox_task(bot))
+            background_tasks.append(payment_inbox_task_instance)
+            logger.info("Payment inbox worker started")
+        except Exception as e:
+            logger.warning("Payment inbox worker failed to start: %s", e)
+
     # xray_sync worker удалён вместе с samopis-мастером — весь sync
     # теперь встроен в purchase_flow.provision_subscription (Remnawave 3.x).
 
@@ -636,6 +711,10 @@ async def main():
                 pass
             sys.exit(1)
 
+        # Очередь апдейтов: воркеры должны жить до того, как uvicorn
+        # начнёт принимать webhook'и.
+        await tg_webhook_module.start_ingestion()
+
         # Start uvicorn serving FastAPI
         try:
             import uvicorn
@@ -653,11 +732,29 @@ async def main():
             )
             background_tasks.append(webhook_server_task)
             logger.info("UVICORN_STARTED host=0.0.0.0 port=%s", config.WEBHOOK_PORT)
+
+            # Sub-aggregator: слушатель pub/sub инвалидаций L2 (чистит L1
+            # этого процесса, когда clear_cache позвали в соседнем воркере).
+            if config.SUB_AGGREGATOR_ENABLED and config.SUB_AGGREGATOR_REDIS_L2 and config.REDIS_URL:
+                from app.api.sub_aggregator_route import run_invalidation_listener
+                background_tasks.append(asyncio.create_task(
+                    run_invalidation_listener(), name="sub_agg_invalidation_listener"
+                ))
+            if config.SUB_AGGREGATOR_ENABLED and config.SUB_AGGREGATOR_REFRESH_AHEAD:
+                from app.api.sub_aggregator_route import run_refresh_ahead
+                background_tasks.append(asyncio.create_task(
+                    run_refresh_ahead(), name="sub_agg_refresh_ahead"
+                ))
         except Exception as e:
             logger.error("UVICORN_START_FAILED port=%s error=%s", config.WEBHOOK_PORT, e)
             logger.exception("Failed to start uvicorn - full traceback:")
             sys.exit(1)
 
+        # atlas_worker_crash_total: таска упала с исключением (не cancel)
+        from app.core import metrics
+        for task in background_tasks:
+            metrics.watch_task(task)
+
         # Keep process alive — wait for shutdown signal
         await asyncio.gather(*background_tasks, return_exceptions=True)
     except SystemExit:
@@ -670,6 +767,13 @@ async def main():
             logger.info("WEBHOOK_DELETED")
         except Exception as e:
             logger.warning("webhook_delete_failed error=%s", e)
+
+        # HTTP уже остановлен — даём принятым апдейтам доработать, пока
+        # фоновые задачи (flush last_seen и т.п.) ещё живы
+        try:
+            await tg_webhook_module.stop_ingestion()
+        except Exception as e:
+            logger.warning("update queue stop failed: %s", e)
         
         # Cancel and await all background tasks gracefully
         log_event(
@@ -715,6 +819,27 @@ async def main():
             finally:
                 instance_lock_conn = None
         
+        # Close Remnawave keep-alive HTTP pool
+        try:
+            from app.services.remnawave_api import close as remnawave_close
+            await remnawave_close()
+        except Exception as e:
+            logger.debug(f"Error closing Remnawave client: {e}")
+
+        # Incy sidecar pool: node-процессы
+        try:
+            from app.services import incy_crypto
+            await incy_crypto.close()
+        except Exception as e:
+            logger.debug(f"Error closing Incy sidecars: {e}")
+
+        # Event bus: дослать буфер в Redis до закрытия клиента
+        try:
+            from app.events import bus
+            await bus.close()
+        except Exception as e:
+            logger.debug(f"Error closing event bus: {e}")
+
         # Close Redis client
         try:
             from app.utils.redis_client import close as redis_close
@@ -722,6 +847,11 @@ async def main():
         except Exception as e:
             logger.debug(f"Error closing Redis client: {e}")
 
+        try:
+            await database.stop_notify_listener()
+        except Exception as e:
+            logger.debug(f"Error stopping NOTIFY listener: {e}")
+
         # Close DB pool
         try:
             await database.close_pool()
@@ -0,0 +1,112 @@
+-- Migration 080: subscriptions.next_reminder_due_at — индексируемое время
+-- следующего напоминания об окончании подписки.
+--
+-- Раньше reminders.send_smart_reminders каждые 45 минут выкачивал ВСЕ
+-- активные подписки (SELECT s.* + коррелированный подзапрос в
+-- subscription_history на каждую строку) и фильтровал их в Python.
+-- Теперь воркер берёт только строки с next_reminder_due_at <= now по
+-- частичному индексу (keyset-пагинация) — стоимость ∝ числу напоминаний,
+-- а не размеру активной базы.
+--
+-- next_reminder_due_at = момент открытия ближайшего ещё не отправленного
+-- окна напоминания (окна — те же, что в notification_service
+-- .should_send_reminder: 7d±3h, 3d±2.4h, 24h±1h, 6h±0.5h, 3h±0.5h),
+-- у которого конец окна ещё впереди. Набор окон — надмножество (paid +
+-- admin-grant): точное решение по-прежнему принимает should_send_reminder,
+-- лишний «холостой» pick стоит одну строку. NULL → напоминать нечего
+-- (истекла, триал, все окна отправлены/прошли).
+--
+-- Пересчёт — BEFORE-триггером на любую запись expires_at / флагов
+-- напоминаний / source: покрывает grant_access, продления, revoke,
+-- auto_renewal, админские правки и скрипты без правок каждого writer'а.
+-- Строки, которые воркер оценил и ничего не отправил (окно не подошло по
+-- типу подписки / уже отправлено), он сам двигает на следующее окно через
+-- database.reschedule_reminders (p_skip_open) — прямой UPDATE колонки
+-- триггер не трогает.
+--
+-- Rollback: код при отсутствии колонки падает обратно на полный скан.
+
+ALTER TABLE subscriptions ADD COLUMN IF NOT EXISTS next_reminder_due_at TIMESTAMP;
+
+CREATE OR REPLACE FUNCTION subscription_next_reminder_due(
+    p_expires_at TIMESTAMP,
+    p_source TEXT,
+    p_subscription_type TEXT,
+    p_7d_sent BOOLEAN,
+    p_3d_sent BOOLEAN,
+    p_1d_sent BOOLEAN,
+    p_24h_sent BOOLEAN,
+    p_6h_sent BOOLEAN,
+    p_3h_sent BOOLEAN,
+    p_now TIMESTAMP,
+    -- TRUE → уже открытые окна не считаются (воркер оценил строку в p_now
+    -- и ничего не отправил → ждём следующего окна).
+    p_skip_open BOOLEAN DEFAULT FALSE
+) RETURNS TIMESTAMP
+LANGUAGE sql IMMUTABLE AS $$
+    SELECT CASE
+        WHEN p_expires_at IS NULL OR p_expires_at <= p_now THEN NULL
+        -- Триалы обслуживает trial_notifications.py
+        WHEN lower(COALESCE(p_source, '')) = 'trial'
+          OR lower(COALESCE(p_subscription_type, '')) = 'trial' THEN NULL
+        ELSE (
+            SELECT min(w.opens_at)
+            FROM (VALUES
+                (COALESCE(p_7d_sent, FALSE),
+                 p_expires_at - INTERVAL '7 days 3 hours',
+                 p_expires_at - INTERVAL '6 days 21 hours'),
+                (COALESCE(p_3d_sent, FALSE),
+                 p_expires_at - INTERVAL '3 days 2 hours 24 minutes',
+                 p_expires_at - INTERVAL '2 days 21 hours 36 minutes'),
+                -- 24h: reminder_1d_sent (paid) / reminder_24h_sent (admin 7d)
+                (COALESCE(p_1d_sent, FALSE) AND COALESCE(p_24h_sent, FALSE),
+                 p_expires_at - INTERVAL '25 hours',
+                 p_expires_at - INTERVAL '23 hours'),
+                (COALESCE(p_6h_sent, FALSE),
+                 p_expires_at - INTERVAL '6 hours 30 minutes',
+                 p_expires_at - INTERVAL '5 hours 30 minutes'),
+                (COALESCE(p_3h_sent, FALSE),
+                 p_expires_at - INTERVAL '3 hours 30 minutes',
+                 p_expires_at - INTERVAL '2 hours 30 minutes')
+            ) AS w(sent, opens_at, closes_at)
+            WHERE NOT w.sent
+              AND CASE WHEN p_skip_open THEN w.opens_at > p_now
+                       ELSE w.closes_at > p_now END
+        )
+    END
+$$;
+
+CREATE OR REPLACE FUNCTION subscriptions_set_next_reminder_due() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+    NEW.next_reminder_due_at := subscription_next_reminder_due(
+        NEW.expires_at, NEW.source, NEW.subscription_type,
+        NEW.reminder_7d_sent, NEW.reminder_3d_sent, NEW.reminder_1d_sent,
+        NEW.reminder_24h_sent, NEW.reminder_6h_sent, NEW.reminder_3h_sent,
+        (NOW() AT TIME ZONE 'UTC')
+    );
+    RETURN NEW;
+END
+$$;
+
+DROP TRIGGER IF EXISTS trg_subscriptions_next_reminder_due ON subscriptions;
+CREATE TRIGGER trg_subscriptions_next_reminder_due
+    BEFORE INSERT OR UPDATE OF
+        expires_at, source, subscription_type,
+        reminder_7d_sent, reminder_3d_sent, reminder_1d_sent,
+        reminder_24h_sent, reminder_6h_sent, reminder_3h_sent
+    ON subscriptions
+    FOR EACH ROW EXECUTE FUNCTION subscriptions_set_next_reminder_due();
+
+-- Backfill активных подписок (прямой UPDATE колонки — триггер не срабатывает).
+UPDATE subscriptions
+SET next_reminder_due_at = subscription_next_reminder_due(
+        expires_at, source, subscription_type,
+        reminder_7d_sent, reminder_3d_sent, reminder_1d_sent,
+        reminder_24h_sent, reminder_6h_sent, reminder_3h_sent,
+        (NOW() AT TIME ZONE 'UTC'))
+WHERE expires_at > (NOW() AT TIME ZONE 'UTC');
+
+CREATE INDEX IF NOT EXISTS idx_subscriptions_next_reminder_due
+    ON subscriptions (next_reminder_due_at, telegram_id)
+    WHERE next_reminder_due_at IS NOT NULL;
@@ -0,0 +1,43 @@
+-- Migration 081: индексы для поиска юзеров в дашборде
+-- (database.search_users_dashboard).
+--
+-- Раньше поиск шёл `CAST(telegram_id AS TEXT) ILIKE '%q%' OR username
+-- ILIKE '%q%'` — seq scan всей users на каждое нажатие клавиши.
+-- Теперь запрос собирается по типу строки (database.users
+-- .build_user_search_query):
+--   * цифры       → префикс telegram_id::text (btree text_pattern_ops)
+--   * 1-2 символа → префикс lower(username) (btree text_pattern_ops)
+--   * 3+ символа  → подстрока username ILIKE (GIN pg_trgm)
+--
+-- pg_trgm может быть недоступен (managed PG без прав на CREATE
+-- EXTENSION) — тогда trigram-индекс пропускается, поиск работает, но
+-- подстрока по username остаётся seq scan. Префиксные индексы не
+-- зависят от расширения.
+--
+-- Индексы без CONCURRENTLY: миграции транзакционные. На большой users
+-- при желании создать заранее вручную `CREATE INDEX CONCURRENTLY ...` с
+-- теми же именами — IF NOT EXISTS их подхватит.
+
+DO $$
+BEGIN
+    CREATE EXTENSION IF NOT EXISTS pg_trgm;
+EXCEPTION WHEN insufficient_privilege OR feature_not_supported OR undefined_file THEN
+    RAISE NOTICE 'pg_trgm unavailable (%), skipping trigram index', SQLERRM;
+END
+$$;
+
+DO $$
+BEGIN
+    IF EXISTS (SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm') THEN
+        EXECUTE 'CREATE INDEX IF NOT EXISTS idx_users_username_trgm
+                 ON users USING gin (username gin_trgm_ops)';
+    END IF;
+END
+$$;
+
+CREATE INDEX IF NOT EXISTS idx_users_telegram_id_text_prefix
+    ON users ((telegram_id::text) text_pattern_ops);
+
+CREATE INDEX IF NOT EXISTS idx_users_username_lower_prefix
+    ON users (lower(username) text_pattern_ops)
+    WHERE username IS NOT NULL;
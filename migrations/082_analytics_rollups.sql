@@ -0,0 +1,53 @@
+-- Migration 082: предагрегированные факты для аналитики дашборда
+-- (database.analytics, воркер app/workers/analytics_rollup.py).
+--
+-- get_daily_timeseries / get_hourly_timeseries / get_revenue_for_period /
+-- get_payments_breakdown / get_extended_bot_stats раньше на каждый заход
+-- в дашборд пересчитывали GROUP BY по сырым payments, pending_purchases,
+-- users и subscriptions за всё окно. Теперь воркер раскладывает факты по
+-- часам и дням, а читатели берут закрытые часы/дни отсюда и добирают
+-- сырыми запросами только хвост после watermark'а (≤ 1 часа + интервал
+-- воркера) и неполный первый час окна.
+--
+-- metric: 'payment'      — payments.status = 'approved', amount
+--         'purchase'     — pending_purchases.status = 'paid', price_kopecks
+--         'user'         — users.created_at
+--         'subscription' — subscriptions.activated_at, source
+-- NULL в provider / tariff / source хранится как '' (ключ PK), дефолты
+-- ('unknown', 'subscription') подставляют читатели.
+--
+-- bucket — начало часа UTC; day — сутки UTC. Строка дня собирается из
+-- часовых строк и читается только для дней целиком до watermark'а.
+
+CREATE TABLE IF NOT EXISTS analytics_hourly (
+    bucket   TIMESTAMPTZ NOT NULL,
+    metric   TEXT        NOT NULL,
+    provider TEXT        NOT NULL DEFAULT '',
+    tariff   TEXT        NOT NULL DEFAULT '',
+    source   TEXT        NOT NULL DEFAULT '',
+    cnt      BIGINT      NOT NULL DEFAULT 0,
+    amount   BIGINT      NOT NULL DEFAULT 0,
+    PRIMARY KEY (bucket, metric, provider, tariff, source)
+);
+
+CREATE TABLE IF NOT EXISTS analytics_daily (
+    day      DATE   NOT NULL,
+    metric   TEXT   NOT NULL,
+    provider TEXT   NOT NULL DEFAULT '',
+    tariff   TEXT   NOT NULL DEFAULT '',
+    source   TEXT   NOT NULL DEFAULT '',
+    cnt      BIGINT NOT NULL DEFAULT 0,
+    amount   BIGINT NOT NULL DEFAULT 0,
+    PRIMARY KEY (day, metric, provider, tariff, source)
+);
+
+-- watermark: все часы < watermark разложены. NULL — ещё не было
+-- backfill'а, читатели тогда считают всё по сырым таблицам.
+CREATE TABLE IF NOT EXISTS analytics_rollup_state (
+    name       TEXT PRIMARY KEY,
+    watermark  TIMESTAMPTZ,
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+INSERT INTO analytics_rollup_state (name) VALUES ('dashboard_facts')
+ON CONFLICT (name) DO NOTHING;
@@ -0,0 +1,36 @@
+-- Migration 083: transactional outbox для мутаций Remnawave (bypass entity).
+--
+-- create / renew / extend_bypass / disable / delete раньше запускались
+-- как asyncio.create_task после commit'а подписки — рестарт или деплой
+-- посреди пачки платежей молча терял их, и дрейф потом находили
+-- panel_traffic_audit / сверка полным сканом. Теперь строка пишется в
+-- той же транзакции, что меняет подписку (или сразу после commit'а там,
+-- где транзакция живёт глубже в database.*), а app/workers/
+-- remnawave_outbox.py разбирает очередь: по юзеру строго по порядку id,
+-- с ретраями и склейкой (три renew подряд → один PATCH).
+--
+-- status: pending    — ждёт next_attempt_at
+--         processing — взята диспетчером; next_attempt_at = конец lease
+--                      (после падения процесса строка берётся снова)
+--         dead       — исчерпаны попытки, разбирать руками
+-- Выполненные строки удаляются.
+
+CREATE TABLE IF NOT EXISTS remnawave_outbox (
+    id              BIGSERIAL   PRIMARY KEY,
+    telegram_id     BIGINT      NOT NULL,
+    op              TEXT        NOT NULL,
+    payload         JSONB       NOT NULL DEFAULT '{}'::jsonb,
+    status          TEXT        NOT NULL DEFAULT 'pending',
+    attempts        INTEGER     NOT NULL DEFAULT 0,
+    next_attempt_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    last_error      TEXT,
+    created_at      TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS idx_remnawave_outbox_due
+    ON remnawave_outbox (next_attempt_at)
+    WHERE status IN ('pending', 'processing');
+
+CREATE INDEX IF NOT EXISTS idx_remnawave_outbox_user
+    ON remnawave_outbox (telegram_id, id)
+    WHERE status IN ('pending', 'processing');
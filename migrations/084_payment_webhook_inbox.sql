@@ -0,0 +1,47 @@
+-- Migration 084: inbox для webhook'ов платёжных провайдеров.
+--
+-- Раньше /webhooks/<provider> внутри запроса делал всё: подпись,
+-- process_confirmed_payment, finalize_purchase, выдачу в Remnawave и
+-- сообщение юзеру. Медленная панель → ответ не успевает → провайдер
+-- ретраит → дублирующая работа (и 500 там, где деньги уже дошли).
+-- Теперь endpoint проверяет подпись, пишет событие сюда и сразу
+-- отвечает 200; app/workers/payment_inbox.py разбирает очередь с
+-- лимитом конкурентности и ретраями. wata_reconciler кладёт найденные
+-- Paid-транзакции сюда же.
+--
+-- Идемпотентность: одно событие провайдера = (provider, invoice_id,
+-- event_status). Статус в ключе нужен потому, что на один invoice
+-- приходит несколько webhook'ов (Pending → Paid) — дедуп только по
+-- invoice_id проглотил бы Paid. Повтор того же события → ON CONFLICT
+-- DO NOTHING.
+--
+-- status: pending    — ждёт next_attempt_at
+--         processing — взято воркером; next_attempt_at = конец lease
+--         done       — обработано (result — status из обработчика)
+--         dead       — исчерпаны попытки, разбирать руками
+-- Строки done хранятся PAYMENT_INBOX_RETENTION_DAYS для дедупа и аудита.
+
+CREATE TABLE IF NOT EXISTS payment_webhook_inbox (
+    id              BIGSERIAL   PRIMARY KEY,
+    provider        TEXT        NOT NULL,
+    invoice_id      TEXT        NOT NULL,
+    event_status    TEXT        NOT NULL DEFAULT '',
+    source          TEXT        NOT NULL DEFAULT 'webhook',
+    body            JSONB       NOT NULL,
+    status          TEXT        NOT NULL DEFAULT 'pending',
+    attempts        INTEGER     NOT NULL DEFAULT 0,
+    next_attempt_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    result          TEXT,
+    last_error      TEXT,
+    created_at      TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    processed_at    TIMESTAMPTZ,
+    CONSTRAINT uq_payment_webhook_inbox_event UNIQUE (provider, invoice_id, event_status)
+);
+
+CREATE INDEX IF NOT EXISTS idx_payment_webhook_inbox_due
+    ON payment_webhook_inbox (next_attempt_at)
+    WHERE status IN ('pending', 'processing');
+
+CREATE INDEX IF NOT EXISTS idx_payment_webhook_inbox_done
+    ON payment_webhook_inbox (processed_at)
+    WHERE status = 'done';
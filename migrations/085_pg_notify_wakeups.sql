@@ -0,0 +1,95 @@
+-- Migration 085: LISTEN/NOTIFY-пробуждение фоновых воркеров.
+--
+-- activation_worker, scheduled_broadcasts_worker и wata_reconciler жили
+-- на фиксированных интервалах: свежая pending-активация ждала до полного
+-- ACTIVATION_INTERVAL_SECONDS, а пустые итерации всё равно стоили
+-- запросов. Теперь триггеры шлют pg_notify, database/notify.py слушает
+-- каналы на отдельном соединении, и воркер просыпается сразу; прежний
+-- poll остался редкой страховкой (пропущенные NOTIFY при реконнекте).
+--
+-- NOTIFY доставляется только после COMMIT, одинаковые (канал, payload)
+-- внутри транзакции склеиваются.
+--
+-- Каналы (payload — для логов, воркеры перечитывают таблицы сами):
+--   activation_pending       — subscriptions.activation_status стал 'pending'
+--   scheduled_broadcast      — scheduled_broadcasts: новое/перенесённое задание
+--   pending_purchase_invoice — pending_purchases получил provider_invoice_id
+
+-- activation_status добавляется inline-DDL в init_db уже ПОСЛЕ миграций —
+-- на чистой БД триггеру нужна колонка раньше.
+ALTER TABLE subscriptions ADD COLUMN IF NOT EXISTS activation_status TEXT DEFAULT 'active';
+
+CREATE OR REPLACE FUNCTION notify_activation_pending() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+    PERFORM pg_notify('activation_pending', NEW.telegram_id::text);
+    RETURN NULL;
+END
+$$;
+
+-- Только переход в 'pending': UPDATE счётчика попыток воркером (статус
+-- остаётся 'pending') не должен будить его же по кругу.
+DROP TRIGGER IF EXISTS trg_subscriptions_activation_pending_ins ON subscriptions;
+CREATE TRIGGER trg_subscriptions_activation_pending_ins
+    AFTER INSERT ON subscriptions
+    FOR EACH ROW
+    WHEN (NEW.activation_status = 'pending')
+    EXECUTE FUNCTION notify_activation_pending();
+
+DROP TRIGGER IF EXISTS trg_subscriptions_activation_pending_upd ON subscriptions;
+CREATE TRIGGER trg_subscriptions_activation_pending_upd
+    AFTER UPDATE OF activation_status ON subscriptions
+    FOR EACH ROW
+    WHEN (NEW.activation_status = 'pending'
+          AND OLD.activation_status IS DISTINCT FROM 'pending')
+    EXECUTE FUNCTION notify_activation_pending();
+
+CREATE OR REPLACE FUNCTION notify_scheduled_broadcast() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+    PERFORM pg_notify('scheduled_broadcast', NEW.id::text);
+    RETURN NULL;
+END
+$$;
+
+DROP TRIGGER IF EXISTS trg_scheduled_broadcasts_notify_ins ON scheduled_broadcasts;
+CREATE TRIGGER trg_scheduled_broadcasts_notify_ins
+    AFTER INSERT ON scheduled_broadcasts
+    FOR EACH ROW
+    WHEN (NEW.is_active)
+    EXECUTE FUNCTION notify_scheduled_broadcast();
+
+-- Админ перенёс время / включил задание. Сам воркер тоже двигает
+-- scheduled_at (mark_ran_and_reschedule) — это одно лишнее пробуждение
+-- на запуск, не цикл: следующий scheduled_at в будущем.
+DROP TRIGGER IF EXISTS trg_scheduled_broadcasts_notify_upd ON scheduled_broadcasts;
+CREATE TRIGGER trg_scheduled_broadcasts_notify_upd
+    AFTER UPDATE OF scheduled_at, is_active ON scheduled_broadcasts
+    FOR EACH ROW
+    WHEN (NEW.is_active
+          AND (OLD.scheduled_at IS DISTINCT FROM NEW.scheduled_at
+               OR OLD.is_active IS DISTINCT FROM NEW.is_active))
+    EXECUTE FUNCTION notify_scheduled_broadcast();
+
+CREATE OR REPLACE FUNCTION notify_pending_purchase_invoice() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+    PERFORM pg_notify('pending_purchase_invoice', NEW.purchase_id);
+    RETURN NULL;
+END
+$$;
+
+DROP TRIGGER IF EXISTS trg_pending_purchases_invoice_ins ON pending_purchases;
+CREATE TRIGGER trg_pending_purchases_invoice_ins
+    AFTER INSERT ON pending_purchases
+    FOR EACH ROW
+    WHEN (NEW.provider_invoice_id IS NOT NULL AND NEW.provider_invoice_id <> '')
+    EXECUTE FUNCTION notify_pending_purchase_invoice();
+
+DROP TRIGGER IF EXISTS trg_pending_purchases_invoice_upd ON pending_purchases;
+CREATE TRIGGER trg_pending_purchases_invoice_upd
+    AFTER UPDATE OF provider_invoice_id ON pending_purchases
+    FOR EACH ROW
+    WHEN (NEW.provider_invoice_id IS NOT NULL AND NEW.provider_invoice_id <> ''
+          AND OLD.provider_invoice_id IS DISTINCT FROM NEW.provider_invoice_id)
+    EXECUTE FUNCTION notify_pending_purchase_invoice();
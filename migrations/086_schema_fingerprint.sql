@@ -0,0 +1,14 @@
+-- Migration 086: schema fingerprint для быстрого старта init_db.
+--
+-- database.init_db считает sha256 по файлам migrations/ и исходнику
+-- inline DDL (_ensure_inline_schema, _init_promo_codes) и пишет его сюда
+-- после успешного полного прохода. Если на следующем старте отпечаток
+-- совпал — run_migrations, пересоздание пула и ~100 DDL-запросов
+-- пропускаются. Любая новая миграция или правка inline DDL меняет
+-- отпечаток → снова полный путь. DB_SCHEMA_FAST_PATH=false — всегда полный.
+
+CREATE TABLE IF NOT EXISTS schema_fingerprint (
+    id SMALLINT PRIMARY KEY DEFAULT 1 CHECK (id = 1),
+    fingerprint TEXT NOT NULL,
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
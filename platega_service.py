@@ -239,19 +239,35 @@ async def process_webhook_data(headers: dict, body: dict, bot: Bot) -> dict:
         logger.warning("Platega webhook: DB not ready — returning 500 for retry")
         raise TransientPaymentError("DB not ready")
 
+    if not verify_webhook_auth(headers):
+        return {"status": "unauthorized"}
+
+    return await handle_webhook_event(body, bot)
+
+
+def verify_webhook_auth(headers: dict, *, kind: str = "webhook") -> bool:
+    """Check X-MerchantId / X-Secret of a Platega callback (one-off and subscription)."""
     # Verify authentication headers (case-insensitive lookup)
     merchant_id = headers.get("x-merchantid", "") or headers.get("X-MerchantId", "")
     secret = headers.get("x-secret", "") or headers.get("X-Secret", "")
 
     # SECURITY: Reject if server-side credentials are not configured (prevents empty-string bypass)
     if not PLATEGA_MERCHANT_ID or not PLATEGA_SECRET:
-        logger.error("Platega webhook: server credentials not configured")
-        return {"status": "unauthorized"}
+        logger.error(f"Platega {kind}: server credentials not configured")
+        return False
 
     if not hmac.compare_digest(str(merchant_id), str(PLATEGA_MERCHANT_ID)) or not hmac.compare_digest(str(secret), str(PLATEGA_SECRET)):
-        logger.warning("Platega webhook: auth failed")
-        return {"status": "unauthorized"}
+        logger.warning(f"Platega {kind}: auth failed")
+        return False
+    return True
 
+
+async def handle_webhook_event(body: dict, bot: Bot) -> dict:
+    """Business part of the one-off payment webhook, after auth.
+
+    Called inline by process_webhook_data and by the payment inbox worker
+    (app/workers/payment_inbox.py) for events accepted earlier.
+    """
     transaction_id = body.get("id") or body.get("transactionId")
     status = (body.get("status") or "").lower()
 
@@ -567,18 +583,15 @@ async def process_subscription_webhook_data(
         raise TransientPaymentError("DB not ready")
 
     # ── Auth (тот же паттерн, что и в process_webhook_data) ─────────────
-    merchant_id = headers.get("x-merchantid", "") or headers.get("X-MerchantId", "")
-    secret = headers.get("x-secret", "") or headers.get("X-Secret", "")
-
-    if not PLATEGA_MERCHANT_ID or not PLATEGA_SECRET:
-        logger.error("Platega sub webhook: server credentials not configured")
+    if not verify_webhook_auth(headers, kind="sub webhook"):
         return {"status": "unauthorized"}
 
-    if not hmac.compare_digest(str(merchant_id), str(PLATEGA_MERCHANT_ID)) or \
-       not hmac.compare_digest(str(secret), str(PLATEGA_SECRET)):
-        logger.warning("Platega sub webhook: auth failed")
-        return {"status": "unauthorized"}
+    return await handle_subscription_webhook_event(body, bot)
+
 
+async def handle_subscription_webhook_event(body: dict, bot: Bot) -> dict:
+    """Всё, что после auth: inline из process_subscription_webhook_data
+    и из воркера payment inbox."""
     # ── Extract fields (ЗАГЛАВНЫЕ + строчные fallback на всякий случай) ─
     charge_id       = body.get("Id") or body.get("id")
     subscription_id = body.get("SubscriptionId") or body.get("subscriptionId")
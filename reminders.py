@@ -8,11 +8,12 @@ from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 import database
 import config
 from app import i18n
-from app.services.language_service import resolve_user_language
+from app.services.language_service import resolve_languages, resolve_user_language
 from app.services.notifications import service as notification_service
 from app.services.notifications.service import ReminderType
 from app.utils.telegram_safe import safe_send_message
 from app.core.structured_logger import log_event
+from app.core.telegram_scheduler import Priority, pace, with_send_priority
 from app.utils.logging_helpers import (
     log_worker_iteration_start,
     log_worker_iteration_end,
@@ -113,211 +114,259 @@ def get_tariff_1_month_keyboard(language: str) -> InlineKeyboardMarkup:
 
 
 
+# Размер страницы due-запроса (keyset по next_reminder_due_at, migration 080).
+REMINDER_PAGE_SIZE = 500
+
+
+async def _reminder_pages():
+    """Страницы подписок, которым пора проверить напоминание.
+
+    Основной путь — индекс next_reminder_due_at (только due-строки,
+    keyset-пагинация). Если миграция 080 ещё не применена —
+    один полный скан get_subscriptions_for_reminders, как раньше
+    (now=None: due-колонки нет, reschedule не нужен).
+    """
+    now = datetime.now(timezone.utc)
+    cursor = None
+    while True:
+        page = await database.get_subscriptions_due_for_reminders(
+            now, after=cursor, limit=REMINDER_PAGE_SIZE,
+        )
+        if page is None:
+            legacy = await database.get_subscriptions_for_reminders()
+            if legacy:
+                yield None, legacy
+            return
+        if not page:
+            return
+        yield now, page
+        if len(page) < REMINDER_PAGE_SIZE:
+            return
+        last = page[-1]
+        cursor = (last["next_reminder_due_at"], last["telegram_id"])
+
+
+@with_send_priority(Priority.REMINDER)
 async def send_smart_reminders(bot: Bot):
     """Отправить умные напоминания пользователям (старая логика для совместимости)"""
     try:
-        subscriptions = await database.get_subscriptions_for_reminders()
-        
-        if not subscriptions:
-            return
-        
-        logger.info("Found %d subscriptions for reminders check", len(subscriptions))
+        async for now, subscriptions in _reminder_pages():
+            logger.info("Found %d subscriptions for reminders check", len(subscriptions))
+            idle = await _send_reminders_page(bot, subscriptions)
+            if idle and now is not None:
+                # Оценены и ничего не ушло — двигаем due на следующее окно.
+                await database.reschedule_reminders(idle, now)
+    except Exception as e:
+        logger.exception(f"Error in send_smart_reminders: {e}")
+
+
+async def _send_reminders_page(bot: Bot, subscriptions: list) -> list:
+    """Обработать одну страницу подписок. Возвращает telegram_id тех, по
+    кому should_send_reminder ничего не решил отправить (для reschedule)."""
+    idle: list = []
+
+    # Один ANY($1)-запрос за языками всех, кому реально уйдёт напоминание,
+    # вместо users-SELECT на каждого получателя.
+    await resolve_languages(
+        s["telegram_id"] for s in subscriptions
+        if notification_service.should_send_reminder(s).should_send
+    )
+
+    for subscription in subscriptions:
+        telegram_id = subscription["telegram_id"]
         
-        for subscription in subscriptions:
-            telegram_id = subscription["telegram_id"]
+        try:
+            # Use notification service to determine if reminder should be sent
+            decision = notification_service.should_send_reminder(subscription)
             
-            try:
-                # Use notification service to determine if reminder should be sent
-                decision = notification_service.should_send_reminder(subscription)
-                
-                if not decision.should_send:
-                    # Skip this subscription (already sent, not in time window, etc.)
-                    if decision.reason:
-                        logger.debug("Skipping reminder for user %s: %s", telegram_id, decision.reason)
-                    continue
+            if not decision.should_send:
+                # Skip this subscription (already sent, not in time window, etc.)
+                if decision.reason:
+                    logger.debug("Skipping reminder for user %s: %s", telegram_id, decision.reason)
+                idle.append(telegram_id)
+                continue
 
-                # Idempotency: skip if reminder sent recently (container restart guard)
-                last_reminder_at = subscription.get("last_reminder_at")
-                if last_reminder_at and isinstance(last_reminder_at, datetime):
-                    try:
-                        # subscription from get_subscriptions_for_reminders is normalized (aware UTC via _from_db_utc)
-                        last_at = last_reminder_at if last_reminder_at.tzinfo else last_reminder_at.replace(tzinfo=timezone.utc)
-                        delta = datetime.now(timezone.utc) - last_at
-                        if 0 <= delta.total_seconds() < REMINDER_IDEMPOTENCY_WINDOW.total_seconds():
-                            logger.debug("Skipping reminder for user %s: last_reminder_at within idempotency window", telegram_id)
-                            continue
-                    except (TypeError, AttributeError) as e:
-                        logger.warning("Invalid last_reminder_at for user %s: %s", telegram_id, e)
-
-                language = await resolve_user_language(telegram_id)
-
-                # Determine reminder text and keyboard based on reminder type.
-                # Для paid-reminder'ов (7d/3d/1d/24h/3h) сначала спрашиваем
-                # automated_notifications — если админ отключил через дашборд,
-                # пропускаем + логируем как skipped_disabled. Кастомный текст
-                # админа берётся первым, fallback на i18n-дефолт.
+            # Idempotency: skip if reminder sent recently (container restart guard)
+            last_reminder_at = subscription.get("last_reminder_at")
+            if last_reminder_at and isinstance(last_reminder_at, datetime):
+                try:
+                    # subscription from get_subscriptions_for_reminders is normalized (aware UTC via _from_db_utc)
+                    last_at = last_reminder_at if last_reminder_at.tzinfo else last_reminder_at.replace(tzinfo=timezone.utc)
+                    delta = datetime.now(timezone.utc) - last_at
+                    if 0 <= delta.total_seconds() < REMINDER_IDEMPOTENCY_WINDOW.total_seconds():
+                        logger.debug("Skipping reminder for user %s: last_reminder_at within idempotency window", telegram_id)
+                        continue
+                except (TypeError, AttributeError) as e:
+                    logger.warning("Invalid last_reminder_at for user %s: %s", telegram_id, e)
+
+            language = await resolve_user_language(telegram_id)
+
+            # Determine reminder text and keyboard based on reminder type.
+            # Для paid-reminder'ов (7d/3d/1d/24h/3h) сначала спрашиваем
+            # automated_notifications — если админ отключил через дашборд,
+            # пропускаем + логируем как skipped_disabled. Кастомный текст
+            # админа берётся первым, fallback на i18n-дефолт.
+            from app.services.automated_notifications import (
+                is_notification_enabled, get_notification_text,
+                log_notification_send,
+            )
+            reminder_type = decision.reminder_type
+            text = None
+            keyboard = None
+            audit_message = None
+            notif_key = None  # registry-key для логирования и enable-check
+
+            if reminder_type == ReminderType.ADMIN_1DAY_6H:
+                text = i18n.get_text(language, "reminder.admin_1day_6h")
+                keyboard = get_subscription_keyboard(language)
+                audit_message = "Admin 1-day reminder (6h before expiry)"
+
+            elif reminder_type == ReminderType.ADMIN_7DAYS_24H:
+                text = i18n.get_text(language, "reminder.admin_7days_24h")
+                keyboard = get_tariff_1_month_keyboard(language)
+                audit_message = "Admin 7-day reminder (24h before expiry)"
+
+            elif reminder_type == ReminderType.REMINDER_7D:
+                notif_key = "subscription.reminder_7d"
+                text = (await get_notification_text(notif_key)) or i18n.get_text(language, "reminder.paid_7d")
+                keyboard = get_renewal_keyboard_7d(language)
+                audit_message = "Paid subscription reminder (7d before expiry)"
+
+            elif reminder_type == ReminderType.REMINDER_3D:
+                notif_key = "subscription.reminder_3d"
+                text = (await get_notification_text(notif_key)) or i18n.get_text(language, "reminder.paid_3d")
+                keyboard = get_renewal_keyboard_3d(language)
+                audit_message = "Paid subscription reminder (3d before expiry)"
+
+            elif reminder_type == ReminderType.REMINDER_1D:
+                notif_key = "subscription.reminder_1d"
+                text = (await get_notification_text(notif_key)) or i18n.get_text(language, "reminder.paid_1d")
+                keyboard = get_renewal_keyboard_1d(language)
+                audit_message = "Paid subscription reminder (1d before expiry)"
+
+            elif reminder_type == ReminderType.REMINDER_24H:
+                notif_key = "subscription.reminder_24h"
+                text = (await get_notification_text(notif_key)) or i18n.get_text(language, "reminder.paid_24h")
+                keyboard = get_renewal_keyboard(language)
+                audit_message = "Paid subscription reminder (24h before expiry)"
+
+            elif reminder_type == ReminderType.REMINDER_3H:
+                notif_key = "subscription.reminder_3h"
+                text = (await get_notification_text(notif_key)) or i18n.get_text(language, "reminder.paid_3h_special")
+                keyboard = get_renewal_discount_keyboard(language)
+                audit_message = "Paid subscription reminder (3h before expiry) with 15% discount"
+
+            # Если админ выключил через дашборд — мгновенный skip.
+            # Помечаем reminder_sent, чтобы next-cycle тоже не спамил.
+            if notif_key and not await is_notification_enabled(notif_key):
+                try:
+                    await notification_service.mark_reminder_sent(telegram_id, reminder_type)
+                    await log_notification_send(
+                        notif_key, telegram_id, status="skipped_disabled",
+                    )
+                except Exception:
+                    pass
+                logger.info(
+                    "reminder_skipped_disabled: user=%s key=%s",
+                    telegram_id, notif_key,
+                )
+                continue
+
+            # Опциональный segment_filter из trigger_config: если
+            # админ задал сегмент, шлём только тем, кто в него входит.
+            # Пример: reminder_7d + segment_filter='paid_expires_in_7d'
+            # → отправится только тем, у кого сейчас платная активна.
+            if notif_key:
                 from app.services.automated_notifications import (
-                    is_notification_enabled, get_notification_text,
-                    log_notification_send,
+                    get_trigger_config, is_user_in_segment,
                 )
-                reminder_type = decision.reminder_type
-                text = None
-                keyboard = None
-                audit_message = None
-                notif_key = None  # registry-key для логирования и enable-check
-
-                if reminder_type == ReminderType.ADMIN_1DAY_6H:
-                    text = i18n.get_text(language, "reminder.admin_1day_6h")
-                    keyboard = get_subscription_keyboard(language)
-                    audit_message = "Admin 1-day reminder (6h before expiry)"
-
-                elif reminder_type == ReminderType.ADMIN_7DAYS_24H:
-                    text = i18n.get_text(language, "reminder.admin_7days_24h")
-                    keyboard = get_tariff_1_month_keyboard(language)
-                    audit_message = "Admin 7-day reminder (24h before expiry)"
-
-                elif reminder_type == ReminderType.REMINDER_7D:
-                    notif_key = "subscription.reminder_7d"
-                    text = (await get_notification_text(notif_key)) or i18n.get_text(language, "reminder.paid_7d")
-                    keyboard = get_renewal_keyboard_7d(language)
-                    audit_message = "Paid subscription reminder (7d before expiry)"
-
-                elif reminder_type == ReminderType.REMINDER_3D:
-                    notif_key = "subscription.reminder_3d"
-                    text = (await get_notification_text(notif_key)) or i18n.get_text(language, "reminder.paid_3d")
-                    keyboard = get_renewal_keyboard_3d(language)
-                    audit_message = "Paid subscription reminder (3d before expiry)"
-
-                elif reminder_type == ReminderType.REMINDER_1D:
-                    notif_key = "subscription.reminder_1d"
-                    text = (await get_notification_text(notif_key)) or i18n.get_text(language, "reminder.paid_1d")
-                    keyboard = get_renewal_keyboard_1d(language)
-                    audit_message = "Paid subscription reminder (1d before expiry)"
-
-                elif reminder_type == ReminderType.REMINDER_24H:
-                    notif_key = "subscription.reminder_24h"
-                    text = (await get_notification_text(notif_key)) or i18n.get_text(language, "reminder.paid_24h")
-                    keyboard = get_renewal_keyboard(language)
-                    audit_message = "Paid subscription reminder (24h before expiry)"
-
-                elif reminder_type == ReminderType.REMINDER_3H:
-                    notif_key = "subscription.reminder_3h"
-                    text = (await get_notification_text(notif_key)) or i18n.get_text(language, "reminder.paid_3h_special")
-                    keyboard = get_renewal_discount_keyboard(language)
-                    audit_message = "Paid subscription reminder (3h before expiry) with 15% discount"
-
-                # Если админ выключил через дашборд — мгновенный skip.
-                # Помечаем reminder_sent, чтобы next-cycle тоже не спамил.
-                if notif_key and not await is_notification_enabled(notif_key):
+                _tcfg = await get_trigger_config(notif_key) or {}
+                _seg = str(_tcfg.get("segment_filter") or "").strip()
+                if _seg and not await is_user_in_segment(telegram_id, _seg):
+                    # Пропускаем на этом цикле — юзер может войти в сегмент
+                    # позже (изменится состояние). НЕ помечаем reminder_sent,
+                    # чтобы дать шанс сработать после апдейта.
                     try:
-                        await notification_service.mark_reminder_sent(telegram_id, reminder_type)
                         await log_notification_send(
                             notif_key, telegram_id, status="skipped_disabled",
                         )
                     except Exception:
                         pass
                     logger.info(
-                        "reminder_skipped_disabled: user=%s key=%s",
-                        telegram_id, notif_key,
+                        "reminder_skipped_segment: user=%s key=%s seg=%s",
+                        telegram_id, notif_key, _seg,
                     )
                     continue
-
-                # Опциональный segment_filter из trigger_config: если
-                # админ задал сегмент, шлём только тем, кто в него входит.
-                # Пример: reminder_7d + segment_filter='paid_expires_in_7d'
-                # → отправится только тем, у кого сейчас платная активна.
-                if notif_key:
-                    from app.services.automated_notifications import (
-                        get_trigger_config, is_user_in_segment,
+            
+            if text and keyboard:
+                # 3-day reminder gets a photo header on prod; everything else
+                # stays plain text.  Photo send falls back to text on any
+                # error (stale file_id, blocked, etc.) via safe_send_message.
+                sent = None
+                if reminder_type == ReminderType.REMINDER_3D:
+                    photo_id = _REMINDER_3D_PHOTO.get(
+                        "prod" if config.IS_PROD else "stage", ""
                     )
-                    _tcfg = await get_trigger_config(notif_key) or {}
-                    _seg = str(_tcfg.get("segment_filter") or "").strip()
-                    if _seg and not await is_user_in_segment(telegram_id, _seg):
-                        # Пропускаем на этом цикле — юзер может войти в сегмент
-                        # позже (изменится состояние). НЕ помечаем reminder_sent,
-                        # чтобы дать шанс сработать после апдейта.
+                    if photo_id:
                         try:
-                            await log_notification_send(
-                                notif_key, telegram_id, status="skipped_disabled",
+                            sent = await bot.send_photo(
+                                chat_id=telegram_id,
+                                photo=photo_id,
+                                caption=text,
+                                reply_markup=keyboard,
+                                parse_mode="HTML",
                             )
-                        except Exception:
-                            pass
-                        logger.info(
-                            "reminder_skipped_segment: user=%s key=%s seg=%s",
-                            telegram_id, notif_key, _seg,
-                        )
-                        continue
-                
-                if text and keyboard:
-                    # 3-day reminder gets a photo header on prod; everything else
-                    # stays plain text.  Photo send falls back to text on any
-                    # error (stale file_id, blocked, etc.) via safe_send_message.
-                    sent = None
-                    if reminder_type == ReminderType.REMINDER_3D:
-                        photo_id = _REMINDER_3D_PHOTO.get(
-                            "prod" if config.IS_PROD else "stage", ""
-                        )
-                        if photo_id:
-                            try:
-                                sent = await bot.send_photo(
-                                    chat_id=telegram_id,
-                                    photo=photo_id,
-                                    caption=text,
-                                    reply_markup=keyboard,
-                                    parse_mode="HTML",
-                                )
-                            except Exception as e:
-                                logger.warning(
-                                    "REMINDER_3D photo send failed user=%s err=%s — "
-                                    "falling back to plain text",
-                                    telegram_id, type(e).__name__,
-                                )
-                                sent = None
-                    if sent is None:
-                        # Default path / photo fallback: plain text reminder.
-                        sent = await safe_send_message(bot, telegram_id, text, reply_markup=keyboard)
-                    if sent is None:
-                        # Юзер заблокировал бота / чат недоступен.
-                        if notif_key:
-                            try:
-                                await log_notification_send(
-                                    notif_key, telegram_id, status="blocked",
-                                )
-                            except Exception:
-                                pass
-                        continue
-                    await asyncio.sleep(0.05)  # Telegram rate limit: max 20 msgs/sec
-
-                    # Mark reminder as sent using notification service
-                    await notification_service.mark_reminder_sent(telegram_id, reminder_type)
-
-                    # Метрика для admin-stats (только для reminder-типов
-                    # обёрнутых в registry — admin/legacy остаются без).
+                        except Exception as e:
+                            logger.warning(
+                                "REMINDER_3D photo send failed user=%s err=%s — "
+                                "falling back to plain text",
+                                telegram_id, type(e).__name__,
+                            )
+                            sent = None
+                if sent is None:
+                    # Default path / photo fallback: plain text reminder.
+                    sent = await safe_send_message(bot, telegram_id, text, reply_markup=keyboard)
+                if sent is None:
+                    # Юзер заблокировал бота / чат недоступен.
                     if notif_key:
                         try:
                             await log_notification_send(
-                                notif_key, telegram_id, status="sent",
+                                notif_key, telegram_id, status="blocked",
                             )
                         except Exception:
                             pass
+                    continue
+                await pace(0.05)  # Telegram rate limit: max 20 msgs/sec
 
-                    # Log to audit_log
-                    await database._log_audit_event_atomic_standalone(
-                        "reminder_sent",
-                        telegram_id,
-                        telegram_id,
-                        audit_message
-                    )
+                # Mark reminder as sent using notification service
+                await notification_service.mark_reminder_sent(telegram_id, reminder_type)
 
-                    logger.info("Reminder (%s) sent to user %s", reminder_type.value, telegram_id)
-                
-            except Exception as e:
-                # Ошибка для одного пользователя не должна ломать цикл
-                logger.error("Error sending reminder to user %s: %s", telegram_id, e, exc_info=True)
-                continue
-                
-    except Exception as e:
-        logger.exception(f"Error in send_smart_reminders: {e}")
+                # Метрика для admin-stats (только для reminder-типов
+                # обёрнутых в registry — admin/legacy остаются без).
+                if notif_key:
+                    try:
+                        await log_notification_send(
+                            notif_key, telegram_id, status="sent",
+                        )
+                    except Exception:
+                        pass
+
+                # Log to audit_log
+                await database._log_audit_event_atomic_standalone(
+                    "reminder_sent",
+                    telegram_id,
+                    telegram_id,
+                    audit_message
+                )
+
+                logger.info("Reminder (%s) sent to user %s", reminder_type.value, telegram_id)
+            
+        except Exception as e:
+            # Ошибка для одного пользователя не должна ломать цикл
+            logger.error("Error sending reminder to user %s: %s", telegram_id, e, exc_info=True)
+            continue
+
+    return idle
 
 
 async def reminders_task(bot: Bot):
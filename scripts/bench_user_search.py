@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк поиска юзеров дашборда (database.search_users_dashboard).
+
+Создаёт отдельную схему bench_user_search с синтетическими users /
+subscriptions (N строк), индексами из миграции 081 и гоняет через
+search_path ТОТ ЖЕ SQL, что собирает database.users
+.build_user_search_query, плюс старый seq-scan запрос для сравнения.
+Боевые таблицы не трогаются; схема удаляется в конце (--keep — оставить
+для повторных прогонов).
+
+Использование:
+    # 2M юзеров, по 200 запросов на каждый тип
+    python -m scripts.bench_user_search --users 2000000 --runs 200
+
+    # Повторный прогон на уже засеянной схеме
+    python -m scripts.bench_user_search --reuse --keep
+
+Печатает p50 / p95 / max (мс) по каждому пути: numeric prefix, short
+username prefix, 3+ символа с префиксным попаданием, trigram substring
+и для сравнения legacy ILIKE (seq scan).
+"""
+import argparse
+import asyncio
+import logging
+import random
+import statistics
+import string
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import asyncpg
+
+import config
+from database.users import build_user_search_query
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+)
+logger = logging.getLogger("bench_user_search")
+
+SCHEMA = "bench_user_search"
+
+LEGACY_QUERY = """SELECT u.telegram_id, u.username, u.language, u.created_at,
+       EXISTS (SELECT 1 FROM subscriptions s
+               WHERE s.telegram_id = u.telegram_id
+                 AND s.status = 'active' AND s.expires_at > NOW()) AS has_active_sub
+   FROM users u
+   WHERE CAST(u.telegram_id AS TEXT) ILIKE $1 OR u.username ILIKE $1
+   ORDER BY
+       CASE
+           WHEN CAST(u.telegram_id AS TEXT) = $2 THEN 0
+           WHEN LOWER(u.username) = LOWER($2) THEN 1
+           WHEN CAST(u.telegram_id AS TEXT) ILIKE $3 THEN 2
+           WHEN u.username ILIKE $3 THEN 3
+           ELSE 4
+       END,
+       u.created_at DESC NULLS LAST
+   LIMIT $4"""
+
+SEED_SQL = f"""
+CREATE SCHEMA {SCHEMA};
+CREATE TABLE {SCHEMA}.users (
+    telegram_id BIGINT PRIMARY KEY,
+    username    TEXT,
+    language    TEXT,
+    created_at  TIMESTAMP
+);
+CREATE TABLE {SCHEMA}.subscriptions (
+    telegram_id BIGINT UNIQUE NOT NULL,
+    status      TEXT,
+    expires_at  TIMESTAMP
+);
+INSERT INTO {SCHEMA}.users
+SELECT 100000000 + g * 37,
+       CASE WHEN g % 5 = 0 THEN NULL
+            ELSE 'user_' || substr(md5(g::text), 1, 4 + g % 8) END,
+       'ru',
+       NOW() - (g % 1000) * INTERVAL '1 hour'
+FROM generate_series(1, $N) AS g;
+INSERT INTO {SCHEMA}.subscriptions
+SELECT telegram_id, 'active', NOW() + INTERVAL '10 days'
+FROM {SCHEMA}.users WHERE telegram_id % 3 = 0;
+CREATE INDEX ON {SCHEMA}.users USING gin (username gin_trgm_ops);
+CREATE INDEX ON {SCHEMA}.users ((telegram_id::text) text_pattern_ops);
+CREATE INDEX ON {SCHEMA}.users (lower(username) text_pattern_ops) WHERE username IS NOT NULL;
+ANALYZE {SCHEMA}.users;
+ANALYZE {SCHEMA}.subscriptions;
+"""
+
+
+def _queries(n_users: int, runs: int) -> dict:
+    rnd = random.Random(42)
+    ids = [str(100000000 + rnd.randint(1, n_users) * 37) for _ in range(runs)]
+    hexes = string.hexdigits.lower()[:16]
+    return {
+        "numeric_prefix": [i[: rnd.randint(3, 9)] for i in ids],
+        # "u"/"us" — худший случай: префикс у ~80% юзеров
+        "username_prefix": [rnd.choice(["u", "us"]) for _ in range(runs)],
+        "username_3plus": ["user_" + "".join(rnd.choice(hexes) for _ in range(rnd.randint(0, 3)))
+                           for _ in range(runs)],
+        "trigram_substring": ["".join(rnd.choice(hexes) for _ in range(rnd.randint(3, 6))) for _ in range(runs)],
+    }
+
+
+async def _timed(conn, sql: str, args: list) -> float:
+    t0 = time.perf_counter()
+    await conn.fetch(sql, *args)
+    return (time.perf_counter() - t0) * 1000
+
+
+def _report(name: str, samples: list) -> None:
+    samples = sorted(samples)
+    p95 = samples[max(0, int(len(samples) * 0.95) - 1)]
+    logger.info(
+        "%-18s n=%-4d p50=%7.2fms p95=%7.2fms max=%7.2fms",
+        name, len(samples), statistics.median(samples), p95, samples[-1],
+    )
+
+
+async def main(args) -> int:
+    conn = await asyncpg.connect(config.env("DATABASE_URL"))
+    try:
+        await conn.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        if not args.reuse:
+            await conn.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+            logger.info("seeding %s users into schema %s ...", args.users, SCHEMA)
+            t0 = time.perf_counter()
+            await conn.execute(SEED_SQL.replace("$N", str(int(args.users))))
+            logger.info("seeded in %.1fs", time.perf_counter() - t0)
+        await conn.execute(f"SET search_path = {SCHEMA}, public")
+
+        for name, qs in _queries(args.users, args.runs).items():
+            samples = []
+            for q in qs:
+                sql, qargs = build_user_search_query(q, args.limit)
+                samples.append(await _timed(conn, sql, qargs))
+            _report(name, samples)
+
+        if not args.skip_legacy:
+            samples = []
+            for q in _queries(args.users, min(args.runs, 20))["trigram_substring"]:
+                samples.append(await _timed(conn, LEGACY_QUERY, [f"%{q}%", q, f"{q}%", args.limit]))
+            _report("legacy_ilike", samples)
+    finally:
+        if not args.keep:
+            await conn.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+        await conn.close()
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=2_000_000)
+    parser.add_argument("--runs", type=int, default=200)
+    parser.add_argument("--limit", type=int, default=25)
+    parser.add_argument("--reuse", action="store_true", help="не пересевать схему")
+    parser.add_argument("--keep", action="store_true", help="не удалять схему в конце")
+    parser.add_argument("--skip-legacy", action="store_true", help="не гонять старый seq-scan запрос")
+    sys.exit(asyncio.run(main(parser.parse_args())))
@@ -1,8 +1,17 @@
 // Node sidecar — wraps @incy/link-encoder for the Python bot.
 //
-// Usage:  node scripts/incy_encode.mjs <subscription_url>
-// stdout: incy://crypt1/<base64url>
-// exit 0 on success, 1 on usage error, 2 on encode failure.
+// One-shot:  node scripts/incy_encode.mjs <subscription_url>
+//   stdout: incy://crypt1/<base64url>
+//   exit 0 on success, 1 on usage error, 2 on encode failure.
+//
+// Serve:     node scripts/incy_encode.mjs --serve
+//   Long-lived worker for the pool in app/services/incy_crypto.py.
+//   Newline-delimited JSON on stdin/stdout, one object per line:
+//     → {"id": 7, "url": "https://…"}   ← {"id": 7, "link": "incy://crypt1/…"}
+//     → {"id": 8, "ping": true}          ← {"id": 8, "pong": true}
+//   Encode errors come back as {"id": …, "error": "…"}; the process keeps
+//   serving. Requests are answered in order, so the caller can pipeline.
+//   Exits when stdin closes.
 //
 // Why a sidecar:
 //   The AES-256-GCM key Incy uses is shipped inside the npm package
@@ -13,20 +22,53 @@
 // Resolved relative to __file__ in the Python wrapper, so cwd does not
 // matter and the bot can run from anywhere.
 
+import { createInterface } from "node:readline";
 import { encryptLink } from "@incy/link-encoder";
 
-const url = process.argv[2];
-if (!url) {
-  process.stderr.write("usage: incy_encode.mjs <url>\n");
-  process.exit(1);
+// `name` shows up in the Incy app once the subscription is imported;
+// it's a label, not a unique key.
+const LINK_NAME = "Atlas Secure";
+
+function errorText(err) {
+  return err && err.message ? err.message : String(err);
 }
 
-try {
-  // `name` shows up in the Incy app once the subscription is imported;
-  // it's a label, not a unique key.
-  const link = encryptLink(url, { name: "Atlas Secure" });
-  process.stdout.write(link);
-} catch (err) {
-  process.stderr.write(`encode failed: ${err && err.message ? err.message : err}\n`);
-  process.exit(2);
+function serve() {
+  const rl = createInterface({ input: process.stdin, crlfDelay: Infinity });
+  rl.on("line", (line) => {
+    let req;
+    try {
+      req = JSON.parse(line);
+    } catch (err) {
+      process.stdout.write(JSON.stringify({ id: null, error: "bad request" }) + "\n");
+      return;
+    }
+    const out = { id: req.id };
+    if (req.ping) {
+      out.pong = true;
+    } else {
+      try {
+        out.link = encryptLink(req.url, { name: LINK_NAME });
+      } catch (err) {
+        out.error = errorText(err);
+      }
+    }
+    process.stdout.write(JSON.stringify(out) + "\n");
+  });
+  rl.on("close", () => process.exit(0));
+}
+
+const arg = process.argv[2];
+if (arg === "--serve") {
+  serve();
+} else if (!arg) {
+  process.stderr.write("usage: incy_encode.mjs <url> | --serve\n");
+  process.exit(1);
+} else {
+  try {
+    process.stdout.write(encryptLink(arg, { name: LINK_NAME }));
+  } catch (err) {
+    process.stderr.write(`encode failed: ${errorText(err)}\n`);
+    process.exit(2);
+  }
 }
@@ -0,0 +1,109 @@
+"""
+Tests for dashboard analytics rollups (database.analytics) and the
+readers in database.admin that stitch rollups with the raw tail.
+
+SQL is only inspected, not executed; the pool is mocked.
+"""
+from contextlib import asynccontextmanager
+from datetime import date, datetime, timezone
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from database import admin
+from database.analytics import build_facts_query, fact_segments
+
+UTC = timezone.utc
+
+
+def _pool(conn):
+    pool = MagicMock()
+
+    @asynccontextmanager
+    async def acquire():
+        yield conn
+
+    pool.acquire = acquire
+    return pool
+
+
+def test_segments_without_watermark_are_raw():
+    since = datetime(2026, 5, 1, 10, 30, tzinfo=UTC)
+    now = datetime(2026, 5, 3, 12, 5, tzinfo=UTC)
+    assert fact_segments(since, now, None) == [("raw", since, now)]
+    assert fact_segments(since, now, since) == [("raw", since, now)]
+
+
+def test_segments_stitch_raw_hours_days_raw():
+    since = datetime(2026, 5, 1, 10, 30, tzinfo=UTC)
+    wm = datetime(2026, 5, 4, 7, 0, tzinfo=UTC)
+    now = datetime(2026, 5, 4, 7, 40, tzinfo=UTC)
+    assert fact_segments(since, now, wm) == [
+        ("raw", since, datetime(2026, 5, 1, 11, tzinfo=UTC)),
+        ("hour", datetime(2026, 5, 1, 11, tzinfo=UTC), datetime(2026, 5, 2, tzinfo=UTC)),
+        ("day", date(2026, 5, 2), date(2026, 5, 4)),
+        ("hour", datetime(2026, 5, 4, tzinfo=UTC), wm),
+        ("raw", wm, now),
+    ]
+    # hour-of-day графикам нужны только часовые строки
+    kinds = [k for k, _, _ in fact_segments(since, now, wm, daily=False)]
+    assert kinds == ["raw", "hour", "raw"]
+
+
+def test_query_binds_metrics_only_for_rollup_segments():
+    now = datetime(2026, 5, 4, 7, 40, tzinfo=UTC)
+    sql, args = build_facts_query([("raw", now, now)], ["metric"], ["user"])
+    assert "FROM users" in sql and "analytics_" not in sql
+    assert len(args) == 2
+
+    segs = fact_segments(datetime(2026, 5, 1, tzinfo=UTC), now, datetime(2026, 5, 4, 7, tzinfo=UTC))
+    sql, args = build_facts_query(segs, ["metric", "source"], ["purchase", "payment"])
+    assert args[0] == ["payment", "purchase"]         # since выровнен — сырой головы нет
+    assert "FROM analytics_daily" in sql and "FROM pending_purchases" in sql
+    assert "FROM users" not in sql
+    assert sql.rstrip().endswith("GROUP BY 1, 2")
+
+
+async def test_breakdown_aggregates_one_rollup_query():
+    rows = [
+        {"provider": "platega", "tariff": "apple_id_tr_500", "source": "apple_id", "cnt": 2, "amount": 90000},
+        {"provider": "", "tariff": "basic_30", "source": "", "cnt": 3, "amount": 30000},
+        {"provider": "platega", "tariff": "basic_30", "source": "subscription", "cnt": 1, "amount": 10000},
+    ]
+    fetch = AsyncMock(return_value=rows)
+    with patch.object(admin, "get_pool", AsyncMock(return_value=_pool(MagicMock()))), \
+         patch.object(admin, "get_rollup_watermark", AsyncMock(return_value=None)), \
+         patch.object(admin, "fetch_facts", fetch):
+        out = await admin.get_payments_breakdown(24)
+
+    fetch.assert_awaited_once()
+    assert out["total"] == {"count": 6, "revenue_rubles": 1300.0}
+    assert out["by_provider"][0] == {"provider": "platega", "count": 3, "revenue_rubles": 1000.0}
+    assert {"tariff": "basic_30", "count": 4, "revenue_rubles": 400.0} in out["by_tariff"]
+    assert [t["purchase_type"] for t in out["by_type"]] == ["apple_id", "unknown", "subscription"]
+    assert out["by_apple_nominal"] == [
+        {"region": "tr", "nominal": 500, "count": 2, "revenue_rubles": 900.0},
+    ]
+
+
+async def test_daily_series_fills_empty_days():
+    today = datetime.now(UTC).date()
+    rows = [
+        {"day": today, "metric": "payment", "source": "", "cnt": 2, "amount": 25000},
+        {"day": today, "metric": "subscription", "source": "payment", "cnt": 1, "amount": 0},
+        {"day": today, "metric": "subscription", "source": "trial", "cnt": 4, "amount": 0},
+    ]
+    with patch.object(admin, "get_read_pool", AsyncMock(return_value=_pool(MagicMock()))), \
+         patch.object(admin, "get_rollup_watermark", AsyncMock(return_value=None)), \
+         patch.object(admin, "fetch_facts", AsyncMock(return_value=rows)):
+        out = await admin.get_daily_timeseries(3)
+
+    assert [p["date"] for p in out["series"]][-1] == today.isoformat()
+    assert len(out["series"]) == 3
+    assert out["series"][0]["payments_count"] == 0
+    assert out["series"][-1] == {
+        "date": today.isoformat(),
+        "revenue_rubles": 250.0,
+        "payments_count": 2,
+        "new_users": 0,
+        "new_subscriptions": 5,
+        "new_paid_subscriptions": 1,
+    }
@@ -0,0 +1,56 @@
+"""Unit tests for BroadcastLogBuffer — batched broadcast_log writes."""
+import asyncio
+from unittest.mock import AsyncMock, patch
+
+import pytest
+
+from app.services import broadcast_log_buffer
+from app.services.broadcast_log_buffer import BroadcastLogBuffer
+
+
+@pytest.mark.asyncio
+async def test_flush_writes_all_pending_rows_in_one_call():
+    bulk = AsyncMock(side_effect=lambda records: len(records))
+    with patch.object(broadcast_log_buffer.database, "log_broadcast_sends_bulk", bulk, create=True):
+        buf = BroadcastLogBuffer(7)
+        await buf.add(1, "sent", "A", message_id=11)
+        await buf.add(2, "failed", "B")
+        assert await buf.flush() == 2
+        assert await buf.flush() == 0
+
+    bulk.assert_awaited_once()
+    assert bulk.call_args.args[0] == [(7, 1, "sent", "A", 11), (7, 2, "failed", "B", None)]
+    assert buf.written == 2
+
+
+@pytest.mark.asyncio
+async def test_context_exit_flushes_on_cancellation():
+    bulk = AsyncMock(side_effect=lambda records: len(records))
+    started = asyncio.Event()
+
+    async def _sender(buf):
+        async with buf:
+            await buf.add(1, "sent", message_id=5)
+            started.set()
+            await asyncio.sleep(10)
+
+    with patch.object(broadcast_log_buffer.database, "log_broadcast_sends_bulk", bulk, create=True):
+        buf = BroadcastLogBuffer(3)
+        task = asyncio.create_task(_sender(buf))
+        await started.wait()
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    assert buf.written == 1
+    assert len(buf) == 0
+
+
+@pytest.mark.asyncio
+async def test_flush_failure_is_swallowed_and_counted():
+    bulk = AsyncMock(side_effect=RuntimeError("db down"))
+    with patch.object(broadcast_log_buffer.database, "log_broadcast_sends_bulk", bulk, create=True):
+        buf = BroadcastLogBuffer(1)
+        await buf.add(1, "sent")
+        assert await buf.flush() == 0
+    assert buf.dropped == 1
@@ -0,0 +1,114 @@
+"""
+Tests for app/events.RedisBus: batched/coalesced publish, own-origin skip,
+local_only subscribers. Redis is a fake that records PUBLISH calls.
+"""
+import asyncio
+import json
+from unittest.mock import AsyncMock, patch
+
+from app import events
+from app.events import RedisBus
+
+
+class _FakeRedis:
+    def __init__(self):
+        self.publish = AsyncMock()
+
+
+async def test_progress_events_coalesced_into_one_publish():
+    r = _FakeRedis()
+    b = RedisBus(flush_interval=0.01)
+    local = b.subscribe(local_only=True)
+    with patch("app.utils.redis_client.get_redis", AsyncMock(return_value=r)):
+        for sent in range(1, 51):
+            b.publish({"type": "broadcast:progress", "broadcast_id": 7, "sent": sent})
+        b.publish({"type": "broadcast:progress", "broadcast_id": 8, "sent": 1})
+        b.publish({"type": "user:new", "telegram_id": 1})
+        await asyncio.sleep(0.05)
+
+    assert local.qsize() == 52                     # локально — каждое событие
+    r.publish.assert_awaited_once()
+    channel, payload = r.publish.await_args.args
+    message = json.loads(payload)
+    assert channel == "events:bus" and message["o"] == b._origin
+    assert message["e"] == [
+        {"type": "broadcast:progress", "broadcast_id": 7, "sent": 50},
+        {"type": "broadcast:progress", "broadcast_id": 8, "sent": 1},
+        {"type": "user:new", "telegram_id": 1},
+    ]
+
+
+async def test_remote_events_skip_own_origin_and_local_only():
+    b = RedisBus()
+    with patch.object(RedisBus, "_ensure_listener"):
+        remote = b.subscribe()
+        local = b.subscribe(local_only=True)
+
+    b._handle_message(json.dumps({"o": b._origin, "e": [{"type": "x"}]}))
+    assert remote.empty()
+    b._handle_message(json.dumps({"o": "other", "e": [{"type": "y"}]}))
+    assert remote.get_nowait() == {"type": "y"}
+    assert local.empty()
+    b._handle_message("not json")
+
+
+async def test_full_queue_drops_instead_of_blocking():
+    b = events.Bus()
+    q = b.subscribe()
+    for i in range(events._MAX_QUEUE_SIZE + 5):
+        b.publish({"type": "t", "i": i})
+    assert q.qsize() == events._MAX_QUEUE_SIZE
+
+
+def test_redis_backend_without_url_falls_back_to_memory():
+    with patch.object(events.config, "EVENT_BUS_BACKEND", "redis"), \
+         patch.object(events.config, "REDIS_URL", ""):
+        assert type(events._make_bus()) is events.Bus
+
+
+class _IdlePubSub:
+    """get_message() → None while the channel is quiet, then one message."""
+
+    def __init__(self, messages):
+        self.subscribe_calls = 0
+        self._messages = list(messages)
+
+    async def subscribe(self, channel):
+        self.subscribe_calls += 1
+
+    async def get_message(self, ignore_subscribe_messages=False, timeout=0.0):
+        await asyncio.sleep(0)
+        return self._messages.pop(0) if self._messages else None
+
+    async def aclose(self):
+        pass
+
+
+async def test_idle_read_does_not_resubscribe():
+    remote_event = json.dumps({"o": "other", "e": [{"type": "user:new", "telegram_id": 5}]})
+    pubsub = _IdlePubSub([None] * 20 + [{"type": "message", "data": remote_event}])
+    client = type("C", (), {"pubsub": lambda self: pubsub})()
+    b = RedisBus()
+    with patch("app.utils.redis_client.get_pubsub_redis", AsyncMock(return_value=client)):
+        remote = b.subscribe()
+        event = await asyncio.wait_for(remote.get(), timeout=1.0)
+        await b.close()
+
+    assert event == {"type": "user:new", "telegram_id": 5}
+    assert pubsub.subscribe_calls == 1
+
+
+async def test_listener_retries_when_client_is_missing(monkeypatch):
+    monkeypatch.setattr(events, "_RECONNECT_DELAY", 0)
+    remote_event = json.dumps({"o": "other", "e": [{"type": "user:new", "telegram_id": 6}]})
+    pubsub = _IdlePubSub([{"type": "message", "data": remote_event}])
+    client = type("C", (), {"pubsub": lambda self: pubsub})()
+    b = RedisBus()
+    get_client = AsyncMock(side_effect=[None, client])
+    with patch("app.utils.redis_client.get_pubsub_redis", get_client):
+        remote = b.subscribe()
+        event = await asyncio.wait_for(remote.get(), timeout=1.0)
+        await b.close()
+
+    assert event == {"type": "user:new", "telegram_id": 6}
+    assert get_client.await_count == 2
@@ -0,0 +1,163 @@
+"""
+Tests for the staged fast_expiry_cleanup pipeline.
+
+Stage 2 (panel removals) is exercised with a fake remove_uuid_if_needed;
+stage 3 with a mocked connection — database.expire_subscriptions_bulk
+returns the rows that actually transitioned.
+"""
+import asyncio
+from datetime import datetime, timezone
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import fast_expiry_cleanup as fec
+
+
+def _row(tid, uuid="uuid-%s"):
+    return {
+        "id": tid,
+        "telegram_id": tid,
+        "uuid": uuid % tid if "%s" in uuid else uuid,
+        "expires_at": datetime(2026, 1, 1, tzinfo=timezone.utc),
+        "source": "payment",
+    }
+
+
+async def test_remove_uuids_bounded_concurrency_and_outcomes():
+    in_flight = 0
+    peak = 0
+
+    async def fake_remove(*, uuid, subscription_status, subscription_expired):
+        nonlocal in_flight, peak
+        in_flight += 1
+        peak = max(peak, in_flight)
+        await asyncio.sleep(0.01)
+        in_flight -= 1
+        if uuid == "uuid-3":
+            raise fec.vpn_service.VPNRemovalError("panel down")
+        return True
+
+    rows = [_row(i) for i in range(10)]
+    with patch.object(fec, "REMOVAL_CONCURRENCY", 3), \
+         patch.object(fec.vpn_service, "remove_uuid_if_needed", side_effect=fake_remove), \
+         patch.object(fec.database, "_log_vpn_lifecycle_audit_async", AsyncMock()) as audit:
+        removed = await fec._remove_uuids(rows)
+
+    assert peak <= 3
+    assert [r["telegram_id"] for r in removed] == [0, 1, 2, 4, 5, 6, 7, 8, 9]
+    audit.assert_awaited_once()
+    assert audit.await_args.kwargs["result"] == "error"
+
+
+async def test_apply_transitions_single_bulk_update_per_chunk():
+    rows = [_row(1), _row(2), _row(3)]
+    expired = [
+        {"telegram_id": 1, "uuid": "uuid-1", "expires_at": rows[0]["expires_at"], "bypass_only": False},
+        {"telegram_id": 3, "uuid": "uuid-3", "expires_at": rows[2]["expires_at"], "bypass_only": True},
+    ]
+    conn = MagicMock()
+    tx = MagicMock()
+    tx.__aenter__ = AsyncMock()
+    tx.__aexit__ = AsyncMock(return_value=None)
+    conn.transaction.return_value = tx
+    acq = MagicMock()
+    acq.__aenter__ = AsyncMock(return_value=conn)
+    acq.__aexit__ = AsyncMock(return_value=None)
+
+    with patch.object(fec, "acquire_connection", return_value=acq), \
+         patch.object(fec.database, "expire_subscriptions_bulk", AsyncMock(return_value=expired)) as bulk, \
+         patch.object(fec.database, "_log_fast_expiry_audit_bulk", AsyncMock()) as audit:
+        result = await fec._apply_transitions(MagicMock(), rows, datetime.now(timezone.utc))
+
+    assert result == expired
+    bulk.assert_awaited_once()
+    assert bulk.await_args.args[1] == [(1, "uuid-1"), (2, "uuid-2"), (3, "uuid-3")]
+    audit.assert_awaited_once()
+    assert audit.await_args.args[2] == expired
+
+
+async def test_bypass_only_notifications_run_detached():
+    bot = MagicMock()
+    expired = [
+        {"telegram_id": 1, "uuid": "u1", "expires_at": None, "bypass_only": False},
+        {"telegram_id": 2, "uuid": "u2", "expires_at": None, "bypass_only": True},
+    ]
+    with patch("app.services.remnawave_service.extend_remnawave_for_bypass_bg") as extend, \
+         patch.object(fec, "resolve_languages", AsyncMock(return_value={2: "en"})), \
+         patch.object(fec, "safe_send_message", AsyncMock()) as send:
+        fec._after_transitions(bot, expired)
+        assert len(fec._notify_tasks) == 1
+        await asyncio.gather(*list(fec._notify_tasks))
+
+    extend.assert_called_once_with(2)
+    send.assert_awaited_once()
+    assert send.await_args.args[1] == 2
+
+
+async def test_bypass_extend_enqueued_in_transition_transaction():
+    rows = [_row(1), _row(2)]
+    expired = [
+        {"telegram_id": 1, "uuid": "uuid-1", "expires_at": None, "bypass_only": False},
+        {"telegram_id": 2, "uuid": "uuid-2", "expires_at": None, "bypass_only": True},
+    ]
+    conn = MagicMock()
+    tx = MagicMock()
+    tx.__aenter__ = AsyncMock()
+    tx.__aexit__ = AsyncMock(return_value=None)
+    conn.transaction.return_value = tx
+    acq = MagicMock()
+    acq.__aenter__ = AsyncMock(return_value=conn)
+    acq.__aexit__ = AsyncMock(return_value=None)
+
+    with patch.object(fec, "acquire_connection", return_value=acq), \
+         patch.object(fec.database, "outbox_enabled", return_value=True), \
+         patch.object(fec.database, "expire_subscriptions_bulk", AsyncMock(return_value=expired)), \
+         patch.object(fec.database, "_log_fast_expiry_audit_bulk", AsyncMock()), \
+         patch.object(fec.database, "enqueue_remnawave_ops", AsyncMock()) as enqueue, \
+         patch("app.services.remnawave_service.extend_remnawave_for_bypass_bg") as extend:
+        await fec._apply_transitions(MagicMock(), rows, datetime.now(timezone.utc))
+        fec._after_transitions(None, expired)
+
+    assert enqueue.await_args.args == (conn, [(2, "extend_bypass", None)])
+    extend.assert_not_called()
+
+
+async def test_remove_uuids_stops_calling_panel_after_deadline():
+    calls = []
+
+    async def fake_remove(*, uuid, subscription_status, subscription_expired):
+        calls.append(uuid)
+        await asyncio.sleep(0.05)
+        return True
+
+    rows = [_row(i) for i in range(6)]
+    with patch.object(fec, "REMOVAL_CONCURRENCY", 2), \
+         patch.object(fec.vpn_service, "remove_uuid_if_needed", side_effect=fake_remove):
+        removed = await fec._remove_uuids(rows, deadline=fec.time.monotonic() + 0.02)
+
+    assert calls == ["uuid-0", "uuid-1"]
+    assert [r["telegram_id"] for r in removed] == [0, 1]
+
+
+async def test_cancelled_iteration_still_applies_transitions_for_removed_uuids():
+    removal_started = asyncio.Event()
+
+    async def slow_remove(*, uuid, subscription_status, subscription_expired):
+        removal_started.set()
+        await asyncio.sleep(0.05)
+        return True
+
+    rows = [_row(i) for i in range(4)]
+    with patch.object(fec, "REMOVAL_CONCURRENCY", 4), \
+         patch.object(fec, "REMOVAL_CHUNK", 4), \
+         patch.object(fec.vpn_service, "remove_uuid_if_needed", side_effect=slow_remove), \
+         patch.object(fec, "_apply_transitions", AsyncMock(return_value=[])) as apply:
+        outer = asyncio.create_task(
+            fec._process_batch(MagicMock(), None, rows, datetime.now(timezone.utc), fec.time.monotonic() + 60)
+        )
+        await removal_started.wait()
+        outer.cancel()
+        await asyncio.gather(outer, return_exceptions=True)
+        await asyncio.gather(*list(fec._chunk_tasks))
+
+    apply.assert_awaited_once()
+    assert [r["telegram_id"] for r in apply.await_args.args[1]] == [0, 1, 2, 3]
@@ -0,0 +1,109 @@
+"""
+Tests for the persistent Incy sidecar pool (app/services/incy_crypto):
+pipelined requests over `incy_encode.mjs --serve`, restart after the
+process dies, graceful disable when the npm package is missing, bulk
+pre-warm of _link_cache.
+
+Runs the real script under node against a fake @incy/link-encoder
+package in a temp dir; skipped when node is not installed.
+"""
+import asyncio
+import shutil
+from pathlib import Path
+from unittest.mock import patch
+
+import pytest
+
+from app.services import incy_crypto
+
+pytestmark = pytest.mark.skipif(shutil.which("node") is None, reason="node not installed")
+
+_REAL_SCRIPT = Path(incy_crypto.__file__).resolve().parent.parent.parent / "scripts" / "incy_encode.mjs"
+
+_FAKE_ENCODER = """
+export function encryptLink(url, opts) {
+  if (url === "boom") throw new Error("bad url");
+  return "incy://crypt1/" + Buffer.from(url).toString("base64url");
+}
+"""
+
+
+def _layout(root: Path, with_package: bool = True) -> Path:
+    scripts = root / "scripts"
+    scripts.mkdir()
+    shutil.copy(_REAL_SCRIPT, scripts / "incy_encode.mjs")
+    if with_package:
+        pkg = root / "node_modules" / "@incy" / "link-encoder"
+        pkg.mkdir(parents=True)
+        (pkg / "package.json").write_text(
+            '{"name": "@incy/link-encoder", "type": "module", "main": "index.js"}'
+        )
+        (pkg / "index.js").write_text(_FAKE_ENCODER)
+    return scripts / "incy_encode.mjs"
+
+
+@pytest.fixture
+def sidecar(tmp_path):
+    def make(with_package=True, size=2):
+        script = _layout(tmp_path, with_package)
+        patches = [
+            patch.object(incy_crypto, "_SCRIPT_PATH", script),
+            patch.object(incy_crypto, "_disabled", False),
+            patch.object(incy_crypto, "_pool", None),
+            patch.object(incy_crypto, "_link_cache", {}),
+            patch.object(incy_crypto.config, "INCY_SIDECAR_POOL_SIZE", size, create=True),
+        ]
+        for p in patches:
+            p.start()
+        stack.extend(patches)
+    stack = []
+    yield make
+    for p in reversed(stack):
+        p.stop()
+
+
+async def test_pipelined_encodes_and_restart(sidecar):
+    sidecar()
+    try:
+        urls = [f"https://sub.example/{i}" for i in range(200)]
+        links = await asyncio.gather(*(incy_crypto.to_incy_link_crypt1(u) for u in urls))
+        assert all(link and link.startswith(incy_crypto.DEEP_LINK_PREFIX) for link in links)
+        assert len(set(links)) == 200
+
+        # Ошибка encode не валит процесс
+        assert await incy_crypto.to_incy_link_crypt1("boom") is None
+
+        pool = incy_crypto._get_pool()
+        for w in pool._workers:
+            if w.proc is not None:
+                w.proc.kill()
+                await w.proc.wait()
+        await asyncio.sleep(0.05)
+        for w in pool._workers:
+            w._next_start_at = 0.0
+        assert await incy_crypto.to_incy_link_crypt1("https://sub.example/x")
+        assert await pool.health_check() == 2
+    finally:
+        await incy_crypto.close()
+
+
+async def test_missing_package_disables_and_falls_back(sidecar):
+    sidecar(with_package=False)
+    try:
+        link = await incy_crypto.to_incy_link("https://sub.example/1")
+        assert link.startswith("incy://add/")
+        assert incy_crypto._disabled is True
+        assert incy_crypto._link_cache["https://sub.example/1"] == link
+    finally:
+        await incy_crypto.close()
+
+
+async def test_prewarm_fills_link_cache(sidecar):
+    sidecar(size=1)
+    try:
+        urls = [f"https://agg.example/a/t{i}" for i in range(300)]
+        assert await incy_crypto.prewarm(urls + urls[:10]) == 300
+        assert incy_crypto._link_cache[urls[5]].startswith(incy_crypto.DEEP_LINK_PREFIX)
+        assert await incy_crypto.prewarm(urls) == 0
+    finally:
+        await incy_crypto.close()
@@ -0,0 +1,52 @@
+"""
+Tests for the pool-level json/jsonb codec (database/core) and the farm
+paths that now rely on it instead of parsing farm_plots by hand.
+"""
+import json
+from contextlib import asynccontextmanager
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from database import core, users
+
+
+def test_codec_round_trip_and_text_passthrough():
+    plots = [{"plot_id": 0, "status": "growing", "ready_at": "2026-10-16T10:00:00+00:00"}]
+    encoded = core._encode_json(plots)
+    assert core._json_loads(encoded) == plots
+    # Старые вызовы передают уже сериализованный JSON — не кодируем повторно.
+    assert core._encode_json('{"a": 1}') == '{"a": 1}'
+    assert json.loads(core._encode_json({"n": 1, "k": {1: "x"}})) == {"n": 1, "k": {"1": "x"}}
+
+
+async def test_init_connection_registers_json_and_jsonb():
+    conn = MagicMock()
+    conn.set_type_codec = AsyncMock()
+    await core._init_connection(conn)
+    assert [c.args[0] for c in conn.set_type_codec.await_args_list] == ["jsonb", "json"]
+    assert core._get_pool_config()["init"] is core._init_connection
+
+
+async def test_get_farm_data_uses_decoded_plots():
+    conn = MagicMock()
+    conn.execute = AsyncMock()
+    plots = [{"plot_id": 0, "status": "ready"}]
+    conn.fetchrow = AsyncMock(side_effect=[
+        {"farm_plots": plots, "farm_plot_count": 1, "balance": 500},
+        {"farm_plots": [], "farm_plot_count": 1, "balance": None},
+    ])
+    pool = MagicMock()
+
+    @asynccontextmanager
+    async def acquire():
+        yield conn
+
+    pool.acquire = acquire
+    with patch.object(core, "DB_READY", True), \
+         patch.object(users, "get_pool", AsyncMock(return_value=pool)):
+        assert await users.get_farm_data(1) == (plots, 1, 500)
+        conn.execute.assert_not_awaited()
+
+        restored, count, balance = await users.get_farm_data(1)
+        assert restored == [users.empty_farm_plot(0)] and (count, balance) == (1, 0)
+        # Список уходит в драйвер как есть — сериализует кодек.
+        assert conn.execute.await_args.args[1] == restored
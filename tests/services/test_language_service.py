@@ -0,0 +1,62 @@
+"""Unit tests for the language_service LRU+TTL cache."""
+from unittest.mock import AsyncMock, patch
+
+import pytest
+
+from app.services import language_service
+
+
+@pytest.fixture(autouse=True)
+def _clean_cache(monkeypatch):
+    monkeypatch.setattr(language_service.config, "LANGUAGE_CACHE_REDIS", False)
+    language_service.clear_language_cache()
+    yield
+    language_service.clear_language_cache()
+
+
+@pytest.mark.asyncio
+async def test_second_resolve_is_served_from_cache():
+    fetch = AsyncMock(return_value={42: "en"})
+    with patch.object(language_service.database, "get_user_languages", fetch, create=True):
+        assert await language_service.resolve_user_language(42) == "en"
+        assert await language_service.resolve_user_language(42) == "en"
+    fetch.assert_awaited_once()
+
+
+@pytest.mark.asyncio
+async def test_invalidate_forces_refetch():
+    fetch = AsyncMock(side_effect=[{42: "en"}, {42: "de"}])
+    with patch.object(language_service.database, "get_user_languages", fetch, create=True):
+        assert await language_service.resolve_user_language(42) == "en"
+        await language_service.invalidate_user_language(42)
+        assert await language_service.resolve_user_language(42) == "de"
+
+
+@pytest.mark.asyncio
+async def test_missing_user_returns_default_without_caching():
+    fetch = AsyncMock(return_value={})
+    with patch.object(language_service.database, "get_user_languages", fetch, create=True):
+        assert await language_service.resolve_user_language(7) == language_service.DEFAULT_LANGUAGE
+        assert await language_service.resolve_user_language(7) == language_service.DEFAULT_LANGUAGE
+    assert fetch.await_count == 2
+
+
+@pytest.mark.asyncio
+async def test_resolve_languages_queries_only_misses_once():
+    fetch = AsyncMock(side_effect=[{1: "en"}, {2: "uz", 3: None}])
+    with patch.object(language_service.database, "get_user_languages", fetch, create=True):
+        await language_service.resolve_user_language(1)
+        out = await language_service.resolve_languages([1, 2, 3, 2])
+        assert out == {1: "en", 2: "uz", 3: language_service.DEFAULT_LANGUAGE}
+        assert await language_service.resolve_user_language(2) == "uz"
+    assert fetch.call_args_list[1].args[0] == [2, 3]
+    assert fetch.await_count == 2
+
+
+@pytest.mark.asyncio
+async def test_lru_evicts_oldest(monkeypatch):
+    monkeypatch.setattr(language_service.config, "LANGUAGE_CACHE_MAX_ENTRIES", 2)
+    fetch = AsyncMock(return_value={1: "en", 2: "ru", 3: "de"})
+    with patch.object(language_service.database, "get_user_languages", fetch, create=True):
+        await language_service.resolve_languages([1, 2, 3])
+    assert list(language_service._cache) == [2, 3]
@@ -0,0 +1,59 @@
+"""Unit tests for the coalescing users.last_seen_at buffer."""
+import asyncio
+from datetime import datetime, timezone
+from unittest.mock import AsyncMock, patch
+
+import pytest
+
+import database
+from app.core.last_seen_middleware import LastSeenBuffer
+
+
+@pytest.mark.asyncio
+async def test_touches_coalesce_to_latest_per_user():
+    bulk = AsyncMock(side_effect=lambda batch: len(batch))
+    buf = LastSeenBuffer(flush_interval=60, max_pending=100)
+    t1 = datetime(2026, 1, 1, 12, 0, 0, tzinfo=timezone.utc)
+    t2 = datetime(2026, 1, 1, 12, 0, 5, tzinfo=timezone.utc)
+    buf.touch(1, t1)
+    buf.touch(1, t2)
+    buf.touch(2, t1)
+    with patch.object(database, "touch_last_seen_bulk", bulk):
+        assert await buf.flush() == 2
+    bulk.assert_awaited_once()
+    assert bulk.call_args.args[0] == {1: t2, 2: t1}
+    assert len(buf) == 0
+
+
+@pytest.mark.asyncio
+async def test_size_trigger_schedules_early_flush():
+    bulk = AsyncMock(side_effect=lambda batch: len(batch))
+    buf = LastSeenBuffer(flush_interval=60, max_pending=2)
+    with patch.object(database, "touch_last_seen_bulk", bulk):
+        buf.touch(1)
+        buf.touch(2)
+        await asyncio.sleep(0.01)
+    bulk.assert_awaited_once()
+
+
+@pytest.mark.asyncio
+async def test_failed_flush_keeps_touches_for_retry():
+    buf = LastSeenBuffer(flush_interval=60, max_pending=100)
+    buf.touch(1)
+    with patch.object(database, "touch_last_seen_bulk", AsyncMock(side_effect=RuntimeError("db"))):
+        assert await buf.flush() == 0
+    assert len(buf) == 1
+
+
+@pytest.mark.asyncio
+async def test_run_flushes_on_cancel():
+    bulk = AsyncMock(side_effect=lambda batch: len(batch))
+    buf = LastSeenBuffer(flush_interval=60, max_pending=100)
+    with patch.object(database, "touch_last_seen_bulk", bulk):
+        task = asyncio.create_task(buf.run())
+        await asyncio.sleep(0)
+        buf.touch(5)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+    bulk.assert_awaited_once()
@@ -0,0 +1,93 @@
+"""
+Tests for app/core/metrics (registry + text exposition), the handler
+latency middleware and /metrics access control.
+"""
+from types import SimpleNamespace
+from unittest.mock import patch
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.api import metrics_route
+from app.core import metrics
+from app.core.metrics_middleware import UpdateMetricsMiddleware
+from app.utils.logging_helpers import log_handler_exit, log_worker_iteration_end
+
+
+@pytest.fixture(autouse=True)
+def _clean():
+    metrics.reset()
+    yield
+    metrics.reset()
+
+
+def test_histogram_exposition_is_cumulative():
+    h = metrics.REMNAWAVE_SECONDS
+    for v in (0.003, 0.02, 0.02, 7.0, 99.0):
+        h.observe(v, endpoint="GET /api/users/{uuid}")
+    text = metrics.render()
+    prefix = 'atlas_remnawave_request_seconds_bucket{endpoint="GET /api/users/{uuid}",le='
+    assert prefix + '"0.005"} 1' in text
+    assert prefix + '"0.025"} 3' in text
+    assert prefix + '"10"} 4' in text
+    assert prefix + '"+Inf"} 5' in text
+    assert 'atlas_remnawave_request_seconds_count{endpoint="GET /api/users/{uuid}"} 5' in text
+    assert "# TYPE atlas_remnawave_request_seconds histogram" in text
+
+
+async def test_worker_iteration_records_items_and_errors():
+    async with metrics.worker_iteration("w") as it:
+        it.items = 3
+    with pytest.raises(RuntimeError):
+        async with metrics.worker_iteration("w"):
+            raise RuntimeError("boom")
+    assert metrics.WORKER_ITERATION_SECONDS.count(worker="w") == 2
+    assert metrics.WORKER_ITEMS.value(worker="w") == 3
+    assert metrics.WORKER_ERRORS.value(worker="w") == 1
+
+
+def test_logging_helpers_with_duration():
+    log_handler_exit("process_successful_payment", "success", telegram_id=1, duration_ms=12.5)
+    log_worker_iteration_end("w", "success", items_processed=4, duration_ms=1500.0)
+    log_worker_iteration_end("w", "failed", error_type="infra_error", duration_ms=10.0)
+    log_worker_iteration_end("w", "skipped", duration_ms=1.0)
+    assert metrics.WORKER_ITERATION_SECONDS.count(worker="w") == 2
+    assert metrics.WORKER_ITEMS.value(worker="w") == 4
+    assert metrics.WORKER_ERRORS.value(worker="w") == 1
+    assert metrics.WORKER_ITERATION_SECONDS.count(worker="process_successful_payment") == 0
+
+
+async def test_update_middleware_labels_by_handler_module():
+    async def on_start(event, data):
+        return "ok"
+    on_start.__module__ = "app.handlers.user.start"
+
+    mw = UpdateMetricsMiddleware("message")
+    data = {"handler": SimpleNamespace(callback=on_start)}
+    assert await mw(on_start, object(), data) == "ok"
+    assert metrics.UPDATE_SECONDS.count(router="user.start", event="message") == 1
+
+
+def test_collector_failure_does_not_break_scrape():
+    def broken():
+        raise RuntimeError("pool gone")
+    with patch.object(metrics, "_collectors", [broken]):
+        assert metrics.render().endswith("\n")
+
+
+def test_metrics_endpoint_access():
+    app = FastAPI()
+    app.include_router(metrics_route.router)
+    client = TestClient(app, client=("127.0.0.1", 5000))
+    metrics.WORKER_CRASH.inc(task="reminders")
+
+    with patch.object(metrics_route.config, "METRICS_TOKEN", ""):
+        resp = client.get("/metrics")
+        assert resp.status_code == 200
+        assert 'atlas_worker_crash_total{task="reminders"} 1' in resp.text
+        assert client.get("/metrics", headers={"X-Forwarded-For": "1.2.3.4"}).status_code == 404
+
+    with patch.object(metrics_route.config, "METRICS_TOKEN", "s3cret"):
+        assert client.get("/metrics").status_code == 404
+        assert client.get("/metrics", headers={"Authorization": "Bearer s3cret"}).status_code == 200
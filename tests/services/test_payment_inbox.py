@@ -0,0 +1,136 @@
+"""
+Tests for the payment webhook inbox: verify + idempotent persist at the
+endpoint (app/services/payments/inbox), outcome handling in the worker
+(app/workers/payment_inbox) and the fast 200 from /webhooks/<provider>.
+
+The database layer is mocked.
+"""
+import hashlib
+import hmac
+import json
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+import cryptobot_service
+import database.payment_inbox as inbox_db
+import platega_service
+from app.api import payment_webhook
+from app.services.payments import inbox
+from app.services.payments.confirmation import TransientPaymentError
+from app.workers import payment_inbox
+
+TOKEN = "test-cryptobot-token"
+
+
+def _sign(raw: bytes) -> str:
+    secret = hashlib.sha256(TOKEN.encode()).digest()
+    return hmac.new(secret, raw, hashlib.sha256).hexdigest()
+
+
+async def test_accept_verifies_and_dedupes_by_event_key():
+    body = {"update_type": "invoice_paid", "payload": {"invoice_id": 42, "status": "paid"}}
+    raw = json.dumps(body).encode()
+    fake_db = SimpleNamespace(DB_READY=True, enqueue_payment_event=AsyncMock(side_effect=[11, None]))
+    with patch.object(cryptobot_service, "CRYPTOBOT_API_TOKEN", TOKEN), \
+         patch.dict("sys.modules", {"database": fake_db}):
+        bad = await inbox.accept("cryptobot", {"crypto-pay-api-signature": "nope"}, raw, body)
+        assert bad == {"status": "unauthorized"}
+        fake_db.enqueue_payment_event.assert_not_awaited()
+
+        headers = {"crypto-pay-api-signature": _sign(raw)}
+        assert await inbox.accept("cryptobot", headers, raw, body) == {"status": "accepted"}
+        assert fake_db.enqueue_payment_event.await_args.args == ("cryptobot", "42", "invoice_paid:paid", body)
+        again = await inbox.accept("cryptobot", headers, raw, body)
+        assert again == {"status": "accepted", "duplicate": True}
+
+        # Без invoice id — в inbox не кладём, endpoint обработает inline.
+        other = {"update_type": "something_else"}
+        raw_other = json.dumps(other).encode()
+        assert await inbox.accept(
+            "cryptobot", {"crypto-pay-api-signature": _sign(raw_other)}, raw_other, other,
+        ) is None
+
+    # Pending и Paid одного invoice — разные события.
+    pending = inbox._key_wata({"transactionId": "t1", "kind": "Payment", "transactionStatus": "Pending"})
+    paid = inbox._key_wata({"transactionId": "t1", "kind": "Payment", "transactionStatus": "Paid"})
+    assert pending[0] == paid[0] and pending != paid
+
+
+async def test_worker_maps_outcomes_to_done_retry_dead():
+    fake_db = SimpleNamespace(
+        complete_payment_event=AsyncMock(),
+        fail_payment_event=AsyncMock(side_effect=[False, True]),
+        log_payment_error=AsyncMock(),
+    )
+    results = [
+        {"status": "ok"},
+        ValueError("already paid"),
+        TransientPaymentError("db timeout"),
+        RuntimeError("boom"),
+    ]
+
+    async def fake_process(event, bot):
+        r = results[event["id"] - 1]
+        if isinstance(r, Exception):
+            raise r
+        return r
+
+    with patch.object(inbox, "process_event", fake_process), \
+         patch.dict("sys.modules", {"database": fake_db}):
+        for i in range(1, 5):
+            await payment_inbox._handle_event(
+                {"id": i, "provider": "wata", "invoice_id": f"t{i}", "attempts": 10}, MagicMock(),
+            )
+
+    done = [c.args for c in fake_db.complete_payment_event.await_args_list]
+    assert done == [(1, "ok"), (2, "already_processed")]
+    failed = fake_db.fail_payment_event.await_args_list
+    assert [c.args[0] for c in failed] == [3, 4]
+    assert all(c.kwargs["attempts"] == 10 for c in failed)
+    assert failed[0].args[1].startswith("transient:")
+    assert fake_db.log_payment_error.await_args.kwargs["error_code"] == "RuntimeError"
+
+
+async def test_late_failure_does_not_reset_a_reclaimed_row():
+    conn = MagicMock()
+    conn.fetchval = AsyncMock(return_value=None)       # строку уже взял другой
+    acq = MagicMock()
+    acq.__aenter__ = AsyncMock(return_value=conn)
+    acq.__aexit__ = AsyncMock(return_value=None)
+    pool = MagicMock()
+    pool.acquire.return_value = acq
+    with patch.object(inbox_db, "get_pool", AsyncMock(return_value=pool)):
+        assert await inbox_db.fail_payment_event(5, "timeout", 30, 8, attempts=2) is None
+    sql, *params = conn.fetchval.await_args.args
+    assert "status = 'processing' AND attempts = $5" in sql
+    assert params[-1] == 2
+
+
+def test_endpoint_replies_before_processing():
+    app = FastAPI()
+    app.include_router(payment_webhook.router)
+    client = TestClient(app)
+    accept = AsyncMock(return_value={"status": "accepted"})
+    process = AsyncMock(return_value={"status": "ok"})
+    with patch.object(payment_webhook, "_bot", MagicMock()), \
+         patch.object(payment_webhook.config, "PAYMENT_INBOX_ENABLED", True), \
+         patch.object(platega_service, "is_enabled", lambda: True), \
+         patch.object(platega_service, "process_webhook_data", process), \
+         patch.object(inbox, "accept", accept):
+        resp = client.post("/webhooks/platega", json={"id": "tx1", "status": "CONFIRMED"})
+        assert resp.status_code == 200 and resp.json() == {"status": "accepted"}
+        process.assert_not_awaited()
+        assert accept.await_args.args[0] == "platega"
+
+        accept.side_effect = TransientPaymentError("DB not ready")
+        assert client.post("/webhooks/platega", json={"id": "tx1"}).status_code == 500
+
+        # inline fallback (флаг выключен)
+        with patch.object(payment_webhook.config, "PAYMENT_INBOX_ENABLED", False):
+            accept.reset_mock()
+            assert client.post("/webhooks/platega", json={"id": "tx2"}).json() == {"status": "ok"}
+            accept.assert_not_awaited()
+            process.assert_awaited_once()
@@ -0,0 +1,95 @@
+"""
+Tests for LISTEN/NOTIFY wakeups (database/notify): delivery to waiters,
+reconnect with catch-up signal, and the scheduled broadcasts worker
+sleeping until the next scheduled_at. asyncpg is replaced by a fake
+connection.
+"""
+import asyncio
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, patch
+
+from app.services import scheduled_broadcasts_worker
+from database import notify
+
+
+class _FakeConn:
+    def __init__(self):
+        self.listeners, self.on_close, self.closed = {}, [], False
+
+    def add_termination_listener(self, cb):
+        self.on_close.append(cb)
+
+    async def add_listener(self, channel, cb):
+        self.listeners[channel] = cb
+
+    async def fetchval(self, *a, **kw):
+        return 1
+
+    def is_closed(self):
+        return self.closed
+
+    def terminate(self):
+        self.closed = True
+
+    def drop(self):
+        self.closed = True
+        for cb in self.on_close:
+            cb(self)
+
+
+async def test_notify_wakes_waiter_and_reconnect_signals_catch_up():
+    conns = []
+
+    async def connect(*a, **kw):
+        conns.append(_FakeConn())
+        return conns[-1]
+
+    with patch.object(notify.asyncpg, "connect", connect), \
+         patch.object(notify, "RECONNECT_MIN_SEC", 0.01), \
+         patch.object(notify.config, "PG_NOTIFY_ENABLED", True), \
+         patch.object(notify._core, "DATABASE_URL", "postgresql://x"), \
+         patch.object(notify, "_events", {}):
+        notify.start_listener()
+        try:
+            # Первое подключение будит всех (catch-up) — снимаем этот сигнал.
+            assert await notify.wait_for_notify(notify.CHANNEL_ACTIVATION, 1)
+            assert notify.listener_connected()
+            assert await notify.wait_for_notify(notify.CHANNEL_ACTIVATION, 0.05) is False
+
+            conns[0].listeners[notify.CHANNEL_ACTIVATION](conns[0], 1, notify.CHANNEL_ACTIVATION, "42")
+            assert await notify.wait_for_notify(notify.CHANNEL_ACTIVATION, 1)
+
+            assert await notify.wait_for_notify(notify.CHANNEL_SCHEDULED_BROADCAST, 0.05)
+            conns[0].drop()
+            assert notify.listener_connected() is False
+            assert await notify.wait_for_notify(notify.CHANNEL_SCHEDULED_BROADCAST, 1)
+            assert len(conns) == 2 and notify.listener_connected()
+        finally:
+            await notify.stop_listener()
+    assert conns[-1].closed
+
+
+async def test_scheduled_worker_sleeps_until_next_run():
+    waits = []
+
+    async def wait_for_notify(channel, timeout):
+        waits.append(timeout)
+        return False
+
+    now = datetime.now(timezone.utc)
+    fake_db = SimpleNamespace(
+        CHANNEL_SCHEDULED_BROADCAST="scheduled_broadcast",
+        listener_connected=lambda: True,
+        get_next_scheduled_at=AsyncMock(side_effect=[now + timedelta(seconds=30), None, now - timedelta(seconds=5)]),
+        wait_for_notify=wait_for_notify,
+    )
+    with patch.dict("sys.modules", {"database": fake_db}):
+        for _ in range(3):
+            await scheduled_broadcasts_worker._wait_next_tick()
+        fake_db.listener_connected = lambda: False
+        await scheduled_broadcasts_worker._wait_next_tick()
+
+    assert 25 < waits[0] <= 30
+    assert waits[1] == scheduled_broadcasts_worker.SAFETY_INTERVAL_SECONDS
+    assert waits[2] == waits[3] == scheduled_broadcasts_worker.POLL_INTERVAL_SECONDS
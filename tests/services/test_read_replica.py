@@ -0,0 +1,104 @@
+"""
+Tests for read-replica routing (database.core.get_read_pool): replica while
+its lag is within the limit, fallback to the primary pool when it lags or
+is unreachable, and acquire_connection(..., role="read"). asyncpg is
+replaced by fake pools.
+
+The replica is (re)checked in a background task; tests await
+core._replica_refresh to let it finish.
+"""
+import asyncio
+from contextlib import ExitStack, asynccontextmanager, contextmanager
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from app.core import pool_monitor
+from database import core
+
+
+def _pool(lags):
+    conn = MagicMock()
+    conn.fetchval = AsyncMock(side_effect=lags)
+    pool = MagicMock(name="replica")
+
+    @asynccontextmanager
+    async def acquire(timeout=None):
+        yield conn
+
+    pool.acquire = acquire
+    pool.close = AsyncMock()
+    return pool
+
+
+@contextmanager
+def _replica_env(create_pool, primary):
+    with ExitStack() as stack:
+        for target, name, value in (
+            (core, "READ_DATABASE_URL", "postgresql://replica"),
+            (core.asyncpg, "create_pool", create_pool),
+            (core, "get_pool", AsyncMock(return_value=primary)),
+            (core, "_read_routed", {}),
+            (core, "_replica_retry_at", 0.0),
+            (core, "_replica_refresh", None),
+            (core.config, "READ_REPLICA_LAG_CHECK_SECONDS", 0),
+            (core.config, "READ_REPLICA_MAX_LAG_SECONDS", 30),
+        ):
+            stack.enter_context(patch.object(target, name, value))
+        yield
+
+
+async def test_routes_to_replica_until_it_lags():
+    primary = MagicMock(name="primary")
+    replica = _pool([2.0, 120.0, None, 0])
+    create_pool = AsyncMock(return_value=replica)
+    with _replica_env(create_pool, primary):
+        try:
+            routed = []
+            for _ in range(5):
+                routed.append(await core.get_read_pool())
+                await core._replica_refresh
+            # пул ещё создаётся → 2.0s → 120s > 30s → lag неизвестен → 0
+            assert routed == [primary, replica, primary, primary, replica]
+            create_pool.assert_awaited_once()
+            assert core._read_routed == {"replica": 2, "primary": 3}
+        finally:
+            await core._close_read_pool()
+    replica.close.assert_awaited_once()
+
+
+async def test_unreachable_replica_falls_back_and_backs_off():
+    primary = MagicMock(name="primary")
+    create_pool = AsyncMock(side_effect=OSError("connection refused"))
+    with _replica_env(create_pool, primary):
+        assert await core.get_read_pool() is primary
+        await core._replica_refresh
+        assert await core.get_read_pool() is primary
+        await core._replica_refresh
+        create_pool.assert_awaited_once()                  # ретрай только после паузы
+
+        # acquire_connection(role="read") берёт тот же маршрут
+        conn = MagicMock()
+        primary.acquire = AsyncMock(return_value=conn)
+        primary.release = AsyncMock()
+        async with pool_monitor.acquire_connection(None, "audit", role="read") as got:
+            assert got is conn
+        primary.release.assert_awaited_once_with(conn)
+
+
+async def test_slow_replica_connect_does_not_block_reads():
+    primary = MagicMock(name="primary")
+    connecting = asyncio.Event()
+
+    async def hang(*args, **kwargs):
+        connecting.set()
+        await asyncio.Event().wait()
+
+    create_pool = AsyncMock(side_effect=hang)
+    with _replica_env(create_pool, primary):
+        try:
+            assert await core.get_read_pool() is primary
+            await connecting.wait()
+            for _ in range(3):
+                assert await asyncio.wait_for(core.get_read_pool(), 0.1) is primary
+            create_pool.assert_awaited_once()              # одна попытка в фоне
+        finally:
+            await core._close_read_pool()
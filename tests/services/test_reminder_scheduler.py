@@ -0,0 +1,51 @@
+"""
+Tests for the due-time driven reminder scan in reminders.py (migration 080).
+
+DB access is mocked: database.get_subscriptions_due_for_reminders returns
+keyset pages; None means the column is missing and the worker falls back
+to the legacy full scan.
+"""
+from datetime import datetime, timedelta, timezone
+from unittest.mock import AsyncMock, patch
+
+import reminders
+
+
+def _sub(tid, due):
+    return {"telegram_id": tid, "next_reminder_due_at": due}
+
+
+async def test_reminder_pages_follow_keyset_cursor():
+    base = datetime(2026, 1, 1, tzinfo=timezone.utc)
+    first = [_sub(i, base + timedelta(minutes=i)) for i in range(3)]
+    second = [_sub(10, base + timedelta(hours=1))]
+    due = AsyncMock(side_effect=[first, second])
+    with patch.object(reminders, "REMINDER_PAGE_SIZE", 3), \
+         patch.object(reminders.database, "get_subscriptions_due_for_reminders", due), \
+         patch.object(reminders.database, "get_subscriptions_for_reminders", AsyncMock()) as legacy:
+        pages = [page async for _, page in reminders._reminder_pages()]
+
+    assert pages == [first, second]
+    assert due.await_args_list[0].kwargs["after"] is None
+    assert due.await_args_list[1].kwargs["after"] == (base + timedelta(minutes=2), 2)
+    legacy.assert_not_awaited()
+
+
+async def test_reminder_pages_fall_back_to_full_scan_without_column():
+    legacy_rows = [_sub(1, None)]
+    with patch.object(reminders.database, "get_subscriptions_due_for_reminders", AsyncMock(return_value=None)), \
+         patch.object(reminders.database, "get_subscriptions_for_reminders", AsyncMock(return_value=legacy_rows)):
+        pages = [(now, page) async for now, page in reminders._reminder_pages()]
+    assert pages == [(None, legacy_rows)]
+
+
+async def test_idle_rows_are_rescheduled():
+    expires = datetime.now(timezone.utc) + timedelta(days=10)   # ни одно окно не открыто
+    page = [{"telegram_id": 7, "expires_at": expires, "next_reminder_due_at": None}]
+    with patch.object(reminders.database, "get_subscriptions_due_for_reminders",
+                      AsyncMock(side_effect=[page])), \
+         patch.object(reminders.database, "reschedule_reminders", AsyncMock(return_value=1)) as resched, \
+         patch.object(reminders, "resolve_languages", AsyncMock(return_value={})):
+        await reminders.send_smart_reminders(bot=None)
+    resched.assert_awaited_once()
+    assert resched.await_args.args[0] == [7]
@@ -0,0 +1,65 @@
+"""Unit tests for the shared keep-alive client in remnawave_api.
+
+Проверяем что все вызовы идут через ОДИН AsyncClient (без handshake на
+каждый запрос) и что latency-счётчики нормализуют path по endpoint.
+"""
+import httpx
+import pytest
+
+from app.services import remnawave_api
+
+
+@pytest.fixture
+def mock_panel(monkeypatch):
+    seen = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        seen.append(request.url.path)
+        if request.method == "DELETE":
+            return httpx.Response(204)
+        if request.url.path.endswith("/missing"):
+            return httpx.Response(404, text="nope")
+        return httpx.Response(200, json={"response": {"id": 7}})
+
+    client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    monkeypatch.setattr(remnawave_api, "_client", client)
+    monkeypatch.setattr(remnawave_api.config, "REMNAWAVE_API_URL", "https://panel.test")
+    remnawave_api.reset_latency_stats()
+    yield seen
+    remnawave_api.reset_latency_stats()
+
+
+def test_endpoint_key_normalizes_ids_and_query():
+    assert remnawave_api._endpoint_key("get", "/api/users/382?x=1") == "GET /api/users/{id}"
+    assert (
+        remnawave_api._endpoint_key("POST", "/api/users/382/actions/enable")
+        == "POST /api/users/{id}/actions/enable"
+    )
+    assert (
+        remnawave_api._endpoint_key(
+            "POST", "/api/internal-squads/0b0e5c8e-1111-2222-3333-444455556666/bulk-actions/add-many-users",
+        )
+        == "POST /api/internal-squads/{uuid}/bulk-actions/add-many-users"
+    )
+    assert remnawave_api._endpoint_key("GET", "/api/users/stream?size=250") == "GET /api/users/stream"
+
+
+@pytest.mark.asyncio
+async def test_requests_reuse_shared_client_and_record_latency(mock_panel):
+    shared = remnawave_api._get_client()
+    assert await remnawave_api._request("GET", "/api/users/1") == {"id": 7}
+    assert await remnawave_api._request("GET", "/api/users/2") == {"id": 7}
+    assert await remnawave_api._request("DELETE", "/api/users/2") == {}
+    assert await remnawave_api._request("GET", "/api/missing", quiet=True) is None
+    assert remnawave_api._get_client() is shared
+
+    stats = remnawave_api.get_latency_stats()
+    assert stats["GET /api/users/{id}"]["count"] == 2
+    assert stats["DELETE /api/users/{id}"]["errors"] == 0
+    assert stats["GET /api/missing"]["errors"] == 1
+
+
+@pytest.mark.asyncio
+async def test_close_resets_client(mock_panel):
+    await remnawave_api.close()
+    assert remnawave_api._client is None
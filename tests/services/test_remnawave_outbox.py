@@ -0,0 +1,223 @@
+"""
+Tests for the Remnawave provisioning outbox: op coalescing and renew
+checkpointing in app/services/remnawave_service, per-user ordering and
+retry in the dispatcher (app/workers/remnawave_outbox).
+
+The database layer is mocked; remnawave_api is a fake namespace.
+"""
+from datetime import datetime, timezone
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import database.remnawave_outbox as outbox_db
+from app.services import remnawave_service
+from app.workers import remnawave_outbox
+
+GB = 1024 ** 3
+UUID = "aaaaaaaa-bbbb-cccc-dddd-eeeeeeeeeeee"
+MARKER = "2036-10-14T20:15:30Z"
+
+
+def _cfg():
+    return SimpleNamespace(
+        REMNAWAVE_ENABLED=True,
+        REMNAWAVE_SQUAD_UUID="",
+        TRAFFIC_LIMITS={"basic": {30: 50 * GB}, "plus": {30: 100 * GB}},
+        DEVICE_LIMITS={"basic": 3, "plus": 5},
+        REMNAWAVE_OUTBOX_CONCURRENCY=4,
+    )
+
+
+def _op(row_id, op, **payload):
+    return {"id": row_id, "op": op, "payload": payload, "attempts": 1}
+
+
+def test_three_renewals_become_one_call():
+    ops = [
+        _op(1, "renew", tariff="basic", period_days=30),
+        _op(2, "renew", tariff="basic", period_days=30),
+        _op(3, "renew", tariff="plus", period_days=30),
+        _op(4, "extend_bypass"),
+        _op(5, "disable"),
+    ]
+    with patch.object(remnawave_service, "config", _cfg()):
+        groups = remnawave_service.coalesce_ops(ops)
+    assert [(op, ids) for op, _, ids in groups] == [("renew", [1, 2, 3]), ("disable", [4, 5])]
+    renew = groups[0][1]
+    assert renew["traffic_add"] == 200 * GB and renew["tariff"] == "plus"
+
+
+def test_checkpointed_renew_does_not_absorb_new_rows():
+    ops = [
+        _op(1, "renew", tariff="basic", traffic_add=50 * GB, expire_marker=MARKER),
+        _op(2, "renew", tariff="basic", traffic_add=50 * GB, expire_marker=MARKER),
+        _op(3, "renew", tariff="basic", period_days=30),
+    ]
+    with patch.object(remnawave_service, "config", _cfg()):
+        groups = remnawave_service.coalesce_ops(ops)
+    assert [ids for _, _, ids in groups] == [[1, 2], [3]]
+    assert groups[0][1]["traffic_add"] == 100 * GB
+
+
+def test_delete_drops_earlier_ops():
+    ops = [_op(1, "renew", tariff="basic"), _op(2, "disable"), _op(3, "delete"), _op(4, "delete")]
+    with patch.object(remnawave_service, "config", _cfg()):
+        groups = remnawave_service.coalesce_ops(ops)
+    assert groups == [("delete", {}, [1, 2, 3, 4])]
+
+
+async def test_renew_retry_skips_already_applied_traffic():
+    user = {"uuid": UUID, "trafficLimitBytes": 110 * GB, "status": "ACTIVE",
+            "expireAt": "2036-10-14T20:15:30.000Z"}
+    fake_db = SimpleNamespace(
+        get_remnawave_uuid=AsyncMock(return_value=UUID),
+        get_remnawave_id=AsyncMock(return_value=42),
+        reset_traffic_notification_flags=AsyncMock(),
+    )
+    fake_api = SimpleNamespace(get_user=AsyncMock(return_value=user), update_user=AsyncMock(return_value={}))
+    checkpoint = AsyncMock()
+    with patch.object(remnawave_service, "config", _cfg()), \
+         patch.object(remnawave_service, "database", fake_db), \
+         patch.object(remnawave_service, "remnawave_api", fake_api):
+        ok = await remnawave_service.renew_remnawave_user(
+            1, "basic", None, traffic_add_override=100 * GB,
+            expire_marker=MARKER, checkpoint=checkpoint,
+        )
+        assert ok is True
+        assert fake_api.update_user.await_args.kwargs["trafficLimitBytes"] == 110 * GB
+        assert fake_api.update_user.await_args.kwargs["expireAt"] == MARKER
+        checkpoint.assert_not_awaited()
+
+        # Первая попытка: checkpoint с expireAt до PATCH, +100 GB
+        user["trafficLimitBytes"] = 10 * GB
+        await remnawave_service.renew_remnawave_user(
+            1, "basic", None, traffic_add_override=100 * GB, checkpoint=checkpoint,
+        )
+        marker = checkpoint.await_args.kwargs["expire_marker"]
+        assert fake_api.update_user.await_args.kwargs["expireAt"] == marker
+        assert fake_api.update_user.await_args.kwargs["trafficLimitBytes"] == 110 * GB
+
+
+async def test_renew_not_skipped_when_limit_raised_by_someone_else():
+    # add_bypass_traffic поднял лимит, но наш PATCH не дошёл (expireAt чужой).
+    user = {"uuid": UUID, "trafficLimitBytes": 200 * GB, "status": "ACTIVE",
+            "expireAt": "2036-10-14T19:00:00.000Z"}
+    fake_db = SimpleNamespace(
+        get_remnawave_uuid=AsyncMock(return_value=UUID),
+        get_remnawave_id=AsyncMock(return_value=42),
+        reset_traffic_notification_flags=AsyncMock(),
+    )
+    fake_api = SimpleNamespace(get_user=AsyncMock(return_value=user), update_user=AsyncMock(return_value={}))
+    with patch.object(remnawave_service, "config", _cfg()), \
+         patch.object(remnawave_service, "database", fake_db), \
+         patch.object(remnawave_service, "remnawave_api", fake_api):
+        ok = await remnawave_service.renew_remnawave_user(
+            1, "basic", None, traffic_add_override=100 * GB,
+            expire_marker=MARKER, checkpoint=AsyncMock(),
+        )
+    assert ok is True
+    assert fake_api.update_user.await_args.kwargs["trafficLimitBytes"] == 300 * GB
+
+
+async def test_missing_panel_user_completes_ops():
+    fake_db = SimpleNamespace(
+        get_remnawave_uuid=AsyncMock(return_value=UUID),
+        clear_remnawave_uuid=AsyncMock(),
+    )
+    fake_api = SimpleNamespace(
+        get_user=AsyncMock(return_value=None),
+        update_user=AsyncMock(),
+        delete_user=AsyncMock(return_value={"ok": False, "status": 404}),
+    )
+    with patch.object(remnawave_service, "config", _cfg()), \
+         patch.object(remnawave_service, "database", fake_db), \
+         patch.object(remnawave_service, "remnawave_api", fake_api):
+        assert await remnawave_service.extend_remnawave_for_bypass(1) is True
+        assert await remnawave_service.disable_remnawave_user(1) is True
+        assert await remnawave_service.delete_remnawave_user(1) is True
+        fake_db.clear_remnawave_uuid.assert_awaited_once_with(1)
+
+        # Транспорт / 5xx — ретрай, uuid не трогаем.
+        fake_db.clear_remnawave_uuid.reset_mock()
+        fake_api.delete_user.return_value = {"ok": False, "status": 0}
+        assert await remnawave_service.delete_remnawave_user(1) is False
+        fake_api.delete_user.return_value = {"ok": False, "status": 502}
+        assert await remnawave_service.delete_remnawave_user(1) is False
+        fake_db.clear_remnawave_uuid.assert_not_awaited()
+    fake_api.update_user.assert_not_awaited()
+
+
+async def test_dispatcher_keeps_order_and_retries_the_tail():
+    ops = [_op(1, "create", tariff="basic"), _op(2, "renew", tariff="basic"), _op(3, "disable")]
+    calls = []
+
+    async def fake_apply(tid, op, payload, checkpoint):
+        calls.append(op)
+        return op != "renew"
+
+    fake_db = SimpleNamespace(
+        complete_remnawave_ops=AsyncMock(),
+        fail_remnawave_ops=AsyncMock(return_value=0),
+        update_remnawave_op_payload=AsyncMock(),
+    )
+    with patch.object(remnawave_service, "config", _cfg()), \
+         patch.object(remnawave_service, "apply_outbox_op", fake_apply), \
+         patch.dict("sys.modules", {"database": fake_db}):
+        await remnawave_outbox._dispatch_user(7, ops)
+
+    assert calls == ["create", "renew"]                  # disable не обгоняет renew
+    fake_db.complete_remnawave_ops.assert_awaited_once_with([1])
+    assert fake_db.fail_remnawave_ops.await_args.args[0] == [2, 3]
+
+
+async def test_bg_falls_back_to_inline_when_enqueue_fails():
+    fake_db = SimpleNamespace(
+        outbox_enabled=lambda: True,
+        enqueue_remnawave_op=AsyncMock(side_effect=RuntimeError("db down")),
+    )
+    extend = AsyncMock(return_value=True)
+    with patch.object(remnawave_service, "config", _cfg()), \
+         patch.object(remnawave_service, "database", fake_db), \
+         patch.object(remnawave_service, "extend_remnawave_for_bypass", extend):
+        remnawave_service.extend_remnawave_for_bypass_bg(5)
+        for task in list(remnawave_service._bg_tasks):
+            await task
+    fake_db.enqueue_remnawave_op.assert_awaited_once_with(5, "extend_bypass", None)
+    extend.assert_awaited_once_with(5)
+
+
+async def test_renew_enqueued_on_callers_transaction():
+    conn = MagicMock()
+    conn.execute = AsyncMock()
+    end = datetime(2026, 11, 1, tzinfo=timezone.utc)
+    with patch.object(outbox_db, "outbox_enabled", return_value=True):
+        assert await outbox_db.enqueue_remnawave_renew(conn, 7, "plus", end, 90) is True
+    args = conn.execute.await_args.args
+    assert args[1:] == ([7], ["renew"], ['{"tariff": "plus", "subscription_end": "2026-11-01T00:00:00+00:00", "period_days": 90}'])
+
+    conn.execute.reset_mock()
+    with patch.object(outbox_db, "outbox_enabled", return_value=False):
+        assert await outbox_db.enqueue_remnawave_renew(conn, 7, "plus", end, 90) is False
+    conn.execute.assert_not_awaited()
+
+
+async def test_claim_skips_rows_still_backing_off():
+    conn = MagicMock()
+    conn.fetchval = AsyncMock(return_value=True)
+    conn.fetch = AsyncMock(return_value=[])
+    tx = MagicMock()
+    tx.__aenter__ = AsyncMock()
+    tx.__aexit__ = AsyncMock(return_value=None)
+    conn.transaction.return_value = tx
+    acq = MagicMock()
+    acq.__aenter__ = AsyncMock(return_value=conn)
+    acq.__aexit__ = AsyncMock(return_value=None)
+    pool = MagicMock()
+    pool.acquire.return_value = acq
+    with patch.object(outbox_db._core, "DB_READY", True), \
+         patch.object(outbox_db, "get_pool", AsyncMock(return_value=pool)):
+        await outbox_db.claim_remnawave_outbox(10, 60)
+    sql = conn.fetch.await_args.args[0]
+    update = sql[sql.index("UPDATE"):]
+    assert "o.next_attempt_at <= NOW()" in update
+    assert "p.status IN ('pending', 'processing')" in sql
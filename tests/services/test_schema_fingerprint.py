@@ -0,0 +1,34 @@
+"""
+Tests for the init_db schema fingerprint (database/core): stable across
+calls, changes with any migration file, and the startup timing report.
+"""
+import migrations
+from app.core import metrics
+from database import core
+
+
+def test_fingerprint_tracks_migration_files(tmp_path, monkeypatch):
+    (tmp_path / "001_init.sql").write_text("CREATE TABLE a (id INT);")
+    monkeypatch.setattr(migrations, "MIGRATIONS_DIR", tmp_path)
+
+    first = core._schema_fingerprint()
+    assert first and first == core._schema_fingerprint()
+
+    (tmp_path / "001_init.sql").write_text("CREATE TABLE a (id BIGINT);")
+    changed = core._schema_fingerprint()
+    assert changed != first
+
+    (tmp_path / "002_more.sql").write_text("SELECT 1;")
+    assert core._schema_fingerprint() not in (first, changed)
+
+
+def test_timing_report_exposed_as_gauge(monkeypatch):
+    monkeypatch.setattr(core, "INIT_TIMINGS", {})
+    timer = core._StartupTimer()
+    for phase in ("probe", "pool", "fingerprint", "verify"):
+        timer.mark(phase)
+    timer.report(fast_path=True)
+
+    assert set(core.INIT_TIMINGS) == {"probe", "pool", "fingerprint", "verify", "total"}
+    text = metrics.render()
+    assert 'atlas_db_init_phase_seconds{phase="total"}' in text
@@ -0,0 +1,75 @@
+"""
+Tests for segment predicates (database.admin.segment_sql) and the
+is_user_in_segment membership memo.
+
+SQL is only inspected, not executed; DB entry points are mocked.
+"""
+from unittest.mock import AsyncMock, patch
+
+import pytest
+
+import database
+from database.admin import segment_sql
+from app.services.automated_notifications import helper
+
+KNOWN_SEGMENTS = [
+    "all_users", "active_subscriptions", "no_subscription", "no_remnawave",
+    "expired_1d", "expired_2d", "expired_3d", "started_7d_cold",
+    "trial_ends_in_1d", "trial_expired_6h", "trial_expired_1d", "trial_expired_3d",
+    "paid_expired_1d", "paid_expired_7d", "paid_expired_730d", "paid_expired_30d",
+    "paid_lapsed_any", "paid_bought_within_14d", "trial_active_any",
+    "trial_activated_today", "trial_active_day2", "paid_expires_in_7d",
+    "trial_expired_within_6m", "trial_expired_90d", "started_3d_cold",
+    "vip_active", "combo_active", "basic_active", "plus_active",
+    "discount_active", "has_balance_50plus", "expires_in_3d", "bought_proxy",
+]
+
+
+@pytest.mark.parametrize("segment", KNOWN_SEGMENTS)
+def test_every_segment_has_all_three_queries(segment):
+    seg = segment_sql(segment)
+    assert seg is not None
+    assert seg.ids_sql().startswith("SELECT")
+    assert "COUNT(" in seg.count_sql()
+    exists = seg.exists_sql()
+    assert f"{seg.id_col} = $1" in exists
+    # Предикаты без параметров — единственный $-плейсхолдер у EXISTS.
+    assert "$" not in seg.ids_sql() and "$" not in seg.count_sql()
+
+
+def test_unknown_segment_and_composition():
+    assert segment_sql("nope") is None
+    seg = segment_sql("vip_active").and_("u.balance_kopecks > 0")
+    assert "u.is_vip = TRUE" in seg.where and "u.balance_kopecks > 0" in seg.where
+    assert "COUNT(DISTINCT s.telegram_id)" in segment_sql("basic_active").count_sql()
+
+
+async def _aiter(ids):
+    for i in ids:
+        yield i
+
+
+async def test_hot_segment_is_memoised():
+    helper.clear_segment_memo()
+    exists = AsyncMock(return_value=False)
+    iter_calls = []
+
+    def fake_iter(segment):
+        iter_calls.append(segment)
+        return _aiter([5, 6])
+
+    with patch.object(helper, "_SEGMENT_HOT_PROBES", 3), \
+         patch.object(database, "user_in_segment", exists), \
+         patch.object(database, "iter_users_by_segment", side_effect=fake_iter):
+        results = [await helper.is_user_in_segment(uid, "vip_active") for uid in (1, 2, 5, 6, 7)]
+
+    assert results == [False, False, True, True, False]
+    assert exists.await_count == 2          # холодные проверки — EXISTS
+    assert iter_calls == ["vip_active"]     # материализация один раз
+    helper.clear_segment_memo()
+
+
+async def test_unknown_segment_fails_open():
+    helper.clear_segment_memo()
+    with patch.object(database, "user_in_segment", AsyncMock(return_value=None)):
+        assert await helper.is_user_in_segment(1, "nope") is True
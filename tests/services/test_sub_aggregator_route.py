@@ -82,6 +82,7 @@ def _reset_state():
     m._cache.clear()
     m._pair_cache.clear()
     m._inflight.clear()
+    m._access_counts.clear()
     for k in list(m._metrics.keys()):
         m._metrics[k] = 0
     m._attack_window_start = 0.0
@@ -250,16 +251,16 @@ def test_pair_negative_ttl_shorter(monkeypatch):
 
 # ── clear_cache ───────────────────────────────────────────────────────
 
-def test_clear_cache_token_wipes_both():
+async def test_clear_cache_token_wipes_both():
     m._cache_set("t", b"x", {})
     m._pair_set("t", {"y": 1})
-    m.clear_cache("t")
+    await m.clear_cache("t")
     assert "t" not in m._cache and "t" not in m._pair_cache
 
-def test_clear_cache_all():
+async def test_clear_cache_all():
     m._cache_set("a", b"x", {})
     m._pair_set("b", {"y": 1})
-    m.clear_cache(None)
+    await m.clear_cache(None)
     assert len(m._cache) == 0 and len(m._pair_cache) == 0
 
 
@@ -379,14 +380,15 @@ async def test_aggregate_both_down_no_cache_503():
     assert resp.headers["retry-after"] == "30"
 
 async def test_aggregate_stale_served_when_upstream_dies(monkeypatch):
-    # 1) успешный запрос → кеш; 2) fresh истёк; 3) панель упала → stale
+    # 1) успешный запрос → кеш; 2) fresh истёк (и SWR-окно тоже — иначе
+    # stale отдался бы сразу с фоновым refresh); 3) панель упала → stale
     t = [1000.0]
     monkeypatch.setattr(m.time, "monotonic", lambda: t[0])
     ok_fetch = AsyncMock(side_effect=_patch_fetch())
     with patch.object(m, "_fetch_upstream", ok_fetch), \
          patch.object(m.database, "get_pool", AsyncMock(return_value=FakePool(_pair_row()))):
         await m.aggregate(FakeRequest(), token="tok12345")
-        t[0] += m.FRESH_TTL + 1          # fresh истёк, stale жив
+        t[0] += m.FRESH_TTL + m.SWR_WINDOW + 1   # fresh и SWR истекли, stale жив
         dead_fetch = AsyncMock(side_effect=_patch_fetch(main_status=None, gb_status=None))
         with patch.object(m, "_fetch_upstream", dead_fetch):
             resp = await m.aggregate(FakeRequest(), token="tok12345")
@@ -443,3 +445,245 @@ async def test_metrics_endpoint_shape():
     assert data["hit_ratio"] == 0.9
     assert data["cache_size"] == 1
     assert "avg_upstream_ms" in data
+
+
+# ══════════════════════════════════════════════════════════════════════
+# L2 (Redis) — общий tier между воркерами
+# ══════════════════════════════════════════════════════════════════════
+
+class FakeRedis:
+    def __init__(self):
+        self.kv = {}
+        self.published = []
+
+    async def get(self, key):
+        return self.kv.get(key)
+
+    async def set(self, key, value, ex=None):
+        self.kv[key] = value
+
+    async def delete(self, *keys):
+        for k in keys:
+            self.kv.pop(k, None)
+
+    async def publish(self, channel, data):
+        self.published.append((channel, data))
+
+    async def scan_iter(self, match=None, count=None):
+        for k in list(self.kv):
+            yield k
+
+
+@pytest.fixture
+def fake_l2(monkeypatch):
+    r = FakeRedis()
+    monkeypatch.setattr(m, "_l2_enabled", lambda: True)
+
+    async def _redis():
+        return r
+    monkeypatch.setattr(m, "_l2_redis", _redis)
+    return r
+
+
+async def test_l2_serves_body_after_local_cache_loss(fake_l2):
+    async def fetch(url, ua):
+        return FakeResp(_b64_sub(["vless://a"]), 200, {"subscription-userinfo": "total=1; expire=1"})
+
+    pool = AsyncMock(return_value=FakePool(_pair_row()))
+    with patch.object(m, "_fetch_upstream", fetch), patch.object(m.database, "get_pool", pool):
+        first = await m.aggregate(FakeRequest(), token="tok12345")
+    assert first.headers["x-cache"] == "miss"
+    assert "subagg:body:tok12345" in fake_l2.kv
+    assert "subagg:pair:tok12345" in fake_l2.kv
+
+    # «Рестарт» / соседний воркер: L1 пуст, панель и БД недоступны.
+    m._cache.clear()
+    m._pair_cache.clear()
+    dead = AsyncMock(side_effect=AssertionError("upstream must not be hit"))
+    with patch.object(m, "_fetch_upstream", dead):
+        second = await m.aggregate(FakeRequest(), token="tok12345")
+    assert second.headers["x-cache"] == "hit"
+    assert second.body == first.body
+    assert m._metrics["l2_hits"] == 1
+
+
+async def test_l2_stale_copy_survives_restart(fake_l2, monkeypatch):
+    m._pair_set("tok12345", _pair_row())
+    await m._l2_put("tok12345", m._compress(b"old-body"), 8, {"profile-title": "x"})
+    m._cache.clear()
+    # fresh-окно L2 истекло, stale ещё жив.
+    real_time = m.time.time
+    monkeypatch.setattr(m.time, "time", lambda: real_time() + m.FRESH_TTL + 1)
+
+    async def down(url, ua):
+        return None
+    with patch.object(m, "_fetch_upstream", down):
+        resp = await m.aggregate(FakeRequest(), token="tok12345")
+    assert resp.headers["x-cache"] == "stale"
+    assert resp.body == b"old-body"
+
+
+async def test_clear_cache_fans_out_through_pubsub(fake_l2):
+    await m._l2_put("tok12345", m._compress(b"body"), 4, {})
+    m._cache_set("tok12345", b"body", {})
+    await m.clear_cache("tok12345")             # L2 уже удалён к возврату
+    assert "tok12345" not in m._cache
+    assert "subagg:body:tok12345" not in fake_l2.kv
+    assert fake_l2.published == [(m.SUB_AGG_INVALIDATE_CHANNEL, "tok12345")]
+
+
+def test_invalidation_message_clears_local_only():
+    m._cache_set("tok12345", b"a", {})
+    m._cache_set("other123", b"b", {})
+    m._handle_invalidation_message("tok12345")
+    assert "tok12345" not in m._cache and "other123" in m._cache
+    m._handle_invalidation_message("../bad")      # мусор игнорим
+    assert "other123" in m._cache
+    m._handle_invalidation_message("*")
+    assert not m._cache
+
+
+# ── Сжатое хранение body ──────────────────────────────────────────────
+
+def test_cache_stores_body_compressed():
+    body = base64.b64encode("\n".join(
+        f"vless://00000000-1111-2222-3333-444444444444@node{i}.example:443?type=tcp#N{i}"
+        for i in range(60)
+    ).encode())
+    m._cache_set("t", body, {})
+    stored = m._cache["t"][2]
+    assert len(stored) * 5 < len(body)
+    assert m._cache_get("t")[0] == body
+    snap = m.get_metrics_snapshot()
+    assert snap["cache_bytes"] == len(stored)
+    assert snap["cache_raw_bytes"] == len(body)
+    assert snap["compression_ratio"] > 5
+
+
+def test_accepts_gzip_parsing():
+    def req(ae):
+        r = FakeRequest()
+        r.headers["accept-encoding"] = ae
+        return r
+    assert m._accepts_gzip(req("gzip, deflate, br"))
+    assert m._accepts_gzip(req("br;q=1.0, gzip;q=0.8"))
+    assert not m._accepts_gzip(req("gzip;q=0"))
+    assert not m._accepts_gzip(req("br"))
+    assert not m._accepts_gzip(FakeRequest())
+
+
+async def test_hit_served_gzip_straight_from_cache():
+    import gzip
+    m._cache_set("tok12345", b"c3Vi", {"profile-title": "x"})
+    req = FakeRequest()
+    req.headers["accept-encoding"] = "gzip"
+    resp = await m.aggregate(req, token="tok12345")
+    assert resp.headers["content-encoding"] == "gzip"
+    assert resp.body == m._cache["tok12345"][2]
+    assert gzip.decompress(resp.body) == b"c3Vi"
+
+    plain = await m.aggregate(FakeRequest(), token="tok12345")
+    assert "content-encoding" not in plain.headers
+    assert plain.body == b"c3Vi"
+
+
+# ── Stale-while-revalidate / refresh-ahead ───────────────────────────
+
+async def test_swr_serves_stale_immediately_and_refreshes_in_background(monkeypatch):
+    t = [1000.0]
+    monkeypatch.setattr(m.time, "monotonic", lambda: t[0])
+    m._pair_set("tok12345", _pair_row())
+    m._cache_set("tok12345", base64.b64encode(b"vless://old"), {"profile-title": "x"})
+    t[0] += m.FRESH_TTL + 60
+
+    gate = asyncio.Event()
+
+    async def slow_fetch(url, ua):
+        await gate.wait()
+        return FakeResp(_b64_sub(["vless://new"]), 200, {"subscription-userinfo": "total=1"})
+
+    with patch.object(m, "_fetch_upstream", slow_fetch):
+        resp = await m.aggregate(FakeRequest(), token="tok12345")
+        # Ответ ушёл, не дожидаясь панели.
+        assert resp.headers["x-cache"] == "stale"
+        assert base64.b64decode(resp.body) == b"vless://old"
+        assert m._metrics["swr"] == 1 and m._metrics["stale"] == 0
+        gate.set()
+        await asyncio.gather(*list(m._bg_tasks))
+
+    body, _, state = m._cache_get("tok12345")
+    assert state == "fresh"
+    assert base64.b64decode(body) == b"vless://new"
+    assert m._metrics["bg_refresh_ok"] == 1
+
+
+async def test_access_counts_follow_lru_eviction(monkeypatch):
+    monkeypatch.setattr(m, "MAX_CACHE_ENTRIES", 2)
+    for tok in ("t0", "t1"):
+        m._cache_set(tok, b"x", {})
+        m._access_counts[tok] = 5
+    m._cache_set("t2", b"x", {})
+    assert "t0" not in m._access_counts and m._access_counts["t1"] == 5
+    await m.clear_cache("t1")
+    assert "t1" not in m._access_counts
+
+
+async def test_refresh_ahead_refreshes_only_hot_expiring_tokens(monkeypatch):
+    t = [1000.0]
+    monkeypatch.setattr(m.time, "monotonic", lambda: t[0])
+    for tok in ("hot12345", "cold1234", "later123"):
+        m._pair_set(tok, {**_pair_row(), "token": tok})
+    m._cache_set("hot12345", b"old", {})
+    m._cache_set("cold1234", b"old", {})
+    t[0] += m.FRESH_TTL - 2                    # оба истекают в пределах LEAD
+    m._cache_set("later123", b"old", {})       # этот свежий ещё 15 сек
+    m._access_counts.update({"hot12345": 10, "cold1234": 1, "later123": 10})
+
+    fetch = AsyncMock(side_effect=_patch_fetch())
+    with patch.object(m, "_fetch_upstream", fetch):
+        assert await m.refresh_ahead_tick() == 1
+    assert fetch.await_count == 2              # main+gb только для hot
+    assert m._cache_get("hot12345")[0] != b"old"
+    assert m._cache_get("cold1234")[0] == b"old"
+    assert m._metrics["refresh_ahead"] == 1
+
+
+def test_access_counts_decay():
+    m._access_counts.update({"a": 8, "b": 1})
+    m._decay_access_counts()
+    assert m._access_counts == {"a": 4}
+
+
+class _IdlePubSub:
+    """get_message() → None, пока канал молчит (idle poll), потом сообщение."""
+
+    def __init__(self, messages):
+        self.subscribed = []
+        self._messages = list(messages)
+
+    async def subscribe(self, channel):
+        self.subscribed.append(channel)
+
+    async def get_message(self, ignore_subscribe_messages=False, timeout=0.0):
+        await asyncio.sleep(0)
+        return self._messages.pop(0) if self._messages else None
+
+    async def aclose(self):
+        pass
+
+
+async def test_invalidation_listener_survives_idle_channel(monkeypatch):
+    pubsub = _IdlePubSub([None] * 20 + [{"type": "message", "data": "tok12345"}])
+    client = type("C", (), {"pubsub": lambda self: pubsub})()
+    monkeypatch.setattr(m, "_l2_enabled", lambda: True)
+    m._cache["tok12345"] = (1e12, 1e12, b"x", {}, 1)
+    with patch("app.utils.redis_client.get_pubsub_redis", AsyncMock(return_value=client)):
+        task = asyncio.create_task(m.run_invalidation_listener())
+        for _ in range(100):
+            await asyncio.sleep(0)
+            if "tok12345" not in m._cache:
+                break
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+    assert "tok12345" not in m._cache
+    assert pubsub.subscribed == [m.SUB_AGG_INVALIDATE_CHANNEL]
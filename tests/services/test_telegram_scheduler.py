@@ -0,0 +1,83 @@
+"""Unit tests for the global outbound Telegram scheduler."""
+import asyncio
+import time
+from unittest.mock import AsyncMock
+
+import pytest
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import AnswerCallbackQuery, SendMessage
+
+from app.core import telegram_scheduler
+from app.core.telegram_scheduler import (
+    OutboundScheduler,
+    Priority,
+    TelegramSendSchedulerMiddleware,
+    send_priority,
+)
+
+
+@pytest.mark.asyncio
+async def test_higher_priority_waiters_are_served_first():
+    sched = OutboundScheduler(rate=50, burst=1)
+    await sched.acquire(Priority.INTERACTIVE)  # drain the single burst token
+
+    order = []
+
+    async def _wait(p):
+        await sched.acquire(p)
+        order.append(p)
+
+    tasks = [asyncio.create_task(_wait(Priority.BROADCAST)) for _ in range(3)]
+    await asyncio.sleep(0)
+    tasks.append(asyncio.create_task(_wait(Priority.INTERACTIVE)))
+    await asyncio.gather(*tasks)
+
+    # Все ждут следующего токена (20ms) — interactive, встав в очередь
+    # последним, всё равно получает его первым.
+    assert order[0] == Priority.INTERACTIVE
+
+
+@pytest.mark.asyncio
+async def test_pause_blocks_everyone():
+    sched = OutboundScheduler(rate=1000, burst=5)
+    sched.pause(0.2)
+    started = time.monotonic()
+    await sched.acquire(Priority.INTERACTIVE)
+    assert time.monotonic() - started >= 0.15
+    assert sched.stats["retry_after"] == 1
+
+
+@pytest.mark.asyncio
+async def test_middleware_uses_context_priority_and_pauses_on_retry_after():
+    sched = OutboundScheduler(rate=1000, burst=10)
+    sched.acquire = AsyncMock(wraps=sched.acquire)
+    mw = TelegramSendSchedulerMiddleware(sched)
+    method = SendMessage(chat_id=1, text="hi")
+
+    ok = AsyncMock(return_value="resp")
+    with send_priority(Priority.BROADCAST):
+        assert await mw(ok, None, method) == "resp"
+    sched.acquire.assert_awaited_with(Priority.BROADCAST)
+
+    boom = AsyncMock(side_effect=TelegramRetryAfter(method=method, message="flood", retry_after=3))
+    with pytest.raises(TelegramRetryAfter):
+        await mw(boom, None, method)
+    assert sched._paused_until > time.monotonic() + 2
+
+
+@pytest.mark.asyncio
+async def test_non_send_methods_bypass_the_bucket():
+    sched = OutboundScheduler(rate=1000, burst=10)
+    sched.acquire = AsyncMock()
+    mw = TelegramSendSchedulerMiddleware(sched)
+    make_request = AsyncMock(return_value=True)
+    await mw(make_request, None, AnswerCallbackQuery(callback_query_id="x"))
+    sched.acquire.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_pace_is_noop_when_scheduler_enabled(monkeypatch):
+    monkeypatch.setattr(telegram_scheduler.config, "TELEGRAM_SCHEDULER_ENABLED", True)
+    started = time.monotonic()
+    await telegram_scheduler.pace(1.0)
+    assert time.monotonic() - started < 0.5
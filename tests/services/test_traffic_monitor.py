@@ -0,0 +1,65 @@
+"""Unit tests for traffic_monitor bulk snapshot mode.
+
+Bulk проход: одна stream-выборка панели → join с активными юзерами БД по
+remnawave_id / uuid. Per-user GET только для несовпавших.
+"""
+from unittest.mock import AsyncMock, patch
+
+import pytest
+
+from app.workers import traffic_monitor
+
+GB = 1024 ** 3
+
+
+def _scan_with(pages):
+    async def _scan(on_page, page_size=250, progress_cb=None):
+        n = 0
+        for page in pages:
+            on_page(page)
+            n += len(page)
+        return n
+    return _scan
+
+
+@pytest.mark.asyncio
+async def test_bulk_iteration_joins_snapshot_and_skips_per_user_calls():
+    users = [
+        {"telegram_id": 1, "remnawave_id": 10, "remnawave_uuid": "u-1"},
+        {"telegram_id": 2, "remnawave_id": None, "remnawave_uuid": "u-2"},
+    ]
+    pages = [
+        [{"id": 10, "trafficLimitBytes": 10 * GB, "userTraffic": {"usedTrafficBytes": 9 * GB}}],
+        [{"id": 20, "vlessUuid": "u-2", "trafficLimitBytes": 10 * GB, "userTraffic": {"usedTrafficBytes": 0}}],
+    ]
+    evaluate = AsyncMock()
+    per_user = AsyncMock()
+    with patch.object(traffic_monitor.remnawave_api, "scan_users", _scan_with(pages)), \
+            patch.object(traffic_monitor, "_evaluate_thresholds", evaluate), \
+            patch.object(traffic_monitor, "_check_user_traffic", per_user):
+        ok = await traffic_monitor._bulk_iteration(bot=None, users=users)
+
+    assert ok is True
+    per_user.assert_not_called()
+    calls = {c.args[1]: (c.args[2], c.args[3]) for c in evaluate.call_args_list}
+    assert calls == {1: (9 * GB, 10 * GB), 2: (0, 10 * GB)}
+
+
+@pytest.mark.asyncio
+async def test_bulk_iteration_reports_failure_when_stream_breaks():
+    async def _broken(on_page, page_size=250, progress_cb=None):
+        return None
+
+    with patch.object(traffic_monitor.remnawave_api, "scan_users", _broken):
+        ok = await traffic_monitor._bulk_iteration(
+            bot=None, users=[{"telegram_id": 1, "remnawave_id": 1, "remnawave_uuid": "x"}],
+        )
+    assert ok is False
+
+
+@pytest.mark.asyncio
+async def test_evaluate_thresholds_skips_flag_lookup_when_nothing_crossed():
+    flags = AsyncMock(return_value={})
+    with patch.object(traffic_monitor.database, "get_traffic_notification_flags", flags):
+        await traffic_monitor._evaluate_thresholds(None, 1, used=1 * GB, limit=100 * GB)
+    flags.assert_not_called()
@@ -0,0 +1,151 @@
+"""
+Tests for ack-fast update ingestion (app/core/update_queue): per-user
+order, parallelism across users, the queue bound, and redelivery of
+unacked Redis stream entries. Redis is a small in-memory fake.
+"""
+import asyncio
+from types import SimpleNamespace
+
+from app.core import update_queue
+from app.core.update_queue import KeyedDispatcher, UpdateIngestor, update_key
+
+
+def _update(update_id, user_id):
+    msg = SimpleNamespace(from_user=SimpleNamespace(id=user_id), chat=SimpleNamespace(id=user_id))
+    return SimpleNamespace(update_id=update_id, event=msg)
+
+
+def _parse(body):
+    return _update(body["update_id"], body["user"])
+
+
+async def test_per_user_order_and_cross_user_parallelism():
+    log, running, peak = [], set(), [0]
+
+    async def handler(item):
+        uid, seq = item
+        assert uid not in running                   # один апдейт юзера за раз
+        running.add(uid)
+        peak[0] = max(peak[0], len(running))
+        await asyncio.sleep(0.01 if seq % 2 else 0.001)
+        log.append(item)
+        running.discard(uid)
+
+    d = KeyedDispatcher(handler, workers=4, max_pending=100, timeout=5)
+    d.start()
+    for seq in range(5):
+        for uid in (1, 2, 3, 4):
+            assert d.submit(f"u{uid}", (uid, seq))
+    assert await d.drain(5)
+    await d.stop()
+
+    for uid in (1, 2, 3, 4):
+        assert [s for u, s in log if u == uid] == list(range(5))
+    assert peak[0] == 4
+
+
+async def test_full_queue_rejects_and_failed_handler_does_not_block_user():
+    done = []
+
+    async def handler(item):
+        if item == "bad":
+            raise RuntimeError("boom")
+        done.append(item)
+
+    d = KeyedDispatcher(handler, workers=1, max_pending=2, timeout=5)
+    assert d.submit("u1", "bad") and d.submit("u1", "next")
+    assert d.submit("u2", "x") is False
+    d.start()
+    assert await d.drain(5)
+    await d.stop()
+    assert done == ["next"]
+
+
+def test_update_key_falls_back_to_update_id():
+    assert update_key(_update(1, 42)) == "u42"
+    assert update_key(SimpleNamespace(update_id=9, event=SimpleNamespace())) == "x9"
+
+
+class _FakeStreamRedis:
+    def __init__(self):
+        self.entries, self.pending, self.delivered, self.acked = [], set(), 0, []
+        self.deleted = set()
+
+    async def xgroup_create(self, *a, **kw):
+        return True
+
+    async def xadd(self, key, fields, **kw):
+        assert "maxlen" not in kw                   # обрезка теряла бы unacked
+        entry_id = f"{len(self.entries) + 1}-0"
+        self.entries.append((entry_id, fields))
+        return entry_id
+
+    async def xlen(self, key):
+        return len(self.entries) - len(self.deleted)
+
+    async def xdel(self, key, entry_id):
+        self.deleted.add(entry_id)
+
+    async def xreadgroup(self, group, consumer, streams, count, block):
+        cursor = streams[update_queue.STREAM_KEY]
+        if cursor == ">":
+            batch = self.entries[self.delivered:self.delivered + count]
+            self.delivered += len(batch)
+            self.pending.update(e[0] for e in batch)
+        else:
+            after = 0 if cursor == "0" else int(cursor.split("-")[0])
+            batch = [e for e in self.entries if e[0] in self.pending and int(e[0].split("-")[0]) > after]
+        if not batch:
+            await asyncio.sleep(0.01)
+            return []
+        return [(update_queue.STREAM_KEY, batch)]
+
+    async def xack(self, key, group, entry_id):
+        self.pending.discard(entry_id)
+        self.acked.append(entry_id)
+
+
+async def test_redis_backend_redelivers_unacked_entries(monkeypatch):
+    r = _FakeStreamRedis()
+
+    async def get_redis():
+        return r
+    monkeypatch.setattr("app.utils.redis_client.get_redis", get_redis)
+
+    # «Упавший» процесс: запись прочитана, но не подтверждена.
+    await r.xadd(update_queue.STREAM_KEY, {"u": '{"update_id": 1, "user": 7}'})
+    r.delivered, r.pending = 1, {"1-0"}
+
+    seen = []
+
+    async def process(update):
+        seen.append(update.update_id)
+
+    ing = UpdateIngestor(process, _parse, backend="redis", workers=2, max_pending=10, timeout=5)
+    await ing.start()
+    assert await ing.ingest({"update_id": 2, "user": 7})
+    for _ in range(100):
+        if len(r.acked) == 2:
+            break
+        await asyncio.sleep(0.01)
+    await ing.stop(drain_timeout=1)
+    assert seen == [1, 2]
+    assert r.acked == ["1-0", "2-0"] and not r.pending
+    assert r.deleted == {"1-0", "2-0"}
+
+
+async def test_redis_backend_rejects_when_stream_is_full(monkeypatch):
+    r = _FakeStreamRedis()
+
+    async def get_redis():
+        return r
+    monkeypatch.setattr("app.utils.redis_client.get_redis", get_redis)
+
+    async def process(update):
+        pass
+
+    # Reader не запущен — записи копятся неподтверждёнными.
+    ing = UpdateIngestor(process, _parse, backend="redis", workers=1, max_pending=2, timeout=5)
+    results = [await ing.ingest({"update_id": i, "user": 7}) for i in range(6)]
+    assert results == [True] * 4 + [False] * 2
+    assert len(r.entries) == 4 and not r.deleted
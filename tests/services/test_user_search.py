@@ -0,0 +1,97 @@
+"""
+Tests for indexed dashboard user search: query-path selection in
+database.users.build_user_search_query and the debounced result cache
+in app/api/dashboard/routes/users.py.
+"""
+import asyncio
+from unittest.mock import AsyncMock, patch
+
+from database.users import build_user_search_query
+from app.api.dashboard.routes import users as users_route
+
+
+def test_numeric_query_uses_id_prefix_range():
+    sql, args = build_user_search_query(" 12389 ", 25)
+    assert "u.telegram_id::text ~>=~ $1" in sql
+    assert "ILIKE" not in sql
+    assert args == ["12389", "1238:", 25]
+
+
+def test_short_text_is_prefix_only():
+    sql, args = build_user_search_query("@Ab", 10)
+    assert "lower(u.username) ~>=~ $1" in sql and "ILIKE" not in sql
+    assert args == ["ab", "ac", 10]
+
+
+def test_long_text_prefix_then_trigram_with_escaping():
+    sql, args = build_user_search_query("Jo_n%", 5)
+    assert sql.index("~>=~") < sql.index("ILIKE $4")
+    assert "UNION ALL" in sql
+    assert args[:3] == ["jo_n%", "jo_n&", 5]
+    assert args[3] == "%Jo\\_n\\%%"
+
+
+def test_empty_query():
+    assert build_user_search_query("  @ ", 5) is None
+
+
+async def test_search_cache_and_inflight_coalescing():
+    users_route._search_cache.clear()
+    gate = asyncio.Event()
+    calls = []
+
+    async def slow_search(q, limit=25):
+        calls.append(q)
+        await gate.wait()
+        return [{"telegram_id": 1}]
+
+    with patch.object(users_route.database, "search_users_dashboard", side_effect=slow_search):
+        t1 = asyncio.create_task(users_route._cached_search("Bob", 25))
+        t2 = asyncio.create_task(users_route._cached_search("@bob", 25))
+        await asyncio.sleep(0)
+        gate.set()
+        r1, r2 = await asyncio.gather(t1, t2)
+        r3 = await users_route._cached_search("bob ", 25)
+
+    assert r1 == r2 == r3 == [{"telegram_id": 1}]
+    assert calls == ["Bob"]
+    users_route._search_cache.clear()
+
+
+async def test_search_errors_are_not_cached():
+    users_route._search_cache.clear()
+    failing = AsyncMock(side_effect=[RuntimeError("db"), [{"telegram_id": 2}]])
+    with patch.object(users_route.database, "search_users_dashboard", failing):
+        try:
+            await users_route._cached_search("zed", 25)
+        except RuntimeError:
+            pass
+        assert await users_route._cached_search("zed", 25) == [{"telegram_id": 2}]
+    users_route._search_cache.clear()
+
+
+async def test_follower_survives_cancelled_leader():
+    users_route._search_cache.clear()
+    first_call = asyncio.Event()
+    calls = []
+
+    async def search(q, limit=25):
+        calls.append(q)
+        if len(calls) == 1:
+            first_call.set()
+            await asyncio.Event().wait()  # клиент-владелец отвалится раньше
+        return [{"telegram_id": 3}]
+
+    with patch.object(users_route.database, "search_users_dashboard", side_effect=search):
+        leader = asyncio.create_task(users_route._cached_search("amy", 25))
+        await first_call.wait()
+        follower = asyncio.create_task(users_route._cached_search("amy", 25))
+        await asyncio.sleep(0)
+        leader.cancel()
+        result = await asyncio.wait_for(follower, timeout=1.0)
+
+    assert leader.cancelled()
+    assert result == [{"telegram_id": 3}]
+    assert len(calls) == 2
+    assert not users_route._search_inflight
+    users_route._search_cache.clear()
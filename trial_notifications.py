@@ -15,13 +15,14 @@ import database
 import config
 from app import i18n
 from app.services.trials import service as trial_service
-from app.services.language_service import resolve_user_language
+from app.services.language_service import resolve_languages, resolve_user_language
 from app.utils.logging_helpers import (
     log_worker_iteration_start,
     log_worker_iteration_end,
     classify_error,
 )
 from app.core.structured_logger import log_event
+from app.core.telegram_scheduler import Priority, pace, with_send_priority
 
 logger = logging.getLogger(__name__)
 
@@ -208,7 +209,7 @@ async def send_trial_notification(
         sent = await safe_send_message(bot, telegram_id, text, reply_markup=reply_markup)
         if sent is None:
             return (False, "failed_permanently")
-        await asyncio.sleep(0.05)  # Telegram rate limit: max 20 msgs/sec
+        await pace(0.05)  # Telegram rate limit: max 20 msgs/sec
 
         logger.info(
             f"trial_notification_sent: user={telegram_id}, notification={notification_key}, "
@@ -340,7 +341,7 @@ async def _process_single_trial_notification(bot: Bot, pool, row: dict, now: dat
                 bot, telegram_id, photo_id, text, reply_markup=keyboard,
             )
             if sent is not None:
-                await asyncio.sleep(0.05)
+                await pace(0.05)
                 flag_query = _get_trial_flag_query("trial_notif_3h_sent")
                 async with pool.acquire() as conn:
                     await conn.execute(flag_query, telegram_id)
@@ -534,6 +535,7 @@ async def _process_single_trial_notification(bot: Bot, pool, row: dict, now: dat
             )
 
 
+@with_send_priority(Priority.REMINDER)
 async def process_trial_notifications(bot: Bot):
     """Обработать все уведомления о trial
     
@@ -626,6 +628,7 @@ async def process_trial_notifications(bot: Bot):
             if total_fetched > 1000:
                 logger.warning("[WORKER_ITEMS] worker=trial_notifications total_fetched=%d > 1000", total_fetched)
 
+            await resolve_languages(r["telegram_id"] for r in rows)
             for row in rows:
                 await _process_single_trial_notification(bot, pool, dict(row), now)
 
@@ -785,7 +788,7 @@ async def _process_single_trial_expiration(bot: Bot, pool, row: dict, now: datet
                         parse_mode="HTML", reply_markup=keyboard
                     )
                     if sent:
-                        await asyncio.sleep(0.05)
+                        await pace(0.05)
                         logger.info(
                             f"trial_expired: notification sent: user={telegram_id}, "
                             f"trial_used_at={trial_used_at.isoformat() if trial_used_at else None}, "
@@ -809,6 +812,7 @@ async def _process_single_trial_expiration(bot: Bot, pool, row: dict, now: datet
             logger.exception(f"Error expiring trial subscription for user {telegram_id}: {e}")
 
 
+@with_send_priority(Priority.REMINDER)
 async def expire_trial_subscriptions(bot: Bot):
     """Завершить истёкшие trial-подписки
     
@@ -868,6 +872,7 @@ async def expire_trial_subscriptions(bot: Bot):
             if not rows:
                 break
 
+            await resolve_languages(r["telegram_id"] for r in rows)
             for row in rows:
                 await _process_single_trial_expiration(bot, pool, dict(row), now)
 
@@ -398,11 +398,27 @@ async def process_webhook_data(
     if not is_enabled():
         return {"status": "disabled"}
 
+    if not await verify_webhook_auth(headers, raw_body):
+        return {"status": "invalid_signature"}
+
+    return await handle_webhook_event(body, bot)
+
+
+async def verify_webhook_auth(headers: dict, raw_body: bytes) -> bool:
+    """X-Signature по сырому телу (см. _verify_webhook_signature)."""
     signature = headers.get("x-signature") or headers.get("X-Signature") or ""
     if not await _verify_webhook_signature(raw_body, signature):
         logger.error("Wata webhook: invalid signature (body=%s)", raw_body[:200])
-        return {"status": "invalid_signature"}
+        return False
+    return True
+
 
+async def handle_webhook_event(body: dict, bot: Bot) -> dict:
+    """Разбор события после проверки подписи.
+
+    Зовётся inline из process_webhook_data и воркером payment inbox —
+    туда же wata_reconciler кладёт найденные Paid-транзакции.
+    """
     tx_status = str(body.get("transactionStatus") or "").strip()
     kind = str(body.get("kind") or "").strip()
     order_id = body.get("orderId")